@@ -10,18 +10,434 @@ This function:
 Trigger: HTTP (manual trigger)
 """
 
+import base64
+import importlib
+import json
 import logging
 import os
-import json
-from io import BytesIO
-from datetime import datetime
+import re
+import threading
+import time
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
+from functools import cached_property
+from io import BufferedReader, BytesIO, RawIOBase
+from datetime import datetime, timezone
+from tempfile import SpooledTemporaryFile
 import azure.functions as func
-from azure.identity import ManagedIdentityCredential
-from azure.storage.blob import BlobServiceClient
-from azure.keyvault.secrets import SecretClient
-import pandas as pd
-from openpyxl.styles import Font, PatternFill
-from msoffcrypto import OfficeFile
+from azure.core import MatchConditions
+from azure.core.exceptions import (
+    ClientAuthenticationError,
+    ResourceNotFoundError,
+)
+
+from .data_export import (
+    DEFAULT_REPORT_FORMAT,
+    REPORT_FORMATS,
+    report_extension,
+)
+from .instrumentation import StageMetrics
+from .planner import CACHE, MEMORY, PARALLEL, STREAM
+from .query import QueryError, read_query
+from .schema import (
+    INVENTORY_COLUMNS,
+    SOFTWARE_LIST_COLUMNS,
+    concat,
+    csv_options,
+    parse_columns,
+    project,
+    prune_categories,
+)
+
+# Heavy dependencies, imported when the first stage that needs them runs so
+# a cold start only pays for what its request uses. Submodules built on
+# pandas, pyarrow or openpyxl are imported inside the methods using them;
+# the names below remain attributes of this module, resolved on each use
+# so they can be replaced, e.g. by tests.
+_LAZY_ATTRIBUTES = {
+    "BlobServiceClient": "azure.storage.blob",
+    "ManagedIdentityCredential": "azure.identity",
+    "OfficeFile": "msoffcrypto",
+    "SecretClient": "azure.keyvault.secrets",
+}
+
+
+def __getattr__(name):
+    module = _LAZY_ATTRIBUTES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def _lazy(name):
+    """
+    Return a lazily imported attribute of this module.
+    """
+    return globals().get(name) or __getattr__(name)
+
+
+# Rows per DataFrame chunk when streaming the inventory
+DEFAULT_CHUNK_ROWS = 50000
+
+# Inventory shards downloaded and parsed at the same time
+DEFAULT_MAX_WORKERS = 8
+
+# Report size above which the Excel and encrypted files spill to disk
+DEFAULT_SPOOL_MAX_BYTES = 32 * 1024 * 1024
+
+# Reports larger than this are uploaded in blocks of this size
+DEFAULT_UPLOAD_BLOCK_BYTES = 8 * 1024 * 1024
+
+# Report blocks staged at the same time
+DEFAULT_UPLOAD_CONCURRENCY = 4
+
+# Key Vault secret holding the report password (see password_rotation.tf)
+REPORT_SECRET_NAME = "postprocess-secret"
+
+# Seconds a fetched report password is reused before Key Vault is asked
+# again. The secret rotates every 90 days, so an hour bounds how long a
+# rotated password can go unnoticed.
+DEFAULT_SECRET_TTL_SECONDS = 3600
+
+# Seconds a cached report password is reused before its version is
+# compared with Key Vault's newest, bounding how long a rotation made
+# within the TTL goes unnoticed
+DEFAULT_SECRET_CHECK_SECONDS = 300
+
+# Values of the "metrics" request parameter that return the run's metrics
+METRICS_FORMATS = ("header", "json")
+METRICS_HEADER = "X-Stage-Metrics"
+
+
+class StalePasswordError(Exception):
+    """
+    Raised when the report password is known to be out of date.
+    """
+
+
+class _ClientRegistry:
+    """
+    Process-wide cache of Azure credentials and service clients.
+
+    A function worker serves many invocations, so reusing the credential
+    keeps its token cache and reusing the clients keeps their HTTP
+    connection pools across warm invocations. Entries are keyed by the
+    service URL and managed identity client ID, and a client is rebuilt
+    whenever the credential it was created with has been replaced.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, factory, credential=None):
+        """
+        Return the cached object for ``key``, creating it with ``factory``
+        if it is missing or was built with a different credential.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is credential:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            client = factory()
+            self._entries[key] = (credential, client)
+            return client
+
+    def clear(self):
+        """
+        Drop every cached credential and client, e.g. after an
+        authentication failure, so the next invocation rebuilds them.
+
+        Returns:
+            List of the dropped credentials and clients
+        """
+        with self._lock:
+            dropped = [client for _, client in self._entries.values()]
+            self._entries.clear()
+            return dropped
+
+
+_clients = _ClientRegistry()
+
+
+def get_credential(client_id):
+    """
+    Return the shared managed identity credential for a client ID.
+    """
+    return _clients.get(
+        ("credential", client_id),
+        lambda: _lazy("ManagedIdentityCredential")(client_id=client_id),
+    )
+
+
+def get_blob_service_client(account_url, client_id, credential):
+    """
+    Return the shared BlobServiceClient for a storage account.
+    """
+    return _clients.get(
+        ("blob", account_url, client_id),
+        lambda: _lazy("BlobServiceClient")(
+            account_url=account_url, credential=credential
+        ),
+        credential,
+    )
+
+
+def get_secret_client(vault_url, client_id, credential):
+    """
+    Return the shared SecretClient for a Key Vault.
+    """
+    return _clients.get(
+        ("keyvault", vault_url, client_id),
+        lambda: _lazy("SecretClient")(
+            vault_url=vault_url, credential=credential
+        ),
+        credential,
+    )
+
+
+def reset_clients():
+    """
+    Discard all pooled credentials and clients.
+    """
+    _clients.clear()
+
+
+def _secret_expired(secret):
+    """
+    Return True if a Key Vault secret has passed its expiration date.
+    """
+    expires_on = secret.properties.expires_on
+    return isinstance(expires_on, datetime) and expires_on <= datetime.now(
+        timezone.utc
+    )
+
+
+def _latest_version(versions):
+    """
+    Return the version of the newest enabled secret among ``versions``.
+
+    Args:
+        versions: SecretProperties of a secret's versions
+
+    Returns:
+        The version, or None if no version is enabled
+    """
+    enabled = [
+        properties
+        for properties in versions
+        if properties.enabled is not False and properties.created_on
+    ]
+    if not enabled:
+        return None
+    return max(enabled, key=lambda properties: properties.created_on).version
+
+
+class _SecretCache:
+    """
+    In-process cache of Key Vault secrets with a TTL.
+
+    A cached secret is reused until the TTL runs out or the secret's own
+    expiration date passes, whichever comes first. Within the TTL, a
+    secret last checked more than a check interval ago is compared with
+    the vault's newest version, a metadata-only call, so a rotated
+    password is fetched again without waiting for the TTL.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = {}
+
+    def get(
+        self,
+        secret_client,
+        vault_url,
+        name,
+        ttl,
+        force_refresh=False,
+        check_interval=None,
+    ):
+        """
+        Return the secret, fetching it from Key Vault only when needed.
+
+        Args:
+            secret_client: SecretClient for the vault
+            vault_url: Key Vault URL, part of the cache key
+            name: Secret name
+            ttl: Seconds a fetched secret may be reused
+            force_refresh: Ignore any cached value
+            check_interval: Seconds a cached secret is reused before its
+                version is compared with the vault's newest, never if None
+
+        Returns:
+            KeyVaultSecret
+        """
+        key = (vault_url, name)
+        with self._lock:
+            if not force_refresh:
+                secret = self.lookup(key, ttl)
+                if secret is not None and (
+                    not self.needs_check(key, check_interval)
+                    or not self.rotated(
+                        key,
+                        _latest_version(
+                            secret_client.list_properties_of_secret_versions(
+                                name
+                            )
+                        ),
+                    )
+                ):
+                    return secret
+            return self.store(key, secret_client.get_secret(name))
+
+    def lookup(self, key, ttl):
+        """
+        Return the cached secret for ``key`` if it is still fresh.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if (
+                entry is not None
+                and time.monotonic() - entry[1] < ttl
+                and not _secret_expired(entry[0])
+            ):
+                return entry[0]
+            return None
+
+    def needs_check(self, key, check_interval):
+        """
+        Return True if the version of the secret for ``key`` is due a check.
+        """
+        if check_interval is None:
+            return False
+        with self._lock:
+            entry = self._entries.get(key)
+            return (
+                entry is not None
+                and time.monotonic() - entry[2] >= check_interval
+            )
+
+    def rotated(self, key, latest):
+        """
+        Record a version check, returning True if the vault's newest
+        version ``latest`` differs from the cached secret's.
+        """
+        with self._lock:
+            secret, fetched_at, _ = self._entries[key]
+            if latest is not None and latest != secret.properties.version:
+                logging.info(f"Secret {key[1]} was rotated")
+                return True
+            self._entries[key] = (secret, fetched_at, time.monotonic())
+            return False
+
+    def store(self, key, secret):
+        """
+        Cache a freshly fetched secret, logging version changes.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if (
+                entry is not None
+                and entry[0].properties.version != secret.properties.version
+            ):
+                logging.info(f"Secret {key[1]} has a new version")
+            now = time.monotonic()
+            self._entries[key] = (secret, now, now)
+            return secret
+
+    def clear(self):
+        """
+        Drop every cached secret.
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+_secrets = _SecretCache()
+
+
+def get_report_secret(
+    secret_client, vault_url, ttl, force_refresh=False, check_interval=None
+):
+    """
+    Return the report password secret from the in-process cache.
+
+    An unusable password is fetched from Key Vault once more before it is
+    rejected, in case the cached copy was replaced in the vault since.
+
+    Raises:
+        StalePasswordError: If Key Vault only has an expired or empty
+            password
+    """
+    secret = _secrets.get(
+        secret_client,
+        vault_url,
+        REPORT_SECRET_NAME,
+        ttl,
+        force_refresh,
+        check_interval,
+    )
+    if not secret.value or _secret_expired(secret):
+        if not force_refresh:
+            return get_report_secret(
+                secret_client, vault_url, ttl, force_refresh=True
+            )
+        raise StalePasswordError(
+            f"Key Vault secret {REPORT_SECRET_NAME} is expired or empty"
+        )
+    return secret
+
+
+def reset_secret_cache():
+    """
+    Discard all cached secrets.
+    """
+    _secrets.clear()
+
+
+def is_blob_pattern(input_path):
+    """
+    Return True if an input path names a set of shards rather than a blob.
+    """
+    return input_path.endswith("/") or any(
+        char in input_path for char in "*?["
+    )
+
+
+class _BlobChunkReader(RawIOBase):
+    """
+    Read-only file object over the chunks of a blob download.
+
+    Lets pandas parse the blob while it is still downloading, so only the
+    chunk currently being consumed is held in memory.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._chunk = memoryview(b"")
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._chunk:
+            try:
+                self._chunk = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        self.bytes_read += size
+        return size
 
 
 class VMFilter:
@@ -29,246 +445,1652 @@ class VMFilter:
     Class to handle filtering of VMs with SQL Server and export to Excel.
     """
 
-    def __init__(self, credential, config):
+    def __init__(self, credential, config, metrics=None):
         """
         Initialize the VMFilter class.
 
         Args:
             credential: Azure managed identity credential
             config: Configuration dictionary with storage and Key Vault info
+            metrics: StageMetrics recording each stage, a new one if omitted
         """
         self.credential = credential
         self.config = config
         self.data = None
+        self.metrics = metrics if metrics is not None else StageMetrics()
+
+    def plan_load(self, input_path):
+        """
+        Choose how to load the inventory from its blob properties and the
+        memory and CPUs available to this worker.
+
+        Args:
+            input_path: Blob name of the input CSV file
+
+        Returns:
+            Load plan dictionary, see planner.plan_load
+        """
+        from .planner import (
+            available_cpus,
+            available_memory_bytes,
+            input_compression,
+            plan_load,
+        )
+
+        with self.metrics.stage("plan") as stage:
+            properties = self._get_preprocess_blob_client(
+                input_path
+            ).get_blob_properties()
+            cache_fresh = False
+            if self.config.get("parquet_cache"):
+                from .inventory_cache import SOURCE_ETAG_KEY, cache_blob_name
+
+                try:
+                    cache_properties = self._get_preprocess_blob_client(
+                        cache_blob_name(input_path)
+                    ).get_blob_properties()
+                except ResourceNotFoundError:
+                    pass
+                else:
+                    cache_fresh = (
+                        cache_properties.metadata.get(SOURCE_ETAG_KEY)
+                        == properties.etag
+                    )
+            plan = plan_load(
+                properties.size,
+                compression=input_compression(
+                    input_path, properties.content_settings.content_encoding
+                ),
+                parquet_cache=self.config.get("parquet_cache", False),
+                cache_fresh=cache_fresh,
+                memory_bytes=available_memory_bytes(),
+                cpus=available_cpus(),
+                processes=(
+                    self.config["parse_processes"]
+                    if self.config.get("parse_processes", 0) > 1
+                    else None
+                ),
+            )
+            stage.update(plan)
+
+        logging.info(
+            f"Loading {input_path} with the {plan['strategy']} strategy, as "
+            f"{plan['reason']}",
+            extra={"custom_dimensions": plan},
+        )
+        return plan
 
-    def load_data(self, input_path):
+    def load_data(self, input_path, columns=None, sql_server_only=False):
         """
         Load VM data from CSV file in Azure Blob Storage.
 
+        When the Parquet cache is enabled, the data is read from a cached
+        copy next to the CSV, which is rebuilt whenever the CSV's ETag
+        changes.
+
         Args:
             input_path: Blob name of the input CSV file
+            columns: Columns to load, defaults to all inventory columns
+            sql_server_only: Only return VMs with SQL Server installed
 
         Returns:
             Loaded pandas DataFrame
         """
         logging.info(f"Loading data from {input_path}...")
 
-        # Create blob client for pre-process storage
-        preprocess_blob_url = (
-            f"https://{self.config['preprocess_account']}"
-            f".blob.core.windows.net"
-        )
-        preprocess_client = BlobServiceClient(
-            account_url=preprocess_blob_url, credential=self.credential
-        )
-        preprocess_blob_client = preprocess_client.get_blob_client(
-            container=self.config["preprocess_container"], blob=input_path
-        )
+        preprocess_blob_client = self._get_preprocess_blob_client(input_path)
 
-        # Download and parse CSV
-        csv_data = preprocess_blob_client.download_blob().readall()
-        self.data = pd.read_csv(BytesIO(csv_data))
+        if self.config.get("parquet_cache"):
+            self.data = self._load_cached_data(
+                preprocess_blob_client,
+                input_path,
+                columns,
+                sql_server_only,
+                self._software_lists(),
+            )
+        else:
+            # Download and parse CSV, skipping unwanted columns
+            csv_data = self._download_csv(preprocess_blob_client)
+            read_columns = columns
+            if columns is not None and sql_server_only:
+                read_columns = {*columns, "SQLSoftware"}
+            self.data = self._select(
+                self._parse_csv(csv_data, read_columns),
+                columns,
+                sql_server_only,
+            )
 
         logging.info(f"Loaded {len(self.data)} total VMs")
         return self.data
 
-    def filter_sql_vms(self, data):
+    def _load_cached_data(
+        self, source_blob_client, input_path, columns, sql_server_only, lists
+    ):
         """
-        Return rows where SQLSoftware contains 'Microsoft SQL Server'.
+        Load the inventory from its Parquet cache, rebuilding a missing or
+        stale cache from the CSV.
+
+        The cached list columns of the software columns in ``lists`` are
+        returned too when the cache is read; a rebuilt cache returns the
+        CSV's columns only.
         """
-        logging.info("Filtering VMs for Microsoft SQL Server...")
+        from .inventory_cache import (
+            SOURCE_ETAG_KEY,
+            BlobRangeReader,
+            build_cache_table,
+            cache_blob_name,
+            read_cache,
+            write_cache,
+        )
 
-        def contains_sql_server(val):
-            # Handle None/NaN
-            if val is None or (isinstance(val, float) and pd.isna(val)):
-                return False
+        source_etag = source_blob_client.get_blob_properties().etag
+        cache_blob_client = self._get_preprocess_blob_client(
+            cache_blob_name(input_path)
+        )
+        try:
+            cache_properties = cache_blob_client.get_blob_properties()
+        except ResourceNotFoundError:
+            cache_properties = None
 
-            # Handle string representations of empty lists
-            if isinstance(val, str) and val.strip() in ("[]", ""):
-                return False
+        if (
+            cache_properties is not None
+            and cache_properties.metadata.get(SOURCE_ETAG_KEY) == source_etag
+        ):
+            logging.info("Reading inventory from Parquet cache...")
+            with self.metrics.stage("cache_read") as stage:
+                data = read_cache(
+                    BlobRangeReader(cache_blob_client, cache_properties.size),
+                    columns,
+                    sql_server_only,
+                    lists,
+                )
+                stage["rows_out"] = len(data)
+            return data
 
-            # If the column is already a list, check directly
-            if isinstance(val, list):
-                return any("Microsoft SQL Server" in s for s in val)
+        logging.info("Parquet cache missing or stale, parsing CSV...")
+        csv_data = self._download_csv(
+            source_blob_client,
+            etag=source_etag,
+            match_condition=MatchConditions.IfNotModified,
+        )
+        data = self._parse_csv(csv_data)
+        del csv_data
 
-            # Otherwise treat as a string
-            try:
-                parsed = json.loads(val)
-                return any("Microsoft SQL Server" in s for s in parsed)
-            except Exception:
-                # fallback: simple substring search
-                return "Microsoft SQL Server" in str(val)
+        spool_max_bytes = self.config.get(
+            "spool_max_bytes", DEFAULT_SPOOL_MAX_BYTES
+        )
+        with self.metrics.stage("cache_write", rows_in=len(data)) as stage:
+            with SpooledTemporaryFile(max_size=spool_max_bytes) as cache_file:
+                write_cache(build_cache_table(data), cache_file)
+                length = cache_file.tell()
+                cache_file.seek(0)
+                cache_blob_client.upload_blob(
+                    cache_file,
+                    length=length,
+                    overwrite=True,
+                    metadata={SOURCE_ETAG_KEY: source_etag},
+                )
+                stage["bytes"] = length
+        logging.info(f"Wrote Parquet cache {cache_blob_name(input_path)}")
 
-        mask = data["SQLSoftware"].apply(contains_sql_server)
-        result = data[mask].copy()
+        return self._select(data, columns, sql_server_only)
 
-        logging.info(
-            f"Found {len(result)} VMs with Microsoft SQL Server installed."
-        )
-        return result
+    def _software_lists(self):
+        """
+        Return the software columns whose cached list columns a run uses:
+        SQLSoftware to classify versions and RawSoftware to tag products.
+        """
+        lists = []
+        if self.config.get("classify_sql_versions"):
+            lists.append("SQLSoftware")
+        if self.config.get("product_patterns"):
+            lists.append("RawSoftware")
+        return lists
 
-    def export_to_excel(self, data, output_path, password):
+    def _download_csv(self, blob_client, **kwargs):
         """
-        Export filtered data to password-protected Excel file and upload to
-        blob storage.
+        Download a whole CSV blob.
+        """
+        with self.metrics.stage("download") as stage:
+            csv_data = blob_client.download_blob(**kwargs).readall()
+            stage["bytes"] = len(csv_data)
+        return csv_data
 
-        Args:
-            data: Filtered VM pandas DataFrame
-            output_path: Blob name to save the Excel file
-            password: Password to protect the Excel file (REQUIRED)
+    def _parse_csv(self, csv_data, columns=None):
         """
-        logging.info(f"Exporting {len(data)} VMs to Excel...")
+        Parse a downloaded CSV blob with the declared inventory dtypes.
 
-        if "AccountID" in data.columns:
-            data = data.copy()
-            data["AccountID"] = data["AccountID"].astype(str)
+        Args:
+            csv_data: CSV bytes
+            columns: Columns to parse, defaults to all
+        """
+        import pandas as pd
 
-        # Create Excel file with formatting - AI used for formatting code
-        excel_buffer = BytesIO()
-        with pd.ExcelWriter(excel_buffer, engine="openpyxl") as writer:
-            data.to_excel(writer, index=False, sheet_name="SQL Servers")
+        with self.metrics.stage("parse") as stage:
+            data = pd.read_csv(BytesIO(csv_data), **csv_options(columns))
+            stage["bytes"] = len(csv_data)
+            stage["rows_out"] = len(data)
+        return data
 
-            # Format the Excel sheet
-            workbook = writer.book
-            worksheet = writer.sheets["SQL Servers"]
+    def _select(self, data, columns, sql_server_only):
+        """
+        Apply row and column selection to a fully parsed inventory.
+        """
+        if sql_server_only:
+            with self.metrics.stage("filter", rows_in=len(data)) as stage:
+                data = prune_categories(data[self._sql_server_mask(data)])
+                stage["rows_out"] = len(data)
+        if columns is not None:
+            data = data[list(columns)]
+        return data
 
-            # Header formatting
-            header_fill = PatternFill(
-                start_color="0066CC", end_color="0066CC", fill_type="solid"
-            )
-            header_font = Font(bold=True, color="FFFFFF")
-
-            for cell in worksheet[1]:
-                cell.fill = header_fill
-                cell.font = header_font
-
-            # Auto-adjust column widths
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        cell_len = len(str(cell.value))
-                        if cell_len > max_length:
-                            max_length = cell_len
-                    # Column-width logic is unreachable in unit tests due to
-                    # pandas/openpyxl lazy worksheet population
-                    except Exception:  # pragma: no cover
-                        pass  # pragma: no cover
-                adjusted_width = min(max_length + 2, 50)
-                worksheet.column_dimensions[column_letter].width = (
-                    adjusted_width
-                )
+    def load_sql_vms(
+        self,
+        input_path,
+        chunksize=DEFAULT_CHUNK_ROWS,
+        columns=None,
+        compression=None,
+    ):
+        """
+        Stream VM data from Azure Blob Storage and keep only SQL Server VMs.
 
-        excel_buffer.seek(0)
+        The blob is parsed while it downloads, in DataFrames of at most
+        ``chunksize`` rows, and each chunk is filtered as it arrives. Peak
+        memory depends on the chunk size and the number of matches rather
+        than on the size of the inventory.
 
-        # Apply password protection
-        logging.info("Applying password protection to Excel file...")
-        protected_buffer = BytesIO()
-        office_file = OfficeFile(excel_buffer)
-        office_file.load_key(password=password)
-        office_file.encrypt(password, protected_buffer)
-        protected_buffer.seek(0)
-        logging.info("Password protection applied successfully")
+        Args:
+            input_path: Blob name of the input CSV file
+            chunksize: Maximum number of rows parsed at a time
+            columns: Columns to parse, defaults to all; must include
+                SQLSoftware
+            compression: Compression of the blob, e.g. "gzip", decompressed
+                as it streams
 
-        # Upload to post-process storage
-        logging.info(f"Uploading password-protected file to {output_path}...")
-        postprocess_blob_url = f"https://{self.config['postprocess_account']}.blob.core.windows.net"
-        postprocess_client = BlobServiceClient(
-            account_url=postprocess_blob_url, credential=self.credential
+        Returns:
+            pandas DataFrame of VMs with SQL Server installed
+        """
+        logging.info(
+            f"Streaming data from {input_path} in chunks of "
+            f"{chunksize} rows..."
         )
-        postprocess_blob_client = postprocess_client.get_blob_client(
-            container=self.config["postprocess_container"], blob=output_path
+
+        total, self.data = self._stream_sql_vms(
+            input_path, chunksize, columns, compression
         )
 
-        postprocess_blob_client.upload_blob(
-            protected_buffer.read(), overwrite=True
+        logging.info(
+            f"Streamed {total} total VMs, found {len(self.data)} VMs with "
+            f"Microsoft SQL Server installed."
         )
+        return self.data
 
-        logging.info(f"Successfully uploaded {output_path}")
+    def load_sql_vms_parallel(self, input_path, processes, columns=None):
+        """
+        Load VM data and keep only SQL Server VMs, parsing in worker
+        processes.
 
+        The blob is divided into up to ``processes`` byte ranges, which the
+        workers download, parse and filter concurrently; their SQL Server
+        rows are merged in file order.
 
-def main(req: func.HttpRequest) -> func.HttpResponse:
-    """
-    Main function to orchestrate the VM filtering process.
-    """
-    logging.info("SQL Server filter function triggered")
+        Args:
+            input_path: Blob name of the input CSV file
+            processes: Number of worker processes
+            columns: Columns to parse, defaults to all; must include
+                SQLSoftware
 
-    try:
-        # Get configuration from environment variables
-        config = {
-            "preprocess_account": os.environ["PREPROCESS_STORAGE_ACCOUNT"],
-            "preprocess_container": os.environ["PREPROCESS_CONTAINER"],
-            "postprocess_account": os.environ["POSTPROCESS_STORAGE_ACCOUNT"],
-            "postprocess_container": os.environ["POSTPROCESS_CONTAINER"],
-            "keyvault_url": os.environ.get("KEY_VAULT_URL"),
-            "managed_identity_client_id": os.environ[
-                "MANAGED_IDENTITY_CLIENT_ID"
-            ],
-        }
+        Returns:
+            pandas DataFrame of VMs with SQL Server installed
+        """
+        from . import parallel
+
+        logging.info(
+            f"Loading data from {input_path} with {processes} "
+            f"parse processes..."
+        )
+
+        properties = self._get_preprocess_blob_client(
+            input_path
+        ).get_blob_properties()
+        source = (
+            self._preprocess_account_url(),
+            self.config["preprocess_container"],
+            input_path,
+            self.config.get("managed_identity_client_id"),
+            properties.etag,
+        )
+        # Download, parse and filter overlap in the workers, so they are
+        # one stage
+        with self.metrics.stage(
+            "parallel_parse", bytes=properties.size, processes=processes
+        ) as stage:
+            total, self.data, ranges = parallel.parse_sql_vms(
+                parallel.download_range,
+                source,
+                properties.size,
+                processes,
+                columns,
+            )
+            stage.update(ranges=ranges, rows_in=total, rows_out=len(self.data))
 
-        # Authenticate using managed identity
-        credential = ManagedIdentityCredential(
-            client_id=config["managed_identity_client_id"]
+        logging.info(
+            f"Parsed {total} total VMs in {ranges} ranges, found "
+            f"{len(self.data)} VMs with Microsoft SQL Server installed."
         )
+        return self.data
 
-        # Initialize VM filter
-        vm_filter = VMFilter(credential, config)
+    def load_sharded_sql_vms(
+        self,
+        pattern,
+        max_workers=DEFAULT_MAX_WORKERS,
+        chunksize=DEFAULT_CHUNK_ROWS,
+        columns=None,
+    ):
+        """
+        Load and filter every inventory shard matching a prefix or glob.
 
-        # Load data from pre-process storage
-        input_file = "vm_inventory.csv"
-        data = vm_filter.load_data(input_file)
+        Shards are downloaded, parsed and filtered concurrently on a bounded
+        thread pool, and merged in blob name order so the report does not
+        depend on which shard finishes first.
 
-        # Filter VMs with SQL Server
-        sql_vms = vm_filter.filter_sql_vms(data)
+        Args:
+            pattern: Blob prefix ending in "/" or glob such as
+                "inventory/*.csv"
+            max_workers: Maximum number of shards processed at once
+            chunksize: Maximum number of rows parsed at a time per shard
+            columns: Columns to parse, defaults to all; must include
+                SQLSoftware
 
-        if sql_vms.empty:
-            logging.warning("No SQL Server installations found")
-            return func.HttpResponse(
-                "No SQL Server installations found in inventory",
-                status_code=200,
-            )
+        Returns:
+            pandas DataFrame of VMs with SQL Server installed
+        """
+        shards = self.list_inventory_blobs(pattern)
+        if not shards:
+            raise ValueError(f"No inventory blobs match {pattern}")
+        logging.info(
+            f"Loading {len(shards)} inventory shards matching {pattern} "
+            f"with up to {max_workers} workers..."
+        )
 
-        # Retrieve password from Key Vault (MANDATORY)
-        if not config.get("keyvault_url"):
-            logging.error("KEY_VAULT_URL not configured")
-            return func.HttpResponse(
-                "Configuration error: KEY_VAULT_URL is required",
-                status_code=500,
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(
+                executor.map(
+                    lambda shard: self._stream_sql_vms(
+                        shard, chunksize, columns
+                    ),
+                    shards,
+                )
             )
 
-        logging.info("Retrieving password from Key Vault...")
-        secret_client = SecretClient(
-            vault_url=config["keyvault_url"], credential=credential
+        total = sum(count for count, _ in results)
+        self.data = concat(
+            [matches for _, matches in results], ignore_index=True
         )
-        password_secret = secret_client.get_secret("postprocess-secret")
-        password = password_secret.value
-        logging.info("Password retrieved successfully")
-
-        # Export to Excel with optional password protection
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_file = f"sql_servers_report_{timestamp}.xlsx"
-        vm_filter.export_to_excel(sql_vms, output_file, password)
 
         logging.info(
-            f"Successfully created report with {len(sql_vms)} "
-            f"SQL Server VMs"
+            f"Loaded {total} total VMs from {len(shards)} shards, found "
+            f"{len(self.data)} VMs with Microsoft SQL Server installed."
         )
+        return self.data
 
-        return func.HttpResponse(
-            f"Report generated successfully: {output_file}\n"
-            f"Total SQL Server VMs: {len(sql_vms)}\n"
-            f"File is password-protected using Key Vault secret",
-            status_code=200,
+    def list_inventory_blobs(self, pattern):
+        """
+        List the pre-process blobs matching a prefix or glob, sorted by
+        name.
+        """
+        return [blob.name for blob in self._list_inventory_blobs(pattern)]
+
+    def _list_inventory_blobs(self, pattern):
+        prefix = re.split(r"[*?\[]", pattern, maxsplit=1)[0]
+        service_client = self._get_preprocess_service_client()
+        blobs = service_client.get_container_client(
+            self.config["preprocess_container"]
+        ).list_blobs(name_starts_with=prefix)
+        if not pattern.endswith("/"):
+            blobs = (blob for blob in blobs if fnmatchcase(blob.name, pattern))
+        return sorted(blobs, key=lambda blob: blob.name)
+
+    def _stream_sql_vms(
+        self, input_path, chunksize, columns=None, compression=None
+    ):
+        """
+        Stream one blob and return its row count and SQL Server rows.
+        """
+        import pandas as pd
+
+        preprocess_blob_client = self._get_preprocess_blob_client(input_path)
+        # Download, parse and filter overlap, so they are one stage here
+        with self.metrics.stage("stream", blob=input_path) as stage:
+            downloader = preprocess_blob_client.download_blob()
+            reader = _BlobChunkReader(downloader.chunks())
+
+            total = 0
+            matches = []
+            for chunk in pd.read_csv(
+                BufferedReader(reader),
+                chunksize=chunksize,
+                compression=compression,
+                **csv_options(columns),
+            ):
+                total += len(chunk)
+                matches.append(
+                    prune_categories(chunk[self._sql_server_mask(chunk)])
+                )
+
+            # Only the matching rows are retained in streaming mode
+            matches = concat(matches)
+            stage.update(
+                bytes=reader.bytes_read, rows_in=total, rows_out=len(matches)
+            )
+        return total, matches
+
+    def _preprocess_account_url(self):
+        return (
+            f"https://{self.config['preprocess_account']}"
+            f".blob.core.windows.net"
         )
 
-    except KeyError as e:
-        logging.error(f"Missing configuration: {str(e)}")
-        return func.HttpResponse(
-            f"Configuration error: Missing {str(e)}", status_code=500
+    def _get_preprocess_service_client(self):
+        """
+        Return the BlobServiceClient for the pre-process storage account.
+        """
+        return get_blob_service_client(
+            self._preprocess_account_url(),
+            self.config.get("managed_identity_client_id"),
+            self.credential,
         )
-    except Exception as e:
-        logging.error(
-            f"Error processing SQL Server report: {str(e)}", exc_info=True
+
+    def _get_preprocess_blob_client(self, input_path):
+        """
+        Create a blob client for a blob in the pre-process container.
+        """
+        return self._get_preprocess_service_client().get_blob_client(
+            container=self.config["preprocess_container"], blob=input_path
         )
-        return func.HttpResponse(f"Error: {str(e)}", status_code=500)
+
+    def _preprocess_key(self):
+        return (
+            self.config["preprocess_account"],
+            self.config["preprocess_container"],
+        )
+
+    def _read_inventory_csv(self, input_path, source_etag, columns=None):
+        """
+        Download and parse an inventory blob at a known ETag.
+        """
+        csv_data = self._download_csv(
+            self._get_preprocess_blob_client(input_path),
+            etag=source_etag,
+            match_condition=MatchConditions.IfNotModified,
+        )
+        return self._parse_csv(csv_data, columns)
+
+    def _read_raw_software(self, input_path, source_etag):
+        """
+        Read the RawSoftware column of an inventory blob, with its list
+        column when the Parquet cache is enabled.
+        """
+        if self.config.get("parquet_cache"):
+            return self._load_cached_data(
+                self._get_preprocess_blob_client(input_path),
+                input_path,
+                ["RawSoftware"],
+                False,
+                ["RawSoftware"],
+            )
+        return self._read_inventory_csv(
+            input_path, source_etag, ["RawSoftware"]
+        )
+
+    @cached_property
+    def software_indexes(self):
+        """
+        SoftwareIndexStore of the pre-process container.
+        """
+        from .software_index import SoftwareIndexStore
+
+        return SoftwareIndexStore(
+            self._get_preprocess_blob_client,
+            self._read_raw_software,
+            self._preprocess_key(),
+            self.metrics,
+        )
+
+    @cached_property
+    def queries(self):
+        """
+        InventoryQueries over the pre-process container.
+        """
+        from .query import InventoryQueries
+
+        return InventoryQueries(
+            self._get_preprocess_blob_client,
+            self._read_inventory_csv,
+            self._preprocess_key(),
+            self.software_indexes,
+            self.metrics,
+        )
+
+    def get_source_fingerprint(self, input_path):
+        """
+        Identify the current version of the input with one metadata call.
+
+        Args:
+            input_path: Blob name of the input CSV file, or a shard prefix
+                or glob
+
+        Returns:
+            Dictionary with the blob's ETag and base64 content MD5, or with
+            the name and ETag of every shard
+        """
+        if is_blob_pattern(input_path):
+            return {
+                "shards": [
+                    [blob.name, blob.etag]
+                    for blob in self._list_inventory_blobs(input_path)
+                ]
+            }
+
+        properties = self._get_preprocess_blob_client(
+            input_path
+        ).get_blob_properties()
+        content_md5 = properties.content_settings.content_md5
+        return {
+            "etag": properties.etag,
+            "content_md5": (
+                base64.b64encode(content_md5).decode() if content_md5 else None
+            ),
+        }
+
+    def _postprocess_key(self):
+        return (
+            self.config["postprocess_account"],
+            self.config["postprocess_container"],
+        )
+
+    @cached_property
+    def report_manifests(self):
+        """
+        ReportManifestStore of the post-process container.
+        """
+        from .manifest import ReportManifestStore
+
+        return ReportManifestStore(
+            self._get_postprocess_blob_client, self._postprocess_key()
+        )
+
+    @cached_property
+    def snapshots(self):
+        """
+        SnapshotStore of the post-process container, for change reports.
+        """
+        from .delta import SnapshotStore
+
+        return SnapshotStore(self._get_postprocess_blob_client, self.metrics)
+
+    @cached_property
+    def history(self):
+        """
+        HistoryStore of the post-process container.
+        """
+        from .history import HistoryStore
+
+        return HistoryStore(
+            self._get_postprocess_blob_client,
+            self._get_postprocess_container_client(),
+            self.metrics,
+        )
+
+    def _get_postprocess_service_client(self):
+        """
+        Return the BlobServiceClient for the post-process storage account.
+        """
+        postprocess_blob_url = f"https://{self.config['postprocess_account']}.blob.core.windows.net"
+        return get_blob_service_client(
+            postprocess_blob_url,
+            self.config.get("managed_identity_client_id"),
+            self.credential,
+        )
+
+    def _get_postprocess_container_client(self):
+        """
+        Create a client for the post-process container.
+        """
+        return self._get_postprocess_service_client().get_container_client(
+            self.config["postprocess_container"]
+        )
+
+    def _get_postprocess_blob_client(self, output_path):
+        """
+        Create a blob client for a blob in the post-process container.
+        """
+        return self._get_postprocess_service_client().get_blob_client(
+            container=self.config["postprocess_container"], blob=output_path
+        )
+
+    def filter_sql_vms(self, data):
+        """
+        Return rows where SQLSoftware contains 'Microsoft SQL Server'.
+        """
+        logging.info("Filtering VMs for Microsoft SQL Server...")
+
+        with self.metrics.stage("filter", rows_in=len(data)) as stage:
+            # Boolean indexing already returns a new DataFrame
+            result = prune_categories(data[self._sql_server_mask(data)])
+            stage["rows_out"] = len(result)
+
+        logging.info(
+            f"Found {len(result)} VMs with Microsoft SQL Server installed."
+        )
+        return result
+
+    @staticmethod
+    def _sql_server_mask(data):
+        """
+        Boolean mask of rows whose SQLSoftware mentions Microsoft SQL Server.
+        """
+        from .detection import sql_server_mask
+
+        return sql_server_mask(data["SQLSoftware"])
+
+    def classify_sql_versions(self, data):
+        """
+        Add the SQL Server release, major version, edition and patch status
+        of each VM.
+
+        Args:
+            data: VM pandas DataFrame
+
+        Returns:
+            Copy of ``data`` with SQLServerVersion, SQLServerMajorVersion,
+            SQLServerEdition and SQLServerStatus columns
+        """
+        from .versions import (
+            DEFAULT_VERSION_STATUS,
+            load_version_status,
+            sql_server_versions,
+        )
+
+        logging.info("Classifying SQL Server versions...")
+
+        version_status = self.config.get("sql_version_status")
+        with self.metrics.stage("classify_versions", rows_in=len(data)):
+            versions = sql_server_versions(
+                data,
+                (
+                    load_version_status(version_status)
+                    if version_status
+                    else DEFAULT_VERSION_STATUS
+                ),
+            )
+
+        # Assigned by position, the index may repeat labels
+        return data.assign(
+            **{name: column.array for name, column in versions.items()}
+        )
+
+    def tag_products(self, data):
+        """
+        Tag each VM with the configured products found in RawSoftware.
+
+        All products are found in a single scan per distinct RawSoftware
+        value, however many patterns are configured. The report tags its
+        SQL Server VMs here; find_product_hosts finds the other hosts.
+
+        Args:
+            data: VM pandas DataFrame
+
+        Returns:
+            Copy of ``data`` with a MatchedProducts column listing the
+            matched products, separated by "; "
+        """
+        from .products import (
+            MATCHED_PRODUCTS_COLUMN,
+            PRODUCT_SEPARATOR,
+            ProductMatcher,
+        )
+
+        logging.info("Matching configured products in RawSoftware...")
+
+        matcher = ProductMatcher(self.config["product_patterns"])
+        with self.metrics.stage("match_products", rows_in=len(data)) as stage:
+            matched = matcher.match_series(
+                data["RawSoftware"],
+                data.get(SOFTWARE_LIST_COLUMNS["RawSoftware"]),
+            )
+            stage["rows_out"] = int(matched.astype(bool).sum())
+
+        logging.info(f"Found configured products on {stage['rows_out']} VMs.")
+        return data.assign(
+            **{MATCHED_PRODUCTS_COLUMN: matched.str.join(PRODUCT_SEPARATOR)}
+        )
+
+    def find_product_hosts(
+        self, input_path, columns=None, max_workers=DEFAULT_MAX_WORKERS
+    ):
+        """
+        Find the VMs without SQL Server that have a configured product.
+
+        The whole inventory is scanned, from the Parquet cache when it is
+        enabled. Shards of a blob pattern are scanned concurrently and
+        merged in blob name order.
+
+        Args:
+            input_path: Blob name of the input CSV file, or a blob prefix
+                or glob
+            columns: Columns to load, defaults to all; must include
+                SQLSoftware and RawSoftware
+            max_workers: Maximum number of shards scanned at once
+
+        Returns:
+            pandas DataFrame of the matching VMs with a MatchedProducts
+            column, see tag_products
+        """
+        from .products import ProductMatcher
+
+        matcher = ProductMatcher(self.config["product_patterns"])
+        if not is_blob_pattern(input_path):
+            hosts = self._find_product_hosts(input_path, columns, matcher)
+        else:
+            shards = self.list_inventory_blobs(input_path)
+            if not shards:
+                raise ValueError(f"No inventory blobs match {input_path}")
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                hosts = concat(
+                    list(
+                        executor.map(
+                            lambda shard: self._find_product_hosts(
+                                shard, columns, matcher
+                            ),
+                            shards,
+                        )
+                    ),
+                    ignore_index=True,
+                )
+
+        logging.info(
+            f"Found configured products on {len(hosts)} VMs without "
+            f"Microsoft SQL Server."
+        )
+        return hosts
+
+    def _find_product_hosts(self, input_path, columns, matcher):
+        """
+        Scan one inventory blob for VMs without SQL Server that have a
+        configured product.
+        """
+        from .products import MATCHED_PRODUCTS_COLUMN, PRODUCT_SEPARATOR
+
+        blob_client = self._get_preprocess_blob_client(input_path)
+        if self.config.get("parquet_cache"):
+            data = self._load_cached_data(
+                blob_client, input_path, columns, False, ["RawSoftware"]
+            )
+        else:
+            data = self._parse_csv(self._download_csv(blob_client), columns)
+
+        with self.metrics.stage(
+            "match_products", rows_in=len(data), blob=input_path
+        ) as stage:
+            data = data[~self._sql_server_mask(data)]
+            matched = matcher.match_series(
+                data["RawSoftware"],
+                data.get(SOFTWARE_LIST_COLUMNS["RawSoftware"]),
+            )
+            found = matched.astype(bool).to_numpy()
+            hosts = prune_categories(data[found]).assign(
+                **{
+                    MATCHED_PRODUCTS_COLUMN: matched[found]
+                    .str.join(PRODUCT_SEPARATOR)
+                    .array
+                }
+            )
+            stage["rows_out"] = len(hosts)
+        return hosts
+
+    def export_to_excel(self, data, output_path, password, summaries=True):
+        """
+        Export filtered data to password-protected Excel file and upload to
+        blob storage.
+
+        Args:
+            data: Filtered VM pandas DataFrame
+            output_path: Blob name to save the Excel file
+            password: Password to protect the Excel file (REQUIRED)
+            summaries: Whether to add the summary sheets
+
+        Raises:
+            StalePasswordError: If the password is missing
+        """
+        logging.info(f"Exporting {len(data)} VMs to Excel...")
+
+        protected_file, length = self.render_protected_report(
+            data, password, summaries
+        )
+        self._upload_report(protected_file, length, output_path)
+
+    def export_data(self, data, output_path, password, data_format):
+        """
+        Export filtered data as an encrypted CSV, gzip CSV or Parquet file
+        and upload it to blob storage.
+
+        Args:
+            data: Filtered VM pandas DataFrame
+            output_path: Blob name to save the file
+            password: Password to encrypt the file with (REQUIRED)
+            data_format: One of DATA_FORMATS
+
+        Raises:
+            StalePasswordError: If the password is missing
+        """
+        logging.info(f"Exporting {len(data)} VMs as {data_format}...")
+
+        protected_file, length = self.render_protected_data(
+            data, password, data_format
+        )
+        self._upload_report(protected_file, length, output_path)
+
+    def _upload_report(self, protected_file, length, output_path):
+        """
+        Upload a rendered report to post-process storage and close it.
+
+        Reports larger than one block are staged in parallel blocks, see
+        the upload module; smaller ones are uploaded in one request.
+        """
+        block_bytes = self.config.get(
+            "upload_block_bytes", DEFAULT_UPLOAD_BLOCK_BYTES
+        )
+        with protected_file:
+            # Upload to post-process storage, streamed from the spool
+            logging.info(
+                f"Uploading password-protected file to {output_path}..."
+            )
+            postprocess_blob_client = self._get_postprocess_blob_client(
+                output_path
+            )
+
+            with self.metrics.stage("upload") as stage:
+                if length > block_bytes:
+                    from .upload import upload_blocks
+
+                    stage.update(
+                        upload_blocks(
+                            postprocess_blob_client,
+                            protected_file,
+                            length,
+                            block_bytes,
+                            self.config.get(
+                                "upload_concurrency",
+                                DEFAULT_UPLOAD_CONCURRENCY,
+                            ),
+                        )
+                    )
+                else:
+                    postprocess_blob_client.upload_blob(
+                        protected_file, length=length, overwrite=True
+                    )
+                stage["bytes"] = length
+
+        logging.info(f"Successfully uploaded {output_path}")
+
+    def render_protected_data(self, data, password, data_format):
+        """
+        Write the report in a machine-readable format, encrypted as it is
+        written, to a spooled file.
+
+        Args:
+            data: Filtered VM pandas DataFrame
+            password: Password to encrypt the file with (REQUIRED)
+            data_format: One of DATA_FORMATS
+
+        Returns:
+            Tuple of the encrypted file, positioned at its start, and its
+            length in bytes. The caller closes the file.
+
+        Raises:
+            StalePasswordError: If the password is missing
+        """
+        from .data_export import write_data
+        from .encryption import EncryptingWriter
+
+        if not password:
+            raise StalePasswordError("Report password is empty")
+
+        spool_max_bytes = self.config.get(
+            "spool_max_bytes", DEFAULT_SPOOL_MAX_BYTES
+        )
+        protected_file = SpooledTemporaryFile(max_size=spool_max_bytes)
+        try:
+            # Rendering and encryption overlap, so they are one stage here
+            with self.metrics.stage(
+                "render", rows_in=len(data), format=data_format
+            ) as stage:
+                with EncryptingWriter(protected_file, password) as writer:
+                    write_data(data, writer, data_format)
+                stage["bytes"] = protected_file.tell()
+        except BaseException:
+            protected_file.close()
+            raise
+
+        length = protected_file.tell()
+        protected_file.seek(0)
+        return protected_file, length
+
+    def render_protected_report(self, data, password, summaries=True):
+        """
+        Render the password-protected Excel report to a spooled file.
+
+        Args:
+            data: Filtered VM pandas DataFrame
+            password: Password to protect the Excel file (REQUIRED)
+            summaries: Whether to add the summary sheets, which count the
+                hosts by account, platform and SQL Server release
+
+        Returns:
+            Tuple of the encrypted file, positioned at its start, and its
+            length in bytes. The caller closes the file.
+
+        Raises:
+            StalePasswordError: If the password is missing
+        """
+        from .excel import write_workbook
+        from .summary import summarize
+
+        if not password:
+            raise StalePasswordError("Report password is empty")
+
+        # Reports spill from memory to a temporary file above this size
+        spool_max_bytes = self.config.get(
+            "spool_max_bytes", DEFAULT_SPOOL_MAX_BYTES
+        )
+
+        # Host counts for the summary sheets, from one pass over the report
+        if summaries:
+            with self.metrics.stage("summarize", rows_in=len(data)) as stage:
+                summaries = summarize(data)
+                stage["sheets"] = len(summaries)
+        else:
+            summaries = ()
+
+        # Create Excel file with formatting, streamed in write-only mode.
+        # AccountID is written as text to prevent scientific notation.
+        with SpooledTemporaryFile(max_size=spool_max_bytes) as excel_file:
+            with self.metrics.stage("render", rows_in=len(data)) as stage:
+                write_workbook(
+                    data,
+                    excel_file,
+                    text_columns=("AccountID",),
+                    summaries=summaries,
+                )
+                stage["bytes"] = excel_file.tell()
+            excel_file.seek(0)
+
+            # Apply password protection
+            logging.info("Applying password protection to Excel file...")
+            protected_file = SpooledTemporaryFile(max_size=spool_max_bytes)
+            with self.metrics.stage("encrypt") as stage:
+                office_file = _lazy("OfficeFile")(excel_file)
+                office_file.load_key(password=password)
+                office_file.encrypt(password, protected_file)
+                stage["bytes"] = protected_file.tell()
+            logging.info("Password protection applied successfully")
+
+        length = protected_file.tell()
+        protected_file.seek(0)
+        return protected_file, length
+
+
+def _unchanged_report_response(manifest):
+    """
+    Build the response for a run whose inputs match the last report.
+    """
+    if manifest["report"] is None:
+        return func.HttpResponse(
+            "No SQL Server installations found in inventory",
+            status_code=200,
+        )
+    return func.HttpResponse(
+        f"Report unchanged: {manifest['report']}\n"
+        f"Total SQL Server VMs: {manifest['row_count']}\n"
+        f"Inventory and password have not changed since it was generated",
+        status_code=200,
+    )
+
+
+def load_config():
+    """
+    Read the function configuration from environment variables.
+
+    Raises:
+        KeyError: If a required setting is missing
+    """
+    config = {
+        "preprocess_account": os.environ["PREPROCESS_STORAGE_ACCOUNT"],
+        "preprocess_container": os.environ["PREPROCESS_CONTAINER"],
+        "postprocess_account": os.environ["POSTPROCESS_STORAGE_ACCOUNT"],
+        "postprocess_container": os.environ["POSTPROCESS_CONTAINER"],
+        "keyvault_url": os.environ.get("KEY_VAULT_URL"),
+        "managed_identity_client_id": os.environ["MANAGED_IDENTITY_CLIENT_ID"],
+        # Inventory blob, or a prefix/glob of inventory shards
+        "input_blob": os.environ.get("INVENTORY_BLOB", "vm_inventory.csv"),
+        "max_workers": int(
+            os.environ.get("INVENTORY_MAX_WORKERS", str(DEFAULT_MAX_WORKERS))
+        ),
+        # Stream the inventory in chunks of this many rows (0 disables)
+        "chunk_rows": int(os.environ.get("INVENTORY_CHUNK_ROWS", "0")),
+        # Parse the inventory in this many worker processes (0 or 1
+        # disables); not yet measured faster than the in-memory parse
+        "parse_processes": int(
+            os.environ.get("INVENTORY_PARSE_PROCESSES", "0")
+        ),
+        # Inventory columns in the report, all if unset; the others are
+        # only parsed when a report step needs them
+        "report_columns": parse_columns(os.environ.get("REPORT_COLUMNS", "")),
+        # Choose the in-memory, streaming or cached load for each run from
+        # the inventory's size and the worker's memory, instead of the mode
+        # configured above; the parallel load is only chosen when parse
+        # processes are configured
+        "load_planner": os.environ.get(
+            "INVENTORY_LOAD_PLANNER", "false"
+        ).lower()
+        == "true",
+        # Read the inventory through a Parquet cache in the pre-process
+        # container
+        "parquet_cache": os.environ.get(
+            "INVENTORY_PARQUET_CACHE", "false"
+        ).lower()
+        == "true",
+        # Return the last report when neither the inventory nor the
+        # password changed since it was produced
+        "reuse_unchanged_reports": os.environ.get(
+            "REUSE_UNCHANGED_REPORTS", "false"
+        ).lower()
+        == "true",
+        "secret_ttl_seconds": float(
+            os.environ.get(
+                "SECRET_CACHE_TTL_SECONDS", str(DEFAULT_SECRET_TTL_SECONDS)
+            )
+        ),
+        "secret_check_seconds": float(
+            os.environ.get(
+                "SECRET_VERSION_CHECK_SECONDS",
+                str(DEFAULT_SECRET_CHECK_SECONDS),
+            )
+        ),
+        "spool_max_bytes": int(
+            os.environ.get(
+                "REPORT_SPOOL_MAX_BYTES", str(DEFAULT_SPOOL_MAX_BYTES)
+            )
+        ),
+        "upload_block_bytes": int(
+            os.environ.get(
+                "REPORT_UPLOAD_BLOCK_BYTES", str(DEFAULT_UPLOAD_BLOCK_BYTES)
+            )
+        ),
+        "upload_concurrency": int(
+            os.environ.get(
+                "REPORT_UPLOAD_CONCURRENCY", str(DEFAULT_UPLOAD_CONCURRENCY)
+            )
+        ),
+        # Write a report of the VMs added, changed and removed since the
+        # previous run, alongside or instead of the full report
+        "delta_report": _delta_mode(os.environ.get("DELTA_REPORT", "")),
+        # Append every report's rows to a date-partitioned history in the
+        # post-process container
+        "snapshot_history": os.environ.get("SNAPSHOT_HISTORY", "false").lower()
+        == "true",
+        # Add SQL Server versions, editions and patch status to the report
+        "classify_sql_versions": os.environ.get(
+            "CLASSIFY_SQL_VERSIONS", "false"
+        ).lower()
+        == "true",
+    }
+
+    # Patch status per SQL Server release as JSON, applied over the
+    # defaults. The versions module builds on pandas, so the table is only
+    # parsed when the classify stage runs.
+    config["sql_version_status"] = (
+        os.environ.get("SQL_SERVER_VERSION_STATUS") or None
+        if config["classify_sql_versions"]
+        else None
+    )
+    # The products module builds on pandas, so it is only imported when
+    # products are configured
+    # Products to tag on the report's SQL Server VMs, as a JSON object of
+    # product name to patterns found in RawSoftware
+    config["product_patterns"] = None
+    if os.environ.get("PRODUCT_PATTERNS"):
+        from .products import load_product_patterns
+
+        config["product_patterns"] = load_product_patterns(
+            os.environ["PRODUCT_PATTERNS"]
+        )
+    return config
+
+
+def _report_columns(config):
+    """
+    Return the inventory columns kept in the report, or None for all.
+
+    Change reports and the history identify VMs by AccountID and VMName,
+    so those are kept whenever either is enabled.
+    """
+    report_columns = config.get("report_columns")
+    if report_columns is None:
+        return None
+    if config.get("delta_report") or config.get("snapshot_history"):
+        from .delta import KEY_COLUMNS
+
+        report_columns = (
+            *report_columns,
+            *(key for key in KEY_COLUMNS if key not in report_columns),
+        )
+    return report_columns
+
+
+def _load_columns(config):
+    """
+    Return the inventory columns a report run parses, or None for all.
+
+    SQLSoftware is always needed to find SQL Server hosts, PlatformDetails
+    to classify versions and RawSoftware to tag products.
+    """
+    report_columns = _report_columns(config)
+    if report_columns is None:
+        return None
+    needed = {*report_columns, "SQLSoftware"}
+    if config.get("classify_sql_versions"):
+        needed.add("PlatformDetails")
+    if config.get("product_patterns"):
+        needed.add("RawSoftware")
+    return [column for column in INVENTORY_COLUMNS if column in needed]
+
+
+def _delta_mode(value):
+    """
+    Parse the DELTA_REPORT setting.
+
+    Raises:
+        ValueError: If the value is not a known mode
+    """
+    value = value.strip().lower()
+    if value in ("", "off", "false"):
+        return None
+    from .delta import DELTA_MODES
+
+    if value not in DELTA_MODES:
+        raise ValueError(
+            f"DELTA_REPORT must be one of off, {', '.join(DELTA_MODES)}"
+        )
+    return value
+
+
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Main function to orchestrate the VM filtering process.
+
+    Pass ``metrics=header`` to receive the run's stage metrics in an
+    X-Stage-Metrics header, or ``metrics=json`` to receive the response
+    message and the metrics as a JSON document.
+
+    Pass ``report_format=csv``, ``csv.gz`` or ``parquet`` to write the
+    report as an encrypted data file instead of the default ``xlsx``
+    workbook.
+
+    Pass ``mode=query`` with filters to receive the matching VMs as JSON or
+    CSV instead of producing the report; see the query module.
+    """
+    logging.info("SQL Server filter function triggered")
+
+    metrics = StageMetrics()
+    try:
+        query = _read_query(req)
+    except QueryError as e:
+        return func.HttpResponse(f"Invalid query: {str(e)}", status_code=400)
+    if query is not None:
+        response = _run(metrics, "querying inventory", _run_query, query)
+    else:
+        report_format = _report_format(req)
+        if report_format is None:
+            return func.HttpResponse(
+                "Invalid report format, expected one of "
+                f"{', '.join(REPORT_FORMATS)}",
+                status_code=400,
+            )
+        response = _run(
+            metrics,
+            "processing SQL Server report",
+            _run_report,
+            report_format,
+        )
+    return _finish_run(response, metrics, req)
+
+
+def _finish_run(response, metrics, req):
+    """
+    Log a run's metrics and attach them to its response if requested.
+    """
+    summary = metrics.summary()
+    logging.info(
+        f"Report run finished in {summary['total_seconds']:.3f} s",
+        extra={
+            "custom_dimensions": {
+                "total_seconds": summary["total_seconds"],
+                "peak_rss_bytes": summary["peak_rss_bytes"],
+                "status_code": response.status_code,
+                "stage_count": len(summary["stages"]),
+            }
+        },
+    )
+    return _with_metrics(response, summary, _metrics_format(req))
+
+
+def _read_query(req):
+    """
+    Return the query a request asks for, or None for a report run.
+    """
+    params = getattr(req, "params", None)
+    body = req.get_body() if hasattr(req, "get_body") else None
+    return read_query(
+        params if isinstance(params, Mapping) else {},
+        body if isinstance(body, (bytes, str)) else None,
+    )
+
+
+def _report_format(req):
+    """
+    Return the report format a request asks for, or None if it is unknown.
+    """
+    params = getattr(req, "params", None)
+    value = (
+        params.get("report_format") if isinstance(params, Mapping) else None
+    )
+    if value is None:
+        return DEFAULT_REPORT_FORMAT
+    if not isinstance(value, str):
+        return None
+    value = value.strip().lower()
+    return value if value in REPORT_FORMATS else None
+
+
+def _metrics_format(req):
+    """
+    Return how the caller asked to receive the run's metrics, if at all.
+    """
+    params = getattr(req, "params", None)
+    value = params.get("metrics") if isinstance(params, Mapping) else None
+    if not isinstance(value, str):
+        return None
+    value = value.strip().lower()
+    return value if value in METRICS_FORMATS else None
+
+
+def _with_metrics(response, summary, metrics_format):
+    """
+    Attach the run's metrics to a response in the requested format.
+    """
+    if metrics_format == "header":
+        response.headers[METRICS_HEADER] = json.dumps(
+            summary, separators=(",", ":")
+        )
+    elif metrics_format == "json":
+        return func.HttpResponse(
+            json.dumps(
+                {"message": response.get_body().decode(), "metrics": summary}
+            ),
+            status_code=response.status_code,
+            mimetype="application/json",
+        )
+    return response
+
+
+def _export(
+    vm_filter, data, output_file, password, report_format, summaries=True
+):
+    if report_format == DEFAULT_REPORT_FORMAT:
+        vm_filter.export_to_excel(
+            data, output_file, password, summaries=summaries
+        )
+    else:
+        vm_filter.export_data(data, output_file, password, report_format)
+
+
+def _configured_plan(config):
+    """
+    Return the load plan selected by the fixed load settings.
+    """
+    if config["chunk_rows"] > 0:
+        strategy = STREAM
+    elif config["parquet_cache"]:
+        strategy = CACHE
+    elif config["parse_processes"] > 1:
+        strategy = PARALLEL
+    else:
+        strategy = MEMORY
+    return {
+        "strategy": strategy,
+        "compression": None,
+        "processes": config["parse_processes"],
+    }
+
+
+def _load_sql_vms(vm_filter, input_file, columns, config):
+    """
+    Load the SQL Server VMs of one inventory blob with the planned or
+    configured strategy.
+    """
+    if config["load_planner"]:
+        plan = vm_filter.plan_load(input_file)
+    else:
+        plan = _configured_plan(config)
+
+    if plan["strategy"] == STREAM:
+        return vm_filter.load_sql_vms(
+            input_file,
+            config["chunk_rows"] or DEFAULT_CHUNK_ROWS,
+            columns,
+            **(
+                {"compression": plan["compression"]}
+                if plan["compression"]
+                else {}
+            ),
+        )
+    if plan["strategy"] == CACHE:
+        # Row groups without SQL Server are skipped in the cache
+        return vm_filter.load_data(input_file, columns, sql_server_only=True)
+    if plan["strategy"] == PARALLEL:
+        return vm_filter.load_sql_vms_parallel(
+            input_file, plan["processes"], columns
+        )
+    data = vm_filter.load_data(input_file, columns)
+    return vm_filter.filter_sql_vms(data)
+
+
+def _run(metrics, action, work, *args):
+    """
+    Run a request with the configuration and the managed identity
+    credential, turning failures into error responses.
+
+    Args:
+        metrics: StageMetrics of the run
+        action: What the run does, for the error log
+        work: Callable taking the configuration, the credential, ``metrics``
+            and ``args`` and returning the HttpResponse
+    """
+    try:
+        # Get configuration from environment variables
+        config = load_config()
+
+        # Authenticate using managed identity, reusing the credential from
+        # earlier invocations of this worker
+        with metrics.stage("credential") as stage:
+            hits = _clients.hits
+            credential = get_credential(config["managed_identity_client_id"])
+            stage["reused"] = _clients.hits > hits
+
+        return work(config, credential, metrics, *args)
+
+    except ClientAuthenticationError as e:
+        # Rebuild credentials and clients on the next invocation
+        reset_clients()
+        logging.error(f"Authentication failed: {str(e)}", exc_info=True)
+        return func.HttpResponse(
+            f"Authentication error: {str(e)}", status_code=500
+        )
+    except KeyError as e:
+        logging.error(f"Missing configuration: {str(e)}")
+        return func.HttpResponse(
+            f"Configuration error: Missing {str(e)}", status_code=500
+        )
+    except Exception as e:
+        logging.error(f"Error {action}: {str(e)}", exc_info=True)
+        return func.HttpResponse(f"Error: {str(e)}", status_code=500)
+
+
+def _run_query(config, credential, metrics, query):
+    """
+    Answer a query from the inventory kept in worker memory.
+    """
+    from .query import render_result
+
+    vm_filter = VMFilter(credential, config, metrics)
+    if is_blob_pattern(config["input_blob"]):
+        return func.HttpResponse(
+            "Queries require a single inventory blob", status_code=400
+        )
+    matches = vm_filter.queries.run(config["input_blob"], query)
+
+    with metrics.stage("serialize", rows_in=len(matches)) as stage:
+        body, mimetype = render_result(matches, query["format"])
+        stage["bytes"] = len(body)
+    logging.info(f"Query matched {len(matches)} VMs")
+    return func.HttpResponse(body, status_code=200, mimetype=mimetype)
+
+
+def _run_report(config, credential, metrics, report_format):
+    """
+    Produce the report in ``report_format``, recording each step in
+    ``metrics``.
+    """
+    # Initialize VM filter
+    vm_filter = VMFilter(credential, config, metrics)
+
+    input_file = config["input_blob"]
+
+    # Skip the whole run when the inventory and the password are the
+    # same as for the last report
+    fingerprint = None
+    if config["reuse_unchanged_reports"] and config.get("keyvault_url"):
+        with metrics.stage("secret"):
+            password_secret = get_report_secret(
+                get_secret_client(
+                    config["keyvault_url"],
+                    config["managed_identity_client_id"],
+                    credential,
+                ),
+                config["keyvault_url"],
+                config["secret_ttl_seconds"],
+                check_interval=config["secret_check_seconds"],
+            )
+        with metrics.stage("fingerprint"):
+            fingerprint = dict(
+                vm_filter.get_source_fingerprint(input_file),
+                secret_version=password_secret.properties.version,
+            )
+            # Changed patterns or version statuses change the report's
+            # contents
+            if config["product_patterns"]:
+                fingerprint["product_patterns"] = config["product_patterns"]
+            if config["classify_sql_versions"]:
+                fingerprint["sql_version_status"] = config[
+                    "sql_version_status"
+                ]
+            if config["delta_report"]:
+                fingerprint["delta_report"] = config["delta_report"]
+            if report_format != DEFAULT_REPORT_FORMAT:
+                fingerprint["report_format"] = report_format
+            if config["report_columns"]:
+                fingerprint["report_columns"] = list(config["report_columns"])
+            manifest = vm_filter.report_manifests.read()
+        # The report may have been deleted since the manifest was written
+        if (
+            manifest is not None
+            and manifest["fingerprint"] == fingerprint
+            and (
+                manifest["report"] is None
+                or vm_filter.report_manifests.report_exists(manifest["report"])
+            )
+        ):
+            logging.info("Inventory and password unchanged")
+            return _unchanged_report_response(manifest)
+
+    # Load data from pre-process storage and filter VMs with SQL Server
+    columns = _load_columns(config)
+    if is_blob_pattern(input_file):
+        sql_vms = vm_filter.load_sharded_sql_vms(
+            input_file,
+            config["max_workers"],
+            config["chunk_rows"] or DEFAULT_CHUNK_ROWS,
+            columns,
+        )
+    else:
+        sql_vms = _load_sql_vms(vm_filter, input_file, columns, config)
+
+    # Configured products are also reported on hosts without SQL Server
+    product_hosts = None
+    if config.get("product_patterns"):
+        product_hosts = project(
+            vm_filter.find_product_hosts(
+                input_file, columns, config["max_workers"]
+            ),
+            _report_columns(config),
+        )
+
+    # A delta run still reports the hosts that were removed
+    if (
+        sql_vms.empty
+        and not config["delta_report"]
+        and (product_hosts is None or product_hosts.empty)
+    ):
+        logging.warning("No SQL Server installations found")
+        if fingerprint is not None:
+            vm_filter.report_manifests.write(
+                {
+                    "fingerprint": fingerprint,
+                    "report": None,
+                    "row_count": 0,
+                }
+            )
+        return func.HttpResponse(
+            "No SQL Server installations found in inventory",
+            status_code=200,
+        )
+
+    if config.get("classify_sql_versions"):
+        sql_vms = vm_filter.classify_sql_versions(sql_vms)
+    if config.get("product_patterns"):
+        sql_vms = vm_filter.tag_products(sql_vms)
+    sql_vms = project(sql_vms, _report_columns(config))
+
+    # Retrieve password from Key Vault (MANDATORY)
+    if not config.get("keyvault_url"):
+        logging.error("KEY_VAULT_URL not configured")
+        return func.HttpResponse(
+            "Configuration error: KEY_VAULT_URL is required",
+            status_code=500,
+        )
+
+    logging.info("Retrieving password from Key Vault...")
+    secret_client = get_secret_client(
+        config["keyvault_url"],
+        config["managed_identity_client_id"],
+        credential,
+    )
+    with metrics.stage("secret"):
+        password_secret = get_report_secret(
+            secret_client,
+            config["keyvault_url"],
+            config["secret_ttl_seconds"],
+            check_interval=config["secret_check_seconds"],
+        )
+    logging.info("Password retrieved successfully")
+
+    # Export to Excel with optional password protection
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    message = []
+    output_file = None
+    if not sql_vms.empty and config["delta_report"] != "instead":
+        output_file = (
+            f"sql_servers_report_{timestamp}"
+            f"{report_extension(report_format)}"
+        )
+        _export(
+            vm_filter,
+            sql_vms,
+            output_file,
+            password_secret.value,
+            report_format,
+        )
+        message.append(f"Report generated successfully: {output_file}")
+
+    if product_hosts is not None and not product_hosts.empty:
+        product_file = (
+            f"sql_servers_products_{timestamp}"
+            f"{report_extension(report_format)}"
+        )
+        # The summary sheets count SQL Server releases, which these
+        # hosts do not have
+        _export(
+            vm_filter,
+            product_hosts,
+            product_file,
+            password_secret.value,
+            report_format,
+            summaries=False,
+        )
+        message.append(
+            f"Product report generated successfully: {product_file}"
+        )
+        output_file = output_file or product_file
+
+    if config["delta_report"]:
+        from .delta import count_changes
+
+        changes, snapshot = vm_filter.snapshots.compare(sql_vms)
+        change_file = (
+            f"sql_servers_changes_{timestamp}"
+            f"{report_extension(report_format)}"
+        )
+        # Hosts counted by account, platform and release would mix
+        # added, changed and removed hosts, so a change report has no
+        # summary sheets
+        _export(
+            vm_filter,
+            changes,
+            change_file,
+            password_secret.value,
+            report_format,
+            summaries=False,
+        )
+        # Only move the snapshot on once its changes are reported
+        vm_filter.snapshots.write(snapshot)
+        counts = count_changes(changes)
+        message.append(f"Change report generated successfully: {change_file}")
+        message.append(
+            f"Changes: {counts['added']} added, "
+            f"{counts['changed']} changed, {counts['removed']} removed"
+        )
+        output_file = output_file or change_file
+
+    run_time = None
+    if config["snapshot_history"] and not sql_vms.empty:
+        run_time = datetime.now(timezone.utc)
+        vm_filter.history.append(sql_vms, run_time)
+
+    if fingerprint is not None:
+        vm_filter.report_manifests.write(
+            {
+                "fingerprint": fingerprint,
+                "report": output_file,
+                "row_count": len(sql_vms),
+            }
+        )
+
+    if run_time is not None:
+        # Compaction only tidies the history up, so a failure leaves
+        # the daily files to the next run instead of failing this one
+        try:
+            vm_filter.history.compact(run_time.date())
+        except Exception as e:
+            logging.warning(
+                f"History compaction failed: {str(e)}", exc_info=True
+            )
+
+    logging.info(
+        f"Successfully created report with {len(sql_vms)} " f"SQL Server VMs"
+    )
+
+    message.append(f"Total SQL Server VMs: {len(sql_vms)}")
+    message.append("File is password-protected using Key Vault secret")
+    return func.HttpResponse("\n".join(message), status_code=200)
@@ -0,0 +1,397 @@
+"""
+Async execution path for the SQL Server filter function.
+
+Built on the azure.storage.blob.aio and azure.keyvault.secrets.aio SDKs so
+the Key Vault password lookup overlaps with the inventory download and
+parse. Parsing, filtering and rendering are CPU-bound and run in worker
+threads, off the event loop. HTTP responses match the synchronous main.
+
+The async path serves the default single-blob, in-memory pipeline. When
+streaming, sharded, multi-process, planned, Parquet cache, report reuse,
+delta report, history or product tagging modes are configured, or the
+request is an inventory query or asks for a data file report, the request
+is handed to the synchronous main in a worker thread. The Terraform deployment enables
+those modes, so it disables the async function rather than expose a second
+endpoint that would only wrap the first.
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+import azure.functions as func
+from azure.core.exceptions import ClientAuthenticationError
+from azure.identity.aio import ManagedIdentityCredential
+from azure.keyvault.secrets.aio import SecretClient
+from azure.storage.blob.aio import BlobServiceClient
+
+from . import (
+    DEFAULT_REPORT_FORMAT,
+    REPORT_SECRET_NAME,
+    QueryError,
+    StalePasswordError,
+    VMFilter,
+    _ClientRegistry,
+    _finish_run,
+    _latest_version,
+    _load_columns,
+    _read_query,
+    _report_columns,
+    _report_format,
+    _secret_expired,
+    _secrets,
+    is_blob_pattern,
+    load_config,
+)
+from . import main as sync_main
+from .instrumentation import StageMetrics
+from .schema import project
+
+# Async credentials and clients, pooled across invocations like the
+# synchronous ones so warm invocations keep their token cache and
+# connections. They belong to the worker's event loop, which runs every
+# invocation.
+_clients = _ClientRegistry()
+
+
+def get_credential(client_id):
+    """
+    Return the shared async managed identity credential for a client ID.
+    """
+    return _clients.get(
+        ("credential", client_id),
+        lambda: ManagedIdentityCredential(client_id=client_id),
+    )
+
+
+def get_blob_service_client(account_url, client_id, credential):
+    """
+    Return the shared async BlobServiceClient for a storage account.
+    """
+    return _clients.get(
+        ("blob", account_url, client_id),
+        lambda: BlobServiceClient(
+            account_url=account_url, credential=credential
+        ),
+        credential,
+    )
+
+
+def get_secret_client(vault_url, client_id, credential):
+    """
+    Return the shared async SecretClient for a Key Vault.
+    """
+    return _clients.get(
+        ("keyvault", vault_url, client_id),
+        lambda: SecretClient(vault_url=vault_url, credential=credential),
+        credential,
+    )
+
+
+async def reset_clients():
+    """
+    Close and discard all pooled async credentials and clients.
+    """
+    for client in _clients.clear():
+        await client.close()
+
+
+class AsyncVMFilter:
+    """
+    Async counterpart of VMFilter for the default pipeline.
+    """
+
+    def __init__(self, credential, config, metrics=None):
+        """
+        Initialize the AsyncVMFilter class.
+
+        Args:
+            credential: Async Azure managed identity credential
+            config: Configuration dictionary with storage and Key Vault info
+            metrics: StageMetrics recording each stage, a new one if omitted
+        """
+        self.credential = credential
+        self.config = config
+        self.data = None
+        self.metrics = metrics if metrics is not None else StageMetrics()
+        # CPU-bound stages are shared with the synchronous implementation
+        self._vm_filter = VMFilter(credential, config, self.metrics)
+
+    async def load_data(self, input_path, columns=None):
+        """
+        Load VM data from CSV file in Azure Blob Storage.
+
+        Args:
+            input_path: Blob name of the input CSV file
+            columns: Columns to parse, defaults to all
+
+        Returns:
+            Loaded pandas DataFrame
+        """
+        logging.info(f"Loading data from {input_path}...")
+
+        blob_client = self._service_client(
+            "preprocess_account"
+        ).get_blob_client(
+            container=self.config["preprocess_container"], blob=input_path
+        )
+        with self.metrics.stage("download") as stage:
+            downloader = await blob_client.download_blob()
+            csv_data = await downloader.readall()
+            stage["bytes"] = len(csv_data)
+
+        self.data = await asyncio.to_thread(
+            self._vm_filter._parse_csv, csv_data, columns
+        )
+
+        logging.info(f"Loaded {len(self.data)} total VMs")
+        return self.data
+
+    async def filter_sql_vms(self, data):
+        """
+        Return rows where SQLSoftware contains 'Microsoft SQL Server'.
+        """
+        return await asyncio.to_thread(self._vm_filter.filter_sql_vms, data)
+
+    async def classify_sql_versions(self, data):
+        """
+        Add the SQL Server release, major version, edition and patch status
+        of each VM.
+        """
+        return await asyncio.to_thread(
+            self._vm_filter.classify_sql_versions, data
+        )
+
+    async def export_to_excel(self, data, output_path, password):
+        """
+        Export filtered data to password-protected Excel file and upload to
+        blob storage.
+
+        Args:
+            data: Filtered VM pandas DataFrame
+            output_path: Blob name to save the Excel file
+            password: Password to protect the Excel file (REQUIRED)
+
+        Raises:
+            StalePasswordError: If the password is missing
+        """
+        logging.info(f"Exporting {len(data)} VMs to Excel...")
+
+        protected_file, length = await asyncio.to_thread(
+            self._vm_filter.render_protected_report, data, password
+        )
+        with protected_file:
+            logging.info(
+                f"Uploading password-protected file to {output_path}..."
+            )
+            blob_client = self._service_client(
+                "postprocess_account"
+            ).get_blob_client(
+                container=self.config["postprocess_container"],
+                blob=output_path,
+            )
+            with self.metrics.stage("upload") as stage:
+                await blob_client.upload_blob(
+                    protected_file, length=length, overwrite=True
+                )
+                stage["bytes"] = length
+
+        logging.info(f"Successfully uploaded {output_path}")
+
+    def _service_client(self, account_key):
+        return get_blob_service_client(
+            f"https://{self.config[account_key]}.blob.core.windows.net",
+            self.config.get("managed_identity_client_id"),
+            self.credential,
+        )
+
+
+async def get_report_secret(
+    secret_client, vault_url, ttl, force_refresh=False, check_interval=None
+):
+    """
+    Async counterpart of filter_sql_servers.get_report_secret, sharing its
+    in-process cache. An unusable password is fetched once more before it
+    is rejected.
+
+    Raises:
+        StalePasswordError: If Key Vault only has an expired or empty
+            password
+    """
+    key = (vault_url, REPORT_SECRET_NAME)
+    secret = None if force_refresh else _secrets.lookup(key, ttl)
+    if secret is not None and _secrets.needs_check(key, check_interval):
+        versions = [
+            properties
+            async for properties in (
+                secret_client.list_properties_of_secret_versions(
+                    REPORT_SECRET_NAME
+                )
+            )
+        ]
+        if _secrets.rotated(key, _latest_version(versions)):
+            secret = None
+    if secret is None:
+        secret = _secrets.store(
+            key, await secret_client.get_secret(REPORT_SECRET_NAME)
+        )
+    if not secret.value or _secret_expired(secret):
+        if not force_refresh:
+            return await get_report_secret(
+                secret_client, vault_url, ttl, force_refresh=True
+            )
+        raise StalePasswordError(
+            f"Key Vault secret {REPORT_SECRET_NAME} is expired or empty"
+        )
+    return secret
+
+
+def _uses_sync_only_request(req):
+    try:
+        if _read_query(req) is not None:
+            return True
+    except QueryError:
+        # The synchronous main reports the error
+        return True
+    return _report_format(req) != DEFAULT_REPORT_FORMAT
+
+
+def _uses_sync_only_mode(config):
+    return (
+        is_blob_pattern(config["input_blob"])
+        or config["chunk_rows"] > 0
+        or config["parse_processes"] > 1
+        or config["load_planner"]
+        or config["parquet_cache"]
+        or config["reuse_unchanged_reports"]
+        or config["delta_report"]
+        or config["snapshot_history"]
+        or config["product_patterns"]
+    )
+
+
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Async function to orchestrate the VM filtering process.
+    """
+    logging.info("SQL Server filter function triggered")
+
+    metrics = StageMetrics()
+    try:
+        config = load_config()
+        if _uses_sync_only_request(req) or _uses_sync_only_mode(config):
+            return await asyncio.to_thread(sync_main, req)
+
+        with metrics.stage("credential") as stage:
+            hits = _clients.hits
+            credential = get_credential(config["managed_identity_client_id"])
+            stage["reused"] = _clients.hits > hits
+        response = await _run(credential, config, metrics)
+
+    except ClientAuthenticationError as e:
+        await reset_clients()
+        logging.error(f"Authentication failed: {str(e)}", exc_info=True)
+        response = func.HttpResponse(
+            f"Authentication error: {str(e)}", status_code=500
+        )
+    except KeyError as e:
+        logging.error(f"Missing configuration: {str(e)}")
+        response = func.HttpResponse(
+            f"Configuration error: Missing {str(e)}", status_code=500
+        )
+    except Exception as e:
+        logging.error(
+            f"Error processing SQL Server report: {str(e)}", exc_info=True
+        )
+        response = func.HttpResponse(f"Error: {str(e)}", status_code=500)
+    return _finish_run(response, metrics, req)
+
+
+async def _timed_report_secret(metrics, *args, **kwargs):
+    with metrics.stage("secret"):
+        return await get_report_secret(*args, **kwargs)
+
+
+async def _run(credential, config, metrics):
+    """
+    Run the report pipeline, fetching the password while the inventory
+    downloads and parses.
+    """
+    vm_filter = AsyncVMFilter(credential, config, metrics)
+
+    secret_task = None
+    if config.get("keyvault_url"):
+        secret_client = get_secret_client(
+            config["keyvault_url"],
+            config["managed_identity_client_id"],
+            credential,
+        )
+        secret_task = asyncio.create_task(
+            _timed_report_secret(
+                metrics,
+                secret_client,
+                config["keyvault_url"],
+                config["secret_ttl_seconds"],
+                check_interval=config["secret_check_seconds"],
+            )
+        )
+
+    try:
+        data = await vm_filter.load_data(
+            config["input_blob"], _load_columns(config)
+        )
+        sql_vms = await vm_filter.filter_sql_vms(data)
+
+        if sql_vms.empty:
+            logging.warning("No SQL Server installations found")
+            return func.HttpResponse(
+                "No SQL Server installations found in inventory",
+                status_code=200,
+            )
+
+        if config.get("classify_sql_versions"):
+            sql_vms = await vm_filter.classify_sql_versions(sql_vms)
+        sql_vms = project(sql_vms, _report_columns(config))
+
+        # Retrieve password from Key Vault (MANDATORY)
+        if secret_task is None:
+            logging.error("KEY_VAULT_URL not configured")
+            return func.HttpResponse(
+                "Configuration error: KEY_VAULT_URL is required",
+                status_code=500,
+            )
+
+        password_secret = await secret_task
+        logging.info("Password retrieved successfully")
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_file = f"sql_servers_report_{timestamp}.xlsx"
+        await vm_filter.export_to_excel(
+            sql_vms, output_file, password_secret.value
+        )
+
+        logging.info(
+            f"Successfully created report with {len(sql_vms)} "
+            f"SQL Server VMs"
+        )
+
+        return func.HttpResponse(
+            f"Report generated successfully: {output_file}\n"
+            f"Total SQL Server VMs: {len(sql_vms)}\n"
+            f"File is password-protected using Key Vault secret",
+            status_code=200,
+        )
+    finally:
+        if secret_task is not None:
+            await _settle(secret_task)
+
+
+async def _settle(task):
+    """
+    Cancel a task that is no longer needed and consume its outcome, so an
+    unused password lookup neither leaks nor logs an unretrieved error.
+    """
+    task.cancel()
+    try:
+        await task
+    except (asyncio.CancelledError, Exception):
+        pass
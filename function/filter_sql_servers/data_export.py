@@ -0,0 +1,62 @@
+"""
+Machine-readable report formats.
+
+Next to the password-protected workbook, the report can be written as CSV,
+gzip-compressed CSV or Parquet. These skip the workbook rendering and Office
+encryption, and are encrypted as they are written with the scheme in the
+encryption module.
+"""
+
+import gzip
+
+# Report formats other than the workbook, with the extension of their blobs
+DATA_FORMATS = {
+    "csv": ".csv.enc",
+    "csv.gz": ".csv.gz.enc",
+    "parquet": ".parquet.enc",
+}
+
+DEFAULT_REPORT_FORMAT = "xlsx"
+REPORT_FORMATS = (DEFAULT_REPORT_FORMAT, *DATA_FORMATS)
+
+# zlib's default level; higher levels are much slower for little gain
+GZIP_LEVEL = 6
+
+
+def report_extension(report_format):
+    """
+    Return the blob name extension of a report format.
+    """
+    return DATA_FORMATS.get(report_format, f".{DEFAULT_REPORT_FORMAT}")
+
+
+def write_data(data, stream, data_format):
+    """
+    Write the report DataFrame in a machine-readable format.
+
+    AccountID is written as text, as in the workbook.
+
+    Args:
+        data: Report pandas DataFrame
+        stream: Writable binary file object
+        data_format: One of DATA_FORMATS
+    """
+    if "AccountID" in data.columns:
+        data = data.assign(AccountID=data["AccountID"].astype(str))
+    if data_format == "parquet":
+        # Only Parquet needs pyarrow, so the CSV formats never load it
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        pq.write_table(
+            pa.Table.from_pandas(data, preserve_index=False), stream
+        )
+    elif data_format == "csv.gz":
+        with gzip.GzipFile(
+            fileobj=stream, mode="wb", compresslevel=GZIP_LEVEL
+        ) as compressed:
+            data.to_csv(compressed, index=False)
+    elif data_format == "csv":
+        data.to_csv(stream, index=False)
+    else:
+        raise ValueError(f"Unknown data format: {data_format}")
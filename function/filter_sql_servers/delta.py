@@ -0,0 +1,184 @@
+"""
+Change reports between consecutive SQL Server reports.
+
+Each run keeps a compact snapshot of its report: one row per VM with the
+AccountID and VMName that identify it and a 64-bit hash of the whole report
+row. The next run joins its own snapshot to the previous one on the VM key
+to find added, removed and changed hosts without reading the old report.
+"""
+
+from io import BytesIO
+
+import pandas as pd
+from azure.core.exceptions import ResourceNotFoundError
+
+# Snapshot of the last report, kept next to it in the post-process container
+SNAPSHOT_NAME = "sql_servers_snapshot.parquet"
+
+KEY_COLUMNS = ["AccountID", "VMName"]
+ROW_HASH_COLUMN = "RowHash"
+CHANGE_COLUMN = "Change"
+
+DELTA_MODES = ("alongside", "instead")
+
+# Order of the change kinds in the change report
+CHANGES = ("added", "changed", "removed")
+
+
+def build_snapshot(data):
+    """
+    Fingerprint every VM of a report.
+
+    Keys are kept as text so snapshots compare across inventory dtypes. If a
+    key occurs more than once, its first row is used.
+
+    Args:
+        data: Report pandas DataFrame
+
+    Returns:
+        pandas DataFrame with the key columns and ROW_HASH_COLUMN, indexed
+        by the position of each VM's row in ``data``
+    """
+    snapshot = pd.DataFrame(
+        {column: data[column].astype(str).to_numpy() for column in KEY_COLUMNS}
+    )
+    snapshot[ROW_HASH_COLUMN] = pd.util.hash_pandas_object(
+        data, index=False
+    ).to_numpy()
+    return snapshot.drop_duplicates(KEY_COLUMNS)
+
+
+def change_report(data, current, previous):
+    """
+    Compare a report with the previous run's snapshot.
+
+    Args:
+        data: Report pandas DataFrame
+        current: Snapshot of ``data`` from build_snapshot
+        previous: Snapshot of the previous report, or None if there is none
+
+    Returns:
+        pandas DataFrame with CHANGE_COLUMN followed by the report columns.
+        Added and changed VMs carry their current row, removed VMs only
+        their key.
+    """
+    if previous is None:
+        previous = current.iloc[:0]
+    # Nullable hashes survive the outer join without a lossy cast to float
+    hashes = {ROW_HASH_COLUMN: "UInt64"}
+    merged = (
+        current.astype(hashes)
+        .reset_index(names="_position")
+        .merge(
+            previous.astype(hashes),
+            on=KEY_COLUMNS,
+            how="outer",
+            suffixes=("", "_previous"),
+            indicator=True,
+        )
+    )
+    in_both = merged["_merge"] == "both"
+    changed = in_both & (
+        merged[ROW_HASH_COLUMN] != merged[f"{ROW_HASH_COLUMN}_previous"]
+    )
+
+    parts = []
+    for change, selected in (
+        ("added", merged["_merge"] == "left_only"),
+        ("changed", changed),
+    ):
+        positions = merged.loc[selected, "_position"].astype(int)
+        rows = data.iloc[positions.sort_values().to_numpy()]
+        parts.append(rows.assign(**{CHANGE_COLUMN: change}))
+    removed = merged.loc[merged["_merge"] == "right_only", KEY_COLUMNS]
+    parts.append(removed.assign(**{CHANGE_COLUMN: "removed"}))
+
+    report = pd.concat(parts, ignore_index=True)
+    columns = [CHANGE_COLUMN] + [
+        column for column in data.columns if column != CHANGE_COLUMN
+    ]
+    return report[columns]
+
+
+def count_changes(report):
+    """
+    Return the number of VMs per kind of change.
+    """
+    counts = report[CHANGE_COLUMN].value_counts()
+    return {change: int(counts.get(change, 0)) for change in CHANGES}
+
+
+def save_snapshot(snapshot, stream):
+    """
+    Write a snapshot as Parquet, without its row positions.
+    """
+    snapshot.to_parquet(stream, index=False)
+
+
+def load_snapshot(content):
+    """
+    Read a snapshot written by save_snapshot.
+    """
+    return pd.read_parquet(BytesIO(content))
+
+
+class SnapshotStore:
+    """
+    Reads and writes the snapshot kept in the post-process container.
+    """
+
+    def __init__(self, blob_client, metrics):
+        """
+        Args:
+            blob_client: Callable returning the BlobClient of a blob in the
+                post-process container, by name
+            metrics: StageMetrics recording the reads and writes
+        """
+        self._blob_client = blob_client
+        self._metrics = metrics
+
+    def read(self):
+        """
+        Return the snapshot of the last report, or None if there is none.
+        """
+        with self._metrics.stage("snapshot_read") as stage:
+            try:
+                content = (
+                    self._blob_client(SNAPSHOT_NAME).download_blob().readall()
+                )
+            except ResourceNotFoundError:
+                return None
+            stage["bytes"] = len(content)
+            return load_snapshot(content)
+
+    def write(self, snapshot):
+        """
+        Replace the stored snapshot with the one of the current report.
+        """
+        with self._metrics.stage("snapshot_write") as stage:
+            snapshot_file = BytesIO()
+            save_snapshot(snapshot, snapshot_file)
+            stage["bytes"] = snapshot_file.tell()
+            snapshot_file.seek(0)
+            self._blob_client(SNAPSHOT_NAME).upload_blob(
+                snapshot_file, length=stage["bytes"], overwrite=True
+            )
+
+    def compare(self, data):
+        """
+        Find the VMs added, changed and removed since the last report.
+
+        Args:
+            data: Report pandas DataFrame
+
+        Returns:
+            Tuple of the change report DataFrame and the snapshot of
+            ``data``, to be stored with write once the change report is
+            written
+        """
+        previous = self.read()
+        with self._metrics.stage("delta", rows_in=len(data)) as stage:
+            snapshot = build_snapshot(data)
+            changes = change_report(data, snapshot, previous)
+            stage["rows_out"] = len(changes)
+        return changes, snapshot
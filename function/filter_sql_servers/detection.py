@@ -0,0 +1,119 @@
+"""
+SQL Server detection over the SQLSoftware column of the VM inventory.
+
+SQLSoftware values are usually Python-repr lists such as
+"['Microsoft SQL Server 2019 (64-bit)']", but JSON lists, real lists, empty
+lists and missing values also occur. The vectorized mask answers almost every
+value with column-wide string operations and only falls back to parsing for
+the rare values whose result could depend on how they parse.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import (
+    infer_dtype,
+    is_object_dtype,
+    is_string_dtype,
+)
+
+SQL_SERVER_MARKER = "Microsoft SQL Server"
+
+
+def contains_sql_server(val):
+    """
+    Return True if a single SQLSoftware value mentions Microsoft SQL Server.
+
+    This is the reference, per-value implementation. It is used for values
+    the vectorized mask cannot decide from the raw text.
+    """
+    # Handle None/NaN
+    if val is None or (isinstance(val, float) and pd.isna(val)):
+        return False
+
+    # Handle string representations of empty lists
+    if isinstance(val, str) and val.strip() in ("[]", ""):
+        return False
+
+    # If the column is already a list, check directly
+    if isinstance(val, list):
+        return any(SQL_SERVER_MARKER in s for s in val)
+
+    # Otherwise treat as a string
+    try:
+        parsed = json.loads(val)
+        return any(SQL_SERVER_MARKER in s for s in parsed)
+    except Exception:
+        # fallback: simple substring search
+        return SQL_SERVER_MARKER in str(val)
+
+
+def sql_server_mask(series):
+    """
+    Vectorized equivalent of ``series.apply(contains_sql_server)``.
+
+    Inventories repeat the same few SQLSoftware strings many times, so the
+    strings are factorized and each distinct value is decided once.
+
+    Args:
+        series: SQLSoftware pandas Series
+
+    Returns:
+        Boolean pandas Series aligned with ``series``
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Decide each category once and map the result back via the codes
+        categories = pd.Series(series.cat.categories)
+        category_mask = sql_server_mask(categories).to_numpy()
+        codes = series.cat.codes.to_numpy()
+        mask = (codes >= 0) & category_mask[codes]
+        return pd.Series(mask, index=series.index, name=series.name)
+
+    if not (is_object_dtype(series.dtype) or is_string_dtype(series.dtype)):
+        # Numbers, booleans and timestamps never contain the marker
+        return pd.Series(False, index=series.index, name=series.name)
+
+    values = series.to_numpy(dtype=object)
+    mask = np.zeros(len(values), dtype=bool)
+    if infer_dtype(series, skipna=True) in ("string", "empty"):
+        is_str = series.notna().to_numpy()
+    else:
+        is_str = np.fromiter(
+            (isinstance(val, str) for val in values), bool, len(values)
+        )
+        others = np.flatnonzero(~is_str & series.notna().to_numpy())
+        mask[others] = [contains_sql_server(val) for val in values[others]]
+
+    codes, uniques = pd.factorize(values[is_str])
+    unique_mask = _unique_strings_mask(pd.Series(uniques, dtype=object))
+    mask[is_str] = unique_mask[codes]
+    return pd.Series(mask, index=series.index, name=series.name)
+
+
+def _unique_strings_mask(strings):
+    """
+    Decide distinct string values, parsing only the ambiguous ones.
+    """
+    found = strings.str.contains(SQL_SERVER_MARKER, regex=False)
+    found = found.to_numpy(dtype=bool)
+    # Escape sequences can spell the marker in JSON without it appearing in
+    # the raw text, so any value with a backslash is parsed.
+    ambiguous = strings.str.contains("\\", regex=False).to_numpy(dtype=bool)
+
+    # A match is only decided by the text if the value is a flat list:
+    # json.loads then either fails (substring fallback) or yields string
+    # elements, one of which contains the match.
+    candidates = np.flatnonzero(found & ~ambiguous)
+    texts = strings.iloc[candidates]
+    flat_list = (
+        texts.str.lstrip().str.startswith("[")
+        & (texts.str.count(r"\[") == 1)
+        & ~texts.str.contains("{", regex=False)
+    )
+    ambiguous[candidates] = ~flat_list.to_numpy(dtype=bool)
+
+    mask = found & ~ambiguous
+    slow = np.flatnonzero(ambiguous)
+    mask[slow] = [contains_sql_server(val) for val in strings.iloc[slow]]
+    return mask
@@ -0,0 +1,151 @@
+"""
+Password-based streaming authenticated encryption for machine-readable
+reports.
+
+The file starts with a magic string and a 16-byte random salt. A 256-bit
+AES key is derived from the password and salt with PBKDF2-HMAC-SHA256. The
+data follows in chunks of CHUNK_BYTES, each encrypted with AES-GCM, with
+the header as associated data. A chunk's nonce is its index and a flag
+marking the last chunk. A changed, reordered or truncated file therefore
+fails to decrypt rather than yielding altered data. Data is encrypted as it
+is written, so the plaintext is never held in full.
+
+Consumers decrypt reports with decrypt_stream, or from the command line:
+
+    REPORT_PASSWORD=... python -m filter_sql_servers.encryption \\
+        report.csv.enc report.csv
+"""
+
+import os
+import sys
+from io import RawIOBase
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
+MAGIC = b"SQLRPT\x00\x01"
+SALT_BYTES = 16
+KEY_BYTES = 32
+TAG_BYTES = 16
+PBKDF2_ITERATIONS = 100000
+
+# Plaintext bytes per encrypted chunk
+CHUNK_BYTES = 64 * 1024
+
+
+def derive_key(password, salt, iterations=PBKDF2_ITERATIONS):
+    """
+    Derive the AES key from a password and salt.
+    """
+    return PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=KEY_BYTES,
+        salt=salt,
+        iterations=iterations,
+    ).derive(password.encode())
+
+
+def _nonce(index, last):
+    # 11-byte big-endian chunk index and the last-chunk flag
+    return index.to_bytes(11, "big") + (b"\x01" if last else b"\x00")
+
+
+class EncryptingWriter(RawIOBase):
+    """
+    Write-only file object encrypting everything written to it into
+    another file object.
+
+    Closing the writer writes the last chunk; the destination is left
+    open.
+    """
+
+    def __init__(self, destination, password):
+        """
+        Args:
+            destination: Writable binary file object receiving the
+                encrypted file
+            password: Password the file is encrypted with
+        """
+        salt = os.urandom(SALT_BYTES)
+        self._header = MAGIC + salt
+        self._cipher = AESGCM(derive_key(password, salt))
+        self._destination = destination
+        self._buffer = bytearray()
+        self._index = 0
+        self._position = 0
+        destination.write(self._header)
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def write(self, data):
+        self._buffer += data
+        # The last chunk is only known on close, so a full chunk is kept
+        # back until more data follows it
+        while len(self._buffer) > CHUNK_BYTES:
+            self._write_chunk(self._buffer[:CHUNK_BYTES], last=False)
+            del self._buffer[:CHUNK_BYTES]
+        self._position += len(data)
+        return len(data)
+
+    def _write_chunk(self, chunk, last):
+        self._destination.write(
+            self._cipher.encrypt(
+                _nonce(self._index, last), bytes(chunk), self._header
+            )
+        )
+        self._index += 1
+
+    def close(self):
+        if not self.closed:
+            self._write_chunk(self._buffer, last=True)
+            self._buffer = bytearray()
+        super().close()
+
+
+def decrypt_stream(source, destination, password):
+    """
+    Decrypt a file written by EncryptingWriter.
+
+    Args:
+        source: Readable binary file object positioned at the file start
+        destination: Writable binary file object receiving the plaintext;
+            on error it may hold the chunks verified before the error
+        password: Password the file was encrypted with
+
+    Raises:
+        ValueError: If the file is not in the expected format, the password
+            is wrong or the file was altered or truncated
+    """
+    header = source.read(len(MAGIC) + SALT_BYTES)
+    if len(header) != len(MAGIC) + SALT_BYTES or not header.startswith(MAGIC):
+        raise ValueError("Not an encrypted report")
+    cipher = AESGCM(derive_key(password, header[len(MAGIC) :]))
+    index = 0
+    chunk = source.read(CHUNK_BYTES + TAG_BYTES)
+    while True:
+        following = source.read(CHUNK_BYTES + TAG_BYTES)
+        try:
+            destination.write(
+                cipher.decrypt(
+                    _nonce(index, last=not following), chunk, header
+                )
+            )
+        except InvalidTag:
+            raise ValueError(
+                "Wrong password, or the report was altered or truncated"
+            ) from None
+        if not following:
+            return
+        chunk = following
+        index += 1
+
+
+if __name__ == "__main__":  # pragma: no cover - command line entry point
+    with open(sys.argv[1], "rb") as source, open(sys.argv[2], "wb") as out:
+        decrypt_stream(source, out, os.environ["REPORT_PASSWORD"])
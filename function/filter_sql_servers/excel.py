@@ -0,0 +1,108 @@
+"""
+Streaming Excel rendering for the SQL Server report.
+
+The workbook is written with openpyxl in write-only mode: rows are appended
+in batches straight from the DataFrame and never held as cell objects, and
+column widths are computed up front from vectorized string lengths.
+"""
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill
+from openpyxl.utils import get_column_letter
+
+SHEET_NAME = "SQL Servers"
+
+# Widest column width in characters
+MAX_COLUMN_WIDTH = 50
+
+# Rows converted to Python values per batch while streaming the sheet
+ROW_BATCH_SIZE = 10000
+
+
+def column_widths(data):
+    """
+    Compute Excel column widths from the header and cell string lengths.
+
+    Args:
+        data: pandas DataFrame to be written
+
+    Returns:
+        List of widths, one per column, capped at MAX_COLUMN_WIDTH
+    """
+    widths = []
+    for name in data.columns:
+        column = data[name]
+        lengths = column.astype(str).str.len().where(column.notna(), 0)
+        max_length = len(str(name))
+        if not lengths.empty:
+            max_length = max(max_length, int(lengths.max()))
+        widths.append(min(max_length + 2, MAX_COLUMN_WIDTH))
+    return widths
+
+
+def write_sheet(workbook, data, title, text_columns=()):
+    """
+    Append a formatted sheet with the DataFrame's rows to a write-only
+    workbook.
+
+    Args:
+        workbook: openpyxl Workbook created with write_only=True
+        data: pandas DataFrame to write
+        title: Sheet name
+        text_columns: Columns written as text rather than numbers
+    """
+    worksheet = workbook.create_sheet(title=title)
+
+    # Column widths must be set before any row is written
+    for index, width in enumerate(column_widths(data), start=1):
+        worksheet.column_dimensions[get_column_letter(index)].width = width
+
+    # Header formatting
+    header_fill = PatternFill(
+        start_color="0066CC", end_color="0066CC", fill_type="solid"
+    )
+    header_font = Font(bold=True, color="FFFFFF")
+
+    header = []
+    for name in data.columns:
+        cell = WriteOnlyCell(worksheet, value=str(name))
+        cell.fill = header_fill
+        cell.font = header_font
+        header.append(cell)
+    worksheet.append(header)
+
+    for start in range(0, len(data), ROW_BATCH_SIZE):
+        batch = data.iloc[start : start + ROW_BATCH_SIZE]
+        # Missing values are written as empty cells. Columns are converted
+        # per batch so the caller's DataFrame is never copied as a whole.
+        columns = [
+            (
+                batch[name].astype(str)
+                if name in text_columns
+                else batch[name]
+                .astype(object)
+                .where(batch[name].notna(), None)
+            )
+            for name in batch.columns
+        ]
+        for row in zip(*(column.tolist() for column in columns)):
+            worksheet.append(row)
+
+
+def write_workbook(data, stream, text_columns=(), summaries=()):
+    """
+    Write the report DataFrame as a formatted .xlsx workbook.
+
+    Args:
+        data: Filtered VM pandas DataFrame
+        stream: Writable binary file object receiving the workbook
+        text_columns: Columns written as text rather than numbers
+        summaries: (sheet title, pandas DataFrame) tuples written as
+            further sheets after the report
+    """
+    workbook = Workbook(write_only=True)
+    write_sheet(workbook, data, SHEET_NAME, text_columns)
+    for title, summary in summaries:
+        write_sheet(workbook, summary, title, text_columns)
+    workbook.save(stream)
@@ -0,0 +1,375 @@
+"""
+Date-partitioned history of SQL Server reports.
+
+Every report run appends its rows, stamped with the run time, as a small
+Parquet file in the partition of its day:
+
+    history/date=2026-10-17/run-083000123456.parquet
+
+Compaction merges the daily partitions of each finished month into one file
+with a row group per run, so a trend query over months of history lists a
+handful of blobs:
+
+    history/month=2026-09/history.parquet
+
+Readers select the partitions overlapping the requested dates from the blob
+names, read only the columns they ask for, and skip the row groups of a
+month file that fall outside the requested dates.
+"""
+
+import logging
+import re
+from datetime import date, timedelta
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from azure.core.exceptions import ResourceNotFoundError
+
+from .inventory_cache import BlobRangeReader
+
+HISTORY_PREFIX = "history/"
+
+RUN_TIME_COLUMN = "RunTime"
+SNAPSHOT_DATE_COLUMN = "SnapshotDate"
+TIME_COLUMNS = (SNAPSHOT_DATE_COLUMN, RUN_TIME_COLUMN)
+
+_DAY_PARTITION = re.compile(r"date=(\d{4})-(\d{2})-(\d{2})/")
+_MONTH_PARTITION = re.compile(r"month=(\d{4})-(\d{2})/")
+
+
+def run_blob_name(run_time):
+    """
+    Return the name of the history blob of one report run.
+    """
+    return (
+        f"{HISTORY_PREFIX}date={run_time:%Y-%m-%d}/"
+        f"run-{run_time:%H%M%S%f}.parquet"
+    )
+
+
+def month_blob_name(month):
+    """
+    Return the name of the compacted history blob of a month.
+
+    Args:
+        month: Any date within the month
+    """
+    return f"{HISTORY_PREFIX}month={month:%Y-%m}/history.parquet"
+
+
+def partition_dates(blob_name):
+    """
+    Return the first and last day covered by a history blob, or None if the
+    name is not a history partition.
+    """
+    match = _DAY_PARTITION.search(blob_name)
+    if match:
+        day = date(*map(int, match.groups()))
+        return day, day
+    match = _MONTH_PARTITION.search(blob_name)
+    if match:
+        first = date(int(match.group(1)), int(match.group(2)), 1)
+        following = (first + timedelta(days=31)).replace(day=1)
+        return first, following - timedelta(days=1)
+    return None
+
+
+def select_partitions(blob_names, start=None, end=None):
+    """
+    Select the history blobs covering any day from ``start`` to ``end``.
+
+    Args:
+        blob_names: Names of the blobs under HISTORY_PREFIX
+        start: First day, or None for no lower bound
+        end: Last day, or None for no upper bound
+
+    Returns:
+        Sorted list of blob names
+    """
+    selected = []
+    for name in blob_names:
+        dates = partition_dates(name)
+        if dates is None:
+            continue
+        if start is not None and dates[1] < start:
+            continue
+        if end is not None and dates[0] > end:
+            continue
+        selected.append(name)
+    return sorted(selected)
+
+
+def compaction_groups(blob_names, today):
+    """
+    Group the daily partitions of months before ``today``'s month.
+
+    Returns:
+        Dictionary of month blob name to the sorted daily blob names it
+        replaces
+    """
+    first_of_month = today.replace(day=1)
+    groups = {}
+    for name in sorted(blob_names):
+        if not _DAY_PARTITION.search(name):
+            continue
+        day = partition_dates(name)[0]
+        if day < first_of_month:
+            groups.setdefault(month_blob_name(day), []).append(name)
+    return groups
+
+
+def history_table(data, run_time):
+    """
+    Build the history rows of one report run.
+
+    AccountID and categorical columns are stored as plain text so every
+    partition shares its types and runs can be merged.
+
+    Args:
+        data: Report pandas DataFrame
+        run_time: Timezone-aware time of the run
+    """
+    text = {column: object for column in data.select_dtypes("category")}
+    if "AccountID" in data.columns:
+        text["AccountID"] = str
+    table = pa.Table.from_pandas(data.astype(text), preserve_index=False)
+    rows = len(table)
+    return table.append_column(
+        pa.field(SNAPSHOT_DATE_COLUMN, pa.date32()),
+        pa.array([run_time.date()] * rows, pa.date32()),
+    ).append_column(
+        pa.field(RUN_TIME_COLUMN, pa.timestamp("us", tz="UTC")),
+        pa.array([run_time] * rows, pa.timestamp("us", tz="UTC")),
+    )
+
+
+def write_history(table, stream):
+    """
+    Write the history rows of one run as Parquet.
+    """
+    pq.write_table(table, stream)
+
+
+def load_history_table(source):
+    """
+    Read a whole history file as a pyarrow Table.
+    """
+    return pq.read_table(source)
+
+
+def write_compacted(tables, stream, existing=None):
+    """
+    Merge history tables into one Parquet file with a row group per run.
+
+    Columns missing from some runs are filled with nulls.
+
+    Args:
+        tables: pyarrow Tables of history rows
+        stream: Writable binary file object
+        existing: Previously compacted Table to merge into; its rows of
+            runs that are also in ``tables`` are replaced
+    """
+    if existing is not None:
+        runs = pa.chunked_array(
+            [table.column(RUN_TIME_COLUMN) for table in tables]
+        ).combine_chunks()
+        tables = [
+            *tables,
+            existing.filter(
+                pc.invert(pc.is_in(existing[RUN_TIME_COLUMN], value_set=runs))
+            ),
+        ]
+    table = pa.concat_tables(tables, promote_options="permissive")
+    table = table.sort_by(RUN_TIME_COLUMN)
+    run_times = table.column(RUN_TIME_COLUMN).to_numpy()
+    boundaries = np.concatenate(
+        (
+            [0],
+            np.flatnonzero(run_times[1:] != run_times[:-1]) + 1,
+            [len(table)],
+        )
+    )
+    with pq.ParquetWriter(stream, table.schema) as writer:
+        for start, stop in zip(boundaries[:-1], boundaries[1:]):
+            writer.write_table(table.slice(start, stop - start))
+
+
+def read_history(sources, columns=None, start=None, end=None):
+    """
+    Read history rows from the selected partitions.
+
+    Args:
+        sources: Seekable binary file objects of the history blobs
+        columns: Report columns to read, defaults to all; SnapshotDate and
+            RunTime are always included
+        start: First day to include, or None
+        end: Last day to include, or None
+
+    Returns:
+        pandas DataFrame sorted by run time
+    """
+    filters = []
+    if start is not None:
+        filters.append((SNAPSHOT_DATE_COLUMN, ">=", start))
+    if end is not None:
+        filters.append((SNAPSHOT_DATE_COLUMN, "<=", end))
+
+    frames = []
+    for source in sources:
+        names = pq.ParquetFile(source).schema_arrow.names
+        read_columns = None
+        if columns is not None:
+            read_columns = [
+                name for name in (*columns, *TIME_COLUMNS) if name in names
+            ]
+        frames.append(
+            pq.read_table(
+                source, columns=read_columns, filters=filters or None
+            ).to_pandas()
+        )
+
+    if not frames:
+        return pd.DataFrame(columns=[*(columns or ()), *TIME_COLUMNS])
+    data = pd.concat(frames, ignore_index=True)
+    if columns is not None:
+        data = data.reindex(columns=[*columns, *TIME_COLUMNS])
+    return data.sort_values(RUN_TIME_COLUMN, kind="stable").reset_index(
+        drop=True
+    )
+
+
+class HistoryStore:
+    """
+    Appends to, compacts and reads the history in the post-process
+    container.
+    """
+
+    def __init__(self, blob_client, container_client, metrics):
+        """
+        Args:
+            blob_client: Callable returning the BlobClient of a blob in the
+                post-process container, by name
+            container_client: ContainerClient of the post-process
+                container, used to list the history
+            metrics: StageMetrics recording the reads and writes
+        """
+        self._blob_client = blob_client
+        self._container_client = container_client
+        self._metrics = metrics
+
+    def append(self, data, run_time):
+        """
+        Append a report's rows to the history, in the partition of its day.
+
+        Args:
+            data: Report pandas DataFrame
+            run_time: Timezone-aware time of the run
+        """
+        blob_name = run_blob_name(run_time)
+        with self._metrics.stage("history_write", rows_in=len(data)) as stage:
+            history_file = BytesIO()
+            write_history(history_table(data, run_time), history_file)
+            stage["bytes"] = history_file.tell()
+            history_file.seek(0)
+            self._blob_client(blob_name).upload_blob(
+                history_file, length=stage["bytes"], overwrite=True
+            )
+        logging.info(f"Appended {len(data)} rows to history {blob_name}")
+
+    def compact(self, today):
+        """
+        Merge the daily history partitions of months before ``today``'s
+        month into one file per month.
+
+        A month file that already exists is merged too, and rows of runs
+        it already holds are replaced, so an interrupted compaction can be
+        run again. Daily files another run has already compacted and
+        deleted are skipped.
+        """
+        blobs = {blob.name: blob for blob in self._list()}
+        for month_blob, day_blobs in compaction_groups(blobs, today).items():
+            with self._metrics.stage(
+                "history_compact", partitions=len(day_blobs)
+            ) as stage:
+                tables = []
+                for name in day_blobs:
+                    try:
+                        tables.append(
+                            load_history_table(self._reader(blobs[name]))
+                        )
+                    except ResourceNotFoundError:
+                        # Deleted by a concurrent compaction, which has
+                        # stored its rows in the month file first
+                        logging.info(f"History file {name} already compacted")
+                if not tables:
+                    continue
+                # Read by name, as a concurrent compaction may have stored
+                # the month since the listing
+                month_client = self._blob_client(month_blob)
+                try:
+                    existing = load_history_table(
+                        BlobRangeReader(
+                            month_client,
+                            month_client.get_blob_properties().size,
+                        )
+                    )
+                except ResourceNotFoundError:
+                    existing = None
+                month_file = BytesIO()
+                write_compacted(tables, month_file, existing)
+                stage["bytes"] = month_file.tell()
+                month_file.seek(0)
+                month_client.upload_blob(
+                    month_file, length=stage["bytes"], overwrite=True
+                )
+                # The daily files are only removed once the month is stored
+                for name in day_blobs:
+                    try:
+                        self._blob_client(name).delete_blob()
+                    except ResourceNotFoundError:
+                        pass
+            logging.info(
+                f"Compacted {len(tables)} history files into {month_blob}"
+            )
+
+    def read(self, start=None, end=None, columns=None):
+        """
+        Read report history for trend queries.
+
+        Only the partitions overlapping the requested days are listed and
+        only the requested columns are downloaded.
+
+        Args:
+            start: First day to include, or None
+            end: Last day to include, or None
+            columns: Report columns to read, defaults to all; SnapshotDate
+                and RunTime are always included
+
+        Returns:
+            pandas DataFrame of history rows sorted by run time
+        """
+        blobs = {blob.name: blob for blob in self._list()}
+        names = select_partitions(blobs, start, end)
+        with self._metrics.stage(
+            "history_read", partitions=len(names)
+        ) as stage:
+            data = read_history(
+                [self._reader(blobs[name]) for name in names],
+                columns,
+                start,
+                end,
+            )
+            stage["rows_out"] = len(data)
+        return data
+
+    def _list(self):
+        return self._container_client.list_blobs(
+            name_starts_with=HISTORY_PREFIX
+        )
+
+    def _reader(self, blob):
+        return BlobRangeReader(self._blob_client(blob.name), blob.size)
@@ -0,0 +1,188 @@
+"""
+Per-stage instrumentation of a report run.
+
+Every stage records its wall time, the bytes it transferred or produced,
+the rows it consumed and returned, and the peak memory while it ran. Each
+record is logged with ``custom_dimensions`` so Application Insights can
+aggregate the stages of many runs, and the whole run can be returned to
+the caller.
+"""
+
+import itertools
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+# Linux files holding the process's memory high-water mark and resetting it
+STATUS_PATH = "/proc/self/status"
+CLEAR_REFS_PATH = "/proc/self/clear_refs"
+
+
+def _high_water_mark_bytes():
+    """
+    Return the process's VmHWM in bytes, or None where it cannot be read.
+    """
+    try:
+        with open(STATUS_PATH) as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    # Reported in kB
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_high_water_mark():
+    """
+    Reset VmHWM to the current resident set size, returning True on
+    success.
+    """
+    try:
+        with open(CLEAR_REFS_PATH, "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class _StagePeaks:
+    """
+    Peak resident set size of each running stage.
+
+    The kernel keeps a single high-water mark per process, which a stage
+    resets as it starts. Before each reset the mark reached so far is
+    folded into every stage still running, so nested and concurrent stages
+    each get the highest RSS seen during their own span.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = itertools.count()
+        self._running = {}
+        self.process_peak = 0
+
+    def _fold(self):
+        mark = _high_water_mark_bytes()
+        if mark is None:
+            return
+        self.process_peak = max(self.process_peak, mark)
+        for token, peak in self._running.items():
+            self._running[token] = max(peak, mark)
+
+    def start(self):
+        """
+        Start tracking a stage.
+
+        Returns:
+            Token to pass to finish, or None if the high-water mark cannot
+            be reset here
+        """
+        with self._lock:
+            self._fold()
+            if not _reset_high_water_mark():
+                return None
+            token = next(self._tokens)
+            self._running[token] = 0
+            return token
+
+    def finish(self, token):
+        """
+        Stop tracking a stage and return its peak RSS in bytes.
+        """
+        with self._lock:
+            self._fold()
+            return self._running.pop(token)
+
+
+_stage_peaks = _StagePeaks()
+
+
+def peak_rss_bytes():
+    """
+    Return the peak resident set size of the process in bytes, or None
+    where it cannot be measured.
+
+    The peak never decreases, so it is the high-water mark of the process
+    up to now.
+    """
+    if resource is None:  # pragma: no cover - not available on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    peak = peak if sys.platform == "darwin" else peak * 1024
+    # A reset high-water mark lowers ru_maxrss on Linux, so the marks seen
+    # before each reset are kept too
+    return max(peak, _stage_peaks.process_peak)
+
+
+class StageMetrics:
+    """
+    Collects the stage records of one run.
+
+    Records may be added from worker threads, e.g. one per inventory shard.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, rows_in=None, **dimensions):
+        """
+        Measure the enclosed block as one stage.
+
+        The block may fill in ``bytes`` and ``rows_out`` on the yielded
+        record. The record is kept and logged even if the block raises.
+
+        Args:
+            name: Stage name, e.g. "download"
+            rows_in: Number of rows the stage consumes
+            **dimensions: Extra dimensions such as the blob name
+        """
+        record = {
+            "stage": name,
+            "rows_in": rows_in,
+            "rows_out": None,
+            "bytes": None,
+            **dimensions,
+        }
+        token = _stage_peaks.start()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = round(time.perf_counter() - start, 6)
+            # Where the high-water mark cannot be reset, e.g. outside
+            # Linux, the process's peak so far stands in for the stage's
+            record["peak_rss_bytes"] = (
+                peak_rss_bytes()
+                if token is None
+                else _stage_peaks.finish(token)
+            )
+            with self._lock:
+                self.stages.append(record)
+            logging.info(
+                f"Stage {name} took {record['seconds'] * 1000:.1f} ms",
+                extra={"custom_dimensions": record},
+            )
+
+    def summary(self):
+        """
+        Return the run's total time, peak memory and stage records.
+        """
+        with self._lock:
+            stages = list(self.stages)
+        return {
+            "total_seconds": round(time.perf_counter() - self._start, 6),
+            "peak_rss_bytes": peak_rss_bytes(),
+            "stages": stages,
+        }
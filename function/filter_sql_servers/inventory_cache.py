@@ -0,0 +1,236 @@
+"""
+Columnar Parquet cache of the parsed VM inventory.
+
+The cache holds the inventory's original columns plus derived columns that
+are expensive to recompute from the CSV: the SQLSoftware and RawSoftware
+lists as real list columns, and a HasSQLServer flag. Readers select only
+the columns they need and skip row groups whose flag statistics show no SQL
+Server hosts.
+"""
+
+import ast
+from io import RawIOBase, SEEK_CUR, SEEK_END, SEEK_SET
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .detection import sql_server_mask
+from .schema import SOFTWARE_LIST_COLUMNS, prune_categories
+
+# Derived artefacts are stored under this prefix of the pre-process container
+CACHE_PREFIX = "cache/"
+
+# Blob metadata key recording the ETag of the CSV the cache was built from
+SOURCE_ETAG_KEY = "source_etag"
+
+SQL_SERVER_FLAG = "HasSQLServer"
+
+DERIVED_COLUMNS = (*SOFTWARE_LIST_COLUMNS.values(), SQL_SERVER_FLAG)
+
+# Rows per Parquet row group, the unit readers can skip
+ROW_GROUP_SIZE = 100000
+
+
+def cache_blob_name(input_path):
+    """
+    Return the name of the Parquet cache blob for an inventory blob.
+    """
+    return f"{CACHE_PREFIX}{input_path}.parquet"
+
+
+def parse_software_list(value):
+    """
+    Parse a stringified software list such as "['A', 'B']".
+
+    Returns:
+        List of strings, or None if the value is missing or not a list
+    """
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return None
+    if not isinstance(parsed, (list, tuple)):
+        return None
+    return [str(item) for item in parsed]
+
+
+def parse_software_lists(series):
+    """
+    Parse a column of stringified software lists, once per distinct value.
+
+    Args:
+        series: pandas Series of stringified lists
+
+    Returns:
+        pandas Series of lists aligned with ``series``
+    """
+    codes, _, parsed = distinct_software_lists(series)
+    parsed.append(None)  # code -1 marks missing values
+    return pd.Series(
+        [parsed[code] for code in codes], index=series.index, dtype=object
+    )
+
+
+def distinct_software_lists(series, lists=None):
+    """
+    Factorize a software column and return the list of each distinct value.
+
+    Args:
+        series: pandas Series of stringified lists
+        lists: The column's list column read from the cache, aligned with
+            ``series``; the lists are parsed from ``series`` if omitted
+
+    Returns:
+        Tuple of the codes and distinct values of ``series``, as from
+        pd.factorize, and the list of each distinct value, None where the
+        value is not a list
+    """
+    codes, uniques = pd.factorize(series)
+    if lists is None:
+        return codes, uniques, [parse_software_list(v) for v in uniques]
+
+    # Each distinct value's list is taken from its first row
+    rows = np.flatnonzero(codes >= 0)[::-1]
+    first = np.empty(len(uniques), dtype=np.intp)
+    first[codes[rows]] = rows
+    return (
+        codes,
+        uniques,
+        [
+            None if items is None else [str(item) for item in items]
+            for items in lists.to_numpy()[first]
+        ],
+    )
+
+
+def build_cache_table(data):
+    """
+    Build the Parquet cache table from a freshly parsed inventory.
+
+    Args:
+        data: Inventory pandas DataFrame as read from the CSV
+
+    Returns:
+        pyarrow Table with the original and derived columns
+    """
+    derived = {
+        list_column: parse_software_lists(data[column])
+        for column, list_column in SOFTWARE_LIST_COLUMNS.items()
+        if column in data.columns
+    }
+    if "SQLSoftware" in data.columns:
+        derived[SQL_SERVER_FLAG] = sql_server_mask(data["SQLSoftware"])
+    return pa.Table.from_pandas(data.assign(**derived), preserve_index=False)
+
+
+def write_cache(table, stream):
+    """
+    Write the cache table as Parquet.
+    """
+    pq.write_table(table, stream, row_group_size=ROW_GROUP_SIZE)
+
+
+def read_cache(source, columns=None, sql_server_only=False, lists=()):
+    """
+    Read the inventory from a Parquet cache.
+
+    Args:
+        source: Seekable binary file object with the cache contents
+        columns: Columns to read, defaults to the inventory's own columns
+        sql_server_only: Only return VMs with SQL Server installed; row
+            groups without any are not read at all
+        lists: Software columns whose list columns are also returned,
+            where the column is read and the cache has its list
+
+    Returns:
+        pandas DataFrame
+    """
+    parquet_file = pq.ParquetFile(source)
+    schema = parquet_file.schema_arrow
+    if columns is None:
+        columns = [
+            name for name in schema.names if name not in DERIVED_COLUMNS
+        ]
+    columns = list(columns) + [
+        SOFTWARE_LIST_COLUMNS[column]
+        for column in lists
+        if column in columns and SOFTWARE_LIST_COLUMNS[column] in schema.names
+    ]
+
+    row_groups = list(range(parquet_file.metadata.num_row_groups))
+    read_columns = list(columns)
+    if sql_server_only:
+        flag_index = schema.get_field_index(SQL_SERVER_FLAG)
+        row_groups = [
+            group
+            for group in row_groups
+            if _may_contain_sql_server(
+                parquet_file.metadata.row_group(group).column(flag_index)
+            )
+        ]
+        if SQL_SERVER_FLAG not in read_columns:
+            read_columns.append(SQL_SERVER_FLAG)
+
+    table = parquet_file.read_row_groups(row_groups, columns=read_columns)
+    data = table.to_pandas()
+    if sql_server_only:
+        data = prune_categories(
+            data[data[SQL_SERVER_FLAG]].reset_index(drop=True)
+        )
+    return data[columns]
+
+
+def _may_contain_sql_server(column_chunk):
+    statistics = column_chunk.statistics
+    if statistics is None or not statistics.has_min_max:
+        return True
+    return bool(statistics.max)
+
+
+class BlobRangeReader(RawIOBase):
+    """
+    Seekable, read-only file object over a blob using ranged downloads.
+
+    Parquet readers only fetch the footer and the column chunks they need,
+    so projected reads download a fraction of the blob.
+    """
+
+    def __init__(self, blob_client, size):
+        self._blob_client = blob_client
+        self._size = size
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=SEEK_SET):
+        if whence == SEEK_SET:
+            self._position = offset
+        elif whence == SEEK_CUR:
+            self._position += offset
+        elif whence == SEEK_END:
+            self._position = self._size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self._position
+
+    def readinto(self, buffer):
+        length = min(len(buffer), self._size - self._position)
+        if length <= 0:
+            return 0
+        data = self._blob_client.download_blob(
+            offset=self._position, length=length
+        ).readall()
+        buffer[: len(data)] = data
+        self._position += len(data)
+        return len(data)
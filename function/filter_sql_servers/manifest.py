@@ -0,0 +1,90 @@
+"""
+Manifest of the last report, used to skip runs whose inputs are unchanged.
+
+The manifest is a small JSON blob in the post-process container recording
+the fingerprint of the inputs the last report was built from, the report's
+blob name and its number of SQL Server VMs. A run whose fingerprint matches
+the manifest, and whose report still exists, returns the last report
+instead of producing a new one.
+"""
+
+import json
+
+from azure.core import MatchConditions
+from azure.core.exceptions import (
+    ResourceNotFoundError,
+    ResourceNotModifiedError,
+)
+
+# Blob in the post-process container describing the last report produced
+REPORT_MANIFEST_NAME = "sql_servers_report_manifest.json"
+
+# Last report manifest written or read and its ETag, per post-process
+# container, so repeat triggers on a warm worker only download it again
+# when it has changed
+_report_manifests = {}
+
+
+class ReportManifestStore:
+    """
+    Reads and writes the report manifest of one post-process container.
+    """
+
+    def __init__(self, blob_client, key):
+        """
+        Args:
+            blob_client: Callable returning the BlobClient of a blob in the
+                post-process container, by name
+            key: Identifies the container in the worker-memory cache
+        """
+        self._blob_client = blob_client
+        self._key = key
+
+    def read(self):
+        """
+        Return the manifest of the last report, or None if there is none.
+
+        The manifest is kept in worker memory with its ETag, and warm
+        invocations download it again only if the blob has changed.
+        """
+        cached = _report_manifests.get(self._key)
+        blob_client = self._blob_client(REPORT_MANIFEST_NAME)
+        try:
+            if cached is None:
+                downloader = blob_client.download_blob()
+            else:
+                downloader = blob_client.download_blob(
+                    etag=cached[0],
+                    match_condition=MatchConditions.IfModified,
+                )
+        except ResourceNotModifiedError:
+            return cached[1]
+        except ResourceNotFoundError:
+            _report_manifests.pop(self._key, None)
+            return None
+        manifest = json.loads(downloader.readall())
+        _report_manifests[self._key] = (downloader.properties.etag, manifest)
+        return manifest
+
+    def write(self, manifest):
+        """
+        Record the manifest of the report that was just produced.
+
+        Args:
+            manifest: Dictionary with the input fingerprint, the report
+                blob name and the number of SQL Server VMs
+        """
+        result = self._blob_client(REPORT_MANIFEST_NAME).upload_blob(
+            json.dumps(manifest), overwrite=True
+        )
+        _report_manifests[self._key] = (result["etag"], manifest)
+
+    def report_exists(self, output_path):
+        """
+        Return True if a report blob is still in the post-process container.
+        """
+        try:
+            self._blob_client(output_path).get_blob_properties()
+        except ResourceNotFoundError:
+            return False
+        return True
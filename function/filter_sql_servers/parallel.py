@@ -0,0 +1,392 @@
+"""
+Parallel parsing of one inventory CSV in worker processes.
+
+The blob is divided into nominal byte ranges after the CSV header, and each
+worker downloads its own range with a ranged read, so the parent never holds
+the inventory. A range owns the records that start inside it: the worker
+moves both ends of its range forward to the next record boundary, reading a
+little past its end to find the last one.
+
+A newline ends a record only outside quoted fields, that is where an even
+number of quote characters precedes it since the previous record boundary;
+an escaped quote ("") counts twice, so it never changes the parity. A worker
+starting in the middle of the file does not know the parity, so it tries
+both: the one whose following records have as many fields as the header is
+the boundary. The decision depends only on the bytes after the nominal
+offset, so neighbouring workers agree on it, and quoted RawSoftware values
+with embedded commas or newlines are never split.
+
+Each worker parses its records with the CSV header and filters them, and
+sends back its record count and its SQL Server rows, with the categories no
+kept row uses dropped. Results are merged in file order, so the output
+matches a single-threaded parse.
+
+Parsing in processes has not been measured faster than parsing in memory on
+the function's workers, so it is only used when configured.
+"""
+
+import csv
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO, StringIO
+from itertools import repeat
+
+import pandas as pd
+
+from .detection import sql_server_mask
+from .schema import concat, csv_options, prune_categories
+
+# Ranges smaller than this are not worth a round trip to a worker process
+MIN_RANGE_BYTES = 8 * 1024 * 1024
+
+# Bytes first searched for a record boundary, and read past the end of a
+# range to find where its last record ends
+BOUNDARY_WINDOW_BYTES = 64 * 1024
+
+# Longest record the boundary search allows for; the search window doubles
+# up to this size while the quote parity is undecided
+MAX_RECORD_BYTES = 1024 * 1024
+
+# Worker pools per size, kept across invocations so each worker imports
+# pandas and this package once per function host
+_process_pools = {}
+_process_pools_lock = threading.Lock()
+
+
+def get_process_pool(processes):
+    """
+    Return the shared pool of ``processes`` worker processes.
+
+    Workers are spawned rather than forked: the function host runs threads
+    that a fork would copy in the middle of their work.
+    """
+    with _process_pools_lock:
+        pool = _process_pools.get(processes)
+        if pool is None:
+            pool = ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _process_pools[processes] = pool
+        return pool
+
+
+def shutdown_process_pools():
+    """
+    Stop every shared worker pool.
+    """
+    with _process_pools_lock:
+        pools = list(_process_pools.values())
+        _process_pools.clear()
+    for pool in pools:
+        pool.shutdown()
+
+
+def download_range(source, offset, length):
+    """
+    Download part of an inventory blob.
+
+    Runs in the parent and in the worker processes, each with its own
+    pooled credential and client.
+
+    Args:
+        source: Tuple of (account URL, container, blob name, managed
+            identity client ID, ETag); every range is read from that version
+        offset: First byte to read
+        length: Number of bytes to read
+
+    Returns:
+        The bytes read
+    """
+    from azure.core import MatchConditions
+
+    from . import get_blob_service_client, get_credential
+
+    if length <= 0:
+        return b""
+    account_url, container, blob, client_id, etag = source
+    blob_client = get_blob_service_client(
+        account_url, client_id, get_credential(client_id)
+    ).get_blob_client(container=container, blob=blob)
+    return blob_client.download_blob(
+        offset=offset,
+        length=length,
+        etag=etag,
+        match_condition=MatchConditions.IfNotModified,
+    ).readall()
+
+
+def _next_record_end(data, position, quoted=False):
+    """
+    Return the position after the first record-ending newline at or after
+    ``position``, or None if there is none.
+
+    Args:
+        data: CSV bytes
+        position: Position to search from
+        quoted: Whether ``position`` lies inside a quoted field
+    """
+    while True:
+        newline = data.find(b"\n", position)
+        if newline == -1:
+            return None
+        quoted ^= data.count(b'"', position, newline) % 2 == 1
+        if not quoted:
+            return newline + 1
+        position = newline + 1
+
+
+def _field_count(header):
+    return len(next(csv.reader(StringIO(header.decode("utf-8", "replace")))))
+
+
+def _records_match(data, start, field_count, at_end):
+    """
+    Return True if the whole records of ``data`` from ``start`` have
+    ``field_count`` fields each, and there is at least one.
+
+    Args:
+        at_end: Whether ``data`` runs to the end of the blob, so its last
+            record is whole even without a newline
+    """
+    stop = start
+    while (end := _next_record_end(data, stop)) is not None:
+        stop = end
+    if at_end:
+        stop = len(data)
+    if stop == start:
+        # Only an empty remainder of the blob is known to hold no records
+        return at_end
+    text = data[start:stop].decode("utf-8", "replace")
+    try:
+        return all(
+            len(row) == field_count
+            for row in csv.reader(StringIO(text, newline=""), strict=True)
+        )
+    except csv.Error:
+        return False
+
+
+def _record_start(data, field_count, at_end, final):
+    """
+    Return the position of the first record starting after position 0 of
+    ``data``, or None if ``data`` is too short to tell.
+
+    Args:
+        data: CSV bytes from a nominal range boundary
+        field_count: Number of fields in the header
+        at_end: Whether ``data`` runs to the end of the blob
+        final: Whether to decide from ``data`` whatever it holds
+
+    Raises:
+        ValueError: If neither parity fits a final decision
+    """
+    candidates = []
+    for quoted in (False, True):
+        start = _next_record_end(data, 0, quoted)
+        if start is None:
+            # Under this parity the first record runs past the data
+            if not final:
+                return None
+            if at_end:
+                candidates.append(len(data))
+        elif _records_match(data, start, field_count, at_end):
+            candidates.append(start)
+        elif not final and _next_record_end(data, start) is None:
+            # No whole record to check yet
+            return None
+    if len(set(candidates)) == 1 or (candidates and final):
+        # The unquoted parity is taken if both still fit at the end
+        return candidates[0]
+    if final:
+        raise ValueError("Inventory records do not match the CSV header")
+    return None
+
+
+def find_record_start(read, offset, size, field_count):
+    """
+    Return the position of the first record starting after a nominal
+    range boundary.
+
+    The search window doubles while the quote parity is undecided, up to
+    MAX_RECORD_BYTES.
+
+    Args:
+        read: Function of (offset, length) returning bytes of the blob
+        offset: Nominal range boundary
+        size: Size of the blob in bytes
+        field_count: Number of fields in the header
+    """
+    window = BOUNDARY_WINDOW_BYTES
+    while True:
+        length = min(window, size - offset)
+        at_end = offset + length == size
+        start = _record_start(
+            read(offset, length),
+            field_count,
+            at_end,
+            at_end or window >= MAX_RECORD_BYTES,
+        )
+        if start is not None:
+            return offset + start
+        window *= 2
+
+
+def read_header(fetch, source, size):
+    """
+    Read the CSV header line of a blob.
+
+    Args:
+        fetch: Function of (source, offset, length) returning bytes, see
+            download_range
+        source: Blob to read, passed on to ``fetch``
+        size: Size of the blob in bytes
+    """
+    length = BOUNDARY_WINDOW_BYTES
+    while True:
+        data = fetch(source, 0, min(length, size))
+        end = _next_record_end(data, 0)
+        if end is not None:
+            return data[:end]
+        if length >= size:
+            return data
+        length *= 2
+
+
+def plan_ranges(header_bytes, size, parts, min_range_bytes=None):
+    """
+    Divide the records of a blob into nominal byte ranges.
+
+    Args:
+        header_bytes: Length of the CSV header line
+        size: Size of the blob in bytes
+        parts: Maximum number of ranges
+        min_range_bytes: Smallest range worth splitting off, MIN_RANGE_BYTES
+            if omitted
+
+    Returns:
+        List of (start, stop) offsets in file order; there is always at
+        least one range, possibly empty
+    """
+    if min_range_bytes is None:
+        min_range_bytes = MIN_RANGE_BYTES
+    # Ceiling division, so there are at most ``parts`` ranges
+    step = max(-(-(size - header_bytes) // parts), min_range_bytes, 1)
+    bounds = list(range(header_bytes, size, step)) + [size]
+    if len(bounds) == 1:
+        bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def parse_range(header, body, columns=None):
+    """
+    Parse one range of records and keep its SQL Server rows.
+
+    Args:
+        header: CSV header line
+        body: Whole records following the header
+        columns: Columns to parse, defaults to all; must include SQLSoftware
+
+    Returns:
+        Tuple of (number of records, pandas DataFrame of SQL Server rows
+        indexed by their position in the range)
+    """
+    data = pd.read_csv(BytesIO(header + body), **csv_options(columns))
+    return len(data), prune_categories(
+        data[sql_server_mask(data["SQLSoftware"])]
+    )
+
+
+def parse_blob_range(fetch, source, header, start, stop, size, columns=None):
+    """
+    Download, parse and filter the records starting in one nominal range.
+
+    Runs in a worker process.
+
+    Args:
+        fetch: Function of (source, offset, length) returning bytes, see
+            download_range
+        source: Blob to read, passed on to ``fetch``
+        header: CSV header line
+        start: Nominal start of the range; the first range starts right
+            after the header
+        stop: Nominal end of the range
+        size: Size of the blob in bytes
+        columns: Columns to parse, defaults to all; must include SQLSoftware
+
+    Returns:
+        See parse_range
+    """
+    field_count = _field_count(header)
+    data = fetch(
+        source, start, min(stop + BOUNDARY_WINDOW_BYTES, size) - start
+    )
+
+    def read(offset, length):
+        nonlocal data
+        missing = offset + length - start - len(data)
+        if missing > 0:
+            data += fetch(source, start + len(data), missing)
+        return data[offset - start : offset + length - start]
+
+    def boundary(offset):
+        # The records start right after the header and end with the blob
+        if offset in (len(header), size):
+            return offset
+        return find_record_start(read, offset, size, field_count)
+
+    begin, end = boundary(start), boundary(stop)
+    body = read(begin, end - begin) if end > begin else b""
+    del data
+    return parse_range(header, body, columns)
+
+
+def parse_sql_vms(fetch, source, size, processes, columns=None):
+    """
+    Parse and filter a CSV blob in worker processes.
+
+    Args:
+        fetch: Function of (source, offset, length) returning bytes, see
+            download_range; it must be picklable
+        source: Blob to read, passed on to ``fetch``; it must be picklable
+        size: Size of the blob in bytes
+        processes: Number of worker processes
+        columns: Columns to parse, defaults to all; must include SQLSoftware
+
+    Returns:
+        Tuple of (number of records, pandas DataFrame of SQL Server rows
+        indexed by their position in the CSV, number of ranges)
+    """
+    header = read_header(fetch, source, size)
+    ranges = plan_ranges(len(header), size, processes)
+    starts, stops = zip(*ranges)
+    pool = get_process_pool(processes)
+    try:
+        results = list(
+            pool.map(
+                parse_blob_range,
+                repeat(fetch),
+                repeat(source),
+                repeat(header),
+                starts,
+                stops,
+                repeat(size),
+                repeat(columns),
+            )
+        )
+    except BrokenProcessPool:
+        # A worker died, e.g. out of memory; start afresh next time
+        with _process_pools_lock:
+            if _process_pools.get(processes) is pool:
+                del _process_pools[processes]
+        raise
+
+    total = 0
+    matches = []
+    for rows, part in results:
+        part.index += total
+        matches.append(part)
+        total += rows
+    return total, concat(matches), len(ranges)
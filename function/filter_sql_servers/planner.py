@@ -0,0 +1,178 @@
+"""
+Choice of how a report run loads the inventory.
+
+The in-memory path is fastest for small inventories, but holds the whole
+download, the parsed frame and the filtered copy at once. Streaming keeps
+only a chunk and the matches, and parsing in worker processes uses every
+core at the cost of process start-up, with each worker downloading its own
+range. The
+planner compares the inventory blob's size, compression and Parquet cache
+with the memory and CPUs available to the worker and picks one.
+
+Parsing in worker processes has not been measured faster than parsing in
+memory, so it is only planned when worker processes are configured.
+"""
+
+import os
+
+MEMORY = "memory"
+STREAM = "stream"
+PARALLEL = "parallel"
+CACHE = "cache"
+STRATEGIES = (MEMORY, STREAM, PARALLEL, CACHE)
+
+# Inventories up to this size are parsed in memory: starting processes or
+# reading in chunks costs more than it saves
+SMALL_INPUT_BYTES = 16 * 1024 * 1024
+
+# Inventories from this size are worth parsing in worker processes
+PARALLEL_MIN_BYTES = 64 * 1024 * 1024
+
+# Peak memory per byte of CSV. In memory, the download, the parsed frame
+# and the filtered copy are alive together. In parallel, each worker holds
+# its downloaded range, a copy with the header and its parsed frame, and
+# the SQL Server rows are pickled back to the parent.
+IN_MEMORY_BYTES_PER_CSV_BYTE = 3
+PARALLEL_BYTES_PER_CSV_BYTE = 4
+
+# Share of the available memory a plan may use, leaving room for the
+# report rendering and the rest of the host
+MEMORY_BUDGET_FRACTION = 0.7
+
+# Memory assumed when the worker's limits cannot be read, that of a
+# Consumption plan instance
+ASSUMED_MEMORY_BYTES = 1536 * 1024 * 1024
+
+# Where the worker's limits are read from
+CGROUP_ROOT = "/sys/fs/cgroup"
+MEMINFO_PATH = "/proc/meminfo"
+
+
+def _read(path):
+    try:
+        with open(path) as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+def available_memory_bytes():
+    """
+    Return the memory the worker can still allocate, or None if unknown.
+
+    The smallest of the host's available memory and the room left under a
+    cgroup v2 or v1 memory limit.
+    """
+    candidates = []
+    meminfo = _read(MEMINFO_PATH)
+    if meminfo:
+        for line in meminfo.splitlines():
+            if line.startswith("MemAvailable:"):
+                # Reported in kB
+                candidates.append(int(line.split()[1]) * 1024)
+    for limit_name, usage_name in (
+        ("memory.max", "memory.current"),
+        ("memory/memory.limit_in_bytes", "memory/memory.usage_in_bytes"),
+    ):
+        limit = _read(os.path.join(CGROUP_ROOT, limit_name))
+        usage = _read(os.path.join(CGROUP_ROOT, usage_name))
+        # An unlimited v1 cgroup reports a huge number rather than "max"
+        if limit and limit.isdigit() and usage and usage.isdigit():
+            candidates.append(max(int(limit) - int(usage), 0))
+    return min(candidates) if candidates else None
+
+
+def available_cpus():
+    """
+    Return the number of CPUs the worker may use.
+
+    The CPUs it may be scheduled on, capped by a cgroup v2 CPU quota.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:  # pragma: no cover - not available on macOS or Windows
+        cpus = os.cpu_count() or 1
+    quota = _read(os.path.join(CGROUP_ROOT, "cpu.max"))
+    if quota:
+        limit, _, period = quota.partition(" ")
+        if limit.isdigit() and period.isdigit():
+            cpus = min(cpus, max(int(limit) // int(period), 1))
+    return cpus
+
+
+def input_compression(name, content_encoding=None):
+    """
+    Return "gzip" if an inventory blob is gzip-compressed, None otherwise.
+    """
+    if (content_encoding or "").lower() == "gzip" or name.endswith(".gz"):
+        return "gzip"
+    return None
+
+
+def plan_load(
+    size,
+    compression=None,
+    parquet_cache=False,
+    cache_fresh=False,
+    memory_bytes=None,
+    cpus=1,
+    processes=None,
+):
+    """
+    Choose how to load an inventory.
+
+    Args:
+        size: Size of the inventory blob in bytes
+        compression: Compression of the blob, see input_compression
+        parquet_cache: Whether the Parquet cache is enabled
+        cache_fresh: Whether the Parquet cache matches the blob
+        memory_bytes: Memory available to the worker, ASSUMED_MEMORY_BYTES
+            if None
+        cpus: CPUs available to the worker
+        processes: Worker processes configured to parse with; the parallel
+            strategy is only planned with more than one
+
+    Returns:
+        Dictionary with the strategy, one of STRATEGIES, the reason for it
+        and the inputs it was based on
+    """
+    if memory_bytes is None:
+        memory_bytes = ASSUMED_MEMORY_BYTES
+    budget = memory_bytes * MEMORY_BUDGET_FRACTION
+    processes = min(processes or 1, cpus)
+    fits_in_memory = size * IN_MEMORY_BYTES_PER_CSV_BYTE <= budget
+
+    if cache_fresh:
+        # Only the SQL Server row groups of the cache are read
+        strategy, reason = CACHE, "the Parquet cache is fresh"
+    elif compression is not None:
+        # A compressed stream cannot be split into ranges, and its size
+        # says little about the parsed size
+        strategy, reason = STREAM, f"the inventory is {compression}-compressed"
+    elif parquet_cache and fits_in_memory:
+        strategy, reason = CACHE, "the Parquet cache can be rebuilt in memory"
+    elif size <= SMALL_INPUT_BYTES:
+        strategy, reason = MEMORY, "the inventory is small"
+    elif (
+        processes > 1
+        and size >= PARALLEL_MIN_BYTES
+        and size * PARALLEL_BYTES_PER_CSV_BYTE <= budget
+    ):
+        strategy, reason = (
+            PARALLEL,
+            f"{processes} worker processes are configured",
+        )
+    elif fits_in_memory:
+        strategy, reason = MEMORY, "the inventory fits in memory"
+    else:
+        strategy, reason = STREAM, "the inventory does not fit in memory"
+
+    return {
+        "strategy": strategy,
+        "reason": reason,
+        "bytes": size,
+        "compression": compression,
+        "memory_bytes": memory_bytes,
+        "cpus": cpus,
+        "processes": processes if strategy == PARALLEL else None,
+    }
@@ -0,0 +1,144 @@
+"""
+Multi-product matching over the RawSoftware column of the VM inventory.
+
+Product patterns are compiled into a single Aho-Corasick automaton, so one
+pass over a value finds every configured product at once and the cost of a
+scan barely depends on how many patterns there are. Inventories repeat the
+same software lists many times, so each distinct value is scanned once.
+When the inventory was read from the Parquet cache, the RawSoftwareList
+column is matched instead, scanning each distinct software name once.
+"""
+
+import json
+
+import ahocorasick
+import pandas as pd
+
+from .inventory_cache import distinct_software_lists
+
+MATCHED_PRODUCTS_COLUMN = "MatchedProducts"
+
+# Separator of product names in the report's MatchedProducts column
+PRODUCT_SEPARATOR = "; "
+
+
+def load_product_patterns(value):
+    """
+    Parse product patterns from their JSON configuration.
+
+    Args:
+        value: JSON object mapping each product name to a pattern or a
+            list of patterns, e.g. '{"FileZilla": ["FileZilla"]}'
+
+    Returns:
+        Dictionary of product name to list of patterns
+
+    Raises:
+        ValueError: If the value is not such an object
+    """
+    products = json.loads(value)
+    if not isinstance(products, dict):
+        raise ValueError("Product patterns must be a JSON object")
+    patterns = {}
+    for product, product_patterns in products.items():
+        if isinstance(product_patterns, str):
+            product_patterns = [product_patterns]
+        if not (
+            isinstance(product_patterns, list)
+            and product_patterns
+            and all(isinstance(p, str) and p for p in product_patterns)
+        ):
+            raise ValueError(
+                f"Patterns of {product} must be a non-empty string or a "
+                f"list of them"
+            )
+        patterns[product] = product_patterns
+    return patterns
+
+
+class ProductMatcher:
+    """
+    Finds configured products in software strings.
+
+    Patterns are matched as case-insensitive substrings. A product matches
+    when any of its patterns does, and matches are reported in the order
+    the products were configured.
+    """
+
+    def __init__(self, products):
+        """
+        Compile the product patterns.
+
+        Args:
+            products: Mapping of product name to a list of patterns
+        """
+        self._order = {product: i for i, product in enumerate(products)}
+        self._automaton = ahocorasick.Automaton()
+        for product, patterns in products.items():
+            for pattern in patterns:
+                key = pattern.casefold()
+                # Several products may share a pattern
+                owners = self._automaton.get(key, ())
+                if product not in owners:
+                    self._automaton.add_word(key, owners + (product,))
+        if len(self._automaton):
+            self._automaton.make_automaton()
+        # Products found per software name, see match_items
+        self._item_matches = {}
+
+    def match(self, text):
+        """
+        Return the products found in one string, as a tuple.
+        """
+        if not isinstance(text, str) or not len(self._automaton):
+            return ()
+        found = set()
+        for _, owners in self._automaton.iter(text.casefold()):
+            found.update(owners)
+        return tuple(sorted(found, key=self._order.__getitem__))
+
+    def match_items(self, items):
+        """
+        Return the products found in a software list, as a tuple.
+
+        Each distinct software name is scanned once per matcher.
+        """
+        found = set()
+        for item in items:
+            owners = self._item_matches.get(item)
+            if owners is None:
+                owners = self._item_matches[item] = self.match(item)
+            found.update(owners)
+        return tuple(sorted(found, key=self._order.__getitem__))
+
+    def match_series(self, series, lists=None):
+        """
+        Match every value of a column, scanning each distinct value once.
+
+        Args:
+            series: pandas Series of software strings, e.g. RawSoftware
+            lists: The column's list column read from the Parquet cache,
+                e.g. RawSoftwareList, aligned with ``series``
+
+        Returns:
+            pandas Series of product tuples aligned with ``series``
+        """
+        if lists is None:
+            codes, uniques = pd.factorize(series)
+            matched = [self.match(value) for value in uniques]
+        else:
+            codes, uniques, value_lists = distinct_software_lists(
+                series, lists
+            )
+            # Values that are not lists are matched as plain strings
+            matched = [
+                self.match(value) if items is None else self.match_items(items)
+                for value, items in zip(uniques, value_lists)
+            ]
+        matched.append(())  # code -1 marks missing values
+        return pd.Series(
+            [matched[code] for code in codes],
+            index=series.index,
+            name=MATCHED_PRODUCTS_COLUMN,
+            dtype=object,
+        )
@@ -0,0 +1,246 @@
+"""
+Interactive queries over the VM inventory.
+
+A request with ``mode=query`` asks for the VMs matching a set of filters
+instead of the Excel report. Filters come from the query string or a JSON
+body, the body taking precedence:
+
+- ``product``: software name substring, or a list of substrings that must
+  all match, ignoring case
+- ``account_id``: AccountID, or a list of AccountIDs
+- ``platform``: PlatformDetails, or a list of them, ignoring case
+- ``vm_name_prefix``: start of the VMName
+- ``format``: ``json`` (default) or ``csv``
+"""
+
+import json
+import logging
+
+QUERY_MODE = "query"
+QUERY_FORMATS = ("json", "csv")
+
+# Request fields matched exactly against inventory columns
+EXACT_FILTERS = {"account_id": "AccountID", "platform": "PlatformDetails"}
+
+# Parsed inventory and its source ETag, per inventory blob, kept for queries
+_inventories = {}
+
+
+class QueryError(ValueError):
+    """
+    Raised when a query request is malformed.
+    """
+
+
+def read_query(params, body=None):
+    """
+    Read the query a request asks for.
+
+    Args:
+        params: Mapping of query string parameters
+        body: Raw request body, if any
+
+    Returns:
+        Query dictionary, or None if the request is not a query
+
+    Raises:
+        QueryError: If the query's filters or format are invalid
+    """
+    fields = dict(params)
+    body_error = False
+    if body:
+        try:
+            loaded = json.loads(body)
+        except ValueError:
+            loaded = None
+        if isinstance(loaded, dict):
+            fields.update(loaded)
+        else:
+            body_error = True
+
+    mode = fields.get("mode")
+    if not isinstance(mode, str) or mode.strip().lower() != QUERY_MODE:
+        return None
+    if body_error:
+        raise QueryError("Query body must be a JSON object")
+
+    query = {
+        "product": _strings(fields, "product"),
+        "vm_name_prefix": fields.get("vm_name_prefix"),
+        "format": fields.get("format", "json"),
+    }
+    for name in EXACT_FILTERS:
+        query[name] = _strings(fields, name, allow_numbers=True)
+
+    if query["vm_name_prefix"] is not None and not isinstance(
+        query["vm_name_prefix"], str
+    ):
+        raise QueryError("vm_name_prefix must be a string")
+    if (
+        not isinstance(query["format"], str)
+        or query["format"].strip().lower() not in QUERY_FORMATS
+    ):
+        raise QueryError(f"format must be one of {', '.join(QUERY_FORMATS)}")
+    query["format"] = query["format"].strip().lower()
+    return query
+
+
+def _strings(fields, name, allow_numbers=False):
+    """
+    Return a filter value as a list of strings, or None if absent.
+    """
+    value = fields.get(name)
+    if value is None:
+        return None
+    values = value if isinstance(value, list) else [value]
+    types = (str, int) if allow_numbers else str
+    if not values or not all(
+        isinstance(item, types) and not isinstance(item, bool)
+        for item in values
+    ):
+        raise QueryError(f"{name} must be a string or a list of strings")
+    return [str(item) for item in values]
+
+
+def query_mask(data, query, index=None):
+    """
+    Select the inventory rows matching a query.
+
+    Args:
+        data: Inventory pandas DataFrame
+        query: Query dictionary from read_query
+        index: SoftwareIndex of ``data``, required for product filters
+
+    Returns:
+        Boolean numpy array over the rows of ``data``
+    """
+    # Imported here, as every request is checked with read_query
+    import numpy as np
+
+    mask = np.ones(len(data), dtype=bool)
+    for term in query["product"] or ():
+        mask &= index.mask_matching(term)
+    for name, column in EXACT_FILTERS.items():
+        if query[name]:
+            mask &= _matches_any(data[column], query[name])
+    if query["vm_name_prefix"]:
+        mask &= (
+            data["VMName"]
+            .str.startswith(query["vm_name_prefix"], na=False)
+            .to_numpy(dtype=bool)
+        )
+    return mask
+
+
+def _matches_any(column, values):
+    """
+    Compare a column with the wanted values once per distinct value,
+    ignoring case.
+    """
+    import numpy as np
+    import pandas as pd
+
+    wanted = {value.casefold() for value in values}
+    codes, uniques = pd.factorize(column)
+    # The trailing False is selected by the code -1 of missing values
+    unique_mask = np.array(
+        [_text(value) in wanted for value in uniques] + [False], dtype=bool
+    )
+    return unique_mask[codes]
+
+
+def _text(value):
+    """
+    Spell a column value the way it appears in a request.
+    """
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).casefold()
+
+
+def render_result(data, result_format):
+    """
+    Serialize matching VMs.
+
+    Args:
+        data: pandas DataFrame of matching VMs
+        result_format: One of QUERY_FORMATS
+
+    Returns:
+        Tuple of (body, mimetype)
+    """
+    if result_format == "csv":
+        return data.to_csv(index=False), "text/csv"
+    records = data.to_json(orient="records")
+    return f'{{"count":{len(data)},"vms":{records}}}', "application/json"
+
+
+class InventoryQueries:
+    """
+    Answers queries from inventories kept in worker memory.
+    """
+
+    def __init__(self, blob_client, read_inventory, key, indexes, metrics):
+        """
+        Args:
+            blob_client: Callable returning the BlobClient of a blob in the
+                pre-process container, by name
+            read_inventory: Callable returning the parsed inventory of a
+                blob at an ETag
+            key: Identifies the pre-process container in the worker-memory
+                cache
+            indexes: SoftwareIndexStore used for product filters
+            metrics: StageMetrics recording the queries
+        """
+        self._blob_client = blob_client
+        self._read_inventory = read_inventory
+        self._key = key
+        self._indexes = indexes
+        self._metrics = metrics
+
+    def load(self, input_path):
+        """
+        Return the parsed inventory, kept in worker memory between calls.
+
+        The inventory is downloaded and parsed again only when the blob's
+        ETag changes.
+
+        Args:
+            input_path: Blob name of the input CSV file
+
+        Returns:
+            Tuple of (source ETag, inventory pandas DataFrame)
+        """
+        source_etag = self._blob_client(input_path).get_blob_properties().etag
+        key = (*self._key, input_path)
+        cached = _inventories.get(key)
+        if cached is not None and cached[0] == source_etag:
+            return cached
+
+        logging.info(f"Loading inventory {input_path} into memory...")
+        # Drop the old inventory before parsing the new one
+        _inventories.pop(key, None)
+        data = self._read_inventory(input_path, source_etag)
+
+        _inventories[key] = (source_etag, data)
+        return source_etag, data
+
+    def run(self, input_path, query):
+        """
+        Find the VMs of the inventory matching a query.
+
+        Args:
+            input_path: Blob name of the input CSV file
+            query: Query dictionary from read_query
+
+        Returns:
+            pandas DataFrame of matching VMs
+        """
+        source_etag, data = self.load(input_path)
+        index = None
+        if query["product"]:
+            index = self._indexes.load(input_path, source_etag, data)
+        with self._metrics.stage("query", rows_in=len(data)) as stage:
+            matches = data[query_mask(data, query, index)]
+            stage["rows_out"] = len(matches)
+        return matches
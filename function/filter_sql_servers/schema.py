@@ -0,0 +1,156 @@
+"""
+Declared schema of the VM inventory CSV.
+
+Reading the inventory with declared dtypes avoids per-column type inference
+and keeps the repetitive text columns compact: AccountID is read as text,
+as the report writes it, and columns with few distinct values are read as
+categoricals, which store each distinct value once. Readers that need only
+some columns skip the others while parsing, most usefully the wide
+RawSoftware column.
+"""
+
+# Columns of the inventory CSV, in file order
+INVENTORY_COLUMNS = (
+    "AccountID",
+    "VMName",
+    "PlatformDetails",
+    "SQLSoftware",
+    "RawSoftware",
+)
+
+# List columns the Parquet cache derives from the stringified software
+# columns; they feed version classification and product tagging, not the
+# report
+SOFTWARE_LIST_COLUMNS = {
+    "SQLSoftware": "SQLSoftwareList",
+    "RawSoftware": "RawSoftwareList",
+}
+
+INVENTORY_DTYPES = {
+    # Text, so IDs keep leading zeros and need no conversion for the report
+    "AccountID": str,
+    "VMName": str,
+    "PlatformDetails": "category",
+    "SQLSoftware": "category",
+    # VMs built from the same image share their whole software list
+    "RawSoftware": "category",
+}
+
+
+def csv_options(columns=None):
+    """
+    Return the pd.read_csv arguments reading an inventory.
+
+    Args:
+        columns: Columns to parse, defaults to all; the others are skipped
+            by the parser
+    """
+    options = {"dtype": INVENTORY_DTYPES}
+    if columns is not None:
+        wanted = set(columns)
+        options["usecols"] = lambda name: name in wanted
+    return options
+
+
+def concat(frames, **kwargs):
+    """
+    Concatenate parts of an inventory, such as chunks or shards.
+
+    pd.concat turns categoricals whose categories differ between parts into
+    plain object columns; the parts' categories are merged first to keep
+    them categorical.
+
+    Args:
+        frames: pandas DataFrames with the same columns
+        kwargs: Further pd.concat arguments
+    """
+    import pandas as pd
+
+    frames = list(frames)
+    categories = {}
+    for column, dtype in frames[0].dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            categories[column] = dtype.categories
+            for frame in frames[1:]:
+                categories[column] = categories[column].union(
+                    frame[column].cat.categories
+                )
+    if categories:
+        frames = [
+            frame.assign(
+                **{
+                    column: frame[column].cat.set_categories(values)
+                    for column, values in categories.items()
+                }
+            )
+            for frame in frames
+        ]
+    return pd.concat(frames, **kwargs)
+
+
+def prune_categories(data):
+    """
+    Drop the categories no row of a filtered inventory uses.
+
+    Selecting rows keeps every category of the frame they came from, so
+    the SQL Server rows of a chunk would otherwise hold every RawSoftware
+    value of the chunk, and concat would merge those of all chunks.
+
+    Args:
+        data: pandas DataFrame, e.g. the SQL Server rows of a chunk
+    """
+    import pandas as pd
+
+    pruned = {
+        column: data[column].cat.remove_unused_categories()
+        for column, dtype in data.dtypes.items()
+        if isinstance(dtype, pd.CategoricalDtype)
+    }
+    return data.assign(**pruned) if pruned else data
+
+
+def parse_columns(value):
+    """
+    Parse a comma-separated list of inventory columns.
+
+    Returns:
+        Tuple of column names, or None if the list is empty
+
+    Raises:
+        ValueError: If a name is not an inventory column
+    """
+    columns = tuple(name.strip() for name in value.split(",") if name.strip())
+    unknown = [name for name in columns if name not in INVENTORY_COLUMNS]
+    if unknown:
+        raise ValueError(
+            f"Unknown inventory columns {', '.join(unknown)}, expected "
+            f"{', '.join(INVENTORY_COLUMNS)}"
+        )
+    return columns or None
+
+
+def project(data, columns):
+    """
+    Keep the given inventory columns and every derived column of a report.
+
+    Software list columns read from the Parquet cache are always dropped.
+
+    Args:
+        data: Report pandas DataFrame
+        columns: Inventory columns to keep, or None to keep all
+    """
+    lists = set(SOFTWARE_LIST_COLUMNS.values())
+    if columns is None and lists.isdisjoint(data.columns):
+        return data
+    return data[
+        [
+            column
+            for column in data.columns
+            if column not in lists
+            and (
+                columns is None
+                or column in columns
+                or column not in INVENTORY_COLUMNS
+            )
+        ]
+    ]
@@ -0,0 +1,274 @@
+"""
+Inverted index from installed software to the VMs that have it.
+
+Every distinct software name in RawSoftware is interned as an integer ID,
+and the index stores, per ID, the sorted row positions of the VMs listing
+it, in compressed sparse row (CSR) form: ``indices[indptr[i]:indptr[i+1]]``
+are the rows of name ``i``. Lookups only touch the posting lists of the
+names they ask for, so they take milliseconds whatever the fleet size.
+"""
+
+import logging
+from io import BytesIO
+
+import numpy as np
+from azure.core.exceptions import ResourceNotFoundError
+
+from .inventory_cache import (
+    CACHE_PREFIX,
+    SOURCE_ETAG_KEY,
+    distinct_software_lists,
+)
+from .schema import SOFTWARE_LIST_COLUMNS
+
+# Software index and the source ETag it was built from, per inventory blob
+_software_indexes = {}
+
+
+def index_blob_name(input_path):
+    """
+    Return the name of the software index blob for an inventory blob.
+    """
+    return f"{CACHE_PREFIX}{input_path}.software-index.npz"
+
+
+class SoftwareIndex:
+    """
+    Inverted index of software names to inventory row positions.
+    """
+
+    def __init__(self, names, indptr, indices, row_count):
+        """
+        Args:
+            names: Array of software names; a name's position is its ID
+            indptr: Offsets of each name's rows in ``indices``
+            indices: Concatenated, sorted row positions per name
+            row_count: Number of rows in the indexed inventory
+        """
+        self.names = names
+        self.indptr = indptr
+        self.indices = indices
+        self.row_count = row_count
+        self._ids = {name: i for i, name in enumerate(names.tolist())}
+        self._folded = [name.casefold() for name in names.tolist()]
+
+    @classmethod
+    def build(cls, raw_software, lists=None):
+        """
+        Build the index from a RawSoftware column.
+
+        Each distinct value is parsed once, or taken from the Parquet
+        cache's RawSoftwareList column, and the rows are expanded to
+        (name, row) pairs with array operations.
+
+        Args:
+            raw_software: pandas Series of stringified software lists
+            lists: RawSoftwareList column aligned with ``raw_software``
+        """
+        codes, _, value_lists = distinct_software_lists(raw_software, lists)
+        names = {}
+        value_ids = []
+        for items in value_lists:
+            items = items or []
+            ids = {names.setdefault(item, len(names)) for item in items}
+            value_ids.append(np.array(sorted(ids), dtype=np.int64))
+        value_ids.append(np.empty(0, dtype=np.int64))  # missing values
+
+        lengths = np.array([len(ids) for ids in value_ids], dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        flat = np.concatenate(value_ids)
+
+        # Expand every row to the name IDs of its value
+        row_lengths = lengths[codes]
+        rows = np.repeat(np.arange(len(codes), dtype=np.int64), row_lengths)
+        starts = np.repeat(offsets[codes], row_lengths)
+        within = np.arange(len(rows)) - np.repeat(
+            np.cumsum(row_lengths) - row_lengths, row_lengths
+        )
+        # The narrowest ID type lets numpy radix sort by name, which keeps
+        # the rows of each name in order
+        name_ids = flat.astype(np.min_scalar_type(max(len(names) - 1, 0)))[
+            starts + within
+        ]
+        order = np.argsort(name_ids, kind="stable")
+        indptr = np.concatenate(
+            ([0], np.cumsum(np.bincount(name_ids, minlength=len(names))))
+        )
+        row_dtype = np.int32 if len(codes) < 2**31 else np.int64
+        return cls(
+            np.array(list(names), dtype=str),
+            indptr,
+            rows[order].astype(row_dtype),
+            len(codes),
+        )
+
+    def rows_of(self, name):
+        """
+        Return the sorted row positions of VMs listing exactly ``name``.
+        """
+        i = self._ids.get(name)
+        if i is None:
+            return np.empty(0, dtype=self.indices.dtype)
+        return self.indices[self.indptr[i] : self.indptr[i + 1]]
+
+    def rows_matching(self, term):
+        """
+        Return the sorted row positions of VMs listing any software whose
+        name contains ``term``, ignoring case.
+        """
+        return np.flatnonzero(self.mask_matching(term))
+
+    def mask_matching(self, term):
+        """
+        Return a boolean mask over the inventory rows of VMs listing any
+        software whose name contains ``term``, ignoring case.
+        """
+        term = term.casefold()
+        mask = np.zeros(self.row_count, dtype=bool)
+        for i, name in enumerate(self._folded):
+            if term in name:
+                mask[self.indices[self.indptr[i] : self.indptr[i + 1]]] = True
+        return mask
+
+    def lookup(self, all_of=(), any_of=()):
+        """
+        Find VMs by the software they have installed.
+
+        Each term matches software names containing it, ignoring case.
+        Terms are combined as bitmaps over the inventory rows.
+
+        Args:
+            all_of: Terms that must all match (AND)
+            any_of: Terms of which at least one must match (OR)
+
+        Returns:
+            Sorted numpy array of inventory row positions
+        """
+        mask = np.ones(self.row_count, dtype=bool)
+        for term in all_of:
+            mask &= self.mask_matching(term)
+        if any_of:
+            matches = np.zeros(self.row_count, dtype=bool)
+            for term in any_of:
+                matches |= self.mask_matching(term)
+            mask &= matches
+        return np.flatnonzero(mask)
+
+    def save(self, stream):
+        """
+        Write the index as an uncompressed .npz archive.
+        """
+        np.savez(
+            stream,
+            names=self.names,
+            indptr=self.indptr,
+            indices=self.indices,
+            row_count=np.array(self.row_count),
+        )
+
+    @classmethod
+    def load(cls, stream):
+        """
+        Read an index written by save.
+        """
+        with np.load(stream, allow_pickle=False) as archive:
+            return cls(
+                archive["names"],
+                archive["indptr"],
+                archive["indices"],
+                int(archive["row_count"]),
+            )
+
+
+class SoftwareIndexStore:
+    """
+    Keeps the software index of inventory blobs in worker memory and next
+    to the inventory in the pre-process container.
+    """
+
+    def __init__(self, blob_client, read_raw_software, key, metrics):
+        """
+        Args:
+            blob_client: Callable returning the BlobClient of a blob in the
+                pre-process container, by name
+            read_raw_software: Callable returning the RawSoftware column of
+                an inventory blob at an ETag as a DataFrame, with
+                RawSoftwareList if read from the Parquet cache
+            key: Identifies the pre-process container in the worker-memory
+                cache
+            metrics: StageMetrics recording the reads, builds and writes
+        """
+        self._blob_client = blob_client
+        self._read_raw_software = read_raw_software
+        self._key = key
+        self._metrics = metrics
+
+    def load(self, input_path, source_etag=None, data=None):
+        """
+        Return the software index of an inventory blob.
+
+        The index is kept in worker memory and in the pre-process container
+        next to the inventory, both tagged with the ETag of the CSV it was
+        built from, and is rebuilt when that ETag changes. Row positions in
+        the index are the positions of the inventory's rows.
+
+        Args:
+            input_path: Blob name of the input CSV file
+            source_etag: Current ETag of the CSV, read from the blob if
+                omitted
+            data: Inventory parsed from the CSV at ``source_etag``, used
+                instead of reading it if the index must be built
+
+        Returns:
+            SoftwareIndex of the current inventory
+        """
+        if source_etag is None:
+            source_etag = (
+                self._blob_client(input_path).get_blob_properties().etag
+            )
+        key = (*self._key, input_path)
+        cached = _software_indexes.get(key)
+        if cached is not None and cached[0] == source_etag:
+            return cached[1]
+
+        index_blob_client = self._blob_client(index_blob_name(input_path))
+        try:
+            index_properties = index_blob_client.get_blob_properties()
+        except ResourceNotFoundError:
+            index_properties = None
+
+        if (
+            index_properties is not None
+            and index_properties.metadata.get(SOURCE_ETAG_KEY) == source_etag
+        ):
+            logging.info("Reading software index...")
+            with self._metrics.stage("index_read") as stage:
+                content = index_blob_client.download_blob().readall()
+                index = SoftwareIndex.load(BytesIO(content))
+                stage["bytes"] = len(content)
+        else:
+            logging.info("Software index missing or stale, building it...")
+            if data is None:
+                data = self._read_raw_software(input_path, source_etag)
+            with self._metrics.stage("index_build") as stage:
+                index = SoftwareIndex.build(
+                    data["RawSoftware"],
+                    data.get(SOFTWARE_LIST_COLUMNS["RawSoftware"]),
+                )
+                stage["rows_in"] = index.row_count
+
+            with self._metrics.stage("index_write") as stage:
+                index_file = BytesIO()
+                index.save(index_file)
+                stage["bytes"] = index_file.tell()
+                index_file.seek(0)
+                index_blob_client.upload_blob(
+                    index_file,
+                    length=stage["bytes"],
+                    overwrite=True,
+                    metadata={SOURCE_ETAG_KEY: source_etag},
+                )
+            logging.info(f"Wrote software index {index_blob_name(input_path)}")
+
+        _software_indexes[key] = (source_etag, index)
+        return index
@@ -0,0 +1,98 @@
+"""
+Summary sheets of the Excel report.
+
+Host counts by account, by platform and by SQL Server release are what
+readers otherwise build pivots for. All three are computed from one groupby
+over the report: the rows are counted per combination of the three keys,
+and each summary adds up that much smaller table.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .versions import VERSION_COLUMN, parse_sql_software
+
+HOSTS_COLUMN = "Hosts"
+
+# Label of hosts whose key is missing, e.g. an unrecognized release
+UNKNOWN_LABEL = "Unknown"
+
+# Summary sheets in workbook order, by the column they count hosts by
+SUMMARY_SHEETS = {
+    "AccountID": "By Account",
+    "PlatformDetails": "By Platform",
+    VERSION_COLUMN: "By SQL Version",
+}
+
+
+def sql_releases(software):
+    """
+    Return the latest SQL Server release named in each SQLSoftware value.
+
+    Args:
+        software: SQLSoftware pandas Series
+
+    Returns:
+        pandas Series of releases, None where no release is recognized
+    """
+    # Decide each distinct value once; the last entry serves code -1,
+    # i.e. missing values
+    codes, uniques = pd.factorize(software)
+    latest = [
+        (parse_sql_software(value)[0] or (None,))[-1] for value in uniques
+    ]
+    values = np.array(latest + [None], dtype=object)
+    return pd.Series(values[codes], index=software.index, dtype=object)
+
+
+def summarize(data):
+    """
+    Count the report's hosts by account, platform and SQL Server release.
+
+    The release is taken from the SQLServerVersion column when versions
+    were classified and from SQLSoftware otherwise. Keys missing from the
+    report, e.g. projected away, get no summary.
+
+    Args:
+        data: Filtered VM pandas DataFrame
+
+    Returns:
+        List of (sheet title, pandas DataFrame of key and host count)
+        tuples, largest count first
+    """
+    keys = {
+        column: data[column]
+        for column in ("AccountID", "PlatformDetails")
+        if column in data.columns
+    }
+    if VERSION_COLUMN in data.columns:
+        keys[VERSION_COLUMN] = data[VERSION_COLUMN]
+    elif "SQLSoftware" in data.columns:
+        keys[VERSION_COLUMN] = sql_releases(data["SQLSoftware"])
+    if not keys:
+        return []
+
+    # The one pass over the report's rows
+    counts = (
+        pd.DataFrame(keys)
+        .groupby(list(keys), observed=True, dropna=False)
+        .size()
+    )
+
+    summaries = []
+    for column, title in SUMMARY_SHEETS.items():
+        if column not in keys:
+            continue
+        totals = (
+            counts.groupby(level=column, observed=True, dropna=False)
+            .sum()
+            .sort_values(ascending=False, kind="stable")
+        )
+        summary = pd.DataFrame(
+            {
+                column: totals.index.astype(object).fillna(UNKNOWN_LABEL),
+                HOSTS_COLUMN: totals.to_numpy(),
+            }
+        )
+        summaries.append((title, summary))
+    return summaries
@@ -0,0 +1,160 @@
+"""
+Parallel block upload of large reports.
+
+A report larger than one block is uploaded as a block blob in fixed-size
+blocks. Several blocks are staged at once, each with a transactional MD5
+the service checks on arrival. A block that fails with a transient error is
+staged again on its own, so a network blip near the end of a large report
+does not restart the transfer. Nothing is visible until the block list is
+committed in one request; the committed block list is then read back and
+its block IDs and sizes compared with the blocks staged.
+"""
+
+import base64
+import hashlib
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from azure.core.exceptions import (
+    HttpResponseError,
+    ServiceRequestError,
+    ServiceResponseError,
+)
+from azure.storage.blob import ContentSettings
+
+# Attempts after the first for each block
+DEFAULT_BLOCK_RETRIES = 3
+
+# Seconds before the first retry of a block, doubled for each further one
+RETRY_BACKOFF_SECONDS = 1.0
+
+# HTTP statuses worth retrying: timeouts, throttling and server errors
+_TRANSIENT_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class UploadVerificationError(Exception):
+    """
+    Raised when a committed blob does not match the uploaded report.
+    """
+
+
+def block_id(index):
+    """
+    Return the ID of the block at ``index``.
+
+    The IDs of a blob's blocks must all have the same length; the client
+    base64-encodes them.
+    """
+    return f"{index:08d}"
+
+
+def _transient(error):
+    if isinstance(error, (ServiceRequestError, ServiceResponseError)):
+        return True
+    return (
+        isinstance(error, HttpResponseError)
+        and error.status_code in _TRANSIENT_STATUSES
+    )
+
+
+def _stage_block(blob_client, block, data, retries):
+    """
+    Stage one block, retrying it alone after transient errors.
+
+    The client's own retry policy is turned off for the request, so
+    ``retries`` is the only bound on attempts.
+
+    Returns:
+        Number of retries it took
+    """
+    for attempt in range(retries + 1):
+        try:
+            blob_client.stage_block(
+                block,
+                data,
+                length=len(data),
+                validate_content=True,
+                retry_total=0,
+            )
+            return attempt
+        except Exception as e:
+            if attempt == retries or not _transient(e):
+                raise
+            logging.warning(f"Staging block {block} failed, retrying: {e}")
+            time.sleep(RETRY_BACKOFF_SECONDS * 2**attempt)
+
+
+def upload_blocks(
+    blob_client,
+    stream,
+    length,
+    block_bytes,
+    max_concurrency,
+    retries=DEFAULT_BLOCK_RETRIES,
+):
+    """
+    Upload a file as a block blob, replacing any existing blob.
+
+    At most ``max_concurrency`` blocks are read ahead of the service, so
+    memory use is bounded by ``block_bytes * max_concurrency``.
+
+    Args:
+        blob_client: BlobClient of the destination blob
+        stream: Readable binary file object positioned at the file start
+        length: Length of the file in bytes
+        block_bytes: Size of each block but the last
+        max_concurrency: Maximum number of blocks staged at once
+        retries: Attempts after the first for each block
+
+    Returns:
+        Dictionary with the number of blocks and retries and the base64
+        Content-MD5 stored with the blob
+
+    Raises:
+        UploadVerificationError: If the file was not ``length`` bytes long
+            or the committed blocks differ from those staged
+    """
+    digest = hashlib.md5()
+    blocks = []
+    retried = 0
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        pending = set()
+        while data := stream.read(block_bytes):
+            digest.update(data)
+            blocks.append((block_id(len(blocks)), len(data)))
+            pending.add(
+                executor.submit(
+                    _stage_block, blob_client, blocks[-1][0], data, retries
+                )
+            )
+            del data
+            if len(pending) >= max_concurrency:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                retried += sum(future.result() for future in done)
+        retried += sum(future.result() for future in pending)
+
+    staged = sum(size for _, size in blocks)
+    if staged != length:
+        raise UploadVerificationError(
+            f"Staged {staged} bytes, expected {length}"
+        )
+
+    content_md5 = digest.digest()
+    blob_client.commit_block_list(
+        [block for block, _ in blocks],
+        content_settings=ContentSettings(content_md5=bytearray(content_md5)),
+    )
+
+    committed, _ = blob_client.get_block_list("committed")
+    if [(block.id, block.size) for block in committed] != blocks:
+        raise UploadVerificationError(
+            f"Committed blob has {len(committed)} blocks of "
+            f"{sum(block.size for block in committed)} bytes, expected "
+            f"{len(blocks)} blocks of {length} bytes"
+        )
+    return {
+        "blocks": len(blocks),
+        "retries": retried,
+        "content_md5": base64.b64encode(content_md5).decode(),
+    }
@@ -0,0 +1,225 @@
+"""
+SQL Server version and edition extraction from the VM inventory.
+
+SQLSoftware names the installed SQL Server releases, e.g.
+"['Microsoft SQL Server 2019 (64-bit)']", and licence-included images name
+the edition in PlatformDetails, e.g. "Windows with SQL Server Enterprise".
+The inventory carries no build numbers, so VMs are classified by release.
+Each distinct value is parsed once and the results are mapped back to the
+rows; when the inventory was read from the Parquet cache, its
+SQLSoftwareList column supplies the parsed lists.
+"""
+
+import json
+import re
+
+import numpy as np
+import pandas as pd
+
+from .detection import SQL_SERVER_MARKER
+from .inventory_cache import distinct_software_lists, parse_software_list
+from .schema import SOFTWARE_LIST_COLUMNS
+
+VERSION_COLUMN = "SQLServerVersion"
+MAJOR_VERSION_COLUMN = "SQLServerMajorVersion"
+EDITION_COLUMN = "SQLServerEdition"
+STATUS_COLUMN = "SQLServerStatus"
+
+# Releases in release order, with their internal major version numbers
+RELEASES = {
+    "2005": 9,
+    "2008": 10,
+    "2008 R2": 10,
+    "2012": 11,
+    "2014": 12,
+    "2016": 13,
+    "2017": 14,
+    "2019": 15,
+    "2022": 16,
+    "2025": 17,
+}
+
+EDITIONS = ["Enterprise", "Standard", "Web", "Developer", "Express"]
+
+PATCHED = "patched"
+VULNERABLE = "vulnerable"
+UNKNOWN = "unknown"
+STATUSES = [PATCHED, UNKNOWN, VULNERABLE]
+
+# Releases past the end of Microsoft's extended support no longer receive
+# security updates. 2016's extended support ended on 14 July 2026.
+DEFAULT_VERSION_STATUS = {
+    "2005": VULNERABLE,
+    "2008": VULNERABLE,
+    "2008 R2": VULNERABLE,
+    "2012": VULNERABLE,
+    "2014": VULNERABLE,
+    "2016": VULNERABLE,
+    "2017": PATCHED,
+    "2019": PATCHED,
+    "2022": PATCHED,
+    "2025": PATCHED,
+}
+
+_RELEASE_PATTERN = re.compile(r"SQL Server (\d{4})( R2)?\b")
+# Client libraries, tools and shared components carry a release year but are
+# not server instances, e.g. "Microsoft SQL Server 2012 Native Client"
+_COMPONENT_PATTERN = re.compile(
+    r"Native Client|ODBC|OLE DB|LocalDB|Management Studio|"
+    r"Management Objects|Setup|Support Files|Browser|VSS Writer|"
+    r"System CLR Types|Language Service|ScriptDom|Command Line Utilities|"
+    r"Data-Tier|Report Builder|Books Online|Compact|Policies",
+    re.IGNORECASE,
+)
+_EDITION_PATTERN = re.compile(rf"\b({'|'.join(EDITIONS)})\b")
+
+
+def load_version_status(value):
+    """
+    Parse a version status table and apply it over the defaults.
+
+    Args:
+        value: JSON object mapping releases to "patched" or "vulnerable",
+            e.g. '{"2017": "vulnerable"}'
+
+    Returns:
+        Dictionary of release to status
+
+    Raises:
+        ValueError: If the value is not such an object
+    """
+    overrides = json.loads(value)
+    if not isinstance(overrides, dict) or not all(
+        status in (PATCHED, VULNERABLE) for status in overrides.values()
+    ):
+        raise ValueError(
+            'Version status must map releases to "patched" or "vulnerable"'
+        )
+    return {**DEFAULT_VERSION_STATUS, **overrides}
+
+
+def parse_sql_software(value, items=None):
+    """
+    Find the SQL Server releases and edition named in a SQLSoftware value.
+
+    Client and shared component entries are skipped, so only server
+    releases are reported.
+
+    Args:
+        value: SQLSoftware value
+        items: The value's software list, parsed from ``value`` if omitted
+
+    Returns:
+        Tuple of the releases found, oldest first, and the edition or None
+    """
+    if not isinstance(value, str):
+        return (), None
+    if items is None:
+        items = parse_software_list(value)
+    if items is None:
+        items = [value]
+    releases = set()
+    edition = None
+    for item in items:
+        if SQL_SERVER_MARKER not in item or _COMPONENT_PATTERN.search(item):
+            continue
+        for year, r2 in _RELEASE_PATTERN.findall(item):
+            releases.add(year + r2)
+        match = _EDITION_PATTERN.search(item)
+        if match and edition is None:
+            edition = match.group(1)
+    order = list(RELEASES)
+    known = sorted(
+        (release for release in releases if release in RELEASES),
+        key=order.index,
+    )
+    # Unrecognized releases sort after the known ones
+    return tuple(known + sorted(releases - set(known))), edition
+
+
+def platform_edition(value):
+    """
+    Return the SQL Server edition named in a PlatformDetails value.
+    """
+    if not isinstance(value, str) or "SQL Server" not in value:
+        return None
+    match = _EDITION_PATTERN.search(value)
+    return match.group(1) if match else None
+
+
+def classify_releases(releases, version_status):
+    """
+    Classify a VM by its installed releases.
+
+    A VM is vulnerable if any installed release is, unknown if any release
+    is missing from the table, and patched otherwise.
+    """
+    if not releases:
+        return None
+    statuses = {version_status.get(release, UNKNOWN) for release in releases}
+    return max(statuses, key=STATUSES.index)
+
+
+def sql_server_versions(data, version_status=None):
+    """
+    Extract SQL Server versions and editions and classify each VM.
+
+    Args:
+        data: VM pandas DataFrame with SQLSoftware and PlatformDetails, and
+            SQLSoftwareList if read from the Parquet cache
+        version_status: Release to status table, DEFAULT_VERSION_STATUS
+            if omitted
+
+    Returns:
+        pandas DataFrame aligned with ``data`` with the latest installed
+        release, its major version, the edition and the status
+    """
+    if version_status is None:
+        version_status = DEFAULT_VERSION_STATUS
+
+    # Decide each distinct value once; the last entry serves code -1,
+    # i.e. missing values
+    codes, uniques, lists = distinct_software_lists(
+        data["SQLSoftware"], data.get(SOFTWARE_LIST_COLUMNS["SQLSoftware"])
+    )
+    latest, status, edition = [], [], []
+    for value, items in zip(uniques, lists):
+        releases, value_edition = parse_sql_software(value, items)
+        latest.append(releases[-1] if releases else None)
+        status.append(classify_releases(releases, version_status))
+        edition.append(value_edition)
+    latest = _take(latest, codes, data.index)
+    status = _take(status, codes, data.index)
+    edition = _take(edition, codes, data.index)
+
+    if "PlatformDetails" in data.columns:
+        codes, uniques = pd.factorize(data["PlatformDetails"])
+        edition = edition.fillna(
+            _take(
+                [platform_edition(value) for value in uniques],
+                codes,
+                data.index,
+            )
+        )
+
+    return pd.DataFrame(
+        {
+            VERSION_COLUMN: pd.Categorical(
+                latest,
+                categories=list(RELEASES)
+                + sorted(set(latest.dropna()) - set(RELEASES)),
+                ordered=True,
+            ),
+            MAJOR_VERSION_COLUMN: latest.map(RELEASES).astype("Int64"),
+            EDITION_COLUMN: pd.Categorical(edition, categories=EDITIONS),
+            STATUS_COLUMN: pd.Categorical(
+                status, categories=STATUSES, ordered=True
+            ),
+        },
+        index=data.index,
+    )
+
+
+def _take(values, codes, index):
+    values = np.array(values + [None], dtype=object)
+    return pd.Series(values[codes], index=index, dtype=object)
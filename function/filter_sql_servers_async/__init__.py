@@ -0,0 +1,7 @@
+"""
+Async variant of the SQL Server filter function.
+
+The implementation lives in filter_sql_servers.aio.
+"""
+
+from ..filter_sql_servers.aio import main  # noqa: F401
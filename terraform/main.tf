@@ -244,6 +244,29 @@ resource "azurerm_linux_function_app" "main" {
     "POSTPROCESS_CONTAINER"       = azurerm_storage_container.postprocess.name
     "KEY_VAULT_URL"               = azurerm_key_vault.main.vault_uri
     "MANAGED_IDENTITY_CLIENT_ID"  = azurerm_user_assigned_identity.postprocess.client_id
+    "INVENTORY_PARQUET_CACHE"     = "true"
+    "REUSE_UNCHANGED_REPORTS"     = "true"
+    "CLASSIFY_SQL_VERSIONS"       = "true"
+    "DELTA_REPORT"                = "alongside"
+    "SNAPSHOT_HISTORY"            = "true"
+
+    # The async function only serves the plain in-memory pipeline and hands
+    # the cache, reuse, delta, history and product modes to the synchronous
+    # function in a thread, so it is not exposed alongside it
+    "AzureWebJobs.filter_sql_servers_async.Disabled" = "true"
+
+    # Products tagged in the report's MatchedProducts column; hosts without
+    # SQL Server that have one are listed in a separate product report
+    "PRODUCT_PATTERNS" = jsonencode({
+      "SQL Server ODBC Driver" = [
+        "ODBC Driver 11 for SQL Server",
+        "ODBC Driver 13 for SQL Server",
+        "ODBC Driver 17 for SQL Server",
+        "ODBC Driver 18 for SQL Server",
+      ]
+      "SQL Server Native Client" = ["Native Client"]
+      "FileZilla"                = ["FileZilla"]
+    })
   }
 
   tags = var.tags
@@ -129,6 +129,29 @@ resource "azurerm_role_assignment" "function_preprocess_reader" {
   principal_id         = azurerm_user_assigned_identity.postprocess.principal_id
 }
 
+# Pre-process Storage - Write access limited to derived caches under cache/
+resource "azurerm_role_assignment" "function_preprocess_cache_writer" {
+  scope                = azurerm_storage_account.preprocess.id
+  role_definition_name = "Storage Blob Data Contributor"
+  principal_id         = azurerm_user_assigned_identity.postprocess.principal_id
+  condition_version    = "2.0"
+  condition            = <<-EOT
+    (
+      (
+        !(ActionMatches{'Microsoft.Storage/storageAccounts/blobServices/containers/blobs/write'})
+        AND
+        !(ActionMatches{'Microsoft.Storage/storageAccounts/blobServices/containers/blobs/add/action'})
+        AND
+        !(ActionMatches{'Microsoft.Storage/storageAccounts/blobServices/containers/blobs/delete'})
+      )
+      OR
+      (
+        @Resource[Microsoft.Storage/storageAccounts/blobServices/containers/blobs:path] StringLike 'cache/*'
+      )
+    )
+  EOT
+}
+
 # Post-process Storage - Write access
 resource "azurerm_role_assignment" "function_postprocess_contributor" {
   scope                = azurerm_storage_account.postprocess.id
@@ -0,0 +1,20 @@
+"""
+Benchmark configuration.
+
+Benchmarks are slow and allocate large inventories, so they only run when
+RUN_BENCHMARKS=1 is set, e.g. ``RUN_BENCHMARKS=1 pytest tests/benchmarks -s``.
+"""
+
+import os
+
+import pytest
+
+
+def pytest_collection_modifyitems(config, items):
+    """Skip benchmarks unless they were explicitly requested."""
+    if os.environ.get("RUN_BENCHMARKS") == "1":
+        return
+    skip = pytest.mark.skip(reason="set RUN_BENCHMARKS=1 to run benchmarks")
+    for item in items:
+        if "benchmarks" in item.nodeid:
+            item.add_marker(skip)
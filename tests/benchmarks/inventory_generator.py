@@ -0,0 +1,149 @@
+"""
+Seeded generator of synthetic VM inventories.
+
+Inventories follow the schema of tests/data/vm_inventory.csv. Software
+names and SQLSoftware values are sampled from that file, so the generated
+strings look like real ones. Fleets reuse a limited number of machine
+images, and so do the generated rows. That keeps generation vectorized at
+millions of rows.
+"""
+
+import ast
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+MOCK_CSV_PATH = pathlib.Path(__file__).parents[1] / "data" / "vm_inventory.csv"
+
+COLUMNS = [
+    "AccountID",
+    "VMName",
+    "PlatformDetails",
+    "SQLSoftware",
+    "RawSoftware",
+]
+
+# Share of VMs with SQL Server installed in the mock inventory
+DEFAULT_SQL_PREVALENCE = 0.33
+
+# Distinct software images per population (SQL Server and other VMs)
+IMAGE_COUNT = 500
+
+# Average number of VMs per AWS account
+VMS_PER_ACCOUNT = 100
+
+ENVIRONMENTS = ["prod", "staging", "qa", "dev"]
+REGIONS = ["useast1", "useast2", "uswest2", "cacentral1", "euwest1"]
+ROLES = ["app", "db", "api", "web", "batch"]
+
+# Platform of SQL Server VMs; licence-included images name the edition
+SQL_PLATFORMS = [
+    "Windows",
+    "Windows with SQL Server Enterprise",
+    "Windows with SQL Server Standard",
+]
+SQL_PLATFORM_WEIGHTS = [0.85, 0.1, 0.05]
+
+
+def load_catalogue(path=MOCK_CSV_PATH):
+    """
+    Collect the software names and SQLSoftware values of an inventory.
+
+    Returns:
+        Tuple of the sorted software names that are not SQL Server and the
+        sorted distinct non-empty SQLSoftware lists
+    """
+    data = pd.read_csv(path)
+    sql_values = sorted(
+        {
+            tuple(ast.literal_eval(value))
+            for value in data["SQLSoftware"].dropna()
+        }
+        - {()}
+    )
+    sql_names = {name for value in sql_values for name in value}
+    software = sorted(
+        {
+            name
+            for value in data["RawSoftware"].dropna()
+            for name in ast.literal_eval(value)
+        }
+        - sql_names
+    )
+    return software, [list(value) for value in sql_values]
+
+
+def generate_inventory(rows, sql_prevalence=DEFAULT_SQL_PREVALENCE, seed=0):
+    """
+    Generate a synthetic VM inventory.
+
+    Args:
+        rows: Number of VMs
+        sql_prevalence: Fraction of VMs with SQL Server installed
+        seed: Seed of the random generator; equal arguments give equal
+            inventories
+
+    Returns:
+        pandas DataFrame with the columns of the mock inventory
+    """
+    rng = np.random.default_rng(seed)
+    software, sql_values = load_catalogue()
+
+    # Each image is a random subset of the catalogue; SQL Server images
+    # also list the SQL Server products in RawSoftware
+    images = [
+        [software[i] for i in rng.permutation(len(software))[:size]]
+        for size in rng.integers(12, 25, size=2 * IMAGE_COUNT)
+    ]
+    image_sql = [
+        sql_values[i] for i in rng.integers(len(sql_values), size=IMAGE_COUNT)
+    ]
+    # Object arrays, so rows reference the pooled strings instead of
+    # copying them into fixed-width arrays
+    plain_raw = _objects(repr(image) for image in images[:IMAGE_COUNT])
+    sql_sql = _objects(repr(value) for value in image_sql)
+    sql_raw = _objects(
+        repr(image + value)
+        for image, value in zip(images[IMAGE_COUNT:], image_sql)
+    )
+
+    is_sql = rng.random(rows) < sql_prevalence
+    image = rng.integers(IMAGE_COUNT, size=rows)
+    platform = _objects(SQL_PLATFORMS)[
+        rng.choice(len(SQL_PLATFORMS), size=rows, p=SQL_PLATFORM_WEIGHTS)
+    ]
+
+    accounts = rng.integers(
+        10**11, 10**12, size=max(1, rows // VMS_PER_ACCOUNT)
+    )
+    names = pd.Series(np.arange(rows)).astype(str)
+    for parts in (ROLES, REGIONS, ENVIRONMENTS):
+        names = _objects(parts)[rng.integers(len(parts), size=rows)] + (
+            "-" + names
+        )
+
+    return pd.DataFrame(
+        {
+            "AccountID": rng.choice(accounts, size=rows),
+            "VMName": "vm-" + names,
+            "PlatformDetails": np.where(is_sql, platform, "Windows"),
+            "SQLSoftware": np.where(is_sql, sql_sql[image], "[]"),
+            "RawSoftware": np.where(is_sql, sql_raw[image], plain_raw[image]),
+        },
+        columns=COLUMNS,
+    )
+
+
+def generate_inventory_csv(
+    rows, sql_prevalence=DEFAULT_SQL_PREVALENCE, seed=0
+):
+    """
+    Generate a synthetic inventory encoded as the CSV blob would hold it.
+    """
+    data = generate_inventory(rows, sql_prevalence, seed)
+    return data.to_csv(index=False).encode()
+
+
+def _objects(values):
+    return np.array(list(values), dtype=object)
@@ -0,0 +1,47 @@
+"""
+Benchmark of client acquisition on cold and warm invocations.
+
+Only construction cost is measured here; on a real worker the warm path
+also skips token acquisition and TLS handshakes.
+"""
+
+import time
+
+from filter_sql_servers import (
+    get_blob_service_client,
+    get_credential,
+    get_secret_client,
+    reset_clients,
+)
+
+ITERATIONS = 200
+
+
+def acquire_clients():
+    """Acquire every client a full report run needs."""
+    credential = get_credential("client-id")
+    for account in ("preprocess", "postprocess"):
+        get_blob_service_client(
+            f"https://{account}.blob.core.windows.net", "client-id", credential
+        )
+    get_secret_client("https://kv.vault.azure.net", "client-id", credential)
+
+
+def test_warm_client_acquisition():
+    """Compare rebuilding clients per invocation with pooled clients."""
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        reset_clients()
+        acquire_clients()
+    cold_ms = (time.perf_counter() - start) * 1000 / ITERATIONS
+
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        acquire_clients()
+    warm_ms = (time.perf_counter() - start) * 1000 / ITERATIONS
+
+    print(
+        f"\nClient acquisition per invocation: cold {cold_ms:.3f} ms, "
+        f"warm {warm_ms:.3f} ms"
+    )
+    assert warm_ms < cold_ms
@@ -0,0 +1,41 @@
+"""
+Benchmark of the function module's import time on a cold start.
+"""
+
+import os
+import pathlib
+import subprocess
+import sys
+
+# Cumulative import time of the function module. azure.functions and
+# azure.core take about 0.2 s of it; with every dependency imported
+# eagerly it was about 1.4 s.
+IMPORT_BUDGET_SECONDS = 0.6
+
+
+def test_import_time():
+    """Test importing the function module stays within its budget."""
+    repo_dir = pathlib.Path(__file__).parent.parent.parent
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            "import filter_sql_servers",
+        ],
+        cwd=repo_dir,
+        env=dict(os.environ, PYTHONPATH=str(repo_dir / "function")),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    cumulative = [
+        int(line.split("|")[1])
+        for line in result.stderr.splitlines()
+        if line.endswith("| filter_sql_servers")
+    ]
+    seconds = cumulative[0] / 1e6
+    print(f"\nImport of filter_sql_servers: {seconds:.3f} s")
+    assert seconds < IMPORT_BUDGET_SECONDS
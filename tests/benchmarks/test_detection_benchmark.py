@@ -0,0 +1,35 @@
+"""
+Benchmark of vectorized SQL Server detection against the per-row apply.
+"""
+
+import pathlib
+import time
+
+import pandas as pd
+
+from filter_sql_servers.detection import contains_sql_server, sql_server_mask
+
+MOCK_CSV_PATH = pathlib.Path(__file__).parents[1] / "data" / "vm_inventory.csv"
+ROWS = 1_000_000
+
+
+def test_sql_server_mask_1m_rows():
+    """Compare detection over 1M SQLSoftware values sampled from the mock."""
+    values = pd.read_csv(MOCK_CSV_PATH)["SQLSoftware"]
+    series = values.sample(n=ROWS, replace=True, random_state=0)
+
+    start = time.perf_counter()
+    expected = series.apply(contains_sql_server).astype(bool)
+    apply_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = sql_server_mask(series)
+    vectorized_seconds = time.perf_counter() - start
+
+    print(
+        f"\nSQL Server detection over {ROWS} rows: "
+        f"apply {apply_seconds:.2f}s, vectorized {vectorized_seconds:.2f}s "
+        f"({apply_seconds / vectorized_seconds:.1f}x)"
+    )
+    pd.testing.assert_series_equal(result, expected)
+    assert vectorized_seconds < apply_seconds
@@ -0,0 +1,75 @@
+"""
+Benchmark of product matching as the number of patterns grows.
+
+Values are distinct, so every one is scanned and the per-value
+memoization of match_series does not hide the cost of a scan.
+"""
+
+import random
+import time
+
+import pandas as pd
+
+from filter_sql_servers.products import ProductMatcher
+
+from .inventory_generator import load_catalogue
+
+VALUES = 20_000
+PATTERN_COUNTS = (10, 100, 1000)
+
+
+def make_values(software):
+    """Build distinct RawSoftware strings from the catalogue."""
+    rng = random.Random(0)
+    return pd.Series(
+        [
+            repr(rng.sample(software, rng.randint(12, 24)) + [f"Tool {i}"])
+            for i in range(VALUES)
+        ]
+    )
+
+
+def make_products(software, count):
+    """Configure ``count`` products, from the catalogue and beyond."""
+    names = software + [f"Unknown Product {i}" for i in range(count)]
+    return {name: [name] for name in names[:count]}
+
+
+def test_match_cost_is_flat_in_pattern_count():
+    """Compare the automaton with one substring test per pattern."""
+    software, _ = load_catalogue()
+    values = make_values(software)
+
+    timings = {}
+    for count in PATTERN_COUNTS:
+        products = make_products(software, count)
+        matcher = ProductMatcher(products)
+
+        start = time.perf_counter()
+        result = matcher.match_series(values)
+        automaton_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        patterns = [
+            (product, pattern.casefold())
+            for product, product_patterns in products.items()
+            for pattern in product_patterns
+        ]
+        expected = [
+            tuple(
+                dict.fromkeys(
+                    product for product, pattern in patterns if pattern in text
+                )
+            )
+            for text in values.str.casefold()
+        ]
+        naive_seconds = time.perf_counter() - start
+
+        assert result.tolist() == expected
+        timings[count] = automaton_seconds
+        print(
+            f"\n{count} patterns over {VALUES} values: automaton "
+            f"{automaton_seconds:.2f}s, per-pattern {naive_seconds:.2f}s"
+        )
+
+    assert timings[PATTERN_COUNTS[-1]] < 3 * timings[PATTERN_COUNTS[0]]
@@ -0,0 +1,124 @@
+"""
+Benchmark of each VMFilter stage over synthetic inventories.
+
+Storage is replaced by in-memory stand-ins, so the timings cover parsing,
+filtering, rendering and encryption but no network I/O. Inventory sizes
+and SQL Server prevalence can be overridden, e.g.
+``BENCHMARK_ROWS=10000,100000 BENCHMARK_SQL_PREVALENCE=0.1``. With
+BENCHMARK_OUTPUT set, results are also written there as JSON for comparison
+between runs.
+"""
+
+import json
+import os
+import time
+import tracemalloc
+from unittest.mock import patch
+
+import pytest
+
+from filter_sql_servers import VMFilter
+
+from .blob_stubs import InMemoryBlobServiceClient
+from .inventory_generator import DEFAULT_SQL_PREVALENCE, generate_inventory_csv
+
+ROW_COUNTS = [
+    int(rows)
+    for rows in os.environ.get(
+        "BENCHMARK_ROWS", "10000,100000,1000000,5000000"
+    ).split(",")
+]
+SQL_PREVALENCE = float(
+    os.environ.get("BENCHMARK_SQL_PREVALENCE", DEFAULT_SQL_PREVALENCE)
+)
+
+# Data rows an Excel sheet can hold below the header
+EXCEL_MAX_ROWS = 1_048_575
+
+CONFIG = {
+    "preprocess_account": "preprocess",
+    "preprocess_container": "pre-container",
+    "postprocess_account": "postprocess",
+    "postprocess_container": "post-container",
+    "managed_identity_client_id": "client-id",
+}
+
+INPUT_BLOB = "vm_inventory.csv"
+
+
+@pytest.fixture(scope="module")
+def results():
+    """Collect stage results and report them once all sizes have run."""
+    results = []
+    yield results
+    print("\nrows       stage               seconds   peak MiB")
+    for result in results:
+        print(
+            f"{result['rows']:<10} {result['stage']:<18} "
+            f"{result['seconds']:>8.2f} {result['peak_bytes'] / 2**20:>10.1f}"
+        )
+    if os.environ.get("BENCHMARK_OUTPUT"):
+        with open(os.environ["BENCHMARK_OUTPUT"], "w") as output:
+            json.dump(results, output, indent=2)
+
+
+def measure(stage, *args):
+    """
+    Run a stage once for its wall time and once more under tracemalloc
+    for its peak memory, so tracing does not inflate the timing.
+
+    Returns:
+        Tuple of the stage's result, seconds and peak bytes allocated
+        above what was allocated when it started
+    """
+    start = time.perf_counter()
+    stage(*args)
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = stage(*args)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+@pytest.mark.parametrize("rows", ROW_COUNTS)
+def test_vm_filter_stages(rows, results):
+    """Time each VMFilter stage over an inventory of ``rows`` VMs."""
+    storage = InMemoryBlobServiceClient()
+    storage.blobs[(CONFIG["preprocess_container"], INPUT_BLOB)] = (
+        generate_inventory_csv(rows, SQL_PREVALENCE)
+    )
+
+    def record(stage, *args):
+        result, seconds, peak = measure(stage, *args)
+        results.append(
+            {
+                "rows": rows,
+                "sql_prevalence": SQL_PREVALENCE,
+                "stage": stage.__name__,
+                "seconds": seconds,
+                "peak_bytes": peak,
+            }
+        )
+        return result
+
+    with patch("filter_sql_servers.BlobServiceClient", return_value=storage):
+        vm_filter = VMFilter(None, CONFIG)
+
+        data = record(vm_filter.load_data, INPUT_BLOB)
+        sql_vms = record(vm_filter.filter_sql_vms, data)
+        del data
+        streamed = record(vm_filter.load_sql_vms, INPUT_BLOB)
+        assert len(streamed) == len(sql_vms)
+        del streamed
+
+        if len(sql_vms) > EXCEL_MAX_ROWS:
+            pytest.skip(f"{len(sql_vms)} SQL Server VMs do not fit in Excel")
+        record(vm_filter.export_to_excel, sql_vms, "report.xlsx", "password")
+
+    report = storage.blobs[(CONFIG["postprocess_container"], "report.xlsx")]
+    assert report
@@ -29,6 +29,34 @@ def reset_environment():
     os.environ.update(original_env)
 
 
+@pytest.fixture(autouse=True)
+def reset_azure_clients():
+    """
+    Clear the process-wide Azure client registry, secret cache, report
+    manifests, software indexes and inventories around each test, and stop
+    any worker process pools a test started.
+
+    These are kept across invocations, so without this an object created
+    (or mocked) in one test would leak into the next.
+    """
+    import filter_sql_servers
+    from filter_sql_servers import manifest, query, software_index
+    from filter_sql_servers.parallel import shutdown_process_pools
+
+    filter_sql_servers.reset_clients()
+    filter_sql_servers.reset_secret_cache()
+    manifest._report_manifests.clear()
+    software_index._software_indexes.clear()
+    query._inventories.clear()
+    yield
+    filter_sql_servers.reset_clients()
+    filter_sql_servers.reset_secret_cache()
+    manifest._report_manifests.clear()
+    software_index._software_indexes.clear()
+    query._inventories.clear()
+    shutdown_process_pools()
+
+
 @pytest.fixture
 def mock_azure_env():
     """
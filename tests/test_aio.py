@@ -0,0 +1,459 @@
+"""
+Unit tests for the async execution path of the SQL Server VM filter.
+"""
+
+import json
+import os
+import pathlib
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+
+import azure.functions as func
+import pandas as pd
+import pytest
+from azure.core.exceptions import ClientAuthenticationError
+
+from filter_sql_servers import StalePasswordError, _secrets, aio
+from filter_sql_servers.aio import AsyncVMFilter, get_report_secret, main
+from filter_sql_servers.schema import csv_options
+
+TEST_DATA_DIR = pathlib.Path(__file__).parent / "data"
+MOCK_CSV_PATH = TEST_DATA_DIR / "vm_inventory.csv"
+
+AZURE_ENV = {
+    "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+    "PREPROCESS_CONTAINER": "pre-container",
+    "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+    "POSTPROCESS_CONTAINER": "post-container",
+    "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+    "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+}
+
+
+def make_secret(value="test_password", version="v1"):
+    """Build a stand-in for a KeyVaultSecret."""
+    secret = MagicMock()
+    secret.value = value
+    secret.properties.version = version
+    secret.properties.expires_on = None
+    return secret
+
+
+def make_async_context(client):
+    """Make a mock usable with ``async with``, yielding itself."""
+    client.__aenter__ = AsyncMock(return_value=client)
+    client.__aexit__ = AsyncMock(return_value=False)
+    return client
+
+
+@pytest.fixture(autouse=True)
+def reset_async_clients():
+    """Drop pooled async clients, which would leak mocks between tests."""
+    aio._clients.clear()
+    yield
+    aio._clients.clear()
+
+
+@pytest.fixture
+def csv_bytes():
+    """The mock inventory CSV as the blob download returns it."""
+    return MOCK_CSV_PATH.read_bytes()
+
+
+@pytest.fixture
+def blob_service(csv_bytes):
+    """Mock async BlobServiceClient serving the mock inventory."""
+    service = make_async_context(MagicMock())
+    blob_client = service.get_blob_client.return_value
+    downloader = MagicMock()
+    downloader.readall = AsyncMock(return_value=csv_bytes)
+    blob_client.download_blob = AsyncMock(return_value=downloader)
+    blob_client.upload_blob = AsyncMock()
+    service.close = AsyncMock()
+    with patch(
+        "filter_sql_servers.aio.BlobServiceClient", return_value=service
+    ) as service_class:
+        service.service_class = service_class
+        yield service
+
+
+@pytest.fixture
+def secret_client():
+    """Mock async SecretClient returning the report password."""
+    client = MagicMock()
+    client.get_secret = AsyncMock(return_value=make_secret())
+    client.close = AsyncMock()
+    with patch("filter_sql_servers.aio.SecretClient", return_value=client):
+        yield client
+
+
+@pytest.fixture
+def credential():
+    """Mock async ManagedIdentityCredential."""
+    credential = make_async_context(MagicMock())
+    credential.close = AsyncMock()
+    with patch(
+        "filter_sql_servers.aio.ManagedIdentityCredential",
+        return_value=credential,
+    ) as credential_class:
+        yield credential_class
+
+
+class TestAsyncVMFilter:
+    """Test cases for AsyncVMFilter."""
+
+    @pytest.fixture
+    def test_config(self):
+        return {
+            "preprocess_account": "preprocessstorage",
+            "preprocess_container": "pre-container",
+            "postprocess_account": "postprocessstorage",
+            "postprocess_container": "post-container",
+        }
+
+    @pytest.mark.asyncio
+    async def test_load_and_filter(self, blob_service, test_config):
+        """Test the inventory is downloaded, parsed and filtered."""
+        vm_filter = AsyncVMFilter(MagicMock(), test_config)
+
+        data = await vm_filter.load_data("vm_inventory.csv")
+        sql_vms = await vm_filter.filter_sql_vms(data)
+
+        expected = pd.read_csv(MOCK_CSV_PATH, **csv_options())
+        pd.testing.assert_frame_equal(data, expected)
+        assert 0 < len(sql_vms) < len(data)
+        blob_service.get_blob_client.assert_called_once_with(
+            container="pre-container", blob="vm_inventory.csv"
+        )
+
+    @pytest.mark.asyncio
+    async def test_load_parses_only_requested_columns(
+        self, blob_service, test_config
+    ):
+        """Test unrequested columns are skipped while parsing."""
+        vm_filter = AsyncVMFilter(MagicMock(), test_config)
+
+        data = await vm_filter.load_data(
+            "vm_inventory.csv", ["AccountID", "SQLSoftware"]
+        )
+
+        assert list(data.columns) == ["AccountID", "SQLSoftware"]
+        assert data["SQLSoftware"].dtype == "category"
+
+    @pytest.mark.asyncio
+    async def test_export_uploads_spooled_report(
+        self, blob_service, test_config
+    ):
+        """Test the encrypted report is uploaded with its length."""
+        vm_filter = AsyncVMFilter(MagicMock(), test_config)
+        data = pd.read_csv(MOCK_CSV_PATH)
+
+        await vm_filter.export_to_excel(data, "report.xlsx", "password")
+
+        upload = blob_service.get_blob_client.return_value.upload_blob
+        upload.assert_awaited_once()
+        assert upload.call_args.kwargs["length"] > 0
+        assert upload.call_args.kwargs["overwrite"] is True
+
+    @pytest.mark.asyncio
+    async def test_export_rejects_empty_password(
+        self, blob_service, test_config
+    ):
+        """Test an empty password is reported as stale."""
+        vm_filter = AsyncVMFilter(MagicMock(), test_config)
+
+        with pytest.raises(StalePasswordError):
+            await vm_filter.export_to_excel(
+                pd.read_csv(MOCK_CSV_PATH), "report.xlsx", ""
+            )
+
+
+class TestAsyncReportSecret:
+    """Test cases for the async report password lookup."""
+
+    @pytest.mark.asyncio
+    async def test_shares_sync_cache(self):
+        """Test a cached password is returned without calling Key Vault."""
+        client = MagicMock()
+        client.get_secret = AsyncMock(return_value=make_secret())
+
+        first = await get_report_secret(client, "https://kv", 60)
+        second = await get_report_secret(client, "https://kv", 60)
+
+        assert first is second
+        client.get_secret.assert_awaited_once_with("postprocess-secret")
+        assert _secrets.lookup(("https://kv", "postprocess-secret"), 60)
+
+    @pytest.mark.asyncio
+    async def test_unusable_cached_secret_is_fetched_again(self):
+        """Test a rejected cached password is refreshed once."""
+        client = MagicMock()
+        client.get_secret = AsyncMock(
+            side_effect=[make_secret(value="", version="v1"), make_secret()]
+        )
+
+        secret = await get_report_secret(client, "https://kv", 60)
+
+        assert secret.value
+        assert client.get_secret.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_force_refresh_and_empty_value(self):
+        """Test a forced refresh fetches again and rejects empty values."""
+        client = MagicMock()
+        client.get_secret = AsyncMock(
+            side_effect=[make_secret(), make_secret(value="", version="v2")]
+        )
+
+        await get_report_secret(client, "https://kv", 60)
+        with pytest.raises(StalePasswordError):
+            await get_report_secret(
+                client, "https://kv", 60, force_refresh=True
+            )
+
+    @pytest.mark.asyncio
+    async def test_version_check_detects_rotation(self):
+        """Test a rotated password is fetched again within the TTL."""
+
+        async def versions(name):
+            for version, created_on in (("v1", 1), ("v2", 2)):
+                properties = MagicMock(enabled=True, created_on=created_on)
+                properties.version = version
+                yield properties
+
+        client = MagicMock()
+        client.get_secret = AsyncMock(
+            side_effect=[make_secret(), make_secret(version="v2")]
+        )
+        client.list_properties_of_secret_versions = versions
+
+        await get_report_secret(client, "https://kv", 60, check_interval=0)
+        second = await get_report_secret(
+            client, "https://kv", 60, check_interval=0
+        )
+
+        assert second.properties.version == "v2"
+        assert client.get_secret.await_count == 2
+
+
+class TestAsyncMain:
+    """Test cases for the async main function."""
+
+    @pytest.mark.asyncio
+    @patch.dict(os.environ, AZURE_ENV)
+    async def test_main_success(self, credential, blob_service, secret_client):
+        """Test a report is generated and the clients are kept open."""
+        response = await main(Mock(spec=func.HttpRequest))
+
+        body = response.get_body().decode()
+        assert response.status_code == 200
+        assert "Report generated successfully" in body
+        expected = pd.read_csv(MOCK_CSV_PATH)["SQLSoftware"]
+        count = expected.str.contains("Microsoft SQL Server").sum()
+        assert f"Total SQL Server VMs: {count}" in body
+        credential.assert_called_once_with(client_id="client-id")
+        secret_client.get_secret.assert_awaited_once_with("postprocess-secret")
+        secret_client.close.assert_not_awaited()
+        credential.return_value.close.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    @patch.dict(os.environ, AZURE_ENV)
+    async def test_main_reuses_clients(
+        self, credential, blob_service, secret_client
+    ):
+        """Test warm invocations reuse the credential and clients."""
+        first = await main(Mock(spec=func.HttpRequest))
+        second = await main(Mock(spec=func.HttpRequest))
+
+        assert first.status_code == second.status_code == 200
+        credential.assert_called_once_with(client_id="client-id")
+        # One client per storage account
+        assert blob_service.service_class.call_count == 2
+        aio.SecretClient.assert_called_once()
+
+    @pytest.mark.asyncio
+    @patch.dict(os.environ, AZURE_ENV)
+    async def test_main_returns_stage_metrics(
+        self, credential, blob_service, secret_client
+    ):
+        """Test metrics=json returns the stages of the async run."""
+        req = Mock(spec=func.HttpRequest)
+        req.params = {"metrics": "json"}
+        req.get_body.return_value = b""
+
+        response = await main(req)
+
+        assert response.status_code == 200
+        body = json.loads(response.get_body())
+        assert "Report generated successfully" in body["message"]
+        stages = {s["stage"]: s for s in body["metrics"]["stages"]}
+        assert set(stages) == {
+            "credential",
+            "download",
+            "parse",
+            "filter",
+            "secret",
+            "summarize",
+            "render",
+            "encrypt",
+            "upload",
+        }
+        assert stages["parse"]["rows_out"] == len(pd.read_csv(MOCK_CSV_PATH))
+        assert all(s["peak_rss_bytes"] for s in stages.values())
+
+    @pytest.mark.asyncio
+    @patch.dict(
+        os.environ,
+        dict(AZURE_ENV, CLASSIFY_SQL_VERSIONS="true"),
+    )
+    async def test_main_classifies_report(
+        self, credential, blob_service, secret_client
+    ):
+        """Test the report is classified when configured."""
+        with patch.object(
+            AsyncVMFilter, "export_to_excel", AsyncMock()
+        ) as export:
+            response = await main(Mock(spec=func.HttpRequest))
+
+        assert response.status_code == 200
+        report = export.call_args.args[0]
+        assert report["SQLServerStatus"].notna().all()
+
+    @pytest.mark.asyncio
+    @patch.dict(os.environ, AZURE_ENV)
+    async def test_main_empty_password(
+        self, credential, blob_service, secret_client
+    ):
+        """Test an empty password in Key Vault is reported."""
+        secret_client.get_secret.return_value = make_secret(value="")
+
+        response = await main(Mock(spec=func.HttpRequest))
+
+        assert response.status_code == 500
+        assert "expired or empty" in response.get_body().decode()
+
+    @pytest.mark.asyncio
+    @patch.dict(os.environ, AZURE_ENV)
+    async def test_main_no_sql_servers_ignores_secret_errors(
+        self, credential, blob_service, secret_client
+    ):
+        """Test a failed password lookup does not matter without SQL VMs."""
+        downloader = (
+            blob_service.get_blob_client.return_value.download_blob
+        ).return_value
+        downloader.readall.return_value = (
+            b"AccountID,VMName,SQLSoftware\n1,vm1,[]\n"
+        )
+        secret_client.get_secret.side_effect = RuntimeError("unreachable")
+
+        response = await main(Mock(spec=func.HttpRequest))
+
+        assert response.status_code == 200
+        assert "No SQL Server installations found" in (
+            response.get_body().decode()
+        )
+
+    @pytest.mark.asyncio
+    async def test_main_missing_keyvault_url(
+        self, credential, blob_service, secret_client
+    ):
+        """Test KEY_VAULT_URL is required when there is a report."""
+        env = {k: v for k, v in AZURE_ENV.items() if k != "KEY_VAULT_URL"}
+        with patch.dict(os.environ, env):
+            response = await main(Mock(spec=func.HttpRequest))
+
+        assert response.status_code == 500
+        assert "KEY_VAULT_URL is required" in response.get_body().decode()
+
+    @pytest.mark.asyncio
+    async def test_main_missing_config(self):
+        """Test a missing setting is reported as a configuration error."""
+        with patch.dict(os.environ, {}, clear=True):
+            response = await main(Mock(spec=func.HttpRequest))
+
+        assert response.status_code == 500
+        assert "Configuration error: Missing" in response.get_body().decode()
+
+    @pytest.mark.asyncio
+    @patch.dict(os.environ, AZURE_ENV)
+    async def test_main_authentication_error(
+        self, credential, blob_service, secret_client
+    ):
+        """Test authentication failures are reported."""
+        downloader = blob_service.get_blob_client.return_value
+        downloader.download_blob.side_effect = ClientAuthenticationError(
+            "denied"
+        )
+
+        response = await main(Mock(spec=func.HttpRequest))
+
+        assert response.status_code == 500
+        assert "Authentication error" in response.get_body().decode()
+        # The pooled clients are closed so the next invocation rebuilds them
+        credential.return_value.close.assert_awaited_once()
+        blob_service.close.assert_awaited_once()
+        await main(Mock(spec=func.HttpRequest))
+        assert credential.call_count == 2
+
+    @pytest.mark.asyncio
+    @patch.dict(os.environ, AZURE_ENV)
+    async def test_main_generic_error(
+        self, credential, blob_service, secret_client
+    ):
+        """Test unexpected errors are reported."""
+        downloader = blob_service.get_blob_client.return_value
+        downloader.download_blob.side_effect = RuntimeError("boom")
+
+        response = await main(Mock(spec=func.HttpRequest))
+
+        assert response.status_code == 500
+        assert "Error: boom" in response.get_body().decode()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "setting",
+        [
+            {"INVENTORY_CHUNK_ROWS": "1000"},
+            {"INVENTORY_PARSE_PROCESSES": "4"},
+            {"INVENTORY_LOAD_PLANNER": "true"},
+            {"DELTA_REPORT": "instead"},
+            {"SNAPSHOT_HISTORY": "true"},
+            {"PRODUCT_PATTERNS": '{"Agent": "Agent"}'},
+        ],
+    )
+    async def test_main_delegates_other_modes_to_sync_main(self, setting):
+        """Test modes the async path does not serve use the sync main."""
+        sync_response = func.HttpResponse("sync", status_code=200)
+        request = Mock(spec=func.HttpRequest)
+        with patch.dict(os.environ, dict(AZURE_ENV, **setting)), patch(
+            "filter_sql_servers.aio.sync_main", return_value=sync_response
+        ) as sync_main:
+            response = await main(request)
+
+        assert response is sync_response
+        sync_main.assert_called_once_with(request)
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "params",
+        [
+            {"mode": "query"},
+            {"mode": "query", "format": "xml"},
+            {"report_format": "csv.gz"},
+            {"report_format": "xml"},
+        ],
+    )
+    @patch.dict(os.environ, AZURE_ENV)
+    async def test_main_delegates_requests_to_sync_main(self, params):
+        """Test queries and data file reports, valid or not, are answered
+        by the sync main."""
+        sync_response = func.HttpResponse("sync", status_code=200)
+        request = Mock(spec=func.HttpRequest)
+        request.params = params
+        request.get_body.return_value = b""
+        with patch(
+            "filter_sql_servers.aio.sync_main", return_value=sync_response
+        ) as sync_main:
+            response = await main(request)
+
+        assert response is sync_response
+        sync_main.assert_called_once_with(request)
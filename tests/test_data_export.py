@@ -0,0 +1,60 @@
+"""
+Unit tests for the machine-readable report formats.
+"""
+
+import gzip
+from io import BytesIO
+
+import pandas as pd
+import pytest
+
+from filter_sql_servers.data_export import report_extension, write_data
+
+
+@pytest.fixture
+def report():
+    """Small SQL Server report."""
+    return pd.DataFrame(
+        {
+            "AccountID": [123456789012, 222],
+            "VMName": ["vm-a", "vm-b"],
+            "SQLSoftware": ["['Microsoft SQL Server 2019']", None],
+        }
+    )
+
+
+def read_back(content, data_format):
+    """Parse a written report."""
+    if data_format == "parquet":
+        return pd.read_parquet(BytesIO(content))
+    if data_format == "csv.gz":
+        content = gzip.decompress(content)
+    return pd.read_csv(BytesIO(content), dtype={"AccountID": str})
+
+
+@pytest.mark.parametrize("data_format", ["csv", "csv.gz", "parquet"])
+def test_write_data(report, data_format):
+    """Test every format keeps the rows and writes AccountID as text."""
+    stream = BytesIO()
+
+    write_data(report, stream, data_format)
+
+    data = read_back(stream.getvalue(), data_format)
+    assert data["AccountID"].tolist() == ["123456789012", "222"]
+    assert data["VMName"].tolist() == ["vm-a", "vm-b"]
+    assert pd.isna(data["SQLSoftware"][1])
+    assert report["AccountID"].dtype == "int64"
+
+
+def test_write_data_rejects_unknown_format(report):
+    """Test an unknown format is an error."""
+    with pytest.raises(ValueError, match="Unknown data format"):
+        write_data(report, BytesIO(), "xml")
+
+
+def test_report_extension():
+    """Test data files are marked as encrypted."""
+    assert report_extension("xlsx") == ".xlsx"
+    assert report_extension("csv") == ".csv.enc"
+    assert report_extension("csv.gz") == ".csv.gz.enc"
+    assert report_extension("parquet") == ".parquet.enc"
@@ -0,0 +1,109 @@
+"""
+Unit tests for change reports between consecutive SQL Server reports.
+"""
+
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from filter_sql_servers.delta import (
+    CHANGE_COLUMN,
+    ROW_HASH_COLUMN,
+    build_snapshot,
+    change_report,
+    count_changes,
+    load_snapshot,
+    save_snapshot,
+)
+
+
+@pytest.fixture
+def report():
+    """Small SQL Server report."""
+    return pd.DataFrame(
+        {
+            "AccountID": [111, 111, 222, 333],
+            "VMName": ["vm-a", "vm-b", "vm-a", "vm-c"],
+            "SQLSoftware": [
+                "['Microsoft SQL Server 2019 (64-bit)']",
+                "['Microsoft SQL Server 2016 (64-bit)']",
+                "['Microsoft SQL Server 2019 (64-bit)']",
+                "['Microsoft SQL Server 2022 (64-bit)']",
+            ],
+        }
+    )
+
+
+def test_build_snapshot(report):
+    """Test one text key and row hash per VM."""
+    snapshot = build_snapshot(report)
+
+    assert snapshot["AccountID"].tolist() == ["111", "111", "222", "333"]
+    assert snapshot[ROW_HASH_COLUMN].dtype == np.uint64
+    assert snapshot[ROW_HASH_COLUMN].nunique() == 4
+    assert snapshot.index.tolist() == [0, 1, 2, 3]
+
+
+def test_build_snapshot_keeps_first_duplicate(report):
+    """Test a repeated key keeps its first row."""
+    data = pd.concat([report, report.iloc[[0]]], ignore_index=True)
+
+    snapshot = build_snapshot(data)
+
+    assert len(snapshot) == 4
+    assert snapshot.index.tolist() == [0, 1, 2, 3]
+
+
+def test_change_report(report):
+    """Test added, changed and removed VMs are found."""
+    previous = build_snapshot(report)
+    current_data = report.drop(index=1).reset_index(drop=True)
+    current_data.loc[0, "SQLSoftware"] = "['Microsoft SQL Server 2022']"
+    current_data.loc[len(current_data)] = [444, "vm-d", "[]"]
+    current = build_snapshot(current_data)
+
+    changes = change_report(current_data, current, previous)
+
+    assert changes.columns.tolist() == [CHANGE_COLUMN, *report.columns]
+    assert changes[CHANGE_COLUMN].tolist() == ["added", "changed", "removed"]
+    assert changes["VMName"].tolist() == ["vm-d", "vm-a", "vm-b"]
+    assert changes["SQLSoftware"].iloc[1] == "['Microsoft SQL Server 2022']"
+    assert pd.isna(changes["SQLSoftware"].iloc[2])
+    assert count_changes(changes) == {"added": 1, "changed": 1, "removed": 1}
+
+
+def test_first_run_adds_every_vm(report):
+    """Test without a previous snapshot every VM is added."""
+    changes = change_report(report, build_snapshot(report), None)
+
+    assert count_changes(changes) == {"added": 4, "changed": 0, "removed": 0}
+    assert changes["VMName"].tolist() == report["VMName"].tolist()
+
+
+def test_unchanged_and_emptied_reports(report):
+    """Test an identical report has no changes and an empty one removes
+    every VM."""
+    previous = build_snapshot(report)
+
+    unchanged = change_report(report, build_snapshot(report), previous)
+    empty = report.iloc[:0]
+    emptied = change_report(empty, build_snapshot(empty), previous)
+
+    assert unchanged.empty
+    assert count_changes(emptied) == {"added": 0, "changed": 0, "removed": 4}
+
+
+def test_snapshot_round_trip(report):
+    """Test snapshots keep their exact 64-bit hashes when stored."""
+    snapshot = build_snapshot(report)
+    stream = BytesIO()
+
+    save_snapshot(snapshot, stream)
+    loaded = load_snapshot(stream.getvalue())
+
+    assert loaded[ROW_HASH_COLUMN].tolist() == (
+        snapshot[ROW_HASH_COLUMN].tolist()
+    )
+    assert change_report(report, snapshot, loaded).empty
@@ -0,0 +1,129 @@
+"""
+Unit tests for vectorized SQL Server detection.
+"""
+
+import pathlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from filter_sql_servers.detection import contains_sql_server, sql_server_mask
+
+
+TEST_DATA_DIR = pathlib.Path(__file__).parent / "data"
+MOCK_CSV_PATH = TEST_DATA_DIR / "vm_inventory.csv"
+
+# Values covering every branch of the reference implementation
+EDGE_CASE_VALUES = [
+    None,
+    np.nan,
+    "",
+    "   ",
+    "[]",
+    " [] ",
+    "['Microsoft SQL Server 2019 (64-bit)']",
+    "['PostgreSQL 15']",
+    "['Microsoft SQL Server 2016', 'Microsoft SQL Server 2017 (64-bit)']",
+    '["Microsoft SQL Server 2019"]',
+    '["PostgreSQL"]',
+    ' ["Microsoft SQL Server 2022"] ',
+    '"Microsoft SQL Server 2019"',
+    '{"Microsoft SQL Server": 1}',
+    '{"name": "Microsoft SQL Server 2019"}',
+    '[["Microsoft SQL Server 2019"]]',
+    '["a", ["Microsoft SQL Server"]]',
+    '[1, "Microsoft SQL Server 2019"]',
+    '[null, "Microsoft SQL Server 2019"]',
+    '["Microsoft SQL \\u0053erver 2019"]',
+    '["C:\\\\Program Files\\\\Microsoft SQL Server"]',
+    "Microsoft SQL Server 2019",
+    "microsoft sql server 2019",
+    "['Tool [x64]', 'Microsoft SQL Server 2014']",
+    "['Tool [x64]', 'Oracle']",
+    ["Microsoft SQL Server 2019"],
+    ["PostgreSQL"],
+    [],
+    42,
+    3.5,
+]
+
+
+def reference_mask(series):
+    """Per-row semantics that the vectorized mask must reproduce."""
+    return series.apply(contains_sql_server).astype(bool)
+
+
+class TestSqlServerMask:
+    """Equivalence of the vectorized mask with the reference semantics."""
+
+    def test_matches_reference_on_edge_cases(self):
+        """Test every edge-case value against the reference."""
+        series = pd.Series(EDGE_CASE_VALUES, dtype=object)
+
+        result = sql_server_mask(series)
+
+        pd.testing.assert_series_equal(result, reference_mask(series))
+
+    @pytest.mark.parametrize("value", EDGE_CASE_VALUES)
+    def test_matches_reference_per_value(self, value):
+        """Test each value on its own, so string-only paths are covered."""
+        series = pd.Series([value, "[]"], dtype=object)
+
+        result = sql_server_mask(series)
+
+        pd.testing.assert_series_equal(result, reference_mask(series))
+
+    def test_matches_reference_on_real_data(self):
+        """Test the mock inventory gives identical results."""
+        series = pd.read_csv(MOCK_CSV_PATH)["SQLSoftware"]
+
+        result = sql_server_mask(series)
+
+        pd.testing.assert_series_equal(result, reference_mask(series))
+        assert result.any()
+
+    def test_preserves_duplicate_index(self):
+        """Test results are positional even with duplicate index labels."""
+        series = pd.Series(
+            ["['Microsoft SQL Server 2019']", "[]", '"Microsoft SQL Server"'],
+            index=[7, 7, 7],
+        )
+
+        result = sql_server_mask(series)
+
+        assert result.tolist() == [True, False, False]
+        assert result.index.tolist() == [7, 7, 7]
+
+    def test_categorical_column(self):
+        """Test categorical columns are decided once per category."""
+        series = pd.Series(
+            ["['Microsoft SQL Server 2019']", "[]", None, "['Oracle']"],
+            dtype="category",
+        )
+
+        result = sql_server_mask(series)
+
+        assert result.tolist() == [True, False, False, False]
+
+    def test_string_dtype_column(self):
+        """Test pandas string dtype columns."""
+        series = pd.Series(
+            ["['Microsoft SQL Server 2019']", "[]", None], dtype="string"
+        )
+
+        result = sql_server_mask(series)
+
+        assert result.tolist() == [True, False, False]
+
+    def test_non_string_column(self):
+        """Test numeric and all-missing columns never match."""
+        assert not sql_server_mask(pd.Series([1, 2, 3])).any()
+        assert not sql_server_mask(pd.Series([np.nan, np.nan])).any()
+
+    def test_empty_column(self):
+        """Test an empty column returns an empty boolean mask."""
+        result = sql_server_mask(pd.Series([], dtype=object))
+
+        assert result.empty
+        assert result.dtype == bool
@@ -0,0 +1,111 @@
+"""
+Unit tests for the streaming report encryption.
+"""
+
+from io import BytesIO
+
+import pytest
+
+from filter_sql_servers.encryption import (
+    CHUNK_BYTES,
+    MAGIC,
+    SALT_BYTES,
+    TAG_BYTES,
+    EncryptingWriter,
+    decrypt_stream,
+)
+
+HEADER_BYTES = len(MAGIC) + SALT_BYTES
+SEALED_BYTES = CHUNK_BYTES + TAG_BYTES
+
+
+def encrypt(data, password="secret", pieces=1):
+    """Encrypt bytes, written in a number of pieces."""
+    encrypted = BytesIO()
+    with EncryptingWriter(encrypted, password) as writer:
+        step = max(1, len(data) // pieces)
+        for start in range(0, len(data), step):
+            writer.write(data[start : start + step])
+        assert writer.tell() == len(data)
+    return encrypted.getvalue()
+
+
+def decrypt(data, password="secret"):
+    """Decrypt bytes."""
+    plaintext = BytesIO()
+    decrypt_stream(BytesIO(data), plaintext, password)
+    return plaintext.getvalue()
+
+
+@pytest.mark.parametrize(
+    "size",
+    [0, 15, 1000, CHUNK_BYTES, CHUNK_BYTES + 1, 3 * 1024 * 1024 + 7],
+)
+def test_round_trip(size):
+    """Test files of any length decrypt to what was written."""
+    data = bytes(range(256)) * (size // 256) + bytes(size % 256)
+
+    encrypted = encrypt(data, pieces=7)
+
+    assert encrypted.startswith(MAGIC)
+    chunks = max(1, -(-size // CHUNK_BYTES))
+    assert len(encrypted) == HEADER_BYTES + size + chunks * TAG_BYTES
+    assert decrypt(encrypted) == data
+
+
+def test_salt_makes_every_file_unique():
+    """Test the same data encrypts differently each time."""
+    assert encrypt(b"report") != encrypt(b"report")
+
+
+def test_wrong_password_or_format_is_rejected():
+    """Test decryption fails for a wrong password or a foreign file."""
+    encrypted = encrypt(b"x" * 100)
+
+    with pytest.raises(ValueError):
+        decrypt(encrypted, "wrong")
+    with pytest.raises(ValueError, match="Not an encrypted report"):
+        decrypt(b"PK\x03\x04 a workbook")
+
+
+def test_close_is_idempotent():
+    """Test closing twice writes the final block once."""
+    encrypted = BytesIO()
+    writer = EncryptingWriter(encrypted, "secret")
+    writer.write(b"data")
+    writer.close()
+    length = encrypted.tell()
+    writer.close()
+
+    assert encrypted.tell() == length
+
+
+def swap_first_chunks(data):
+    """Swap the first two encrypted chunks of a file."""
+    first = slice(HEADER_BYTES, HEADER_BYTES + SEALED_BYTES)
+    second = slice(first.stop, first.stop + SEALED_BYTES)
+    return (
+        data[:HEADER_BYTES] + data[second] + data[first] + data[second.stop :]
+    )
+
+
+@pytest.mark.parametrize(
+    "tamper",
+    [
+        # A flipped ciphertext bit
+        lambda data: data[:-1] + bytes([data[-1] ^ 1]),
+        # A changed salt
+        lambda data: MAGIC + bytes(SALT_BYTES) + data[HEADER_BYTES:],
+        # The last chunk cut off, at a chunk boundary
+        lambda data: data[: HEADER_BYTES + 2 * SEALED_BYTES],
+        swap_first_chunks,
+        # Everything after the header dropped
+        lambda data: data[:HEADER_BYTES],
+    ],
+)
+def test_altered_files_are_rejected(tamper):
+    """Test changed, reordered or truncated files do not decrypt."""
+    encrypted = encrypt(bytes(3 * CHUNK_BYTES))
+
+    with pytest.raises(ValueError, match="altered or truncated"):
+        decrypt(tamper(encrypted))
@@ -0,0 +1,124 @@
+"""
+Unit tests for the streaming Excel report writer.
+"""
+
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+from filter_sql_servers import excel
+from filter_sql_servers.excel import (
+    MAX_COLUMN_WIDTH,
+    SHEET_NAME,
+    column_widths,
+    write_workbook,
+)
+
+
+def render(data):
+    """Render a DataFrame and load the resulting worksheet."""
+    buffer = BytesIO()
+    write_workbook(data, buffer)
+    buffer.seek(0)
+    return load_workbook(buffer)[SHEET_NAME]
+
+
+class TestColumnWidths:
+    """Test cases for column width computation."""
+
+    def test_widths_use_longest_value_or_header(self):
+        """Test widths are the longest string plus padding."""
+        data = pd.DataFrame({"VMName": ["vm1", "a-much-longer-vm-name"]})
+
+        assert column_widths(data) == [len("a-much-longer-vm-name") + 2]
+
+    def test_widths_are_capped(self):
+        """Test very wide columns are capped."""
+        data = pd.DataFrame({"RawSoftware": ["x" * 500]})
+
+        assert column_widths(data) == [MAX_COLUMN_WIDTH]
+
+    def test_widths_of_empty_and_missing_columns(self):
+        """Test empty frames and missing values fall back to the header."""
+        empty = pd.DataFrame({"AccountID": pd.Series([], dtype=object)})
+        missing = pd.DataFrame({"SQLSoftware": [np.nan, np.nan]})
+
+        assert column_widths(empty) == [len("AccountID") + 2]
+        assert column_widths(missing) == [len("SQLSoftware") + 2]
+
+
+class TestWriteWorkbook:
+    """Test cases for the write-only workbook writer."""
+
+    def test_writes_header_rows_and_styles(self):
+        """Test header styling, widths and cell values."""
+        data = pd.DataFrame(
+            {
+                "AccountID": ["123456789012", "234567890123"],
+                "VMName": ["vm1", "vm2"],
+                "SQLSoftware": ["['Microsoft SQL Server 2019']", np.nan],
+            }
+        )
+
+        worksheet = render(data)
+
+        rows = list(worksheet.iter_rows(values_only=True))
+        assert rows == [
+            ("AccountID", "VMName", "SQLSoftware"),
+            ("123456789012", "vm1", "['Microsoft SQL Server 2019']"),
+            ("234567890123", "vm2", None),
+        ]
+        header = worksheet[1][0]
+        assert header.font.bold
+        assert header.font.color.rgb.endswith("FFFFFF")
+        assert header.fill.start_color.rgb.endswith("0066CC")
+        assert worksheet.column_dimensions["A"].width == 14
+        assert worksheet.column_dimensions["C"].width == 31
+
+    def test_streams_rows_in_batches(self, monkeypatch):
+        """Test rows spanning several batches are all written in order."""
+        monkeypatch.setattr(excel, "ROW_BATCH_SIZE", 2)
+        data = pd.DataFrame({"VMName": [f"vm{i}" for i in range(5)]})
+
+        worksheet = render(data)
+
+        values = [row[0] for row in worksheet.iter_rows(values_only=True)]
+        assert values == ["VMName", "vm0", "vm1", "vm2", "vm3", "vm4"]
+
+    def test_text_columns_are_written_as_strings(self):
+        """Test text columns are converted without copying the frame."""
+        data = pd.DataFrame({"AccountID": [123456789012], "Count": [3]})
+
+        buffer = BytesIO()
+        write_workbook(data, buffer, text_columns=("AccountID",))
+        buffer.seek(0)
+        worksheet = load_workbook(buffer)[SHEET_NAME]
+
+        assert list(worksheet.iter_rows(values_only=True))[1] == (
+            "123456789012",
+            3,
+        )
+        assert data["AccountID"].dtype == "int64"
+
+    def test_writes_summary_sheets_after_the_report(self):
+        """Test summaries follow the report, with text columns as text."""
+        data = pd.DataFrame({"AccountID": [123456789012], "VMName": ["vm1"]})
+        summary = pd.DataFrame({"AccountID": [123456789012], "Hosts": [1]})
+
+        buffer = BytesIO()
+        write_workbook(
+            data,
+            buffer,
+            text_columns=("AccountID",),
+            summaries=[("By Account", summary)],
+        )
+        buffer.seek(0)
+        workbook = load_workbook(buffer)
+
+        assert workbook.sheetnames == [SHEET_NAME, "By Account"]
+        assert list(workbook["By Account"].iter_rows(values_only=True)) == [
+            ("AccountID", "Hosts"),
+            ("123456789012", 1),
+        ]
@@ -3,26 +3,61 @@ Unit tests for Azure Function SQL Server VM filter.
 Note: AI used to achieve as close to full coverage as possible.
 """
 
+import gzip
 import json
 import os
-from datetime import datetime
+import subprocess
+import sys
+import textwrap
+from datetime import date, datetime, timedelta, timezone
 from io import BytesIO
 from unittest.mock import MagicMock, Mock, patch, PropertyMock
 import pathlib
 
+import numpy as np
 import pandas as pd
 import pytest
 import azure.functions as func
+from msoffcrypto import OfficeFile
 
 # Import the module under test
-from filter_sql_servers import VMFilter, main
-
+from filter_sql_servers import (
+    VMFilter,
+    main,
+    _BlobChunkReader,
+    get_blob_service_client,
+    get_credential,
+    get_report_secret,
+    get_secret_client,
+    reset_clients,
+    StalePasswordError,
+)
+from filter_sql_servers import parallel
+from filter_sql_servers.encryption import decrypt_stream
+from filter_sql_servers.inventory_cache import build_cache_table, write_cache
+from filter_sql_servers.query import read_query
+from filter_sql_servers.schema import csv_options, project
+from filter_sql_servers.software_index import SoftwareIndex
+from .benchmarks.blob_stubs import InMemoryBlobServiceClient
+from azure.core import MatchConditions
+from azure.core.exceptions import (
+    ClientAuthenticationError,
+    ResourceNotFoundError,
+    ResourceNotModifiedError,
+)
 
 # Path to test data
 TEST_DATA_DIR = pathlib.Path(__file__).parent / "data"
 MOCK_CSV_PATH = TEST_DATA_DIR / "vm_inventory.csv"
 
 
+def read_test_blob(source, offset, length):
+    """Read part of a test data file, in place of parallel.download_range."""
+    with open(TEST_DATA_DIR / source[2], "rb") as file:
+        file.seek(offset)
+        return file.read(length)
+
+
 @pytest.fixture
 def mock_credential():
     """Mock Azure ManagedIdentityCredential."""
@@ -44,8 +79,8 @@ def test_config():
 
 @pytest.fixture
 def real_mock_csv_data():
-    """Load the actual mock CSV data from the test data directory."""
-    return pd.read_csv(MOCK_CSV_PATH)
+    """Load the actual mock CSV data with the declared inventory dtypes."""
+    return pd.read_csv(MOCK_CSV_PATH, **csv_options())
 
 
 @pytest.fixture
@@ -55,6 +90,15 @@ def real_mock_csv_bytes():
         return f.read()
 
 
+def make_secret(value="test_password", version="v1", expires_on=None):
+    """Build a stand-in for a KeyVaultSecret."""
+    secret = MagicMock()
+    secret.value = value
+    secret.properties.version = version
+    secret.properties.expires_on = expires_on
+    return secret
+
+
 @pytest.fixture
 def sample_vm_data():
     """Small sample of VM data for quick tests."""
@@ -121,6 +165,153 @@ class TestVMFilter:
         assert "SQLSoftware" in result.columns
         assert "PlatformDetails" in result.columns
 
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_load_sql_vms_parallel(
+        self,
+        mock_blob_service,
+        mock_credential,
+        test_config,
+        real_mock_csv_bytes,
+        real_mock_csv_data,
+        monkeypatch,
+    ):
+        """Test parsing in processes matches load-then-filter."""
+        # Arrange - small enough ranges that both processes get work, read
+        # by the workers from the test data
+        monkeypatch.setattr(parallel, "MIN_RANGE_BYTES", 1)
+        monkeypatch.setattr(parallel, "download_range", read_test_blob)
+        mock_blob_client = MagicMock()
+        mock_blob_client.get_blob_properties.return_value.etag = '"0x1"'
+        mock_blob_client.get_blob_properties.return_value.size = len(
+            real_mock_csv_bytes
+        )
+        mock_blob_service.return_value.get_blob_client.return_value = (
+            mock_blob_client
+        )
+        vm_filter = VMFilter(mock_credential, test_config)
+        expected = vm_filter.filter_sql_vms(real_mock_csv_data)
+
+        # Act
+        result = vm_filter.load_sql_vms_parallel("vm_inventory.csv", 2)
+
+        # Assert - the parent does not download the inventory
+        pd.testing.assert_frame_equal(result, expected)
+        assert vm_filter.data is result
+        mock_blob_client.download_blob.assert_not_called()
+        stage = vm_filter.metrics.stages[-1]
+        assert stage["stage"] == "parallel_parse"
+        assert stage["bytes"] == len(real_mock_csv_bytes)
+        assert stage["ranges"] == 2
+        assert stage["rows_in"] == len(real_mock_csv_data)
+        assert stage["rows_out"] == len(expected)
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_load_sql_vms_parallel_reads_one_version(
+        self, mock_blob_service, mock_credential, test_config, monkeypatch
+    ):
+        """Test the workers are pointed at the blob version planned for."""
+        mock_blob_client = MagicMock()
+        mock_blob_client.get_blob_properties.return_value.etag = '"0x1"'
+        mock_blob_client.get_blob_properties.return_value.size = 10
+        mock_blob_service.return_value.get_blob_client.return_value = (
+            mock_blob_client
+        )
+        parse_sql_vms = MagicMock(return_value=(0, pd.DataFrame(), 1))
+        monkeypatch.setattr(parallel, "parse_sql_vms", parse_sql_vms)
+        vm_filter = VMFilter(mock_credential, test_config)
+
+        vm_filter.load_sql_vms_parallel("vm_inventory.csv", 2, ["VMName"])
+
+        parse_sql_vms.assert_called_once_with(
+            parallel.download_range,
+            (
+                "https://preprocessstorage.blob.core.windows.net",
+                test_config["preprocess_container"],
+                "vm_inventory.csv",
+                test_config.get("managed_identity_client_id"),
+                '"0x1"',
+            ),
+            10,
+            2,
+            ["VMName"],
+        )
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_load_data_parses_requested_columns(
+        self,
+        mock_blob_service,
+        mock_credential,
+        test_config,
+        real_mock_csv_bytes,
+        real_mock_csv_data,
+    ):
+        """Test only the requested columns are parsed from the CSV."""
+        # Arrange
+        mock_blob_client = MagicMock()
+        mock_blob_client.download_blob.return_value.readall.return_value = (
+            real_mock_csv_bytes
+        )
+        mock_blob_service.return_value.get_blob_client.return_value = (
+            mock_blob_client
+        )
+        vm_filter = VMFilter(mock_credential, test_config)
+        expected = vm_filter.filter_sql_vms(real_mock_csv_data)[["VMName"]]
+
+        # Act
+        result = vm_filter.load_data(
+            "vm_inventory.csv", ["VMName"], sql_server_only=True
+        )
+
+        # Assert
+        pd.testing.assert_frame_equal(result, expected)
+        assert result["VMName"].dtype == object
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_load_filter_and_export_record_stages(
+        self,
+        mock_blob_service,
+        mock_credential,
+        test_config,
+        real_mock_csv_bytes,
+    ):
+        """Test each stage is recorded with its bytes and row counts."""
+        # Arrange
+        mock_blob_client = MagicMock()
+        mock_blob_client.download_blob.return_value.readall.return_value = (
+            real_mock_csv_bytes
+        )
+        mock_blob_service.return_value.get_blob_client.return_value = (
+            mock_blob_client
+        )
+        vm_filter = VMFilter(mock_credential, test_config)
+
+        # Act
+        data = vm_filter.load_data("vm_inventory.csv")
+        sql_vms = vm_filter.filter_sql_vms(data)
+        vm_filter.export_to_excel(sql_vms, "report.xlsx", "secret")
+
+        # Assert
+        stages = {s["stage"]: s for s in vm_filter.metrics.stages}
+        assert list(stages) == [
+            "download",
+            "parse",
+            "filter",
+            "summarize",
+            "render",
+            "encrypt",
+            "upload",
+        ]
+        assert stages["download"]["bytes"] == len(real_mock_csv_bytes)
+        assert stages["parse"]["rows_out"] == len(data)
+        assert stages["filter"]["rows_in"] == len(data)
+        assert stages["filter"]["rows_out"] == len(sql_vms)
+        assert stages["summarize"]["rows_in"] == len(sql_vms)
+        assert stages["summarize"]["sheets"] == 3
+        assert stages["render"]["rows_in"] == len(sql_vms)
+        upload = mock_blob_client.upload_blob
+        assert stages["upload"]["bytes"] == upload.call_args.kwargs["length"]
+        assert stages["encrypt"]["bytes"] == stages["upload"]["bytes"]
+
     @patch("filter_sql_servers.BlobServiceClient")
     def test_load_data_success(
         self, mock_blob_service, mock_credential, test_config, sample_vm_data
@@ -150,6 +341,155 @@ class TestVMFilter:
         assert "VMName" in result.columns
         mock_blob_service.assert_called_once()
 
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_load_sql_vms_streams_in_chunks(
+        self,
+        mock_blob_service,
+        mock_credential,
+        test_config,
+        real_mock_csv_bytes,
+        real_mock_csv_data,
+    ):
+        """Test streaming load matches load-then-filter on the real CSV."""
+        # Arrange - deliver the blob in small chunks that split rows
+        chunks = [
+            real_mock_csv_bytes[i : i + 1000]
+            for i in range(0, len(real_mock_csv_bytes), 1000)
+        ]
+        mock_download_result = MagicMock()
+        mock_download_result.chunks.return_value = iter(chunks)
+
+        mock_blob_client = MagicMock()
+        mock_blob_client.download_blob.return_value = mock_download_result
+
+        mock_container_client = MagicMock()
+        mock_container_client.get_blob_client.return_value = mock_blob_client
+        mock_blob_service.return_value = mock_container_client
+
+        vm_filter = VMFilter(mock_credential, test_config)
+        expected = vm_filter.filter_sql_vms(real_mock_csv_data)
+
+        # Act
+        result = vm_filter.load_sql_vms("vm_inventory.csv", chunksize=10)
+
+        # Assert
+        pd.testing.assert_frame_equal(result, expected)
+        assert vm_filter.data is result
+        mock_download_result.readall.assert_not_called()
+        stage = vm_filter.metrics.stages[-1]
+        assert stage["stage"] == "stream"
+        assert stage["bytes"] == len(real_mock_csv_bytes)
+        assert stage["rows_in"] == len(real_mock_csv_data)
+        assert stage["rows_out"] == len(expected)
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_load_sql_vms_decompresses_gzip(
+        self,
+        mock_blob_service,
+        mock_credential,
+        test_config,
+        real_mock_csv_bytes,
+        real_mock_csv_data,
+    ):
+        """Test a gzip-compressed inventory is decompressed as it streams."""
+        # Arrange
+        compressed = gzip.compress(real_mock_csv_bytes)
+        mock_blob_client = mock_blob_service.return_value.get_blob_client
+        mock_blob_client.return_value.download_blob.return_value.chunks = (
+            lambda: iter([compressed[:100], compressed[100:]])
+        )
+        vm_filter = VMFilter(mock_credential, test_config)
+        expected = vm_filter.filter_sql_vms(real_mock_csv_data)
+
+        # Act
+        result = vm_filter.load_sql_vms(
+            "vm_inventory.csv.gz", chunksize=10, compression="gzip"
+        )
+
+        # Assert
+        pd.testing.assert_frame_equal(result, expected)
+        assert vm_filter.metrics.stages[-1]["bytes"] == len(compressed)
+
+    @patch("filter_sql_servers.BlobServiceClient", InMemoryBlobServiceClient)
+    def test_plan_load_reads_blob_and_cache_properties(
+        self, mock_credential, test_config, real_mock_csv_bytes
+    ):
+        """Test the plan is based on the blob, its cache and the worker."""
+        # Arrange
+        storage = get_blob_service_client(
+            "https://preprocessstorage.blob.core.windows.net",
+            "test-client-id",
+            mock_credential,
+        )
+        storage.blobs[("pre-container", "vm_inventory.csv")] = (
+            real_mock_csv_bytes
+        )
+        vm_filter = VMFilter(mock_credential, test_config)
+        cached_filter = VMFilter(
+            mock_credential, dict(test_config, parquet_cache=True)
+        )
+
+        # Act
+        plan = vm_filter.plan_load("vm_inventory.csv")
+        stale = cached_filter.plan_load("vm_inventory.csv")
+        cached_filter.load_data("vm_inventory.csv")
+        fresh = cached_filter.plan_load("vm_inventory.csv")
+
+        # Assert
+        assert plan["strategy"] == "memory"
+        assert plan["bytes"] == len(real_mock_csv_bytes)
+        assert plan["cpus"] >= 1
+        assert stale["strategy"] == "cache"
+        assert stale["reason"] == "the Parquet cache can be rebuilt in memory"
+        assert fresh["reason"] == "the Parquet cache is fresh"
+        stage = vm_filter.metrics.stages[-1]
+        assert stage["stage"] == "plan"
+        assert stage["strategy"] == "memory"
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_load_sql_vms_keeps_only_matching_categories(
+        self, mock_blob_service, mock_credential, test_config
+    ):
+        """Test streamed matches do not hold every chunk's categories."""
+        # Arrange - every VM has its own software list, 1 in 200 has SQL
+        rows = [
+            f"{index},vm{index},Windows,"
+            + (
+                "\"['Microsoft SQL Server 2019']\""
+                if index % 200 == 0
+                else "[]"
+            )
+            + f",\"['Software {index}']\""
+            for index in range(2000)
+        ]
+        csv_bytes = (
+            "AccountID,VMName,PlatformDetails,SQLSoftware,RawSoftware\n"
+            + "\n".join(rows)
+            + "\n"
+        ).encode()
+        mock_blob_client = mock_blob_service.return_value.get_blob_client
+        mock_blob_client.return_value.download_blob.return_value.chunks = (
+            lambda: iter([csv_bytes])
+        )
+        vm_filter = VMFilter(mock_credential, test_config)
+
+        # Act
+        result = vm_filter.load_sql_vms("vm_inventory.csv", chunksize=100)
+
+        # Assert
+        assert len(result) == 10
+        assert result["RawSoftware"].cat.categories.size == 10
+        assert result["SQLSoftware"].cat.categories.size == 1
+
+    def test_blob_chunk_reader_reassembles_chunks(self):
+        """Test the chunk reader returns the blob bytes unchanged."""
+        reader = _BlobChunkReader([b"abc", b"", b"defg", b"h"])
+
+        assert reader.readable()
+        assert reader.read(2) == b"ab"
+        assert reader.read() == b"cdefgh"
+        assert reader.read() == b""
+
     def test_filter_sql_vms_with_real_data(
         self, mock_credential, test_config, real_mock_csv_data
     ):
@@ -180,6 +520,102 @@ class TestVMFilter:
                     # Handle string format
                     assert "Microsoft SQL Server" in sql_software
 
+    def test_tag_products(self, mock_credential, test_config, sample_vm_data):
+        """Test every configured product found is listed per VM."""
+        config = dict(
+            test_config,
+            product_patterns={
+                "Software B": ["software b"],
+                "Software D or E": ["Software D", "Software E"],
+                "Software Z": ["Software Z"],
+            },
+        )
+        vm_filter = VMFilter(mock_credential, config)
+
+        result = vm_filter.tag_products(sample_vm_data)
+
+        assert result["MatchedProducts"].tolist() == [
+            "Software B",
+            "",
+            "Software D or E",
+        ]
+        assert "MatchedProducts" not in sample_vm_data.columns
+        [stage] = vm_filter.metrics.stages
+        assert stage["stage"] == "match_products"
+        assert stage["rows_out"] == 2
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_find_product_hosts(
+        self, mock_blob_service, mock_credential, test_config, sample_vm_data
+    ):
+        """Test products are found on the VMs without SQL Server."""
+        mock_blob_client = MagicMock()
+        mock_blob_client.download_blob.return_value.readall.return_value = (
+            sample_vm_data.to_csv(index=False).encode()
+        )
+        mock_blob_service.return_value.get_blob_client.return_value = (
+            mock_blob_client
+        )
+        config = dict(
+            test_config,
+            product_patterns={
+                "Software A": ["Software A"],
+                "Software C": ["Software C"],
+            },
+        )
+        vm_filter = VMFilter(mock_credential, config)
+
+        result = vm_filter.find_product_hosts("vm_inventory.csv")
+
+        # vm1 has Software A, but also SQL Server, so it is in the report
+        assert result["VMName"].tolist() == ["vm2"]
+        assert result["MatchedProducts"].tolist() == ["Software C"]
+        stage = vm_filter.metrics.stages[-1]
+        assert stage["stage"] == "match_products"
+        assert stage["rows_in"] == 3
+        assert stage["rows_out"] == 1
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_classify_sql_versions_in_report(
+        self, mock_blob_service, mock_credential, test_config, sample_vm_data
+    ):
+        """Test version columns are added by position and exported."""
+        # Arrange - repeated index labels, as after concatenating chunks
+        data = sample_vm_data.set_axis([0, 0, 1])
+        config = dict(test_config, sql_version_status='{"2019": "patched"}')
+        uploaded = {}
+        mock_upload_client = MagicMock()
+        mock_upload_client.upload_blob.side_effect = (
+            lambda stream, **kwargs: uploaded.update(content=stream.read())
+        )
+        mock_blob_service.return_value.get_blob_client.return_value = (
+            mock_upload_client
+        )
+        vm_filter = VMFilter(mock_credential, config)
+
+        # Act
+        result = vm_filter.classify_sql_versions(data)
+        vm_filter.export_to_excel(result, "report.xlsx", "secret")
+
+        # Assert
+        assert result["SQLServerVersion"].tolist()[::2] == ["2019", "2017"]
+        # The installed 2016 is past support by default
+        assert result["SQLServerStatus"].tolist()[::2] == [
+            "patched",
+            "vulnerable",
+        ]
+        assert result["SQLServerMajorVersion"].isna().tolist() == [
+            False,
+            True,
+            False,
+        ]
+        decrypted = BytesIO()
+        office_file = OfficeFile(BytesIO(uploaded["content"]))
+        office_file.load_key(password="secret")
+        office_file.decrypt(decrypted)
+        report = pd.read_excel(decrypted)
+        assert report["SQLServerMajorVersion"].tolist()[::2] == [15, 14]
+
     def test_filter_sql_vms_with_json_strings(
         self, mock_credential, test_config, sample_vm_data
     ):
@@ -335,100 +771,2618 @@ class TestVMFilter:
         # Assert - function creates a copy, verify upload happened
         mock_upload_client.upload_blob.assert_called_once()
 
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_export_streams_encrypted_spool_to_upload(
+        self, mock_blob_service, mock_credential, test_config, sample_vm_data
+    ):
+        """Test the encrypted report is uploaded from a spooled file."""
+        # Arrange - a tiny threshold forces both spools onto disk
+        config = dict(test_config, spool_max_bytes=1)
+        uploaded = {}
 
-class TestMainFunction:
-    """Test cases for main Azure Function."""
+        def capture_upload(stream, length, overwrite):
+            uploaded["is_bytes"] = isinstance(stream, bytes)
+            uploaded["content"] = stream.read()
+            uploaded["length"] = length
 
-    @patch("filter_sql_servers.SecretClient")
-    @patch("filter_sql_servers.VMFilter")
-    @patch("filter_sql_servers.ManagedIdentityCredential")
-    @patch.dict(
-        os.environ,
-        {
-            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
-            "PREPROCESS_CONTAINER": "pre-container",
-            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
-            "POSTPROCESS_CONTAINER": "post-container",
-            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
-            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
-        },
-    )
-    def test_main_success(
-        self,
-        mock_credential_class,
-        mock_vm_filter_class,
-        mock_secret_client_class,
-        sample_vm_data,
-    ):
-        """Test successful execution of main function."""
-        # Arrange
-        mock_req = Mock(spec=func.HttpRequest)
+        mock_upload_client = MagicMock()
+        mock_upload_client.upload_blob.side_effect = capture_upload
+        mock_blob_service.return_value.get_blob_client.return_value = (
+            mock_upload_client
+        )
 
-        mock_credential = MagicMock()
-        mock_credential_class.return_value = mock_credential
+        vm_filter = VMFilter(mock_credential, config)
 
-        mock_vm_filter = MagicMock()
-        filtered_data = sample_vm_data.iloc[:2]
-        mock_vm_filter.load_data.return_value = sample_vm_data
-        mock_vm_filter.filter_sql_vms.return_value = filtered_data
-        mock_vm_filter_class.return_value = mock_vm_filter
+        # Act
+        vm_filter.export_to_excel(sample_vm_data, "report.xlsx", "secret")
+
+        # Assert - upload received a stream, which decrypts to the report
+        assert not uploaded["is_bytes"]
+        assert uploaded["length"] == len(uploaded["content"])
+
+        decrypted = BytesIO()
+        office_file = OfficeFile(BytesIO(uploaded["content"]))
+        office_file.load_key(password="secret")
+        office_file.decrypt(decrypted)
+        report = pd.read_excel(decrypted, dtype=object)
+        assert report["AccountID"].tolist() == [
+            "123456789012",
+            "234567890123",
+            "345678901234",
+        ]
+        assert sample_vm_data["AccountID"].dtype == "int64"
+
+        # The summary sheets follow the report
+        decrypted.seek(0)
+        sheets = pd.read_excel(decrypted, sheet_name=None, dtype=object)
+        assert list(sheets) == [
+            "SQL Servers",
+            "By Account",
+            "By Platform",
+            "By SQL Version",
+        ]
+        assert sheets["By Account"]["AccountID"].tolist() == [
+            "123456789012",
+            "234567890123",
+            "345678901234",
+        ]
+
+    def test_render_without_summaries(
+        self, mock_credential, test_config, sample_vm_data
+    ):
+        """Test a report rendered without summaries has only its sheet."""
+        vm_filter = VMFilter(mock_credential, test_config)
 
-        mock_secret_client = MagicMock()
-        mock_secret = MagicMock()
-        mock_secret.value = "test_password"
-        mock_secret_client.get_secret.return_value = mock_secret
-        mock_secret_client_class.return_value = mock_secret_client
+        protected_file, _ = vm_filter.render_protected_report(
+            sample_vm_data, "secret", summaries=False
+        )
+
+        decrypted = BytesIO()
+        with protected_file:
+            office_file = OfficeFile(protected_file)
+            office_file.load_key(password="secret")
+            office_file.decrypt(decrypted)
+        sheets = pd.read_excel(decrypted, sheet_name=None)
+        assert list(sheets) == ["SQL Servers"]
+        assert "summarize" not in [
+            s["stage"] for s in vm_filter.metrics.stages
+        ]
+
+    @patch("filter_sql_servers.BlobServiceClient", InMemoryBlobServiceClient)
+    def test_export_uploads_large_reports_in_blocks(
+        self, mock_credential, test_config, sample_vm_data
+    ):
+        """Test reports larger than a block are staged and committed."""
+        # Arrange
+        config = dict(test_config, upload_block_bytes=1024)
+        storage = get_blob_service_client(
+            "https://postprocessstorage.blob.core.windows.net",
+            "test-client-id",
+            mock_credential,
+        )
+        vm_filter = VMFilter(mock_credential, config)
 
         # Act
-        response = main(mock_req)
+        vm_filter.export_to_excel(sample_vm_data, "report.xlsx", "secret")
 
         # Assert
-        assert response.status_code == 200
-        assert "Report generated successfully" in (
-            response.get_body().decode()
+        uploaded = storage.blobs[("post-container", "report.xlsx")]
+        stage = vm_filter.metrics.stages[-1]
+        assert stage["stage"] == "upload"
+        assert stage["bytes"] == len(uploaded)
+        assert stage["blocks"] == -(-len(uploaded) // 1024)
+        assert stage["retries"] == 0
+
+        decrypted = BytesIO()
+        office_file = OfficeFile(BytesIO(uploaded))
+        office_file.load_key(password="secret")
+        office_file.decrypt(decrypted)
+        report = pd.read_excel(decrypted, dtype=object)
+        assert report["VMName"].tolist() == ["vm1", "vm2", "vm3"]
+
+    @pytest.mark.parametrize("data_format", ["csv", "csv.gz", "parquet"])
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_export_data_uploads_encrypted_file(
+        self,
+        mock_blob_service,
+        data_format,
+        mock_credential,
+        test_config,
+        sample_vm_data,
+    ):
+        """Test data formats are encrypted while they are written."""
+        # Arrange
+        config = dict(test_config, spool_max_bytes=1)
+        uploaded = {}
+        mock_upload_client = mock_blob_service.return_value.get_blob_client
+        mock_upload_client.return_value.upload_blob.side_effect = (
+            lambda stream, length, overwrite: uploaded.update(
+                content=stream.read(), length=length
+            )
         )
-        assert "Total SQL Server VMs: 2" in response.get_body().decode()
+        vm_filter = VMFilter(mock_credential, config)
 
-        mock_vm_filter.load_data.assert_called_once_with("vm_inventory.csv")
-        mock_secret_client.get_secret.assert_called_once_with(
-            "postprocess-secret"
+        # Act
+        vm_filter.export_data(
+            sample_vm_data, "report.enc", "secret", data_format
         )
 
-    @patch("filter_sql_servers.VMFilter")
-    @patch("filter_sql_servers.ManagedIdentityCredential")
-    @patch.dict(
-        os.environ,
-        {
-            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
-            "PREPROCESS_CONTAINER": "pre-container",
-            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
-            "POSTPROCESS_CONTAINER": "post-container",
-            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
-            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
-        },
+        # Assert
+        assert uploaded["length"] == len(uploaded["content"])
+        decrypted = BytesIO()
+        decrypt_stream(BytesIO(uploaded["content"]), decrypted, "secret")
+        if data_format == "parquet":
+            report = pd.read_parquet(decrypted)
+        else:
+            decrypted.seek(0)
+            report = pd.read_csv(
+                decrypted,
+                compression="gzip" if data_format == "csv.gz" else None,
+                dtype=str,
+            )
+        assert report["AccountID"].tolist() == [
+            "123456789012",
+            "234567890123",
+            "345678901234",
+        ]
+        assert [s["stage"] for s in vm_filter.metrics.stages] == [
+            "render",
+            "upload",
+        ]
+        assert vm_filter.metrics.stages[0]["format"] == data_format
+
+    @patch(
+        "filter_sql_servers.data_export.write_data",
+        side_effect=RuntimeError("boom"),
     )
-    def test_main_no_sql_servers_found(
-        self, mock_credential_class, mock_vm_filter_class, sample_vm_data
+    def test_export_data_rejects_empty_password_and_closes_spool(
+        self, mock_write_data, mock_credential, test_config, sample_vm_data
     ):
-        """Test main function when no SQL Server VMs found."""
-        # Arrange
-        mock_req = Mock(spec=func.HttpRequest)
+        """Test data exports need a password and clean up on failure."""
+        vm_filter = VMFilter(mock_credential, test_config)
 
-        mock_vm_filter = MagicMock()
-        mock_vm_filter.load_data.return_value = sample_vm_data
-        mock_vm_filter.filter_sql_vms.return_value = pd.DataFrame()
-        mock_vm_filter_class.return_value = mock_vm_filter
+        with pytest.raises(StalePasswordError):
+            vm_filter.export_data(sample_vm_data, "report.enc", "", "csv")
+        with pytest.raises(RuntimeError, match="boom"):
+            vm_filter.render_protected_data(sample_vm_data, "secret", "csv")
+
+
+class TestShardedIngestion:
+    """Test cases for loading inventories split across many blobs."""
+
+    @pytest.fixture
+    def sharded_service(self, real_mock_csv_data):
+        """A blob service with the mock inventory split into three shards."""
+        shards = {
+            f"inventory/shard-{i}.csv": part.to_csv(index=False).encode()
+            for i, part in enumerate(
+                [
+                    real_mock_csv_data.iloc[:50],
+                    real_mock_csv_data.iloc[50:100],
+                    real_mock_csv_data.iloc[100:],
+                ]
+            )
+        }
+        shards["inventory/readme.txt"] = b"not an inventory"
+
+        def blob_client(container, blob):
+            client = MagicMock()
+            client.download_blob.return_value.chunks.return_value = iter(
+                [shards[blob]]
+            )
+            client.download_blob.return_value.readall.return_value = shards[
+                blob
+            ]
+            return client
+
+        def blob_properties(name):
+            properties = MagicMock(etag=f"etag-{name}")
+            properties.name = name
+            return properties
+
+        def list_blobs(name_starts_with):
+            # Listing order is not guaranteed to be sorted
+            return [
+                blob_properties(name)
+                for name in sorted(shards, reverse=True)
+                if name.startswith(name_starts_with)
+            ]
+
+        service = MagicMock()
+        service.get_blob_client.side_effect = blob_client
+        service.get_container_client.return_value.list_blobs.side_effect = (
+            list_blobs
+        )
+        return service
 
-        # Act
-        response = main(mock_req)
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_load_sharded_sql_vms_merges_in_name_order(
+        self,
+        mock_blob_service,
+        sharded_service,
+        mock_credential,
+        test_config,
+        real_mock_csv_data,
+    ):
+        """Test shards are filtered concurrently and merged in order."""
+        mock_blob_service.return_value = sharded_service
+        vm_filter = VMFilter(mock_credential, test_config)
+        expected = vm_filter.filter_sql_vms(real_mock_csv_data).reset_index(
+            drop=True
+        )
 
-        # Assert
-        assert response.status_code == 200
-        assert "No SQL Server installations found" in (
-            response.get_body().decode()
+        result = vm_filter.load_sharded_sql_vms(
+            "inventory/*.csv", max_workers=3, chunksize=7
         )
 
-    @patch("filter_sql_servers.VMFilter")
+        pd.testing.assert_frame_equal(result, expected)
+        assert vm_filter.list_inventory_blobs("inventory/*.csv") == [
+            "inventory/shard-0.csv",
+            "inventory/shard-1.csv",
+            "inventory/shard-2.csv",
+        ]
+        assert len(vm_filter.list_inventory_blobs("inventory/")) == 4
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_load_sharded_sql_vms_without_matches(
+        self, mock_blob_service, sharded_service, mock_credential, test_config
+    ):
+        """Test a pattern matching no blobs is an error."""
+        mock_blob_service.return_value = sharded_service
+        vm_filter = VMFilter(mock_credential, test_config)
+
+        with pytest.raises(ValueError, match="No inventory blobs"):
+            vm_filter.load_sharded_sql_vms("other/*.csv")
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_find_product_hosts_in_shards(
+        self,
+        mock_blob_service,
+        sharded_service,
+        mock_credential,
+        test_config,
+        real_mock_csv_data,
+    ):
+        """Test every shard is scanned for products, merged in order."""
+        mock_blob_service.return_value = sharded_service
+        vm_filter = VMFilter(
+            mock_credential,
+            dict(test_config, product_patterns={"FileZilla": ["filezilla"]}),
+        )
+        sql_vms = vm_filter.filter_sql_vms(real_mock_csv_data)
+        expected = real_mock_csv_data[
+            ~real_mock_csv_data.index.isin(sql_vms.index)
+            & real_mock_csv_data["RawSoftware"].str.contains(
+                "FileZilla", case=False
+            )
+        ]
+
+        result = vm_filter.find_product_hosts(
+            "inventory/*.csv", ["VMName", "SQLSoftware", "RawSoftware"], 3
+        )
+
+        assert len(result) > 0
+        assert result["VMName"].tolist() == expected["VMName"].tolist()
+        assert set(result["MatchedProducts"]) == {"FileZilla"}
+        with pytest.raises(ValueError, match="No inventory blobs"):
+            vm_filter.find_product_hosts("other/*.csv")
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_source_fingerprint_of_shards(
+        self, mock_blob_service, sharded_service, mock_credential, test_config
+    ):
+        """Test shard fingerprints come from a single listing."""
+        mock_blob_service.return_value = sharded_service
+        vm_filter = VMFilter(mock_credential, test_config)
+
+        fingerprint = vm_filter.get_source_fingerprint("inventory/shard-?.csv")
+
+        assert fingerprint == {
+            "shards": [
+                [f"inventory/shard-{i}.csv", f"etag-inventory/shard-{i}.csv"]
+                for i in range(3)
+            ]
+        }
+
+
+class TestParquetCache:
+    """Test cases for loading through the Parquet inventory cache."""
+
+    @staticmethod
+    def blob_clients(mock_blob_service, clients):
+        """Route get_blob_client calls to per-blob mocks."""
+        mock_blob_service.return_value.get_blob_client.side_effect = (
+            lambda container, blob: clients[blob]
+        )
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_missing_cache_is_built_from_csv(
+        self,
+        mock_blob_service,
+        mock_credential,
+        test_config,
+        real_mock_csv_bytes,
+        real_mock_csv_data,
+    ):
+        """Test a cache miss parses the CSV and uploads a new cache."""
+        # Arrange
+        source = MagicMock()
+        source.get_blob_properties.return_value = MagicMock(etag='"0x1"')
+        source.download_blob.return_value.readall.return_value = (
+            real_mock_csv_bytes
+        )
+        cache = MagicMock()
+        cache.get_blob_properties.side_effect = ResourceNotFoundError("none")
+        uploaded = {}
+        cache.upload_blob.side_effect = lambda stream, **kwargs: (
+            uploaded.update(kwargs, content=stream.read())
+        )
+        self.blob_clients(
+            mock_blob_service,
+            {
+                "vm_inventory.csv": source,
+                "cache/vm_inventory.csv.parquet": cache,
+            },
+        )
+        vm_filter = VMFilter(
+            mock_credential, dict(test_config, parquet_cache=True)
+        )
+
+        # Act
+        result = vm_filter.load_data("vm_inventory.csv", sql_server_only=True)
+
+        # Assert
+        expected = vm_filter.filter_sql_vms(real_mock_csv_data)
+        pd.testing.assert_frame_equal(result, expected)
+        assert uploaded["metadata"] == {"source_etag": '"0x1"'}
+        assert uploaded["length"] == len(uploaded["content"])
+        source.download_blob.assert_called_once_with(
+            etag='"0x1"', match_condition=MatchConditions.IfNotModified
+        )
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_current_cache_is_read_without_csv(
+        self,
+        mock_blob_service,
+        mock_credential,
+        test_config,
+        real_mock_csv_data,
+    ):
+        """Test a cache keyed to the current ETag replaces CSV parsing."""
+        # Arrange
+        content = BytesIO()
+        write_cache(build_cache_table(real_mock_csv_data), content)
+        content = content.getvalue()
+
+        source = MagicMock()
+        source.get_blob_properties.return_value = MagicMock(etag='"0x1"')
+        cache = MagicMock()
+        cache.get_blob_properties.return_value = MagicMock(
+            metadata={"source_etag": '"0x1"'}, size=len(content)
+        )
+        cache.download_blob.side_effect = lambda offset, length: MagicMock(
+            readall=lambda: content[offset : offset + length]
+        )
+        self.blob_clients(
+            mock_blob_service,
+            {
+                "vm_inventory.csv": source,
+                "cache/vm_inventory.csv.parquet": cache,
+            },
+        )
+        vm_filter = VMFilter(
+            mock_credential, dict(test_config, parquet_cache=True)
+        )
+
+        # Act
+        result = vm_filter.load_data(
+            "vm_inventory.csv", columns=["VMName", "AccountID"]
+        )
+
+        # Assert
+        pd.testing.assert_frame_equal(
+            result, real_mock_csv_data[["VMName", "AccountID"]]
+        )
+        source.download_blob.assert_not_called()
+        cache.upload_blob.assert_not_called()
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_cached_lists_feed_classification_and_tagging(
+        self,
+        mock_blob_service,
+        mock_credential,
+        test_config,
+        real_mock_csv_data,
+    ):
+        """Test a cache read returns the software lists a run uses."""
+        # Arrange
+        content = BytesIO()
+        write_cache(build_cache_table(real_mock_csv_data), content)
+        content = content.getvalue()
+        source = MagicMock()
+        source.get_blob_properties.return_value = MagicMock(etag='"0x1"')
+        cache = MagicMock()
+        cache.get_blob_properties.return_value = MagicMock(
+            metadata={"source_etag": '"0x1"'}, size=len(content)
+        )
+        cache.download_blob.side_effect = lambda offset, length: MagicMock(
+            readall=lambda: content[offset : offset + length]
+        )
+        self.blob_clients(
+            mock_blob_service,
+            {
+                "vm_inventory.csv": source,
+                "cache/vm_inventory.csv.parquet": cache,
+            },
+        )
+        config = dict(
+            test_config,
+            classify_sql_versions=True,
+            product_patterns={"FileZilla": ["FileZilla"]},
+        )
+        vm_filter = VMFilter(mock_credential, dict(config, parquet_cache=True))
+        expected = VMFilter(mock_credential, config)
+        expected = expected.tag_products(
+            expected.classify_sql_versions(
+                expected.filter_sql_vms(real_mock_csv_data)
+            )
+        )
+
+        # Act
+        data = vm_filter.load_data("vm_inventory.csv", sql_server_only=True)
+        with patch(
+            "filter_sql_servers.inventory_cache.parse_software_list",
+            side_effect=AssertionError,
+        ), patch(
+            "filter_sql_servers.versions.parse_software_list",
+            side_effect=AssertionError,
+        ):
+            result = vm_filter.tag_products(
+                vm_filter.classify_sql_versions(data)
+            )
+
+        # Assert
+        assert "SQLSoftwareList" in data.columns
+        assert "RawSoftwareList" in data.columns
+        report = project(result, None)
+        assert list(report.columns) == list(expected.columns)
+        assert report["MatchedProducts"].tolist() == (
+            expected["MatchedProducts"].tolist()
+        )
+        assert report["SQLServerStatus"].tolist() == (
+            expected["SQLServerStatus"].tolist()
+        )
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_product_hosts_are_found_in_cache(
+        self,
+        mock_blob_service,
+        mock_credential,
+        test_config,
+        real_mock_csv_data,
+    ):
+        """Test product hosts are read from the cache, all row groups."""
+        content = BytesIO()
+        write_cache(build_cache_table(real_mock_csv_data), content)
+        content = content.getvalue()
+
+        source = MagicMock()
+        source.get_blob_properties.return_value = MagicMock(etag='"0x1"')
+        cache = MagicMock()
+        cache.get_blob_properties.return_value = MagicMock(
+            metadata={"source_etag": '"0x1"'}, size=len(content)
+        )
+        cache.download_blob.side_effect = lambda offset, length: MagicMock(
+            readall=lambda: content[offset : offset + length]
+        )
+        self.blob_clients(
+            mock_blob_service,
+            {
+                "vm_inventory.csv": source,
+                "cache/vm_inventory.csv.parquet": cache,
+            },
+        )
+        vm_filter = VMFilter(
+            mock_credential,
+            dict(
+                test_config,
+                parquet_cache=True,
+                product_patterns={"FileZilla": ["FileZilla"]},
+            ),
+        )
+
+        result = vm_filter.find_product_hosts(
+            "vm_inventory.csv", ["VMName", "SQLSoftware", "RawSoftware"]
+        )
+
+        assert len(result) > 0
+        assert not vm_filter._sql_server_mask(result).any()
+        assert result["RawSoftware"].str.contains("FileZilla").all()
+        source.download_blob.assert_not_called()
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_csv_path_applies_selection(
+        self, mock_blob_service, mock_credential, test_config, sample_vm_data
+    ):
+        """Test columns and sql_server_only also apply without a cache."""
+        mock_blob_client = MagicMock()
+        mock_blob_client.download_blob.return_value.readall.return_value = (
+            sample_vm_data.to_csv(index=False).encode()
+        )
+        mock_blob_service.return_value.get_blob_client.return_value = (
+            mock_blob_client
+        )
+        vm_filter = VMFilter(mock_credential, test_config)
+
+        result = vm_filter.load_data(
+            "vm_inventory.csv", columns=["VMName"], sql_server_only=True
+        )
+
+        assert result["VMName"].tolist() == ["vm1", "vm3"]
+        assert list(result.columns) == ["VMName"]
+
+
+class TestSoftwareIndex:
+    """Test cases for the stored software index."""
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_missing_index_is_built_and_kept_in_memory(
+        self,
+        mock_blob_service,
+        mock_credential,
+        test_config,
+        real_mock_csv_bytes,
+        real_mock_csv_data,
+    ):
+        """Test a missing index is built, uploaded and reused by ETag."""
+        # Arrange
+        source = MagicMock()
+        source.get_blob_properties.return_value = MagicMock(etag='"0x1"')
+        source.download_blob.return_value.readall.return_value = (
+            real_mock_csv_bytes
+        )
+        index_blob = MagicMock()
+        index_blob.get_blob_properties.side_effect = ResourceNotFoundError(
+            "none"
+        )
+        uploaded = {}
+        index_blob.upload_blob.side_effect = lambda stream, **kwargs: (
+            uploaded.update(kwargs, content=stream.read())
+        )
+        TestParquetCache.blob_clients(
+            mock_blob_service,
+            {
+                "vm_inventory.csv": source,
+                "cache/vm_inventory.csv.software-index.npz": index_blob,
+            },
+        )
+        vm_filter = VMFilter(mock_credential, test_config)
+
+        # Act
+        index = vm_filter.software_indexes.load("vm_inventory.csv")
+        again = vm_filter.software_indexes.load("vm_inventory.csv")
+
+        # Assert
+        assert again is index
+        rows = index.lookup(all_of=["FileZilla"])
+        expected = real_mock_csv_data["RawSoftware"].str.contains(
+            "filezilla", case=False
+        )
+        assert rows.tolist() == np.flatnonzero(expected).tolist()
+        assert uploaded["metadata"] == {"source_etag": '"0x1"'}
+        assert uploaded["length"] == len(uploaded["content"])
+        source.download_blob.assert_called_once_with(
+            etag='"0x1"', match_condition=MatchConditions.IfNotModified
+        )
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_current_index_is_read_without_csv(
+        self,
+        mock_blob_service,
+        mock_credential,
+        test_config,
+        real_mock_csv_data,
+    ):
+        """Test an index tagged with the current ETag is downloaded."""
+        # Arrange
+        stored = BytesIO()
+        SoftwareIndex.build(real_mock_csv_data["RawSoftware"]).save(stored)
+        source = MagicMock()
+        source.get_blob_properties.return_value = MagicMock(etag='"0x2"')
+        index_blob = MagicMock()
+        index_blob.get_blob_properties.return_value = MagicMock(
+            metadata={"source_etag": '"0x2"'}
+        )
+        index_blob.download_blob.return_value.readall.return_value = (
+            stored.getvalue()
+        )
+        TestParquetCache.blob_clients(
+            mock_blob_service,
+            {
+                "vm_inventory.csv": source,
+                "cache/vm_inventory.csv.software-index.npz": index_blob,
+            },
+        )
+        vm_filter = VMFilter(mock_credential, test_config)
+
+        # Act
+        index = vm_filter.software_indexes.load("vm_inventory.csv")
+
+        # Assert
+        assert index.row_count == len(real_mock_csv_data)
+        source.download_blob.assert_not_called()
+        index_blob.upload_blob.assert_not_called()
+        assert [s["stage"] for s in vm_filter.metrics.stages] == ["index_read"]
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_missing_index_is_built_from_cached_lists(
+        self,
+        mock_blob_service,
+        mock_credential,
+        test_config,
+        real_mock_csv_data,
+    ):
+        """Test a missing index is built from the Parquet cache's lists."""
+        # Arrange
+        content = BytesIO()
+        write_cache(build_cache_table(real_mock_csv_data), content)
+        content = content.getvalue()
+        source = MagicMock()
+        source.get_blob_properties.return_value = MagicMock(etag='"0x1"')
+        cache = MagicMock()
+        cache.get_blob_properties.return_value = MagicMock(
+            metadata={"source_etag": '"0x1"'}, size=len(content)
+        )
+        cache.download_blob.side_effect = lambda offset, length: MagicMock(
+            readall=lambda: content[offset : offset + length]
+        )
+        index_blob = MagicMock()
+        index_blob.get_blob_properties.side_effect = ResourceNotFoundError(
+            "none"
+        )
+        TestParquetCache.blob_clients(
+            mock_blob_service,
+            {
+                "vm_inventory.csv": source,
+                "cache/vm_inventory.csv.parquet": cache,
+                "cache/vm_inventory.csv.software-index.npz": index_blob,
+            },
+        )
+        vm_filter = VMFilter(
+            mock_credential, dict(test_config, parquet_cache=True)
+        )
+
+        # Act
+        with patch(
+            "filter_sql_servers.inventory_cache.parse_software_list",
+            side_effect=AssertionError,
+        ):
+            index = vm_filter.software_indexes.load("vm_inventory.csv")
+
+        # Assert
+        expected = SoftwareIndex.build(real_mock_csv_data["RawSoftware"])
+        assert index.names.tolist() == expected.names.tolist()
+        assert index.indices.tolist() == expected.indices.tolist()
+        source.download_blob.assert_not_called()
+        index_blob.upload_blob.assert_called_once()
+
+
+class TestInventoryQuery:
+    """Test cases for queries over the inventory kept in memory."""
+
+    @staticmethod
+    def source_blob(mock_blob_service, csv_bytes, etag='"0x1"'):
+        """Route every blob to one inventory CSV mock."""
+        source = MagicMock()
+        source.get_blob_properties.return_value = MagicMock(etag=etag)
+        source.download_blob.return_value.readall.return_value = csv_bytes
+        mock_blob_service.return_value.get_blob_client.return_value = source
+        return source
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_inventory_is_reloaded_only_when_etag_changes(
+        self,
+        mock_blob_service,
+        mock_credential,
+        test_config,
+        real_mock_csv_bytes,
+    ):
+        """Test the parsed inventory is reused until the ETag changes."""
+        # Arrange
+        source = self.source_blob(mock_blob_service, real_mock_csv_bytes)
+        vm_filter = VMFilter(mock_credential, test_config)
+
+        # Act
+        first = vm_filter.queries.load("vm_inventory.csv")
+        second = vm_filter.queries.load("vm_inventory.csv")
+        source.get_blob_properties.return_value = MagicMock(etag='"0x2"')
+        third = vm_filter.queries.load("vm_inventory.csv")
+
+        # Assert
+        assert second[1] is first[1]
+        assert third[0] == '"0x2"'
+        assert third[1] is not first[1]
+        assert source.download_blob.call_count == 2
+        source.download_blob.assert_called_with(
+            etag='"0x2"', match_condition=MatchConditions.IfNotModified
+        )
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_product_query_builds_index_from_inventory(
+        self,
+        mock_blob_service,
+        mock_credential,
+        test_config,
+        real_mock_csv_bytes,
+        real_mock_csv_data,
+    ):
+        """Test a missing index is built from the inventory in memory."""
+        # Arrange
+        source = MagicMock()
+        source.get_blob_properties.return_value = MagicMock(etag='"0x1"')
+        source.download_blob.return_value.readall.return_value = (
+            real_mock_csv_bytes
+        )
+        index_blob = MagicMock()
+        index_blob.get_blob_properties.side_effect = ResourceNotFoundError(
+            "none"
+        )
+        TestParquetCache.blob_clients(
+            mock_blob_service,
+            {
+                "vm_inventory.csv": source,
+                "cache/vm_inventory.csv.software-index.npz": index_blob,
+            },
+        )
+        vm_filter = VMFilter(mock_credential, test_config)
+        query = read_query(
+            {"mode": "query", "product": "filezilla", "platform": "windows"}
+        )
+
+        # Act
+        matches = vm_filter.queries.run("vm_inventory.csv", query)
+
+        # Assert
+        expected = real_mock_csv_data[
+            real_mock_csv_data["RawSoftware"].str.contains("FileZilla")
+            & (real_mock_csv_data["PlatformDetails"] == "Windows")
+        ]
+        assert matches["VMName"].tolist() == expected["VMName"].tolist()
+        source.download_blob.assert_called_once()
+        index_blob.upload_blob.assert_called_once()
+        assert [s["stage"] for s in vm_filter.metrics.stages] == [
+            "download",
+            "parse",
+            "index_build",
+            "index_write",
+            "query",
+        ]
+
+    @pytest.mark.parametrize("result_format", ["json", "csv"])
+    @patch("filter_sql_servers.BlobServiceClient")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+        },
+    )
+    def test_main_answers_query(
+        self,
+        mock_credential_class,
+        mock_blob_service,
+        result_format,
+        real_mock_csv_bytes,
+        real_mock_csv_data,
+    ):
+        """Test mode=query answers from memory without a report."""
+        # Arrange
+        source = self.source_blob(mock_blob_service, real_mock_csv_bytes)
+        account_id = int(real_mock_csv_data["AccountID"].iloc[0])
+        mock_req = Mock(spec=func.HttpRequest)
+        mock_req.params = {"mode": "query", "format": result_format}
+        mock_req.get_body.return_value = json.dumps(
+            {"account_id": [account_id], "vm_name_prefix": "vm-"}
+        ).encode()
+
+        # Act
+        responses = [main(mock_req) for _ in range(2)]
+
+        # Assert
+        expected = real_mock_csv_data[
+            real_mock_csv_data["AccountID"] == str(account_id)
+        ]
+        for response in responses:
+            assert response.status_code == 200
+            body = response.get_body().decode()
+            if result_format == "json":
+                assert response.mimetype == "application/json"
+                document = json.loads(body)
+                assert document["count"] == len(expected)
+                assert [vm["VMName"] for vm in document["vms"]] == expected[
+                    "VMName"
+                ].tolist()
+            else:
+                assert response.mimetype == "text/csv"
+                result = pd.read_csv(BytesIO(response.get_body()))
+                assert result["VMName"].tolist() == (
+                    expected["VMName"].tolist()
+                )
+        source.download_blob.assert_called_once()
+        source.upload_blob.assert_not_called()
+
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    def test_main_rejects_invalid_query(
+        self, mock_credential_class, mock_vm_filter_class
+    ):
+        """Test an invalid query is answered with 400."""
+        mock_req = Mock(spec=func.HttpRequest)
+        mock_req.params = {"mode": "query", "format": "xml"}
+        mock_req.get_body.return_value = b""
+
+        response = main(mock_req)
+
+        assert response.status_code == 400
+        assert "format must be one of" in response.get_body().decode()
+        mock_vm_filter_class.assert_not_called()
+
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+            "INVENTORY_BLOB": "inventory/*.csv",
+        },
+    )
+    def test_main_query_needs_single_inventory(
+        self, mock_credential_class, mock_vm_filter_class
+    ):
+        """Test queries are refused for sharded inventories."""
+        mock_req = Mock(spec=func.HttpRequest)
+        mock_req.params = {"mode": "query"}
+        mock_req.get_body.return_value = b""
+
+        response = main(mock_req)
+
+        assert response.status_code == 400
+        mock_vm_filter_class.return_value.queries.run.assert_not_called()
+
+    @pytest.mark.parametrize(
+        "error, status, message",
+        [
+            (ClientAuthenticationError("denied"), 500, "Authentication error"),
+            (KeyError("PREPROCESS_CONTAINER"), 500, "Configuration error"),
+            (RuntimeError("boom"), 500, "Error: boom"),
+        ],
+    )
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+        },
+    )
+    def test_main_query_errors(
+        self,
+        mock_credential_class,
+        mock_vm_filter_class,
+        error,
+        status,
+        message,
+    ):
+        """Test query failures are reported like report failures."""
+        mock_req = Mock(spec=func.HttpRequest)
+        mock_req.params = {"mode": "query"}
+        mock_req.get_body.return_value = b""
+        mock_vm_filter_class.return_value.queries.run.side_effect = error
+
+        response = main(mock_req)
+
+        assert response.status_code == status
+        assert message in response.get_body().decode()
+
+
+class TestChangeReport:
+    """Test cases for change reports against the previous snapshot."""
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_snapshot_round_trip_and_comparison(
+        self, mock_blob_service, mock_credential, test_config, sample_vm_data
+    ):
+        """Test the snapshot is stored and compared on the next run."""
+        # Arrange - the snapshot blob behaves like the real one
+        stored = {}
+        snapshot_blob = MagicMock()
+
+        def download_blob():
+            if "content" not in stored:
+                raise ResourceNotFoundError("none")
+            return MagicMock(readall=MagicMock(return_value=stored["content"]))
+
+        snapshot_blob.download_blob.side_effect = download_blob
+        snapshot_blob.upload_blob.side_effect = lambda stream, **kwargs: (
+            stored.update(kwargs, content=stream.read())
+        )
+        mock_blob_service.return_value.get_blob_client.return_value = (
+            snapshot_blob
+        )
+        vm_filter = VMFilter(mock_credential, test_config)
+
+        # Act
+        first, snapshot = vm_filter.snapshots.compare(sample_vm_data)
+        vm_filter.snapshots.write(snapshot)
+        second, _ = vm_filter.snapshots.compare(sample_vm_data.iloc[1:])
+
+        # Assert
+        assert first["Change"].tolist() == ["added"] * len(sample_vm_data)
+        assert second["Change"].tolist() == ["removed"]
+        assert second["VMName"].tolist() == [sample_vm_data["VMName"][0]]
+        assert stored["length"] == len(stored["content"])
+        mock_blob_service.return_value.get_blob_client.assert_called_with(
+            container="post-container",
+            blob="sql_servers_snapshot.parquet",
+        )
+        assert [s["stage"] for s in vm_filter.metrics.stages] == [
+            "snapshot_read",
+            "delta",
+            "snapshot_write",
+            "snapshot_read",
+            "delta",
+        ]
+
+    @pytest.mark.parametrize("mode", ["alongside", "instead"])
+    @patch("filter_sql_servers.SecretClient")
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+        },
+    )
+    def test_main_writes_change_report(
+        self,
+        mock_credential_class,
+        mock_vm_filter_class,
+        mock_secret_client_class,
+        mode,
+        sample_vm_data,
+    ):
+        """Test DELTA_REPORT adds or replaces the full report."""
+        # Arrange
+        os.environ["DELTA_REPORT"] = mode
+        mock_req = Mock(spec=func.HttpRequest)
+        mock_vm_filter = mock_vm_filter_class.return_value
+        mock_vm_filter.load_data.return_value = sample_vm_data
+        mock_vm_filter.filter_sql_vms.return_value = sample_vm_data
+        changes = pd.DataFrame({"Change": ["added", "removed", "removed"]})
+        mock_vm_filter.snapshots.compare.return_value = (changes, "snap")
+        mock_secret_client_class.return_value.get_secret.return_value = (
+            make_secret()
+        )
+
+        # Act
+        response = main(mock_req)
+
+        # Assert
+        body = response.get_body().decode()
+        assert response.status_code == 200
+        assert "Changes: 1 added, 0 changed, 2 removed" in body
+        assert f"Total SQL Server VMs: {len(sample_vm_data)}" in body
+        exported = [
+            call.args[1]
+            for call in mock_vm_filter.export_to_excel.call_args_list
+        ]
+        assert exported[-1].startswith("sql_servers_changes_")
+        assert mock_vm_filter.export_to_excel.call_args.args[0] is changes
+        summaries = [
+            call.kwargs["summaries"]
+            for call in mock_vm_filter.export_to_excel.call_args_list
+        ]
+        assert summaries[-1] is False
+        if mode == "alongside":
+            assert exported[0].startswith("sql_servers_report_")
+            assert summaries[0] is True
+            assert "Report generated successfully" in body
+        else:
+            assert len(exported) == 1
+            assert body.startswith("Change report generated successfully")
+        mock_vm_filter.snapshots.write.assert_called_once_with("snap")
+
+    @patch("filter_sql_servers.SecretClient")
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+            "DELTA_REPORT": "alongside",
+            "REUSE_UNCHANGED_REPORTS": "true",
+        },
+    )
+    def test_main_reports_removals_without_sql_servers(
+        self,
+        mock_credential_class,
+        mock_vm_filter_class,
+        mock_secret_client_class,
+        sample_vm_data,
+    ):
+        """Test a run without SQL Server hosts still reports removals."""
+        # Arrange
+        mock_req = Mock(spec=func.HttpRequest)
+        mock_vm_filter = mock_vm_filter_class.return_value
+        mock_vm_filter.get_source_fingerprint.return_value = {"etag": "e"}
+        mock_vm_filter.report_manifests.read.return_value = None
+        mock_vm_filter.filter_sql_vms.return_value = sample_vm_data.iloc[:0]
+        mock_vm_filter.snapshots.compare.return_value = (
+            pd.DataFrame({"Change": ["removed"]}),
+            "snap",
+        )
+        mock_secret_client_class.return_value.get_secret.return_value = (
+            make_secret()
+        )
+
+        # Act
+        response = main(mock_req)
+
+        # Assert
+        assert "Changes: 0 added, 0 changed, 1 removed" in (
+            response.get_body().decode()
+        )
+        mock_vm_filter.export_to_excel.assert_called_once()
+        manifest = mock_vm_filter.report_manifests.write.call_args.args[0]
+        assert manifest["report"].startswith("sql_servers_changes_")
+        assert manifest["row_count"] == 0
+        assert manifest["fingerprint"]["delta_report"] == "alongside"
+
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+            "DELTA_REPORT": "sometimes",
+        },
+    )
+    def test_main_rejects_unknown_delta_mode(self, mock_credential_class):
+        """Test an unknown DELTA_REPORT value fails the run."""
+        response = main(Mock(spec=func.HttpRequest))
+
+        assert response.status_code == 500
+        assert "DELTA_REPORT must be one of" in response.get_body().decode()
+
+
+class TestReportHistory:
+    """Test cases for the date-partitioned report history."""
+
+    @patch("filter_sql_servers.BlobServiceClient", InMemoryBlobServiceClient)
+    def test_append_compact_and_read(
+        self, mock_credential, test_config, sample_vm_data
+    ):
+        """Test runs are appended, finished months compacted and read."""
+        # Arrange
+        vm_filter = VMFilter(mock_credential, test_config)
+        runs = [
+            datetime(2026, 9, 3, 8, tzinfo=timezone.utc),
+            datetime(2026, 9, 10, 8, tzinfo=timezone.utc),
+            datetime(2026, 10, 1, 8, tzinfo=timezone.utc),
+        ]
+
+        # Act
+        for run in runs:
+            vm_filter.history.append(sample_vm_data, run)
+        vm_filter.history.compact(runs[-1].date())
+        names = [blob.name for blob in vm_filter.history._list()]
+        september = vm_filter.history.read(
+            start=runs[0].date(), end=runs[1].date(), columns=["VMName"]
+        )
+        everything = vm_filter.history.read()
+
+        # Assert
+        assert names == [
+            "history/date=2026-10-01/run-080000000000.parquet",
+            "history/month=2026-09/history.parquet",
+        ]
+        assert september.columns.tolist() == [
+            "VMName",
+            "SnapshotDate",
+            "RunTime",
+        ]
+        assert len(september) == 2 * len(sample_vm_data)
+        assert len(everything) == 3 * len(sample_vm_data)
+        assert vm_filter.metrics.stages[-1]["partitions"] == 2
+
+    @patch("filter_sql_servers.BlobServiceClient", InMemoryBlobServiceClient)
+    def test_interrupted_compaction_is_repeatable(
+        self, mock_credential, test_config, sample_vm_data
+    ):
+        """Test daily files left behind by a compaction are merged once."""
+        # Arrange - the month was stored but a daily file was not deleted
+        vm_filter = VMFilter(mock_credential, test_config)
+        run = datetime(2026, 9, 3, 8, tzinfo=timezone.utc)
+        vm_filter.history.append(sample_vm_data, run)
+        daily = vm_filter._get_postprocess_blob_client(
+            "history/date=2026-09-03/run-080000000000.parquet"
+        )
+        leftover = daily.download_blob().readall()
+        vm_filter.history.compact(date(2026, 10, 1))
+        daily.upload_blob(leftover)
+
+        # Act
+        vm_filter.history.compact(date(2026, 10, 1))
+
+        # Assert
+        assert len(vm_filter.history.read()) == len(sample_vm_data)
+        assert [blob.name for blob in vm_filter.history._list()] == [
+            "history/month=2026-09/history.parquet"
+        ]
+
+    @patch("filter_sql_servers.BlobServiceClient", InMemoryBlobServiceClient)
+    def test_concurrent_compaction_is_tolerated(
+        self, mock_credential, test_config, sample_vm_data
+    ):
+        """Test daily files deleted by another compaction are skipped."""
+        # Arrange - another run compacts after this one listed the files,
+        # and one daily file is left over from an interrupted compaction
+        vm_filter = VMFilter(mock_credential, test_config)
+        for day in (3, 10):
+            vm_filter.history.append(
+                sample_vm_data, datetime(2026, 9, day, 8, tzinfo=timezone.utc)
+            )
+        listed = list(vm_filter.history._list())
+        daily = vm_filter._get_postprocess_blob_client(listed[0].name)
+        leftover = daily.download_blob().readall()
+        vm_filter.history.compact(date(2026, 10, 1))
+        daily.upload_blob(leftover)
+
+        # Act - the second time every listed daily file is gone
+        with patch.object(vm_filter.history, "_list", return_value=listed):
+            vm_filter.history.compact(date(2026, 10, 1))
+            vm_filter.history.compact(date(2026, 10, 1))
+
+        # Assert
+        assert len(vm_filter.history.read()) == 2 * len(sample_vm_data)
+        assert [blob.name for blob in vm_filter.history._list()] == [
+            "history/month=2026-09/history.parquet"
+        ]
+
+    @patch("filter_sql_servers.SecretClient")
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+            "SNAPSHOT_HISTORY": "true",
+        },
+    )
+    def test_main_appends_report_to_history(
+        self,
+        mock_credential_class,
+        mock_vm_filter_class,
+        mock_secret_client_class,
+        sample_vm_data,
+    ):
+        """Test SNAPSHOT_HISTORY appends each report and compacts."""
+        mock_vm_filter = mock_vm_filter_class.return_value
+        mock_vm_filter.load_data.return_value = sample_vm_data
+        mock_vm_filter.filter_sql_vms.return_value = sample_vm_data
+        mock_secret_client_class.return_value.get_secret.return_value = (
+            make_secret()
+        )
+
+        response = main(Mock(spec=func.HttpRequest))
+
+        assert response.status_code == 200
+        data, run_time = mock_vm_filter.history.append.call_args.args
+        assert data is sample_vm_data
+        assert run_time.tzinfo is timezone.utc
+        mock_vm_filter.history.compact.assert_called_once_with(run_time.date())
+
+    @patch("filter_sql_servers.SecretClient")
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+            "SNAPSHOT_HISTORY": "true",
+            "REUSE_UNCHANGED_REPORTS": "true",
+        },
+    )
+    def test_main_survives_failed_compaction(
+        self,
+        mock_credential_class,
+        mock_vm_filter_class,
+        mock_secret_client_class,
+        sample_vm_data,
+    ):
+        """Test a compaction failure after the report keeps the report."""
+        mock_vm_filter = mock_vm_filter_class.return_value
+        mock_vm_filter.get_source_fingerprint.return_value = {"etag": "1"}
+        mock_vm_filter.report_manifests.read.return_value = None
+        mock_vm_filter.filter_sql_vms.return_value = sample_vm_data
+        mock_vm_filter.history.compact.side_effect = ResourceNotFoundError(
+            "deleted"
+        )
+        mock_secret_client_class.return_value.get_secret.return_value = (
+            make_secret()
+        )
+
+        response = main(Mock(spec=func.HttpRequest))
+
+        assert response.status_code == 200
+        assert "Report generated successfully" in response.get_body().decode()
+        mock_vm_filter.report_manifests.write.assert_called_once()
+
+    @patch("filter_sql_servers.SecretClient")
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+            "SNAPSHOT_HISTORY": "true",
+            "DELTA_REPORT": "alongside",
+            "REPORT_COLUMNS": "VMName,SQLSoftware",
+        },
+    )
+    def test_main_keeps_vm_keys_for_history_and_changes(
+        self,
+        mock_credential_class,
+        mock_vm_filter_class,
+        mock_secret_client_class,
+        sample_vm_data,
+    ):
+        """Test REPORT_COLUMNS cannot drop the keys identifying VMs."""
+        mock_vm_filter = mock_vm_filter_class.return_value
+        mock_vm_filter.load_data.return_value = sample_vm_data
+        mock_vm_filter.filter_sql_vms.return_value = sample_vm_data
+        mock_vm_filter.snapshots.compare.return_value = (
+            pd.DataFrame({"Change": ["added"]}),
+            None,
+        )
+        mock_secret_client_class.return_value.get_secret.return_value = (
+            make_secret()
+        )
+
+        response = main(Mock(spec=func.HttpRequest))
+
+        assert response.status_code == 200
+        mock_vm_filter.load_data.assert_called_once_with(
+            "vm_inventory.csv", ["AccountID", "VMName", "SQLSoftware"]
+        )
+        compared = mock_vm_filter.snapshots.compare.call_args.args[0]
+        assert list(compared.columns) == [
+            "AccountID",
+            "VMName",
+            "SQLSoftware",
+        ]
+        history = mock_vm_filter.history.append.call_args.args[0]
+        assert list(history.columns) == list(compared.columns)
+
+
+class TestReportFormat:
+    """Test cases for choosing the report format per request."""
+
+    @patch("filter_sql_servers.SecretClient")
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+            "REUSE_UNCHANGED_REPORTS": "true",
+        },
+    )
+    def test_main_writes_requested_format(
+        self,
+        mock_credential_class,
+        mock_vm_filter_class,
+        mock_secret_client_class,
+        sample_vm_data,
+    ):
+        """Test report_format selects the data export and file name."""
+        # Arrange
+        mock_req = Mock(spec=func.HttpRequest)
+        mock_req.params = {"report_format": " Parquet "}
+        mock_vm_filter = mock_vm_filter_class.return_value
+        mock_vm_filter.get_source_fingerprint.return_value = {"etag": "e"}
+        mock_vm_filter.report_manifests.read.return_value = None
+        mock_vm_filter.filter_sql_vms.return_value = sample_vm_data
+        mock_secret_client_class.return_value.get_secret.return_value = (
+            make_secret("new")
+        )
+
+        # Act
+        response = main(mock_req)
+
+        # Assert
+        assert response.status_code == 200
+        data, output_file, password, data_format = (
+            mock_vm_filter.export_data.call_args.args
+        )
+        assert output_file.startswith("sql_servers_report_")
+        assert output_file.endswith(".parquet.enc")
+        assert (password, data_format) == ("new", "parquet")
+        mock_vm_filter.export_to_excel.assert_not_called()
+        manifest = mock_vm_filter.report_manifests.write.call_args.args[0]
+        assert manifest["fingerprint"]["report_format"] == "parquet"
+
+    @pytest.mark.parametrize("value", ["xml", ["csv"]])
+    @patch("filter_sql_servers.VMFilter")
+    def test_main_rejects_unknown_format(self, mock_vm_filter_class, value):
+        """Test an unknown report format is answered with 400."""
+        mock_req = Mock(spec=func.HttpRequest)
+        mock_req.params = {"report_format": value}
+
+        response = main(mock_req)
+
+        assert response.status_code == 400
+        assert "Invalid report format" in response.get_body().decode()
+        mock_vm_filter_class.assert_not_called()
+
+
+class TestReportManifest:
+    """Test cases for input fingerprints and report manifests."""
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_get_source_fingerprint(
+        self, mock_blob_service, mock_credential, test_config
+    ):
+        """Test the fingerprint comes from one properties call."""
+        properties = MagicMock(etag='"0x8DC"')
+        properties.content_settings.content_md5 = bytearray(b"\x01\x02")
+        mock_blob_client = MagicMock()
+        mock_blob_client.get_blob_properties.return_value = properties
+        mock_blob_service.return_value.get_blob_client.return_value = (
+            mock_blob_client
+        )
+
+        vm_filter = VMFilter(mock_credential, test_config)
+
+        assert vm_filter.get_source_fingerprint("vm_inventory.csv") == {
+            "etag": '"0x8DC"',
+            "content_md5": "AQI=",
+        }
+        mock_blob_client.download_blob.assert_not_called()
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_read_report_manifest_missing(
+        self, mock_blob_service, mock_credential, test_config
+    ):
+        """Test a first run has no manifest."""
+        mock_blob_client = MagicMock()
+        mock_blob_client.download_blob.side_effect = ResourceNotFoundError(
+            "missing"
+        )
+        mock_blob_service.return_value.get_blob_client.return_value = (
+            mock_blob_client
+        )
+
+        vm_filter = VMFilter(mock_credential, test_config)
+
+        assert vm_filter.report_manifests.read() is None
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_report_manifest_is_cached_by_etag(
+        self, mock_blob_service, mock_credential, test_config
+    ):
+        """Test warm reads download the manifest only if it has changed."""
+        manifest = {
+            "fingerprint": {"etag": "1"},
+            "report": "r.xlsx",
+            "row_count": 3,
+        }
+        updated = dict(manifest, report="r2.xlsx")
+        downloader = MagicMock()
+        downloader.readall.return_value = json.dumps(manifest).encode()
+        downloader.properties.etag = '"0x1"'
+        changed = MagicMock()
+        changed.readall.return_value = json.dumps(updated).encode()
+        changed.properties.etag = '"0x3"'
+        mock_blob_client = MagicMock()
+        mock_blob_client.download_blob.side_effect = [
+            downloader,
+            ResourceNotModifiedError("unchanged"),
+            ResourceNotModifiedError("unchanged"),
+            changed,
+            ResourceNotModifiedError("unchanged"),
+        ]
+        mock_blob_client.upload_blob.return_value = {"etag": '"0x2"'}
+        mock_blob_service.return_value.get_blob_client.return_value = (
+            mock_blob_client
+        )
+
+        vm_filter = VMFilter(mock_credential, test_config)
+
+        assert vm_filter.report_manifests.read() == manifest
+        assert vm_filter.report_manifests.read() == manifest
+        assert mock_blob_client.download_blob.call_args.kwargs == {
+            "etag": '"0x1"',
+            "match_condition": MatchConditions.IfModified,
+        }
+
+        vm_filter.report_manifests.write(updated)
+
+        mock_blob_client.upload_blob.assert_called_once_with(
+            json.dumps(updated), overwrite=True
+        )
+        assert vm_filter.report_manifests.read() == updated
+        assert (
+            mock_blob_client.download_blob.call_args.kwargs["etag"] == '"0x2"'
+        )
+
+        # Another worker replaced the manifest
+        assert vm_filter.report_manifests.read() == updated
+        assert vm_filter.report_manifests.read() == updated
+        assert (
+            mock_blob_client.download_blob.call_args.kwargs["etag"] == '"0x3"'
+        )
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_report_exists(
+        self, mock_blob_service, mock_credential, test_config
+    ):
+        """Test a deleted report is detected with one metadata call."""
+        mock_blob_client = MagicMock()
+        mock_blob_service.return_value.get_blob_client.return_value = (
+            mock_blob_client
+        )
+        vm_filter = VMFilter(mock_credential, test_config)
+
+        assert vm_filter.report_manifests.report_exists("r.xlsx")
+
+        mock_blob_client.get_blob_properties.side_effect = (
+            ResourceNotFoundError("missing")
+        )
+        assert not vm_filter.report_manifests.report_exists("r.xlsx")
+
+
+class TestClientRegistry:
+    """Test cases for the process-wide client registry."""
+
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    def test_credential_is_reused_per_client_id(self, mock_credential_class):
+        """Test one credential is created per managed identity."""
+        mock_credential_class.side_effect = lambda **kwargs: MagicMock()
+
+        first = get_credential("client-a")
+        second = get_credential("client-a")
+        other = get_credential("client-b")
+
+        assert first is second
+        assert other is not first
+        assert mock_credential_class.call_count == 2
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_blob_client_is_reused_across_filters(
+        self, mock_blob_service, test_config
+    ):
+        """Test warm invocations share the BlobServiceClient."""
+        credential = MagicMock()
+        url = "https://preprocessstorage.blob.core.windows.net"
+
+        first = get_blob_service_client(url, "client-id", credential)
+        second = get_blob_service_client(url, "client-id", credential)
+
+        assert first is second
+        mock_blob_service.assert_called_once_with(
+            account_url=url, credential=credential
+        )
+
+    @patch("filter_sql_servers.BlobServiceClient")
+    def test_blob_client_rebuilt_for_new_credential_or_url(
+        self, mock_blob_service
+    ):
+        """Test clients are rebuilt when their configuration changes."""
+        mock_blob_service.side_effect = lambda **kwargs: MagicMock()
+        credential = MagicMock()
+        url = "https://preprocessstorage.blob.core.windows.net"
+
+        first = get_blob_service_client(url, "client-id", credential)
+        new_credential = get_blob_service_client(url, "client-id", MagicMock())
+        new_url = get_blob_service_client(
+            "https://other.blob.core.windows.net", "client-id", credential
+        )
+
+        assert new_credential is not first
+        assert new_url is not first
+        assert mock_blob_service.call_count == 3
+
+    @patch("filter_sql_servers.SecretClient")
+    def test_reset_clients_forces_rebuild(self, mock_secret_client):
+        """Test reset_clients discards pooled clients."""
+        mock_secret_client.side_effect = lambda **kwargs: MagicMock()
+        credential = MagicMock()
+        url = "https://test-kv.vault.azure.net"
+
+        first = get_secret_client(url, "client-id", credential)
+        reset_clients()
+        second = get_secret_client(url, "client-id", credential)
+
+        assert first is not second
+
+
+class TestSecretCache:
+    """Test cases for the report password cache."""
+
+    VAULT_URL = "https://test-kv.vault.azure.net"
+
+    def test_secret_is_reused_within_ttl(self):
+        """Test Key Vault is only called once while the TTL holds."""
+        secret_client = MagicMock()
+        secret_client.get_secret.return_value = make_secret()
+
+        first = get_report_secret(secret_client, self.VAULT_URL, ttl=60)
+        second = get_report_secret(secret_client, self.VAULT_URL, ttl=60)
+
+        assert first is second
+        secret_client.get_secret.assert_called_once_with("postprocess-secret")
+
+    def test_secret_is_refetched_after_ttl(self, caplog):
+        """Test an expired TTL fetches and logs the new version."""
+        secret_client = MagicMock()
+        secret_client.get_secret.side_effect = [
+            make_secret(version="v1"),
+            make_secret(value="rotated", version="v2"),
+        ]
+
+        get_report_secret(secret_client, self.VAULT_URL, ttl=0)
+        with caplog.at_level("INFO"):
+            second = get_report_secret(secret_client, self.VAULT_URL, ttl=0)
+
+        assert second.value == "rotated"
+        assert "has a new version" in caplog.text
+
+    def test_secret_is_refetched_after_expiry(self):
+        """Test a cached secret past its expiration date is replaced."""
+        expired = datetime.now(timezone.utc) - timedelta(seconds=1)
+        valid = datetime.now(timezone.utc) + timedelta(days=90)
+        secret_client = MagicMock()
+        secret_client.get_secret.side_effect = [
+            make_secret(version="v1", expires_on=valid),
+            make_secret(version="v2", expires_on=valid),
+        ]
+
+        first = get_report_secret(secret_client, self.VAULT_URL, ttl=3600)
+        first.properties.expires_on = expired
+        second = get_report_secret(secret_client, self.VAULT_URL, ttl=3600)
+
+        assert second.properties.version == "v2"
+
+    def test_force_refresh_bypasses_cache(self):
+        """Test force_refresh always asks Key Vault."""
+        secret_client = MagicMock()
+        secret_client.get_secret.side_effect = [
+            make_secret(version="v1"),
+            make_secret(version="v1"),
+        ]
+
+        get_report_secret(secret_client, self.VAULT_URL, ttl=3600)
+        get_report_secret(
+            secret_client, self.VAULT_URL, ttl=3600, force_refresh=True
+        )
+
+        assert secret_client.get_secret.call_count == 2
+
+    @staticmethod
+    def make_versions(*versions):
+        """Build SecretProperties stand-ins, oldest first."""
+        properties = []
+        for created_on, version in enumerate(versions):
+            item = MagicMock(enabled=True, created_on=created_on)
+            item.version = version
+            properties.append(item)
+        return properties
+
+    def test_version_check_detects_rotation(self, caplog):
+        """Test a rotation within the TTL is found by the version check."""
+        secret_client = MagicMock()
+        secret_client.get_secret.side_effect = [
+            make_secret(version="v1"),
+            make_secret(value="rotated", version="v2"),
+        ]
+        secret_client.list_properties_of_secret_versions.return_value = (
+            self.make_versions("v1", "v2")
+        )
+
+        get_report_secret(
+            secret_client, self.VAULT_URL, ttl=3600, check_interval=0
+        )
+        with caplog.at_level("INFO"):
+            second = get_report_secret(
+                secret_client, self.VAULT_URL, ttl=3600, check_interval=0
+            )
+
+        assert second.value == "rotated"
+        assert "was rotated" in caplog.text
+        secret_client.list_properties_of_secret_versions.assert_called_once_with(
+            "postprocess-secret"
+        )
+
+    def test_version_check_keeps_current_secret(self):
+        """Test an unchanged version is reused and not checked again."""
+        secret_client = MagicMock()
+        secret_client.get_secret.return_value = make_secret(version="v2")
+        versions = self.make_versions("v1", "v2", "v3")
+        # A disabled newer version is not the one in use
+        versions[-1].enabled = False
+        secret_client.list_properties_of_secret_versions.return_value = (
+            versions
+        )
+
+        first = get_report_secret(
+            secret_client, self.VAULT_URL, ttl=3600, check_interval=0
+        )
+        second = get_report_secret(
+            secret_client, self.VAULT_URL, ttl=3600, check_interval=0
+        )
+        third = get_report_secret(
+            secret_client, self.VAULT_URL, ttl=3600, check_interval=3600
+        )
+
+        assert first is second is third
+        secret_client.get_secret.assert_called_once()
+        secret_client.list_properties_of_secret_versions.assert_called_once()
+
+    def test_empty_or_expired_secret_is_stale(self):
+        """Test an unusable password raises StalePasswordError."""
+        expired = datetime.now(timezone.utc) - timedelta(days=1)
+        secret_client = MagicMock()
+        secret_client.get_secret.return_value = make_secret(expires_on=expired)
+
+        with pytest.raises(StalePasswordError):
+            get_report_secret(secret_client, self.VAULT_URL, ttl=3600)
+
+    def test_unusable_cached_secret_is_fetched_again(self):
+        """Test a rejected cached password is refreshed once."""
+        secret_client = MagicMock()
+        secret_client.get_secret.side_effect = [
+            make_secret(value="", version="v1"),
+            make_secret(version="v2"),
+        ]
+
+        secret = get_report_secret(secret_client, self.VAULT_URL, ttl=3600)
+
+        assert secret.properties.version == "v2"
+        assert secret_client.get_secret.call_count == 2
+        assert (
+            get_report_secret(secret_client, self.VAULT_URL, ttl=3600)
+            is secret
+        )
+
+    def test_export_rejects_empty_password(self, mock_credential, test_config):
+        """Test export reports a missing password as stale."""
+        vm_filter = VMFilter(mock_credential, test_config)
+
+        with pytest.raises(StalePasswordError):
+            vm_filter.export_to_excel(pd.DataFrame(), "report.xlsx", "")
+
+
+class TestMainFunction:
+    """Test cases for main Azure Function."""
+
+    @patch("filter_sql_servers.SecretClient")
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+        },
+    )
+    def test_main_success(
+        self,
+        mock_credential_class,
+        mock_vm_filter_class,
+        mock_secret_client_class,
+        sample_vm_data,
+    ):
+        """Test successful execution of main function."""
+        # Arrange
+        mock_req = Mock(spec=func.HttpRequest)
+
+        mock_credential = MagicMock()
+        mock_credential_class.return_value = mock_credential
+
+        mock_vm_filter = MagicMock()
+        filtered_data = sample_vm_data.iloc[:2]
+        mock_vm_filter.load_data.return_value = sample_vm_data
+        mock_vm_filter.filter_sql_vms.return_value = filtered_data
+        mock_vm_filter_class.return_value = mock_vm_filter
+
+        mock_secret_client = MagicMock()
+        mock_secret = MagicMock()
+        mock_secret.value = "test_password"
+        mock_secret_client.get_secret.return_value = mock_secret
+        mock_secret_client_class.return_value = mock_secret_client
+
+        # Act
+        response = main(mock_req)
+
+        # Assert
+        assert response.status_code == 200
+        assert "Report generated successfully" in (
+            response.get_body().decode()
+        )
+        assert "Total SQL Server VMs: 2" in response.get_body().decode()
+
+        mock_vm_filter.load_data.assert_called_once_with(
+            "vm_inventory.csv", None
+        )
+        mock_secret_client.get_secret.assert_called_once_with(
+            "postprocess-secret"
+        )
+
+    @pytest.mark.parametrize("metrics_format", ["header", "json", "other"])
+    @patch("filter_sql_servers.SecretClient")
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+        },
+    )
+    def test_main_returns_stage_metrics_on_request(
+        self,
+        mock_credential_class,
+        mock_vm_filter_class,
+        mock_secret_client_class,
+        metrics_format,
+        sample_vm_data,
+    ):
+        """Test ?metrics=header|json returns the run's stage metrics."""
+        # Arrange
+        mock_req = Mock(spec=func.HttpRequest)
+        mock_req.params = {"metrics": metrics_format}
+
+        mock_vm_filter = mock_vm_filter_class.return_value
+        mock_vm_filter.load_data.return_value = sample_vm_data
+        mock_vm_filter.filter_sql_vms.return_value = sample_vm_data
+        mock_secret_client_class.return_value.get_secret.return_value = (
+            make_secret()
+        )
+
+        # Act
+        response = main(mock_req)
+
+        # Assert - main records its own steps next to the VMFilter stages
+        metrics = mock_vm_filter_class.call_args.args[2]
+        assert [s["stage"] for s in metrics.stages] == [
+            "credential",
+            "secret",
+        ]
+        assert response.status_code == 200
+        body = response.get_body().decode()
+        if metrics_format == "header":
+            summary = json.loads(response.headers["X-Stage-Metrics"])
+            assert summary["stages"][0]["stage"] == "credential"
+            assert body.startswith("Report generated successfully")
+        elif metrics_format == "json":
+            document = json.loads(body)
+            assert response.mimetype == "application/json"
+            assert document["message"].startswith("Report generated")
+            assert document["metrics"]["stages"][1]["stage"] == "secret"
+        else:
+            assert "X-Stage-Metrics" not in response.headers
+            assert body.startswith("Report generated successfully")
+
+    @patch("filter_sql_servers.SecretClient")
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+            "CLASSIFY_SQL_VERSIONS": "true",
+            "SQL_SERVER_VERSION_STATUS": '{"2019": "vulnerable"}',
+        },
+    )
+    def test_main_classifies_sql_versions(
+        self,
+        mock_credential_class,
+        mock_vm_filter_class,
+        mock_secret_client_class,
+        sample_vm_data,
+    ):
+        """Test the report is classified when CLASSIFY_SQL_VERSIONS is set."""
+        # Arrange
+        mock_vm_filter = mock_vm_filter_class.return_value
+        mock_vm_filter.filter_sql_vms.return_value = sample_vm_data
+        classified = sample_vm_data.assign(SQLServerStatus="vulnerable")
+        mock_vm_filter.classify_sql_versions.return_value = classified
+        mock_secret_client_class.return_value.get_secret.return_value = (
+            make_secret()
+        )
+
+        # Act
+        response = main(Mock(spec=func.HttpRequest))
+
+        # Assert
+        assert response.status_code == 200
+        config = mock_vm_filter_class.call_args.args[1]
+        assert config["sql_version_status"] == '{"2019": "vulnerable"}'
+        mock_vm_filter.classify_sql_versions.assert_called_once_with(
+            sample_vm_data
+        )
+        assert mock_vm_filter.export_to_excel.call_args.args[0] is classified
+
+    @patch("filter_sql_servers.SecretClient")
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+            "PRODUCT_PATTERNS": '{"FileZilla": "FileZilla"}',
+        },
+    )
+    def test_main_tags_configured_products(
+        self,
+        mock_credential_class,
+        mock_vm_filter_class,
+        mock_secret_client_class,
+        sample_vm_data,
+    ):
+        """Test the report is tagged when PRODUCT_PATTERNS is set."""
+        # Arrange
+        mock_vm_filter = mock_vm_filter_class.return_value
+        mock_vm_filter.load_data.return_value = sample_vm_data
+        mock_vm_filter.filter_sql_vms.return_value = sample_vm_data
+        tagged = sample_vm_data.assign(MatchedProducts="")
+        mock_vm_filter.tag_products.return_value = tagged
+        product_hosts = sample_vm_data.iloc[[1]].assign(
+            MatchedProducts="FileZilla"
+        )
+        mock_vm_filter.find_product_hosts.return_value = product_hosts
+        mock_secret_client_class.return_value.get_secret.return_value = (
+            make_secret()
+        )
+
+        # Act
+        response = main(Mock(spec=func.HttpRequest))
+
+        # Assert
+        assert response.status_code == 200
+        config = mock_vm_filter_class.call_args.args[1]
+        assert config["product_patterns"] == {"FileZilla": ["FileZilla"]}
+        mock_vm_filter.tag_products.assert_called_once_with(sample_vm_data)
+        mock_vm_filter.find_product_hosts.assert_called_once_with(
+            "vm_inventory.csv", None, 8
+        )
+        report, product_report = (
+            call.args for call in mock_vm_filter.export_to_excel.call_args_list
+        )
+        assert report[0] is tagged
+        assert product_report[0] is product_hosts
+        assert product_report[1].startswith("sql_servers_products_")
+        assert "Product report generated successfully" in (
+            response.get_body().decode()
+        )
+
+    @patch("filter_sql_servers.SecretClient")
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+            "PRODUCT_PATTERNS": '{"FileZilla": "FileZilla"}',
+        },
+    )
+    def test_main_reports_products_without_sql_servers(
+        self,
+        mock_credential_class,
+        mock_vm_filter_class,
+        mock_secret_client_class,
+        sample_vm_data,
+    ):
+        """Test product hosts are reported when no VM has SQL Server."""
+        # Arrange
+        mock_vm_filter = mock_vm_filter_class.return_value
+        no_sql_vms = sample_vm_data.iloc[:0]
+        mock_vm_filter.load_data.return_value = sample_vm_data
+        mock_vm_filter.filter_sql_vms.return_value = no_sql_vms
+        mock_vm_filter.tag_products.return_value = no_sql_vms.assign(
+            MatchedProducts=""
+        )
+        product_hosts = sample_vm_data.assign(MatchedProducts="FileZilla")
+        mock_vm_filter.find_product_hosts.return_value = product_hosts
+        mock_secret_client_class.return_value.get_secret.return_value = (
+            make_secret()
+        )
+
+        # Act
+        response = main(Mock(spec=func.HttpRequest))
+
+        # Assert
+        assert response.status_code == 200
+        [call] = mock_vm_filter.export_to_excel.call_args_list
+        assert call.args[0] is product_hosts
+        assert call.args[1].startswith("sql_servers_products_")
+        assert call.kwargs == {"summaries": False}
+
+    @patch("filter_sql_servers.SecretClient")
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+            "PRODUCT_PATTERNS": '{"FileZilla": "FileZilla"}',
+            "REPORT_COLUMNS": "VMName,AccountID",
+        },
+    )
+    def test_main_projects_report_columns(
+        self,
+        mock_credential_class,
+        mock_vm_filter_class,
+        mock_secret_client_class,
+        sample_vm_data,
+    ):
+        """Test REPORT_COLUMNS limits parsing to the columns a run needs."""
+        # Arrange
+        mock_vm_filter = mock_vm_filter_class.return_value
+        mock_vm_filter.load_data.return_value = sample_vm_data
+        mock_vm_filter.filter_sql_vms.return_value = sample_vm_data
+        mock_vm_filter.tag_products.return_value = sample_vm_data.assign(
+            MatchedProducts=""
+        )
+        mock_vm_filter.find_product_hosts.return_value = sample_vm_data.iloc[
+            :0
+        ].assign(MatchedProducts="")
+        mock_secret_client_class.return_value.get_secret.return_value = (
+            make_secret()
+        )
+
+        # Act
+        response = main(Mock(spec=func.HttpRequest))
+
+        # Assert
+        assert response.status_code == 200
+        # RawSoftware is parsed for product tagging only
+        mock_vm_filter.load_data.assert_called_once_with(
+            "vm_inventory.csv",
+            ["AccountID", "VMName", "SQLSoftware", "RawSoftware"],
+        )
+        report = mock_vm_filter.export_to_excel.call_args.args[0]
+        assert list(report.columns) == [
+            "AccountID",
+            "VMName",
+            "MatchedProducts",
+        ]
+
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+            "REPORT_COLUMNS": "VMName,Owner",
+        },
+    )
+    def test_main_rejects_unknown_report_columns(self):
+        """Test an unknown REPORT_COLUMNS name is a configuration error."""
+        response = main(Mock(spec=func.HttpRequest))
+
+        assert response.status_code == 500
+        assert "Unknown inventory columns Owner" in (
+            response.get_body().decode()
+        )
+
+    @patch("filter_sql_servers.SecretClient")
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+            "INVENTORY_CHUNK_ROWS": "500",
+        },
+    )
+    def test_main_streaming_mode(
+        self,
+        mock_credential_class,
+        mock_vm_filter_class,
+        mock_secret_client_class,
+        sample_vm_data,
+    ):
+        """Test main streams the inventory when INVENTORY_CHUNK_ROWS is set."""
+        # Arrange
+        mock_req = Mock(spec=func.HttpRequest)
+
+        mock_vm_filter = MagicMock()
+        mock_vm_filter.load_sql_vms.return_value = sample_vm_data.iloc[:2]
+        mock_vm_filter_class.return_value = mock_vm_filter
+
+        mock_secret_client_class.return_value.get_secret.return_value = (
+            MagicMock(value="test_password")
+        )
+
+        # Act
+        response = main(mock_req)
+
+        # Assert
+        assert response.status_code == 200
+        assert "Total SQL Server VMs: 2" in response.get_body().decode()
+        mock_vm_filter.load_sql_vms.assert_called_once_with(
+            "vm_inventory.csv", 500, None
+        )
+        mock_vm_filter.load_data.assert_not_called()
+        mock_vm_filter.filter_sql_vms.assert_not_called()
+
+    @pytest.mark.parametrize(
+        "plan, method, args, kwargs",
+        [
+            (
+                {"strategy": "stream", "compression": "gzip"},
+                "load_sql_vms",
+                ("vm_inventory.csv", 50000, None),
+                {"compression": "gzip"},
+            ),
+            (
+                {"strategy": "parallel", "compression": None, "processes": 2},
+                "load_sql_vms_parallel",
+                ("vm_inventory.csv", 2, None),
+                {},
+            ),
+            (
+                {"strategy": "cache", "compression": None},
+                "load_data",
+                ("vm_inventory.csv", None),
+                {"sql_server_only": True},
+            ),
+        ],
+    )
+    @patch("filter_sql_servers.SecretClient")
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+            "INVENTORY_LOAD_PLANNER": "true",
+            # Fixed modes are ignored when the planner is enabled
+            "INVENTORY_PARSE_PROCESSES": "4",
+        },
+    )
+    def test_main_load_planner(
+        self,
+        mock_credential_class,
+        mock_vm_filter_class,
+        mock_secret_client_class,
+        plan,
+        method,
+        args,
+        kwargs,
+        sample_vm_data,
+    ):
+        """Test main loads the inventory as the planner decides."""
+        # Arrange
+        mock_vm_filter = mock_vm_filter_class.return_value
+        mock_vm_filter.plan_load.return_value = plan
+        getattr(mock_vm_filter, method).return_value = sample_vm_data.iloc[:2]
+        mock_secret_client_class.return_value.get_secret.return_value = (
+            make_secret()
+        )
+
+        # Act
+        response = main(Mock(spec=func.HttpRequest))
+
+        # Assert
+        assert response.status_code == 200
+        assert "Total SQL Server VMs: 2" in response.get_body().decode()
+        mock_vm_filter.plan_load.assert_called_once_with("vm_inventory.csv")
+        getattr(mock_vm_filter, method).assert_called_once_with(
+            *args, **kwargs
+        )
+        mock_vm_filter.filter_sql_vms.assert_not_called()
+
+    @patch("filter_sql_servers.SecretClient")
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+            "INVENTORY_PARSE_PROCESSES": "4",
+        },
+    )
+    def test_main_parallel_parse_mode(
+        self,
+        mock_credential_class,
+        mock_vm_filter_class,
+        mock_secret_client_class,
+        sample_vm_data,
+    ):
+        """Test main parses in processes when INVENTORY_PARSE_PROCESSES is
+        set."""
+        # Arrange
+        mock_vm_filter = mock_vm_filter_class.return_value
+        mock_vm_filter.load_sql_vms_parallel.return_value = (
+            sample_vm_data.iloc[:2]
+        )
+        mock_secret_client_class.return_value.get_secret.return_value = (
+            make_secret()
+        )
+
+        # Act
+        response = main(Mock(spec=func.HttpRequest))
+
+        # Assert
+        assert response.status_code == 200
+        assert "Total SQL Server VMs: 2" in response.get_body().decode()
+        mock_vm_filter.load_sql_vms_parallel.assert_called_once_with(
+            "vm_inventory.csv", 4, None
+        )
+        mock_vm_filter.load_data.assert_not_called()
+
+    @patch("filter_sql_servers.SecretClient")
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+            "SECRET_VERSION_CHECK_SECONDS": "0",
+        },
+    )
+    def test_main_caches_password_and_refreshes_when_rotated(
+        self,
+        mock_credential_class,
+        mock_vm_filter_class,
+        mock_secret_client_class,
+        sample_vm_data,
+    ):
+        """Test warm runs reuse the password until a new version appears."""
+        # Arrange
+        mock_req = Mock(spec=func.HttpRequest)
+
+        mock_vm_filter = MagicMock()
+        mock_vm_filter.filter_sql_vms.return_value = sample_vm_data
+        mock_vm_filter_class.return_value = mock_vm_filter
+
+        mock_secret_client = mock_secret_client_class.return_value
+        mock_secret_client.get_secret.side_effect = [
+            make_secret(value="old", version="v1"),
+            make_secret(value="new", version="v2"),
+        ]
+        mock_secret_client.list_properties_of_secret_versions.side_effect = [
+            TestSecretCache.make_versions("v1"),
+            TestSecretCache.make_versions("v1", "v2"),
+        ]
+
+        # Act
+        responses = [main(mock_req) for _ in range(3)]
+
+        # Assert - one fetch for two runs, then one for the new version
+        assert [response.status_code for response in responses] == [200] * 3
+        assert mock_secret_client.get_secret.call_count == 2
+        passwords = [
+            call.args[2]
+            for call in mock_vm_filter.export_to_excel.call_args_list
+        ]
+        assert passwords == ["old", "old", "new"]
+
+    @patch("filter_sql_servers.SecretClient")
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+            "REUSE_UNCHANGED_REPORTS": "true",
+        },
+    )
+    def test_main_reuses_unchanged_report(
+        self,
+        mock_credential_class,
+        mock_vm_filter_class,
+        mock_secret_client_class,
+        sample_vm_data,
+    ):
+        """Test a repeat trigger with unchanged inputs skips the run."""
+        # Arrange - the manifest store behaves like the real one
+        mock_req = Mock(spec=func.HttpRequest)
+        manifests = []
+
+        mock_vm_filter = MagicMock()
+        mock_vm_filter.get_source_fingerprint.return_value = {
+            "etag": '"0x1"',
+            "content_md5": "AQI=",
+        }
+        mock_vm_filter.report_manifests.read.side_effect = lambda: (
+            manifests[-1] if manifests else None
+        )
+        mock_vm_filter.report_manifests.write.side_effect = manifests.append
+        mock_vm_filter.filter_sql_vms.return_value = sample_vm_data.iloc[:2]
+        mock_vm_filter_class.return_value = mock_vm_filter
+
+        mock_secret_client_class.return_value.get_secret.return_value = (
+            make_secret(version="v1")
+        )
+
+        # Act
+        first = main(mock_req)
+        second = main(mock_req)
+
+        # Assert
+        assert "Report generated successfully" in first.get_body().decode()
+        body = second.get_body().decode()
+        assert second.status_code == 200
+        assert f"Report unchanged: {manifests[0]['report']}" in body
+        assert "Total SQL Server VMs: 2" in body
+        assert manifests[0]["fingerprint"] == {
+            "etag": '"0x1"',
+            "content_md5": "AQI=",
+            "secret_version": "v1",
+        }
+        mock_vm_filter.load_data.assert_called_once()
+        mock_vm_filter.export_to_excel.assert_called_once()
+
+    @patch("filter_sql_servers.SecretClient")
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+            "REUSE_UNCHANGED_REPORTS": "true",
+        },
+    )
+    def test_main_regenerates_deleted_report(
+        self,
+        mock_credential_class,
+        mock_vm_filter_class,
+        mock_secret_client_class,
+        sample_vm_data,
+    ):
+        """Test a matching manifest is not reused once its report is gone."""
+        # Arrange
+        mock_vm_filter = mock_vm_filter_class.return_value
+        mock_vm_filter.get_source_fingerprint.return_value = {"etag": "1"}
+        mock_vm_filter.report_manifests.read.return_value = {
+            "fingerprint": {"etag": "1", "secret_version": "v1"},
+            "report": "old.xlsx",
+            "row_count": 2,
+        }
+        mock_vm_filter.report_manifests.report_exists.return_value = False
+        mock_vm_filter.filter_sql_vms.return_value = sample_vm_data
+        mock_secret_client_class.return_value.get_secret.return_value = (
+            make_secret(version="v1")
+        )
+
+        # Act
+        response = main(Mock(spec=func.HttpRequest))
+
+        # Assert
+        assert "Report generated successfully" in response.get_body().decode()
+        mock_vm_filter.report_manifests.report_exists.assert_called_once_with(
+            "old.xlsx"
+        )
+        mock_vm_filter.export_to_excel.assert_called_once()
+
+    @patch("filter_sql_servers.SecretClient")
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+            "REUSE_UNCHANGED_REPORTS": "true",
+            "PRODUCT_PATTERNS": '{"FileZilla": "FileZilla"}',
+            "CLASSIFY_SQL_VERSIONS": "true",
+            "SQL_SERVER_VERSION_STATUS": '{"2016": "patched"}',
+        },
+    )
+    def test_main_fingerprint_includes_report_settings(
+        self,
+        mock_credential_class,
+        mock_vm_filter_class,
+        mock_secret_client_class,
+        sample_vm_data,
+    ):
+        """Test a report is not reused after its settings change."""
+        # Arrange
+        mock_vm_filter = mock_vm_filter_class.return_value
+        mock_vm_filter.get_source_fingerprint.return_value = {"etag": "1"}
+        mock_vm_filter.report_manifests.read.return_value = {
+            "fingerprint": {"etag": "1", "secret_version": "v1"},
+            "report": "old.xlsx",
+            "row_count": 2,
+        }
+        mock_vm_filter.filter_sql_vms.return_value = sample_vm_data
+        mock_vm_filter.classify_sql_versions.return_value = sample_vm_data
+        mock_vm_filter.tag_products.return_value = sample_vm_data
+        mock_vm_filter.find_product_hosts.return_value = sample_vm_data.iloc[
+            :0
+        ]
+        mock_secret_client_class.return_value.get_secret.return_value = (
+            make_secret(version="v1")
+        )
+
+        # Act
+        response = main(Mock(spec=func.HttpRequest))
+
+        # Assert
+        assert "Report generated successfully" in response.get_body().decode()
+        manifest = mock_vm_filter.report_manifests.write.call_args.args[0]
+        assert manifest["fingerprint"]["product_patterns"] == {
+            "FileZilla": ["FileZilla"]
+        }
+        assert manifest["fingerprint"]["sql_version_status"] == (
+            '{"2016": "patched"}'
+        )
+
+    @patch("filter_sql_servers.SecretClient")
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+            "REUSE_UNCHANGED_REPORTS": "true",
+        },
+    )
+    def test_main_recomputes_when_inventory_changes(
+        self,
+        mock_credential_class,
+        mock_vm_filter_class,
+        mock_secret_client_class,
+    ):
+        """Test a new ETag triggers a full run, including no-match runs."""
+        # Arrange
+        mock_req = Mock(spec=func.HttpRequest)
+        manifests = []
+
+        mock_vm_filter = MagicMock()
+        mock_vm_filter.get_source_fingerprint.side_effect = [
+            {"etag": '"0x1"', "content_md5": None},
+            {"etag": '"0x1"', "content_md5": None},
+            {"etag": '"0x2"', "content_md5": None},
+        ]
+        mock_vm_filter.report_manifests.read.side_effect = lambda: (
+            manifests[-1] if manifests else None
+        )
+        mock_vm_filter.report_manifests.write.side_effect = manifests.append
+        mock_vm_filter.filter_sql_vms.return_value = pd.DataFrame()
+        mock_vm_filter_class.return_value = mock_vm_filter
+
+        mock_secret_client_class.return_value.get_secret.return_value = (
+            make_secret(version="v1")
+        )
+
+        # Act
+        responses = [main(mock_req) for _ in range(3)]
+
+        # Assert - the unchanged run answers from the manifest
+        for response in responses:
+            assert "No SQL Server installations found" in (
+                response.get_body().decode()
+            )
+        assert mock_vm_filter.load_data.call_count == 2
+        assert manifests[-1]["report"] is None
+
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+            "INVENTORY_BLOB": "inventory/*.csv",
+            "INVENTORY_MAX_WORKERS": "4",
+        },
+    )
+    def test_main_sharded_mode(
+        self, mock_credential_class, mock_vm_filter_class
+    ):
+        """Test a glob in INVENTORY_BLOB loads shards in parallel."""
+        mock_req = Mock(spec=func.HttpRequest)
+        mock_vm_filter = MagicMock()
+        mock_vm_filter.load_sharded_sql_vms.return_value = pd.DataFrame()
+        mock_vm_filter_class.return_value = mock_vm_filter
+
+        response = main(mock_req)
+
+        assert response.status_code == 200
+        mock_vm_filter.load_sharded_sql_vms.assert_called_once_with(
+            "inventory/*.csv", 4, 50000, None
+        )
+        mock_vm_filter.load_data.assert_not_called()
+
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+            "INVENTORY_PARQUET_CACHE": "true",
+        },
+    )
+    def test_main_parquet_cache_mode(
+        self, mock_credential_class, mock_vm_filter_class
+    ):
+        """Test main loads only SQL Server rows through the cache."""
+        mock_req = Mock(spec=func.HttpRequest)
+        mock_vm_filter = MagicMock()
+        mock_vm_filter.load_data.return_value = pd.DataFrame()
+        mock_vm_filter_class.return_value = mock_vm_filter
+
+        response = main(mock_req)
+
+        assert response.status_code == 200
+        mock_vm_filter.load_data.assert_called_once_with(
+            "vm_inventory.csv", None, sql_server_only=True
+        )
+        mock_vm_filter.filter_sql_vms.assert_not_called()
+
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+        },
+    )
+    def test_main_no_sql_servers_found(
+        self, mock_credential_class, mock_vm_filter_class, sample_vm_data
+    ):
+        """Test main function when no SQL Server VMs found."""
+        # Arrange
+        mock_req = Mock(spec=func.HttpRequest)
+
+        mock_vm_filter = MagicMock()
+        mock_vm_filter.load_data.return_value = sample_vm_data
+        mock_vm_filter.filter_sql_vms.return_value = pd.DataFrame()
+        mock_vm_filter_class.return_value = mock_vm_filter
+
+        # Act
+        response = main(mock_req)
+
+        # Assert
+        assert response.status_code == 200
+        assert "No SQL Server installations found" in (
+            response.get_body().decode()
+        )
+
+    @patch("filter_sql_servers.VMFilter")
     @patch("filter_sql_servers.ManagedIdentityCredential")
     @patch.dict(
         os.environ,
@@ -464,6 +3418,122 @@ class TestMainFunction:
         assert "KEY_VAULT_URL is required" in body
 
 
+class TestColdStart:
+    """Guard what a cold start imports before its first stage runs."""
+
+    # Imported by the stages that need them, never by the function module
+    DEFERRED_MODULES = (
+        "azure.identity",
+        "azure.keyvault.secrets",
+        "azure.storage.blob",
+        "msoffcrypto",
+        "numpy",
+        "openpyxl",
+        "pandas",
+        "pyarrow",
+    )
+
+    @staticmethod
+    def run_python(source, *options):
+        """Run Python source in a fresh interpreter."""
+        repo_dir = pathlib.Path(__file__).parent.parent
+        return subprocess.run(
+            [sys.executable, *options, "-c", source],
+            cwd=repo_dir,
+            env=dict(
+                os.environ,
+                PYTHONPATH=os.pathsep.join([str(repo_dir / "function"), "."]),
+            ),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+            "CLASSIFY_SQL_VERSIONS": "true",
+            "SQL_SERVER_VERSION_STATUS": '{"2019": "vulnerable"}',
+        },
+    )
+    def test_import_defers_heavy_dependencies(self):
+        """Test importing the function module and reading its settings
+        loads none of the heavy dependencies."""
+        result = self.run_python(
+            "import sys, filter_sql_servers; "
+            "filter_sql_servers.load_config(); "
+            f"print(sorted(m for m in {self.DEFERRED_MODULES!r} "
+            "if m in sys.modules))"
+        )
+
+        assert result.stdout.strip() == "[]"
+
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+        },
+    )
+    def test_empty_report_skips_export_dependencies(self):
+        """Test a run without SQL Server hosts never loads the workbook,
+        Office encryption or Key Vault libraries."""
+        result = self.run_python(
+            textwrap.dedent(
+                """
+                import sys
+                from unittest.mock import Mock, patch
+
+                import azure.functions as func
+
+                import filter_sql_servers
+                from tests.benchmarks.blob_stubs import (
+                    InMemoryBlobServiceClient,
+                )
+
+                storage = InMemoryBlobServiceClient(
+                    blobs={
+                        ("pre-container", "vm_inventory.csv"): (
+                            b"AccountID,VMName,PlatformDetails,"
+                            b"SQLSoftware,RawSoftware\\n"
+                            b"1,vm-a,Linux/UNIX,[],[]\\n"
+                        )
+                    }
+                )
+                with patch(
+                    "filter_sql_servers.BlobServiceClient",
+                    return_value=storage,
+                ), patch("filter_sql_servers.ManagedIdentityCredential"):
+                    response = filter_sql_servers.main(
+                        Mock(spec=func.HttpRequest)
+                    )
+                print(response.get_body().decode())
+                print(
+                    sorted(
+                        m
+                        for m in ("azure.keyvault.secrets", "msoffcrypto",
+                                  "openpyxl")
+                        if m in sys.modules
+                    )
+                )
+                """
+            )
+        )
+
+        body, loaded = result.stdout.strip().splitlines()
+        assert body == "No SQL Server installations found in inventory"
+        assert loaded == "[]"
+
+
 class TestEdgeCases:
     """Test edge cases and real-world scenarios."""
 
@@ -578,6 +3648,45 @@ class TestCoverageGaps:
             response.get_body().decode()
         )
 
+    @patch("filter_sql_servers.VMFilter")
+    @patch("filter_sql_servers.ManagedIdentityCredential")
+    @patch.dict(
+        os.environ,
+        {
+            "PREPROCESS_STORAGE_ACCOUNT": "preprocess",
+            "PREPROCESS_CONTAINER": "pre-container",
+            "POSTPROCESS_STORAGE_ACCOUNT": "postprocess",
+            "POSTPROCESS_CONTAINER": "post-container",
+            "KEY_VAULT_URL": "https://test-kv.vault.azure.net",
+            "MANAGED_IDENTITY_CLIENT_ID": "client-id",
+        },
+    )
+    def test_main_authentication_error_resets_clients(
+        self, mock_credential_class, mock_vm_filter_class
+    ):
+        """Test an expired or revoked token drops the pooled clients."""
+        # Arrange
+        mock_req = Mock(spec=func.HttpRequest)
+        mock_credential_class.side_effect = lambda **kwargs: MagicMock()
+
+        mock_vm_filter = MagicMock()
+        mock_vm_filter.load_data.side_effect = ClientAuthenticationError(
+            "token expired"
+        )
+        mock_vm_filter_class.return_value = mock_vm_filter
+
+        # Act
+        first = main(mock_req)
+        second = main(mock_req)
+
+        # Assert - the second invocation got a fresh credential
+        assert first.status_code == 500
+        assert "Authentication error" in first.get_body().decode()
+        assert second.status_code == 500
+        first_credential = mock_vm_filter_class.call_args_list[0].args[0]
+        second_credential = mock_vm_filter_class.call_args_list[1].args[0]
+        assert first_credential is not second_credential
+
     @patch.dict(
         os.environ,
         {
@@ -630,4 +3739,3 @@ class TestCoverageGaps:
         # Assert
         assert response.status_code == 500
         assert "Error: Unexpected error" in response.get_body().decode()
-
@@ -0,0 +1,214 @@
+"""
+Unit tests for the date-partitioned report history.
+"""
+
+from datetime import date, datetime, timezone
+from io import BytesIO
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from filter_sql_servers.history import (
+    compaction_groups,
+    history_table,
+    month_blob_name,
+    partition_dates,
+    read_history,
+    run_blob_name,
+    select_partitions,
+    write_compacted,
+    write_history,
+)
+
+
+def run_time(month, day, hour=8):
+    """Time of a report run in 2026."""
+    return datetime(2026, month, day, hour, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def report():
+    """Small SQL Server report."""
+    return pd.DataFrame(
+        {
+            "AccountID": [111, 222, 333],
+            "VMName": ["vm-a", "vm-b", "vm-c"],
+            "SQLServerMajorVersion": ["2012", "2019", "2012"],
+        }
+    )
+
+
+def to_file(table):
+    """Write a history table to an in-memory file."""
+    stream = BytesIO()
+    write_history(table, stream)
+    stream.seek(0)
+    return stream
+
+
+def test_blob_names_and_partition_dates():
+    """Test run and month blobs name the days they cover."""
+    run_blob = run_blob_name(run_time(9, 3))
+    month_blob = month_blob_name(date(2026, 12, 15))
+
+    assert run_blob == "history/date=2026-09-03/run-080000000000.parquet"
+    assert month_blob == "history/month=2026-12/history.parquet"
+    assert partition_dates(run_blob) == (date(2026, 9, 3), date(2026, 9, 3))
+    assert partition_dates(month_blob) == (
+        date(2026, 12, 1),
+        date(2026, 12, 31),
+    )
+    assert partition_dates("history/notes.txt") is None
+
+
+def test_select_partitions():
+    """Test only partitions overlapping the requested days are kept."""
+    names = [
+        "history/month=2026-08/history.parquet",
+        "history/month=2026-09/history.parquet",
+        "history/date=2026-10-02/run-080000000000.parquet",
+        "history/date=2026-10-09/run-080000000000.parquet",
+        "history/notes.txt",
+    ]
+
+    assert select_partitions(names, date(2026, 9, 20), date(2026, 10, 5)) == [
+        "history/date=2026-10-02/run-080000000000.parquet",
+        "history/month=2026-09/history.parquet",
+    ]
+    assert select_partitions(names) == sorted(names[:4])
+
+
+def test_compaction_groups_skip_current_month():
+    """Test only finished months are compacted."""
+    names = [
+        "history/date=2026-09-03/run-080000000000.parquet",
+        "history/date=2026-09-01/run-080000000000.parquet",
+        "history/date=2026-10-01/run-080000000000.parquet",
+        "history/month=2026-08/history.parquet",
+    ]
+
+    assert compaction_groups(names, date(2026, 10, 17)) == {
+        "history/month=2026-09/history.parquet": [
+            "history/date=2026-09-01/run-080000000000.parquet",
+            "history/date=2026-09-03/run-080000000000.parquet",
+        ]
+    }
+
+
+def test_history_table(report):
+    """Test run columns are added and AccountID is stored as text."""
+    table = history_table(report, run_time(9, 3))
+
+    data = table.to_pandas()
+    assert data["AccountID"].tolist() == ["111", "222", "333"]
+    assert data["SnapshotDate"].tolist() == [date(2026, 9, 3)] * 3
+    assert data["RunTime"].iloc[0] == pd.Timestamp(run_time(9, 3))
+
+
+def test_history_table_without_account_id(report):
+    """Test reports projected without AccountID can be stored."""
+    table = history_table(report.drop(columns="AccountID"), run_time(9, 3))
+
+    assert "AccountID" not in table.column_names
+    assert table.num_rows == 3
+
+
+def test_write_compacted_keeps_one_row_group_per_run(report):
+    """Test compaction merges runs with differing columns."""
+    tables = [
+        history_table(
+            report.assign(MatchedProducts="FileZilla"), run_time(9, 10)
+        ),
+        history_table(report, run_time(9, 3)),
+    ]
+    stream = BytesIO()
+
+    write_compacted(tables, stream)
+
+    stream.seek(0)
+    parquet_file = pq.ParquetFile(stream)
+    assert parquet_file.metadata.num_row_groups == 2
+    data = parquet_file.read().to_pandas()
+    assert data["SnapshotDate"].tolist() == (
+        [date(2026, 9, 3)] * 3 + [date(2026, 9, 10)] * 3
+    )
+    assert data["MatchedProducts"].isna().sum() == 3
+
+
+def test_write_compacted_merges_categorical_runs(report):
+    """Test runs read with categorical and plain columns merge as text."""
+    tables = [
+        history_table(report, run_time(9, 3)),
+        history_table(
+            report.astype({"VMName": "category"}).iloc[:1], run_time(9, 10)
+        ),
+    ]
+    stream = BytesIO()
+
+    write_compacted(tables, stream)
+
+    stream.seek(0)
+    data = pq.read_table(stream).to_pandas()
+    assert data["VMName"].tolist() == ["vm-a", "vm-b", "vm-c", "vm-a"]
+
+
+def test_write_compacted_replaces_runs_already_compacted(report):
+    """Test compacting the same runs again does not duplicate rows."""
+    first = history_table(report, run_time(9, 3))
+    second = history_table(report.iloc[:1], run_time(9, 10))
+    stream = BytesIO()
+    write_compacted([first, second], stream)
+    stream.seek(0)
+    existing = pq.read_table(stream)
+
+    again = BytesIO()
+    write_compacted([second], again, existing)
+
+    again.seek(0)
+    assert pq.read_table(again).num_rows == 4
+
+
+def test_read_history_projects_columns_and_days(report):
+    """Test reads return the requested columns of the requested days."""
+    month = BytesIO()
+    write_compacted(
+        [
+            history_table(report, run_time(9, 3)),
+            history_table(report.iloc[:2], run_time(9, 10)),
+        ],
+        month,
+    )
+    month.seek(0)
+    day = to_file(history_table(report.iloc[:1], run_time(10, 1)))
+
+    data = read_history(
+        [day, month],
+        columns=["SQLServerMajorVersion", "Missing"],
+        start=date(2026, 9, 5),
+    )
+
+    assert data.columns.tolist() == [
+        "SQLServerMajorVersion",
+        "Missing",
+        "SnapshotDate",
+        "RunTime",
+    ]
+    assert data["SnapshotDate"].tolist() == [
+        date(2026, 9, 10),
+        date(2026, 9, 10),
+        date(2026, 10, 1),
+    ]
+    assert data["Missing"].isna().all()
+    weekly = data.groupby("SnapshotDate")["SQLServerMajorVersion"].apply(
+        lambda versions: (versions == "2012").sum()
+    )
+    assert weekly.tolist() == [1, 1]
+
+
+def test_read_history_without_partitions():
+    """Test an empty history reads as an empty frame."""
+    data = read_history([], columns=["VMName"])
+
+    assert data.empty
+    assert data.columns.tolist() == ["VMName", "SnapshotDate", "RunTime"]
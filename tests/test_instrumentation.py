@@ -0,0 +1,122 @@
+"""
+Unit tests for per-stage instrumentation.
+"""
+
+import logging
+
+import pytest
+
+from filter_sql_servers import instrumentation
+from filter_sql_servers.instrumentation import StageMetrics, peak_rss_bytes
+
+# Memory a stage allocates to stand out from the test process's own
+ALLOCATION_BYTES = 64 * 1024 * 1024
+
+resettable = pytest.mark.skipif(
+    not instrumentation._reset_high_water_mark(),
+    reason="the memory high-water mark cannot be reset here",
+)
+
+
+def allocate():
+    """Touch ALLOCATION_BYTES of memory and release it."""
+    data = b"x" * ALLOCATION_BYTES
+    del data
+
+
+class TestStageMetrics:
+    """Test cases for StageMetrics."""
+
+    def test_stage_records_measurements(self, caplog):
+        """Test a stage records time, memory and the filled-in values."""
+        metrics = StageMetrics()
+
+        with caplog.at_level(logging.INFO):
+            with metrics.stage("parse", rows_in=10, blob="a.csv") as stage:
+                stage["rows_out"] = 4
+                stage["bytes"] = 123
+
+        [record] = metrics.stages
+        assert record["stage"] == "parse"
+        assert record["rows_in"] == 10
+        assert record["rows_out"] == 4
+        assert record["bytes"] == 123
+        assert record["blob"] == "a.csv"
+        assert record["seconds"] >= 0
+        assert record["peak_rss_bytes"] > 0
+
+        [log] = [r for r in caplog.records if r.msg.startswith("Stage parse")]
+        assert log.custom_dimensions is record
+
+    def test_failed_stage_is_still_recorded(self):
+        """Test a stage that raises is kept for diagnosis."""
+        metrics = StageMetrics()
+
+        with pytest.raises(RuntimeError):
+            with metrics.stage("download"):
+                raise RuntimeError("boom")
+
+        assert [record["stage"] for record in metrics.stages] == ["download"]
+
+    def test_summary(self):
+        """Test the summary lists the stages in the order they finished."""
+        metrics = StageMetrics()
+        with metrics.stage("download"):
+            pass
+        with metrics.stage("parse"):
+            pass
+
+        summary = metrics.summary()
+
+        assert [s["stage"] for s in summary["stages"]] == [
+            "download",
+            "parse",
+        ]
+        assert summary["total_seconds"] >= sum(
+            s["seconds"] for s in summary["stages"]
+        )
+        assert summary["peak_rss_bytes"] == peak_rss_bytes()
+
+    @resettable
+    def test_stage_peak_covers_only_its_span(self):
+        """Test a stage's peak memory excludes earlier stages'."""
+        metrics = StageMetrics()
+
+        with metrics.stage("render"):
+            allocate()
+        with metrics.stage("upload"):
+            pass
+
+        render, upload = metrics.stages
+        assert render["peak_rss_bytes"] - upload["peak_rss_bytes"] > (
+            ALLOCATION_BYTES / 2
+        )
+        assert metrics.summary()["peak_rss_bytes"] >= render["peak_rss_bytes"]
+
+    @resettable
+    def test_nested_stage_keeps_outer_peak(self):
+        """Test a stage started inside another does not hide its peak."""
+        metrics = StageMetrics()
+
+        with metrics.stage("export"):
+            allocate()
+            with metrics.stage("upload"):
+                pass
+
+        upload, export = metrics.stages
+        assert export["peak_rss_bytes"] - upload["peak_rss_bytes"] > (
+            ALLOCATION_BYTES / 2
+        )
+
+    def test_process_peak_without_reset(self, monkeypatch, tmp_path):
+        """Test the process's peak stands in where it cannot be reset."""
+        monkeypatch.setattr(
+            instrumentation, "CLEAR_REFS_PATH", str(tmp_path / "missing" / "x")
+        )
+        metrics = StageMetrics()
+
+        with metrics.stage("parse"):
+            pass
+
+        [record] = metrics.stages
+        assert record["peak_rss_bytes"] == peak_rss_bytes()
@@ -0,0 +1,183 @@
+"""
+Unit tests for the Parquet inventory cache.
+"""
+
+import pathlib
+from io import BytesIO, SEEK_CUR, SEEK_END
+from unittest.mock import MagicMock
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from filter_sql_servers import inventory_cache
+from filter_sql_servers.inventory_cache import (
+    BlobRangeReader,
+    build_cache_table,
+    cache_blob_name,
+    distinct_software_lists,
+    parse_software_list,
+    parse_software_lists,
+    read_cache,
+    write_cache,
+)
+
+
+MOCK_CSV_PATH = pathlib.Path(__file__).parent / "data" / "vm_inventory.csv"
+
+
+@pytest.fixture
+def inventory():
+    """The mock inventory as parsed from CSV."""
+    return pd.read_csv(MOCK_CSV_PATH)
+
+
+def cache_bytes(data):
+    """Serialise an inventory to Parquet cache bytes."""
+    buffer = BytesIO()
+    write_cache(build_cache_table(data), buffer)
+    return buffer.getvalue()
+
+
+class TestParseSoftwareLists:
+    """Test cases for parsing stringified software lists."""
+
+    @pytest.mark.parametrize(
+        "value,expected",
+        [
+            ("['A', 'B']", ["A", "B"]),
+            ('["A"]', ["A"]),
+            ("[]", []),
+            ("not a list", None),
+            ("'just a string'", None),
+            (np.nan, None),
+            (None, None),
+        ],
+    )
+    def test_parse_software_list(self, value, expected):
+        """Test single values parse to lists or None."""
+        assert parse_software_list(value) == expected
+
+    def test_parse_software_lists_maps_back_duplicates(self):
+        """Test every row gets the parsed list of its value."""
+        series = pd.Series(["['A']", None, "['A']", "[]"], index=[3, 1, 2, 0])
+
+        result = parse_software_lists(series)
+
+        assert result.tolist() == [["A"], None, ["A"], []]
+        assert result.index.tolist() == [3, 1, 2, 0]
+
+    def test_distinct_software_lists_from_cached_lists(self):
+        """Test cached lists are taken per distinct value, not parsed."""
+        series = pd.Series(["['A']", None, "['B', 'C']", "['A']", "x"])
+        lists = pd.Series(
+            [
+                np.array(["A"]),
+                None,
+                np.array(["B", "C"]),
+                np.array(["A"]),
+                None,
+            ]
+        )
+
+        codes, uniques, parsed = distinct_software_lists(series, lists)
+
+        assert codes.tolist() == [0, -1, 1, 0, 2]
+        assert list(uniques) == ["['A']", "['B', 'C']", "x"]
+        assert parsed == [["A"], ["B", "C"], None]
+        assert distinct_software_lists(series)[2] == parsed
+
+
+class TestReadCache:
+    """Test cases for building and reading the cache."""
+
+    def test_round_trip_returns_inventory_columns(self, inventory):
+        """Test a default read returns the CSV's columns and values."""
+        result = read_cache(BytesIO(cache_bytes(inventory)))
+
+        pd.testing.assert_frame_equal(result, inventory)
+
+    def test_derived_list_columns(self, inventory):
+        """Test software lists are stored as real list columns."""
+        result = read_cache(
+            BytesIO(cache_bytes(inventory)),
+            columns=["VMName", "RawSoftware"],
+            lists=["SQLSoftware", "RawSoftware"],
+        )
+
+        # Only the lists of the columns read are returned
+        assert list(result.columns) == [
+            "VMName",
+            "RawSoftware",
+            "RawSoftwareList",
+        ]
+        first_raw = list(result["RawSoftwareList"].iloc[0])
+        assert first_raw[0] == "FileZilla 3.64.0"
+
+    def test_sql_server_only_skips_row_groups(self, inventory, monkeypatch):
+        """Test row groups without SQL Server are not read."""
+        monkeypatch.setattr(inventory_cache, "ROW_GROUP_SIZE", 10)
+        ordered = inventory.sort_values(
+            "SQLSoftware", key=lambda s: s != "[]", kind="stable"
+        ).reset_index(drop=True)
+        content = cache_bytes(ordered)
+        expected = ordered[ordered["SQLSoftware"] != "[]"].reset_index(
+            drop=True
+        )
+
+        reads = []
+        blob_client = MagicMock()
+
+        def download(offset, length):
+            reads.append(length)
+            return MagicMock(
+                readall=lambda: content[offset : offset + length]
+            )
+
+        blob_client.download_blob.side_effect = download
+
+        all_rows = read_cache(BlobRangeReader(blob_client, len(content)))
+        full_bytes = sum(reads)
+        reads.clear()
+        result = read_cache(
+            BlobRangeReader(blob_client, len(content)), sql_server_only=True
+        )
+
+        pd.testing.assert_frame_equal(result, expected)
+        assert len(all_rows) == len(ordered)
+        assert sum(reads) < full_bytes
+
+    def test_cache_blob_name(self):
+        """Test cache blobs live under the cache prefix."""
+        assert cache_blob_name("vm_inventory.csv") == (
+            "cache/vm_inventory.csv.parquet"
+        )
+
+
+class TestBlobRangeReader:
+    """Test cases for the ranged blob reader."""
+
+    def test_seek_and_read(self):
+        """Test reads are served with ranged downloads."""
+        content = b"0123456789"
+        blob_client = MagicMock()
+        blob_client.download_blob.side_effect = lambda offset, length: (
+            MagicMock(readall=lambda: content[offset : offset + length])
+        )
+        reader = BlobRangeReader(blob_client, len(content))
+
+        assert reader.readable() and reader.seekable()
+        assert reader.seek(-3, SEEK_END) == 7
+        assert reader.read(10) == b"789"
+        assert reader.read(1) == b""
+        assert reader.seek(2) == 2
+        assert reader.seek(1, SEEK_CUR) == 3
+        assert reader.tell() == 3
+        assert reader.read(2) == b"34"
+
+    def test_invalid_whence(self):
+        """Test an unknown whence is rejected."""
+        reader = BlobRangeReader(MagicMock(), 10)
+
+        with pytest.raises(ValueError):
+            reader.seek(0, 5)
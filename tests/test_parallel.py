@@ -0,0 +1,253 @@
+"""
+Unit tests for parallel parsing of one inventory CSV.
+"""
+
+import pathlib
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from unittest.mock import MagicMock
+
+import pandas as pd
+import pytest
+from azure.core import MatchConditions
+
+import filter_sql_servers
+from filter_sql_servers import parallel
+from filter_sql_servers.detection import sql_server_mask
+from filter_sql_servers.parallel import (
+    download_range,
+    find_record_start,
+    parse_blob_range,
+    parse_range,
+    parse_sql_vms,
+    plan_ranges,
+    read_header,
+)
+from filter_sql_servers.schema import concat, csv_options, prune_categories
+
+MOCK_CSV_PATH = pathlib.Path(__file__).parent / "data" / "vm_inventory.csv"
+
+# Quoted fields with embedded commas, newlines and escaped quotes
+QUOTED_CSV = (
+    b"AccountID,VMName,PlatformDetails,SQLSoftware,RawSoftware\n"
+    b"1,vm-a,Windows,\"['Microsoft SQL Server 2019']\",\"['A', 'B']\"\n"
+    b"2,vm-b,Windows,\"['Microsoft SQL Server 2022']\",\"['A,\n"
+    b'B\', \'say ""hi""\n\']"\n'
+    b"3,vm-c,Linux/UNIX,[],\"['C']\"\r\n"
+    b'4,vm-d,Windows,"[\'Microsoft SQL Server 2016\']","[\'D\', ""\n'
+    b'E""\']"'
+)
+
+
+def parse(data):
+    """Parse CSV bytes with the inventory schema."""
+    return pd.read_csv(BytesIO(data), **csv_options())
+
+
+def read_bytes(data, offset, length):
+    """Read part of an in-memory blob, the way download_range does."""
+    return data[offset : offset + length]
+
+
+def parse_ranges(data, ranges):
+    """Parse the nominal ranges of a CSV in this process."""
+    header = read_header(read_bytes, data, len(data))
+    return [
+        parse_blob_range(read_bytes, data, header, start, stop, len(data))
+        for start, stop in ranges
+    ]
+
+
+# Offsets where the records of QUOTED_CSV start, and its end
+RECORD_STARTS = [
+    QUOTED_CSV.index(record)
+    for record in (b"1,vm-a", b"2,vm-b", b"3,vm-c", b"4,vm-d")
+] + [len(QUOTED_CSV)]
+
+
+@pytest.mark.parametrize("window", [1, 4, 64 * 1024])
+def test_record_start_from_any_offset(window, monkeypatch):
+    """Test the next record is found from anywhere, even inside quotes."""
+    monkeypatch.setattr(parallel, "BOUNDARY_WINDOW_BYTES", window)
+
+    for offset in range(RECORD_STARTS[0], len(QUOTED_CSV)):
+        assert find_record_start(
+            lambda offset, length: QUOTED_CSV[offset : offset + length],
+            offset,
+            len(QUOTED_CSV),
+            5,
+        ) == min(start for start in RECORD_STARTS if start > offset)
+
+
+@pytest.mark.parametrize(
+    "cut",
+    # The header end, inside a quoted newline, on a record start and in the
+    # last record
+    [
+        RECORD_STARTS[0],
+        QUOTED_CSV.index(b"A,\nB") + 2,
+        RECORD_STARTS[2],
+        len(QUOTED_CSV) - 2,
+    ],
+)
+def test_ranges_parse_each_record_once(cut, monkeypatch):
+    """Test the records of neighbouring ranges merge into the whole CSV."""
+    # Boundaries past the first read are read on demand
+    monkeypatch.setattr(parallel, "BOUNDARY_WINDOW_BYTES", 1)
+    expected = parse(QUOTED_CSV)
+
+    results = parse_ranges(
+        QUOTED_CSV, [(RECORD_STARTS[0], cut), (cut, len(QUOTED_CSV))]
+    )
+
+    assert sum(rows for rows, _ in results) == len(expected)
+    pd.testing.assert_frame_equal(
+        concat([part for _, part in results], ignore_index=True),
+        prune_categories(
+            expected[sql_server_mask(expected["SQLSoftware"])]
+        ).reset_index(drop=True),
+    )
+
+
+def test_boundary_search_reads_past_long_records(monkeypatch):
+    """Test the window grows until the quote parity is decided."""
+    monkeypatch.setattr(parallel, "BOUNDARY_WINDOW_BYTES", 2)
+    reads = []
+
+    def read(offset, length):
+        reads.append(length)
+        return QUOTED_CSV[offset : offset + length]
+
+    header_bytes = QUOTED_CSV.index(b"\n") + 1
+    second = QUOTED_CSV.index(b"2,vm-b")
+    # From inside the first record the second one is found, even with a
+    # newline inside its quoted RawSoftware value
+    assert (
+        find_record_start(read, header_bytes + 3, len(QUOTED_CSV), 5) == second
+    )
+    assert reads[:3] == [2, 4, 8]
+
+
+def test_ambiguous_parity_is_decided_by_reading_on(monkeypatch):
+    """Test the window grows while both parities fit its records."""
+    monkeypatch.setattr(parallel, "BOUNDARY_WINDOW_BYTES", 7)
+    data = b'\na\n"\na\nb\n'
+    reads = []
+
+    def read(offset, length):
+        reads.append(length)
+        return data[offset : offset + length]
+
+    # Both "a" records fit the first window; only the quoted parity fits
+    # the whole blob
+    assert find_record_start(read, 0, len(data), 1) == 5
+    assert reads == [7, 9]
+
+
+def test_inconsistent_records_are_rejected(monkeypatch):
+    """Test records that do not match the header are refused."""
+    monkeypatch.setattr(parallel, "BOUNDARY_WINDOW_BYTES", 4)
+    monkeypatch.setattr(parallel, "MAX_RECORD_BYTES", 8)
+    data = b'A,B\n1,2\n"3"x\n4\n5\n6\n7,8\n'
+
+    with pytest.raises(ValueError):
+        find_record_start(
+            lambda offset, length: data[offset : offset + length],
+            5,
+            len(data),
+            2,
+        )
+
+
+@pytest.mark.parametrize(
+    "size, parts, expected",
+    [
+        (100, 4, [(10, 10 + 23), (33, 56), (56, 79), (79, 100)]),
+        # Small inputs are not split
+        (100, 4, [(10, 100)]),
+        # A header-only blob still has one, empty range
+        (10, 4, [(10, 10)]),
+    ],
+)
+def test_plan_ranges(size, parts, expected):
+    """Test ranges cover the records in at most ``parts`` pieces."""
+    min_range_bytes = 1 if len(expected) > 1 else None
+
+    assert plan_ranges(10, size, parts, min_range_bytes) == expected
+
+
+def test_read_header_spans_windows(monkeypatch):
+    """Test a header longer than the first read is read whole."""
+    monkeypatch.setattr(parallel, "BOUNDARY_WINDOW_BYTES", 4)
+
+    assert read_header(read_bytes, QUOTED_CSV, len(QUOTED_CSV)) == (
+        QUOTED_CSV[: QUOTED_CSV.index(b"\n") + 1]
+    )
+    assert read_header(read_bytes, b"A,B", 3) == b"A,B"
+
+
+def test_parse_range_filters_sql_servers():
+    """Test a range is parsed with the schema and filtered."""
+    header = read_header(read_bytes, QUOTED_CSV, len(QUOTED_CSV))
+
+    rows, sql_vms = parse_range(
+        header, QUOTED_CSV[len(header) :], ["VMName", "SQLSoftware"]
+    )
+
+    assert rows == 4
+    assert sql_vms["VMName"].tolist() == ["vm-a", "vm-b", "vm-d"]
+    assert list(sql_vms.columns) == ["VMName", "SQLSoftware"]
+
+
+def test_parse_sql_vms_matches_single_process_parse(monkeypatch):
+    """Test ranges read and parsed in processes merge back in file order."""
+    monkeypatch.setattr(parallel, "MIN_RANGE_BYTES", 1)
+    data = MOCK_CSV_PATH.read_bytes()
+    inventory = parse(data)
+
+    total, sql_vms, ranges = parse_sql_vms(read_bytes, data, len(data), 3)
+
+    assert total == len(inventory)
+    assert ranges == 3
+    pd.testing.assert_frame_equal(
+        sql_vms,
+        prune_categories(inventory[sql_server_mask(inventory["SQLSoftware"])]),
+    )
+
+
+def test_download_range_reads_one_version(monkeypatch):
+    """Test ranges are read from the pooled client of the blob's ETag."""
+    blob_service = MagicMock()
+    blob_client = blob_service.get_blob_client.return_value
+    blob_client.download_blob.return_value.readall.return_value = b"abc"
+    monkeypatch.setattr(
+        filter_sql_servers,
+        "get_blob_service_client",
+        MagicMock(return_value=blob_service),
+    )
+    monkeypatch.setattr(filter_sql_servers, "get_credential", MagicMock())
+    source = ("https://pre", "container", "inventory.csv", "id", '"0x1"')
+
+    assert download_range(source, 5, 3) == b"abc"
+    assert download_range(source, 5, 0) == b""
+    blob_service.get_blob_client.assert_called_once_with(
+        container="container", blob="inventory.csv"
+    )
+    blob_client.download_blob.assert_called_once_with(
+        offset=5,
+        length=3,
+        etag='"0x1"',
+        match_condition=MatchConditions.IfNotModified,
+    )
+
+
+def test_broken_pool_is_discarded(monkeypatch):
+    """Test a pool whose worker died is replaced on the next run."""
+    pool = MagicMock()
+    pool.map.side_effect = BrokenProcessPool("worker died")
+    monkeypatch.setitem(parallel._process_pools, 2, pool)
+
+    with pytest.raises(BrokenProcessPool):
+        parse_sql_vms(read_bytes, QUOTED_CSV, len(QUOTED_CSV), 2)
+
+    assert 2 not in parallel._process_pools
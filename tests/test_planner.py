@@ -0,0 +1,123 @@
+"""
+Unit tests for the inventory load planner.
+"""
+
+import pytest
+
+from filter_sql_servers import planner
+from filter_sql_servers.planner import (
+    CACHE,
+    MEMORY,
+    PARALLEL,
+    STREAM,
+    available_cpus,
+    available_memory_bytes,
+    input_compression,
+    plan_load,
+)
+
+MIB = 1024 * 1024
+GIB = 1024 * MIB
+
+
+@pytest.mark.parametrize(
+    "size, options, strategy",
+    [
+        # Small inventories stay in memory, even with CPUs to spare
+        (MIB, {"cpus": 8}, MEMORY),
+        # Large inventories stay in memory unless processes are configured
+        (100 * MIB, {"cpus": 4}, MEMORY),
+        # ...and are then split across the CPUs while they fit
+        (100 * MIB, {"cpus": 4, "processes": 4}, PARALLEL),
+        # ...but not on a single CPU
+        (100 * MIB, {"cpus": 1, "processes": 4}, MEMORY),
+        # Medium inventories are not worth starting processes for
+        (32 * MIB, {"cpus": 4, "processes": 4}, MEMORY),
+        # The workers' copies must fit too
+        (
+            800 * MIB,
+            {"memory_bytes": 4 * GIB, "cpus": 4, "processes": 4},
+            MEMORY,
+        ),
+        # Inventories that would not fit are streamed
+        (2 * GIB, {"cpus": 4}, STREAM),
+        (200 * MIB, {"memory_bytes": 512 * MIB, "cpus": 4}, STREAM),
+        # Compressed inventories can only be streamed
+        (MIB, {"compression": "gzip"}, STREAM),
+        # A fresh cache is read whatever the size
+        (2 * GIB, {"parquet_cache": True, "cache_fresh": True}, CACHE),
+        (MIB, {"parquet_cache": True}, CACHE),
+        # A stale cache is only rebuilt when the CSV fits in memory
+        (2 * GIB, {"parquet_cache": True}, STREAM),
+    ],
+)
+def test_plan_load_strategies(size, options, strategy):
+    """Test the strategy chosen for each kind of input and worker."""
+    plan = plan_load(size, **{"memory_bytes": 4 * GIB, **options})
+
+    assert plan["strategy"] == strategy
+    assert plan["bytes"] == size
+    assert plan["reason"]
+
+
+def test_plan_load_defaults():
+    """Test unknown memory is assumed and processes are capped by CPUs."""
+    plan = plan_load(100 * MIB, cpus=4, processes=8)
+
+    assert plan["memory_bytes"] == planner.ASSUMED_MEMORY_BYTES
+    assert plan["strategy"] == PARALLEL
+    assert plan["processes"] == 4
+    assert plan_load(100 * MIB, cpus=4, processes=2)["processes"] == 2
+    assert plan_load(100 * MIB, cpus=4)["processes"] is None
+
+
+def test_input_compression():
+    """Test gzip is recognized from the encoding or the name."""
+    assert input_compression("vm_inventory.csv") is None
+    assert input_compression("vm_inventory.csv.gz") == "gzip"
+    assert input_compression("vm_inventory.csv", "GZIP") == "gzip"
+
+
+def test_available_memory_takes_the_tightest_limit(tmp_path, monkeypatch):
+    """Test the host's and the cgroup's available memory are compared."""
+    meminfo = tmp_path / "meminfo"
+    meminfo.write_text("MemTotal: 8000000 kB\nMemAvailable: 4000000 kB\n")
+    monkeypatch.setattr(planner, "MEMINFO_PATH", str(meminfo))
+    monkeypatch.setattr(planner, "CGROUP_ROOT", str(tmp_path))
+
+    assert available_memory_bytes() == 4000000 * 1024
+
+    (tmp_path / "memory.max").write_text("1073741824\n")
+    (tmp_path / "memory.current").write_text("73741824\n")
+    assert available_memory_bytes() == 1000000000
+
+    # An unlimited cgroup does not count
+    (tmp_path / "memory.max").write_text("max\n")
+    assert available_memory_bytes() == 4000000 * 1024
+
+
+def test_available_memory_unknown(tmp_path, monkeypatch):
+    """Test None is returned when no limit can be read."""
+    monkeypatch.setattr(planner, "MEMINFO_PATH", str(tmp_path / "missing"))
+    monkeypatch.setattr(planner, "CGROUP_ROOT", str(tmp_path))
+
+    assert available_memory_bytes() is None
+
+
+def test_available_cpus_respects_quota(tmp_path, monkeypatch):
+    """Test a cgroup CPU quota caps the schedulable CPUs."""
+    monkeypatch.setattr(planner, "CGROUP_ROOT", str(tmp_path))
+    monkeypatch.setattr(
+        planner.os, "sched_getaffinity", lambda pid: {0, 1, 2, 3}
+    )
+
+    assert available_cpus() == 4
+
+    (tmp_path / "cpu.max").write_text("200000 100000\n")
+    assert available_cpus() == 2
+
+    (tmp_path / "cpu.max").write_text("50000 100000\n")
+    assert available_cpus() == 1
+
+    (tmp_path / "cpu.max").write_text("max 100000\n")
+    assert available_cpus() == 4
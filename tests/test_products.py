@@ -0,0 +1,122 @@
+"""
+Unit tests for multi-product matching.
+"""
+
+import pathlib
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from filter_sql_servers.inventory_cache import parse_software_lists
+from filter_sql_servers.products import ProductMatcher, load_product_patterns
+
+MOCK_CSV_PATH = pathlib.Path(__file__).parent / "data" / "vm_inventory.csv"
+
+PRODUCTS = {
+    "FileZilla": ["FileZilla"],
+    "SQL Server ODBC": ["ODBC Driver 17 for SQL Server", "ODBC Driver 18"],
+    "SQL Server Native Client": ["Native Client"],
+}
+
+
+class TestLoadProductPatterns:
+    """Test cases for load_product_patterns."""
+
+    def test_single_patterns_become_lists(self):
+        """Test a product may be given a single pattern."""
+        patterns = load_product_patterns(
+            '{"FileZilla": "FileZilla", "Git": ["Git ", "GitHub"]}'
+        )
+
+        assert patterns == {
+            "FileZilla": ["FileZilla"],
+            "Git": ["Git ", "GitHub"],
+        }
+
+    @pytest.mark.parametrize(
+        "value",
+        ['["FileZilla"]', '{"FileZilla": []}', '{"FileZilla": [""]}', "{"],
+    )
+    def test_invalid_patterns(self, value):
+        """Test malformed configuration is rejected."""
+        with pytest.raises(ValueError):
+            load_product_patterns(value)
+
+
+class TestProductMatcher:
+    """Test cases for ProductMatcher."""
+
+    def test_match_is_case_insensitive_and_ordered(self):
+        """Test products are reported once each, in configured order."""
+        matcher = ProductMatcher(PRODUCTS)
+
+        matched = matcher.match(
+            "['SQL Server 2012 native client', 'filezilla 3.64.0', "
+            "'Microsoft ODBC Driver 17 for SQL Server', 'ODBC Driver 18']"
+        )
+
+        assert matched == (
+            "FileZilla",
+            "SQL Server ODBC",
+            "SQL Server Native Client",
+        )
+
+    def test_products_may_share_patterns(self):
+        """Test a pattern configured for two products matches both."""
+        matcher = ProductMatcher({"A": ["Agent"], "B": ["agent", "Tool"]})
+
+        assert matcher.match("['Trellix Agent']") == ("A", "B")
+        assert matcher.match("['Tool']") == ("B",)
+
+    def test_no_patterns_or_values(self):
+        """Test empty configuration and missing values match nothing."""
+        assert ProductMatcher({}).match("['FileZilla']") == ()
+        assert ProductMatcher(PRODUCTS).match(float("nan")) == ()
+        assert ProductMatcher(PRODUCTS).match(None) == ()
+
+    def test_match_series_matches_per_row_reference(self):
+        """Test the column scan agrees with matching row by row."""
+        raw_software = pd.read_csv(MOCK_CSV_PATH)["RawSoftware"]
+        raw_software.iloc[3] = None
+        matcher = ProductMatcher(PRODUCTS)
+
+        result = matcher.match_series(raw_software)
+
+        expected = raw_software.map(matcher.match, na_action="ignore")
+        expected = expected.fillna("").map(tuple)
+        assert result.tolist() == expected.tolist()
+        assert result.index.equals(raw_software.index)
+        assert result.name == "MatchedProducts"
+
+    def test_match_series_scans_each_distinct_value_once(self):
+        """Test repeated software lists are only scanned once."""
+        raw_software = pd.Series(["['FileZilla']", "['Git']"] * 500)
+        matcher = ProductMatcher(PRODUCTS)
+
+        with patch.object(
+            ProductMatcher, "match", wraps=matcher.match
+        ) as match:
+            result = matcher.match_series(raw_software)
+
+        assert match.call_count == 2
+        assert result.iloc[0] == ("FileZilla",)
+        assert result.iloc[1] == ()
+
+    def test_match_series_matches_cached_lists_per_name(self):
+        """Test cached lists match like the strings, name by name."""
+        raw_software = pd.read_csv(MOCK_CSV_PATH)["RawSoftware"]
+        raw_software.iloc[3] = None
+        raw_software.iloc[4] = "FileZilla, not a list"
+        lists = parse_software_lists(raw_software)
+        matcher = ProductMatcher(PRODUCTS)
+
+        with patch.object(
+            ProductMatcher, "match", wraps=matcher.match
+        ) as match:
+            result = matcher.match_series(raw_software, lists)
+
+        assert result.tolist() == matcher.match_series(raw_software).tolist()
+        # One scan per distinct software name, plus the value not a list
+        names = {name for items in lists.dropna() for name in items}
+        assert match.call_count == len(names) + 1
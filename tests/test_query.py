@@ -0,0 +1,129 @@
+"""
+Unit tests for inventory queries.
+"""
+
+import json
+import pathlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from filter_sql_servers.query import (
+    QueryError,
+    query_mask,
+    read_query,
+    render_result,
+)
+from filter_sql_servers.software_index import SoftwareIndex
+
+MOCK_CSV_PATH = pathlib.Path(__file__).parent / "data" / "vm_inventory.csv"
+
+
+@pytest.fixture(scope="module")
+def inventory():
+    """Mock inventory and its software index."""
+    data = pd.read_csv(MOCK_CSV_PATH)
+    return data, SoftwareIndex.build(data["RawSoftware"])
+
+
+def test_requests_without_query_mode_are_reports():
+    """Test only mode=query selects a query."""
+    assert read_query({}) is None
+    assert read_query({"metrics": "json"}) is None
+    assert read_query({"mode": "report"}, b"not json") is None
+
+
+def test_defaults_and_body_precedence():
+    """Test filter defaults, and that the JSON body overrides params."""
+    query = read_query(
+        {"mode": "query", "format": "csv", "product": "Edge"},
+        json.dumps({"format": " JSON ", "account_id": [1, "2"]}),
+    )
+
+    assert query == {
+        "product": ["Edge"],
+        "account_id": ["1", "2"],
+        "platform": None,
+        "vm_name_prefix": None,
+        "format": "json",
+    }
+    assert read_query({}, b'{"mode": "Query"}')["format"] == "json"
+
+
+@pytest.mark.parametrize(
+    "params, body, message",
+    [
+        ({"mode": "query"}, b"[1]", "JSON object"),
+        ({"mode": "query"}, b"{oops", "JSON object"),
+        ({"mode": "query", "format": "xml"}, None, "format"),
+        ({}, b'{"mode": "query", "format": 1}', "format"),
+        ({}, b'{"mode": "query", "product": []}', "product"),
+        ({}, b'{"mode": "query", "product": 5}', "product"),
+        ({}, b'{"mode": "query", "account_id": true}', "account_id"),
+        ({}, b'{"mode": "query", "vm_name_prefix": 1}', "vm_name_prefix"),
+    ],
+)
+def test_invalid_queries(params, body, message):
+    """Test malformed queries are rejected."""
+    with pytest.raises(QueryError, match=message):
+        read_query(params, body)
+
+
+def test_query_mask_combines_filters(inventory):
+    """Test every filter narrows the selection."""
+    data, index = inventory
+    account_id = data["AccountID"].iloc[0]
+    query = read_query(
+        {},
+        json.dumps(
+            {
+                "mode": "query",
+                "product": ["filezilla", "ODBC Driver 18"],
+                "account_id": [int(account_id), "0"],
+                "platform": "WINDOWS",
+                "vm_name_prefix": "vm-prod",
+            }
+        ),
+    )
+
+    mask = query_mask(data, query, index)
+
+    expected = (
+        data["RawSoftware"].str.contains("FileZilla")
+        & data["RawSoftware"].str.contains("ODBC Driver 18")
+        & (data["AccountID"] == account_id)
+        & (data["PlatformDetails"] == "Windows")
+        & data["VMName"].str.startswith("vm-prod")
+    )
+    assert mask.tolist() == expected.tolist()
+    assert query_mask(data, read_query({"mode": "query"})).all()
+
+
+def test_exact_filters_handle_missing_and_float_values():
+    """Test float IDs match their integer spelling and NaN never matches."""
+    data = pd.DataFrame(
+        {"AccountID": [1.0, np.nan, 2.0], "PlatformDetails": [None] * 3}
+    )
+    query = read_query({"mode": "query", "account_id": "1"})
+
+    assert query_mask(data, query).tolist() == [True, False, False]
+    query = read_query({"mode": "query", "platform": "Linux"})
+    assert not query_mask(data, query).any()
+
+
+def test_render_result(inventory):
+    """Test JSON and CSV results."""
+    data = inventory[0].iloc[:3]
+
+    body, mimetype = render_result(data, "json")
+    document = json.loads(body)
+    assert mimetype == "application/json"
+    assert document["count"] == 3
+    assert document["vms"][0]["VMName"] == data["VMName"].iloc[0]
+    assert document["vms"][0]["AccountID"] == int(data["AccountID"].iloc[0])
+
+    body, mimetype = render_result(data, "csv")
+    assert mimetype == "text/csv"
+    assert body.splitlines()[0] == ",".join(data.columns)
+    assert len(body.splitlines()) == 4
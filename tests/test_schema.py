@@ -0,0 +1,102 @@
+"""
+Unit tests for the declared inventory schema.
+"""
+
+from io import StringIO
+
+import pandas as pd
+import pytest
+
+from filter_sql_servers.schema import (
+    concat,
+    csv_options,
+    parse_columns,
+    project,
+    prune_categories,
+)
+
+CSV = (
+    "AccountID,VMName,PlatformDetails,SQLSoftware,RawSoftware\n"
+    "012345678901,vm-a,Windows,['Microsoft SQL Server 2019'],['A']\n"
+    "222,vm-b,Linux/UNIX,,['A']\n"
+)
+
+
+def test_csv_options_declare_dtypes():
+    """Test AccountID is read as text and repetitive columns as categories."""
+    data = pd.read_csv(StringIO(CSV), **csv_options())
+
+    assert data["AccountID"].tolist() == ["012345678901", "222"]
+    assert data["PlatformDetails"].dtype == "category"
+    assert data["SQLSoftware"].dtype == "category"
+    assert data["RawSoftware"].cat.categories.tolist() == ["['A']"]
+    assert data["SQLSoftware"].isna().tolist() == [False, True]
+
+
+def test_csv_options_skip_unrequested_columns():
+    """Test only the requested columns are parsed, in file order."""
+    data = pd.read_csv(
+        StringIO(CSV), **csv_options(["SQLSoftware", "AccountID"])
+    )
+
+    assert list(data.columns) == ["AccountID", "SQLSoftware"]
+
+
+def test_concat_keeps_categoricals():
+    """Test parts with different categories concatenate as categoricals."""
+    data = pd.read_csv(StringIO(CSV), **csv_options())
+
+    merged = concat([data.iloc[:1], data.iloc[1:]], ignore_index=True)
+
+    pd.testing.assert_frame_equal(merged, data)
+
+
+def test_prune_categories_drops_unused_values():
+    """Test selected rows only keep the categories they use."""
+    data = pd.read_csv(StringIO(CSV), **csv_options())
+
+    pruned = prune_categories(data.iloc[1:])
+
+    assert pruned["PlatformDetails"].cat.categories.tolist() == ["Linux/UNIX"]
+    assert pruned["SQLSoftware"].cat.categories.tolist() == []
+    assert data["PlatformDetails"].cat.categories.size == 2
+    plain = pd.DataFrame({"VMName": ["vm-a"]})
+    assert prune_categories(plain) is plain
+
+
+def test_parse_columns():
+    """Test column lists are split and validated."""
+    assert parse_columns(" AccountID, VMName ,") == ("AccountID", "VMName")
+    assert parse_columns("") is None
+    with pytest.raises(ValueError, match="Unknown inventory columns Owner"):
+        parse_columns("VMName,Owner")
+
+
+def test_project_keeps_derived_columns():
+    """Test unlisted inventory columns are dropped, derived ones kept."""
+    data = pd.DataFrame(
+        columns=["AccountID", "VMName", "RawSoftware", "MatchedProducts"]
+    )
+
+    assert list(project(data, ("VMName",)).columns) == [
+        "VMName",
+        "MatchedProducts",
+    ]
+    assert project(data, None) is data
+
+
+def test_project_drops_software_lists():
+    """Test list columns read from the cache never reach a report."""
+    data = pd.DataFrame(
+        columns=["VMName", "RawSoftware", "RawSoftwareList", "SQLServerStatus"]
+    )
+
+    assert list(project(data, ("VMName",)).columns) == [
+        "VMName",
+        "SQLServerStatus",
+    ]
+    assert list(project(data, None).columns) == [
+        "VMName",
+        "RawSoftware",
+        "SQLServerStatus",
+    ]
@@ -0,0 +1,130 @@
+"""
+Unit tests for the inverted software index.
+"""
+
+import ast
+import pathlib
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from filter_sql_servers.inventory_cache import parse_software_lists
+from filter_sql_servers.software_index import SoftwareIndex, index_blob_name
+
+MOCK_CSV_PATH = pathlib.Path(__file__).parent / "data" / "vm_inventory.csv"
+
+
+@pytest.fixture(scope="module")
+def raw_software():
+    """RawSoftware of the mock inventory, with a missing value."""
+    values = pd.read_csv(MOCK_CSV_PATH)["RawSoftware"]
+    values.iloc[5] = None
+    return values
+
+
+def reference_rows(raw_software, term):
+    """Scan every value for software names containing ``term``."""
+    term = term.casefold()
+    return np.flatnonzero(
+        [
+            isinstance(value, str)
+            and any(
+                term in name.casefold() for name in ast.literal_eval(value)
+            )
+            for value in raw_software
+        ]
+    )
+
+
+def test_index_blob_name():
+    """Test the index is stored under the cache prefix."""
+    assert (
+        index_blob_name("vm_inventory.csv")
+        == "cache/vm_inventory.csv.software-index.npz"
+    )
+
+
+@pytest.mark.parametrize(
+    "term", ["FileZilla", "odbc driver 18", "Native Client", "missing"]
+)
+def test_rows_matching_agrees_with_scan(raw_software, term):
+    """Test substring lookups return the rows a full scan finds."""
+    index = SoftwareIndex.build(raw_software)
+
+    assert (
+        index.rows_matching(term).tolist()
+        == reference_rows(raw_software, term).tolist()
+    )
+
+
+def test_rows_of_exact_name(raw_software):
+    """Test exact lookups return the posting list of one name."""
+    index = SoftwareIndex.build(raw_software)
+
+    rows = index.rows_of("Microsoft ODBC Driver 17 for SQL Server")
+
+    assert len(rows) > 0
+    assert np.all(np.diff(rows) > 0)
+    assert len(index.rows_of("Not installed anywhere")) == 0
+
+
+def test_lookup_combines_terms(raw_software):
+    """Test AND and OR combinations of terms."""
+    index = SoftwareIndex.build(raw_software)
+    filezilla = set(reference_rows(raw_software, "FileZilla"))
+    odbc_17 = set(reference_rows(raw_software, "ODBC Driver 17"))
+    odbc_18 = set(reference_rows(raw_software, "ODBC Driver 18"))
+
+    assert set(index.lookup(all_of=["FileZilla", "ODBC Driver 17"])) == (
+        filezilla & odbc_17
+    )
+    assert set(index.lookup(any_of=["ODBC Driver 17", "ODBC Driver 18"])) == (
+        odbc_17 | odbc_18
+    )
+    assert set(
+        index.lookup(
+            all_of=["FileZilla"], any_of=["ODBC Driver 17", "ODBC Driver 18"]
+        )
+    ) == filezilla & (odbc_17 | odbc_18)
+    assert index.lookup().tolist() == list(range(len(raw_software)))
+
+
+def test_save_and_load_round_trip(raw_software):
+    """Test a stored index answers like the one it was saved from."""
+    index = SoftwareIndex.build(raw_software)
+    stream = BytesIO()
+
+    index.save(stream)
+    stream.seek(0)
+    loaded = SoftwareIndex.load(stream)
+
+    assert loaded.row_count == index.row_count
+    assert loaded.names.tolist() == index.names.tolist()
+    assert (
+        loaded.lookup(all_of=["FileZilla"]).tolist()
+        == index.lookup(all_of=["FileZilla"]).tolist()
+    )
+
+
+def test_empty_inventory():
+    """Test an inventory without software yields an empty index."""
+    index = SoftwareIndex.build(pd.Series([None, "[]"], dtype=object))
+
+    assert len(index.names) == 0
+    assert index.lookup(all_of=["FileZilla"]).tolist() == []
+    assert index.lookup().tolist() == [0, 1]
+
+
+def test_build_from_cached_lists(raw_software):
+    """Test an index built from RawSoftwareList matches a parsed one."""
+    index = SoftwareIndex.build(raw_software)
+
+    cached = SoftwareIndex.build(
+        raw_software, parse_software_lists(raw_software)
+    )
+
+    assert cached.names.tolist() == index.names.tolist()
+    assert cached.indptr.tolist() == index.indptr.tolist()
+    assert cached.indices.tolist() == index.indices.tolist()
@@ -0,0 +1,99 @@
+"""
+Unit tests for the report summary sheets.
+"""
+
+import numpy as np
+import pandas as pd
+
+from filter_sql_servers.summary import (
+    HOSTS_COLUMN,
+    UNKNOWN_LABEL,
+    sql_releases,
+    summarize,
+)
+from filter_sql_servers.versions import VERSION_COLUMN
+
+
+def report():
+    """Filtered report with categorical columns, as the loaders read it."""
+    return pd.DataFrame(
+        {
+            "AccountID": ["111", "222", "111", "111"],
+            "VMName": ["vm1", "vm2", "vm3", "vm4"],
+            "PlatformDetails": pd.Categorical(
+                ["Windows", "Linux/UNIX", "Windows", np.nan],
+                categories=["Linux/UNIX", "Windows", "Unused"],
+            ),
+            "SQLSoftware": pd.Categorical(
+                [
+                    "['Microsoft SQL Server 2019']",
+                    "['Microsoft SQL Server 2017 (64-bit)']",
+                    "['Microsoft SQL Server 2016', 'Microsoft SQL Server 2019']",
+                    "['Microsoft SQL Server Management Studio']",
+                ]
+            ),
+        }
+    )
+
+
+def test_sql_releases_take_latest_release():
+    """Test each value maps to its latest release, None if unrecognized."""
+    software = pd.Series(
+        [
+            "['Microsoft SQL Server 2016', 'Microsoft SQL Server 2019']",
+            "['Microsoft SQL Server Management Studio']",
+            np.nan,
+        ],
+        index=[5, 6, 7],
+    )
+
+    releases = sql_releases(software)
+
+    assert releases.tolist() == ["2019", None, None]
+    assert releases.index.tolist() == [5, 6, 7]
+
+
+def test_summarize_counts_hosts_per_key():
+    """Test each summary counts hosts, largest first, missing as Unknown."""
+    summaries = dict(summarize(report()))
+
+    assert list(summaries) == ["By Account", "By Platform", "By SQL Version"]
+    pd.testing.assert_frame_equal(
+        summaries["By Account"],
+        pd.DataFrame({"AccountID": ["111", "222"], HOSTS_COLUMN: [3, 1]}),
+    )
+    # Unused categories are not listed
+    assert summaries["By Platform"].values.tolist() == [
+        ["Windows", 2],
+        ["Linux/UNIX", 1],
+        [UNKNOWN_LABEL, 1],
+    ]
+    assert summaries["By SQL Version"].values.tolist() == [
+        ["2019", 2],
+        ["2017", 1],
+        [UNKNOWN_LABEL, 1],
+    ]
+
+
+def test_summarize_uses_classified_versions():
+    """Test the classified release column is counted when present."""
+    data = report().assign(**{VERSION_COLUMN: ["2022"] * 4})
+
+    summaries = dict(summarize(data))
+
+    assert summaries["By SQL Version"].values.tolist() == [["2022", 4]]
+
+
+def test_summarize_skips_missing_keys():
+    """Test projected-away keys get no summary."""
+    assert [title for title, _ in summarize(report()[["VMName"]])] == []
+    assert [
+        title for title, _ in summarize(report()[["VMName", "AccountID"]])
+    ] == ["By Account"]
+
+
+def test_summarize_empty_report():
+    """Test an empty report gives empty summaries."""
+    summaries = summarize(report().iloc[:0])
+
+    assert [len(summary) for _, summary in summaries] == [0, 0, 0]
@@ -0,0 +1,191 @@
+"""
+Unit tests for the parallel block upload of reports.
+"""
+
+import base64
+import hashlib
+import os
+import threading
+import time
+from io import BytesIO
+
+import pytest
+from azure.core.exceptions import HttpResponseError, ServiceResponseError
+
+from filter_sql_servers import upload
+from filter_sql_servers.upload import (
+    UploadVerificationError,
+    block_id,
+    upload_blocks,
+)
+
+from .benchmarks.blob_stubs import InMemoryBlobServiceClient
+
+REPORT = os.urandom(10 * 1024 + 7)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    """Retry failed blocks immediately."""
+    monkeypatch.setattr(upload, "RETRY_BACKOFF_SECONDS", 0)
+
+
+@pytest.fixture
+def storage():
+    """In-memory post-process container."""
+    return InMemoryBlobServiceClient()
+
+
+class FlakyBlobClient:
+    """
+    Blob client failing to stage the given blocks a number of times.
+    """
+
+    def __init__(self, blob_client, failures, error=None):
+        self._blob_client = blob_client
+        self.failures = dict(failures)
+        self.error = error or ServiceResponseError("Connection reset")
+        self.staged = []
+
+    def stage_block(self, block, data, **kwargs):
+        self.staged.append(block)
+        if self.failures.get(block):
+            self.failures[block] -= 1
+            raise self.error
+        self._blob_client.stage_block(block, data, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._blob_client, name)
+
+
+def test_uploads_blocks_and_content_md5(storage):
+    """Test the blob is committed from its blocks with its Content-MD5."""
+    blob_client = storage.get_blob_client("post", "report.xlsx")
+
+    result = upload_blocks(blob_client, BytesIO(REPORT), len(REPORT), 1024, 4)
+
+    assert storage.blobs[("post", "report.xlsx")] == REPORT
+    assert result == {
+        "blocks": 11,
+        "retries": 0,
+        "content_md5": base64.b64encode(hashlib.md5(REPORT).digest()).decode(),
+    }
+    assert storage.staged == {}
+
+
+def test_retries_only_the_failed_block(storage):
+    """Test a transient failure restages that block alone."""
+    blob_client = FlakyBlobClient(
+        storage.get_blob_client("post", "report.xlsx"), {block_id(9): 2}
+    )
+
+    result = upload_blocks(blob_client, BytesIO(REPORT), len(REPORT), 1024, 4)
+
+    assert storage.blobs[("post", "report.xlsx")] == REPORT
+    assert result["retries"] == 2
+    assert blob_client.staged.count(block_id(9)) == 3
+    assert all(
+        blob_client.staged.count(block_id(index)) == 1
+        for index in range(11)
+        if index != 9
+    )
+
+
+def test_gives_up_after_retries(storage):
+    """Test a block failing every attempt fails the upload uncommitted."""
+    blob_client = FlakyBlobClient(
+        storage.get_blob_client("post", "report.xlsx"), {block_id(3): 10}
+    )
+
+    with pytest.raises(ServiceResponseError):
+        upload_blocks(
+            blob_client, BytesIO(REPORT), len(REPORT), 1024, 4, retries=2
+        )
+
+    assert blob_client.staged.count(block_id(3)) == 3
+    assert ("post", "report.xlsx") not in storage.blobs
+
+
+def test_permanent_errors_are_not_retried(storage):
+    """Test errors such as authorization failures are raised at once."""
+    error = HttpResponseError("Forbidden")
+    error.status_code = 403
+    blob_client = FlakyBlobClient(
+        storage.get_blob_client("post", "report.xlsx"), {block_id(0): 1}, error
+    )
+
+    with pytest.raises(HttpResponseError):
+        upload_blocks(blob_client, BytesIO(REPORT), len(REPORT), 1024, 1)
+
+    assert blob_client.staged == [block_id(0)]
+
+
+def test_bounds_blocks_in_flight(storage):
+    """Test no more than max_concurrency blocks are staged at once."""
+    blob_client = storage.get_blob_client("post", "report.xlsx")
+    lock = threading.Lock()
+    in_flight = []
+    peak = []
+    stage_block = blob_client.stage_block
+
+    def slow_stage_block(*args, **kwargs):
+        with lock:
+            in_flight.append(1)
+            peak.append(len(in_flight))
+        time.sleep(0.01)
+        stage_block(*args, **kwargs)
+        with lock:
+            in_flight.pop()
+
+    blob_client.stage_block = slow_stage_block
+
+    upload_blocks(blob_client, BytesIO(REPORT), len(REPORT), 1024, 3)
+
+    assert 1 < max(peak) <= 3
+    assert storage.blobs[("post", "report.xlsx")] == REPORT
+
+
+def test_turns_off_client_retries(storage):
+    """Test blocks are staged without the client's own retries."""
+    blob_client = FlakyBlobClient(
+        storage.get_blob_client("post", "report.xlsx"), {}
+    )
+    calls = []
+    stage_block = blob_client.stage_block
+
+    def recording_stage_block(block, data, **kwargs):
+        calls.append(kwargs)
+        stage_block(block, data, **kwargs)
+
+    blob_client.stage_block = recording_stage_block
+
+    upload_blocks(blob_client, BytesIO(REPORT), len(REPORT), 1024, 4)
+
+    assert all(
+        kwargs["retry_total"] == 0 and kwargs["validate_content"]
+        for kwargs in calls
+    )
+
+
+def test_rejects_short_file_uncommitted(storage):
+    """Test a file shorter than its length is not committed."""
+    blob_client = storage.get_blob_client("post", "report.xlsx")
+
+    with pytest.raises(UploadVerificationError, match="expected 10247"):
+        upload_blocks(blob_client, BytesIO(REPORT[:-1]), len(REPORT), 1024, 4)
+
+    assert ("post", "report.xlsx") not in storage.blobs
+
+
+def test_verifies_committed_block_list(storage):
+    """Test a committed block list differing from the staged is reported."""
+    blob_client = storage.get_blob_client("post", "report.xlsx")
+    commit_block_list = blob_client.commit_block_list
+
+    def dropping_commit_block_list(block_list, **kwargs):
+        commit_block_list(block_list[:-1], **kwargs)
+
+    blob_client.commit_block_list = dropping_commit_block_list
+
+    with pytest.raises(UploadVerificationError, match="10 blocks"):
+        upload_blocks(blob_client, BytesIO(REPORT), len(REPORT), 1024, 4)
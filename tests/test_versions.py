@@ -0,0 +1,198 @@
+"""
+Unit tests for SQL Server version and edition extraction.
+"""
+
+import pathlib
+from io import BytesIO
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from filter_sql_servers import versions
+from filter_sql_servers.inventory_cache import (
+    build_cache_table,
+    read_cache,
+    write_cache,
+)
+from filter_sql_servers.versions import (
+    DEFAULT_VERSION_STATUS,
+    classify_releases,
+    load_version_status,
+    parse_sql_software,
+    platform_edition,
+    sql_server_versions,
+)
+
+MOCK_CSV_PATH = pathlib.Path(__file__).parent / "data" / "vm_inventory.csv"
+
+
+class TestParsing:
+    """Test cases for parsing single values."""
+
+    @pytest.mark.parametrize(
+        "value, expected",
+        [
+            ("['Microsoft SQL Server 2019 (64-bit)']", (("2019",), None)),
+            (
+                "['Microsoft SQL Server 2017', "
+                "'Microsoft SQL Server 2008 R2 (64-bit)']",
+                (("2008 R2", "2017"), None),
+            ),
+            (
+                '["Microsoft SQL Server 2022 Express"]',
+                (("2022",), "Express"),
+            ),
+            ("Microsoft SQL Server 2014 Standard", (("2014",), "Standard")),
+            ("['Microsoft SQL Server 2031']", (("2031",), None)),
+            (
+                "['Microsoft SQL Server 2019 (64-bit)', "
+                "'Microsoft SQL Server 2012 Native Client', "
+                "'Microsoft SQL Server 2014 Express LocalDB', "
+                "'Microsoft SQL Server Management Studio - 18.12']",
+                (("2019",), None),
+            ),
+            (
+                "['Microsoft SQL Server 2012 Native Client', "
+                "'Microsoft SQL Server 2016 T-SQL Language Service']",
+                ((), None),
+            ),
+            ("['PostgreSQL 15']", ((), None)),
+            ("[]", ((), None)),
+            (None, ((), None)),
+        ],
+    )
+    def test_parse_sql_software(self, value, expected):
+        """Test releases are found oldest first with the edition."""
+        assert parse_sql_software(value) == expected
+
+    def test_platform_edition(self):
+        """Test the edition of licence-included platforms is read."""
+        assert (
+            platform_edition("Windows with SQL Server Enterprise")
+            == "Enterprise"
+        )
+        assert platform_edition("Windows") is None
+        assert platform_edition(float("nan")) is None
+
+    def test_classify_releases(self):
+        """Test the worst status of the installed releases wins."""
+        table = {"2016": "vulnerable", "2019": "patched"}
+
+        assert classify_releases(("2019",), table) == "patched"
+        assert classify_releases(("2016", "2019"), table) == "vulnerable"
+        assert classify_releases(("2019", "2031"), table) == "unknown"
+        assert classify_releases((), table) is None
+
+    def test_load_version_status_overrides_defaults(self):
+        """Test configured statuses apply over the default table."""
+        table = load_version_status('{"2019": "vulnerable"}')
+
+        assert table["2019"] == "vulnerable"
+        assert table["2022"] == DEFAULT_VERSION_STATUS["2022"]
+
+    @pytest.mark.parametrize("value", ['{"2019": "old"}', '["2019"]'])
+    def test_load_version_status_rejects_invalid(self, value):
+        """Test unknown statuses and non-objects are rejected."""
+        with pytest.raises(ValueError):
+            load_version_status(value)
+
+
+class TestSqlServerVersions:
+    """Test cases for sql_server_versions."""
+
+    def test_columns_are_typed(self):
+        """Test versions, editions and statuses have their own dtypes."""
+        data = pd.DataFrame(
+            {
+                "SQLSoftware": [
+                    "['Microsoft SQL Server 2019 (64-bit)']",
+                    "['Microsoft SQL Server 2016', "
+                    "'Microsoft SQL Server 2017 (64-bit)']",
+                    "[]",
+                    None,
+                ],
+                "PlatformDetails": [
+                    "Windows with SQL Server Standard",
+                    "Windows",
+                    "Windows with SQL Server Enterprise",
+                    "Windows",
+                ],
+            },
+            index=[7, 7, 3, 1],
+        )
+
+        result = sql_server_versions(data)
+
+        assert result.index.equals(data.index)
+        assert result["SQLServerVersion"].cat.ordered
+        assert result["SQLServerVersion"].tolist()[:2] == ["2019", "2017"]
+        assert result["SQLServerVersion"].isna().tolist()[2:] == [True] * 2
+        assert result["SQLServerMajorVersion"].dtype == "Int64"
+        assert result["SQLServerMajorVersion"].tolist()[:2] == [15, 14]
+        assert result["SQLServerEdition"].isna().tolist() == [
+            False,
+            True,
+            False,
+            True,
+        ]
+        assert result["SQLServerEdition"].tolist()[::2] == [
+            "Standard",
+            "Enterprise",
+        ]
+        assert result["SQLServerStatus"].tolist()[:2] == [
+            "patched",
+            "vulnerable",
+        ]
+
+    def test_client_components_do_not_set_the_status(self):
+        """Test only server releases are classified."""
+        data = pd.DataFrame(
+            {
+                "SQLSoftware": [
+                    "['Microsoft SQL Server 2019 (64-bit)', "
+                    "'Microsoft SQL Server 2012 Native Client']",
+                    "['Microsoft SQL Server 2012 Native Client']",
+                ]
+            }
+        )
+
+        result = sql_server_versions(data)
+
+        assert result["SQLServerVersion"].tolist()[0] == "2019"
+        assert pd.isna(result["SQLServerVersion"].tolist()[1])
+        assert result["SQLServerStatus"].tolist()[0] == "patched"
+        assert pd.isna(result["SQLServerStatus"].tolist()[1])
+
+    def test_each_distinct_value_is_parsed_once(self):
+        """Test repeated values are parsed a single time."""
+        data = pd.read_csv(MOCK_CSV_PATH)
+        big = pd.concat([data] * 20, ignore_index=True)
+
+        with patch.object(
+            versions,
+            "parse_sql_software",
+            wraps=versions.parse_sql_software,
+        ) as parse:
+            result = sql_server_versions(big)
+
+        assert parse.call_count == data["SQLSoftware"].nunique()
+        expected = sql_server_versions(data)
+        pd.testing.assert_frame_equal(
+            result.iloc[: len(data)], expected, check_index_type=False
+        )
+
+    def test_cached_lists_replace_parsing(self):
+        """Test the cache's SQLSoftwareList is used instead of parsing."""
+        data = pd.read_csv(MOCK_CSV_PATH)
+        cache = BytesIO()
+        write_cache(build_cache_table(data), cache)
+        cached = read_cache(cache, lists=["SQLSoftware"])
+        assert "SQLSoftwareList" in cached.columns
+
+        with patch.object(
+            versions, "parse_software_list", side_effect=AssertionError
+        ):
+            result = sql_server_versions(cached)
+
+        pd.testing.assert_frame_equal(result, sql_server_versions(data))